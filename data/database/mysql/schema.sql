@@ -1,4 +1,4 @@
---  The whole schema for the transcoder database VERSION 20081230
+--  The whole schema for the transcoder database VERSION 2026101801
 
 -- schema_information must be updated and looked at before committing schema changes
 -- schema_version is YYYYMMDDXX where XX is 00 for the first schema change on
@@ -11,7 +11,7 @@ create table if not exists schema_information (
 ) engine=InnoDB;
 
 insert into schema_information(schema_version, upgrading_soon, upgrading_currently)
-values ('2008123000', false, false);
+values ('2026101801', false, false);
 
 create table if not exists test_index (
 	id int primary key auto_increment,
@@ -42,7 +42,9 @@ create table if not exists transcoder_reports (
         profile_id varchar(100) not null,
         relative_path varchar(100) not null,
         report_path varchar(100),
-        file_checksum char(32), -- not null
+        -- md5 digest, or another fingerprint prefixed with its mode
+        -- (e.g. 'sampled-md5:<md5 digest>'), see upgrade_2026101800.sql
+        file_checksum varchar(64), -- not null
         file_size int,
         file_type varchar(100),
         mime_type varchar(100),
@@ -54,6 +56,10 @@ create table if not exists transcoder_reports (
         queueing_time datetime,
         transcoding_start_time datetime,
         transcoding_finish_time datetime,
+        -- only for the profiles with a turnaround time,
+        -- see upgrade_2026101801.sql
+        deadline datetime,
+        deadline_missed boolean,
         total_cpu_time float,
         total_real_time float,
         attempt_count int,
@@ -268,6 +274,21 @@ select
 from transcoder_reports
 group by test_id, customer_id, profile_id;
 
+-- deadline misses per customer and profile, for the profiles
+-- with a turnaround time
+create or replace view deadline_misses_per_profile as
+select
+	test_id,
+        customer_id,
+        profile_id,
+        count(deadline) as number_of_transcods,
+        sum(case when deadline_missed then 1 else 0 end) as missed_deadlines,
+        round(sum(case when deadline_missed then 1 else 0 end) / count(deadline), 3) * 100 as miss_rate,
+        max(case when deadline_missed then timestampdiff(SECOND, deadline, transcoding_finish_time) else null end) as max_lateness
+from transcoder_reports
+where deadline is not null
+group by test_id, customer_id, profile_id;
+
 -- reports taking into account only unique files
 
 create or replace view unique_transcoder_reports as
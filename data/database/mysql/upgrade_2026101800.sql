@@ -0,0 +1,9 @@
+--  Upgrades the transcoder database from VERSION 2008123000 to 2026101800
+--
+--  mysql transcoder < upgrade_2026101800.sql
+
+-- the fingerprints other than md5 are prefixed with their mode,
+-- e.g. 'sampled-md5:<md5 digest>' is 44 characters long
+alter table transcoder_reports modify file_checksum varchar(64);
+
+update schema_information set schema_version = '2026101800';
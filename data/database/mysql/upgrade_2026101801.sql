@@ -0,0 +1,25 @@
+--  Upgrades the transcoder database from VERSION 2026101800 to 2026101801
+--
+--  mysql transcoder < upgrade_2026101801.sql
+
+-- the deadlines of the transcodings of the profiles with a turnaround time
+alter table transcoder_reports
+        add column deadline datetime after transcoding_finish_time,
+        add column deadline_missed boolean after deadline;
+
+-- deadline misses per customer and profile, for the profiles
+-- with a turnaround time
+create or replace view deadline_misses_per_profile as
+select
+	test_id,
+        customer_id,
+        profile_id,
+        count(deadline) as number_of_transcods,
+        sum(case when deadline_missed then 1 else 0 end) as missed_deadlines,
+        round(sum(case when deadline_missed then 1 else 0 end) / count(deadline), 3) * 100 as miss_rate,
+        max(case when deadline_missed then timestampdiff(SECOND, deadline, transcoding_finish_time) else null end) as max_lateness
+from transcoder_reports
+where deadline is not null
+group by test_id, customer_id, profile_id;
+
+update schema_information set schema_version = '2026101801';
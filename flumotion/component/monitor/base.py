@@ -17,36 +17,60 @@
 
 
 import os
+import errno
 import shutil
+import time
 
 from twisted.internet import reactor
-from twisted.internet.defer import fail, DeferredSemaphore, DeferredList
+from twisted.internet.defer import Deferred, fail, succeed
+from twisted.internet.defer import DeferredList
 from twisted.internet.interfaces import IReactorThreads
-from twisted.internet.threads import deferToThread
+from twisted.internet.task import LoopingCall
+from twisted.internet.threads import deferToThread, deferToThreadPool
+from twisted.python.threadpool import ThreadPool
 from twisted.python.failure import Failure
 
 from flumotion.common import messages
 from flumotion.common.i18n import gettexter
 from flumotion.common.planet import moods
+from flumotion.configure import configure
 
 from flumotion.inhouse import log
 from flumotion.inhouse.errors import FlumotionError
 
+from flumotion.ovp import hashlib, openfiles
 from flumotion.ovp.utils import safe_mkdirs
 
 from flumotion.component.component import BaseComponentMedium, BaseComponent
+from flumotion.component.monitor.watcher import createDirectoryWatcher
+from flumotion.component.monitor.watcher import DirectoryWatcher
+from flumotion.component.monitor.fingerprint import FingerprintPool
+from flumotion.component.monitor.fingerprint import FingerprintCache
+from flumotion.component.monitor.fingerprint import getFileIdentity
+from flumotion.component.monitor.cooperator import MonitorCooperator
+from flumotion.component.monitor.cooperator import CooperatorStoppedError
+from flumotion.component.monitor.cooperator import LANE_FINGERPRINT
+from flumotion.component.monitor.cooperator import LANE_NAMES
+from flumotion.component.transcoder import compconsts
 from flumotion.transcoder.enums import MonitorFileStateEnum
 from flumotion.transcoder.errors import TranscoderError
 from flumotion.transcoder.local import Local
+from flumotion.transcoder.pendingfiles import PendingFilesJournal
+from flumotion.transcoder.pendingfiles import makeRecord, setRecordState
+from flumotion.transcoder.pendingfiles import makeProfileKey
+from flumotion.transcoder.shards import getEntryShard
 from flumotion.transcoder.virtualpath import VirtualPath
-from flumotion.ovp.fileutils import checksum, magic_mimetype
+from flumotion.ovp.fileutils import fingerprint, fingerprint_mode
+from flumotion.ovp.fileutils import FINGERPRINT_MD5
+from flumotion.ovp.fileutils import magic_mimetype
 from flumotion.inhouse.fileutils import PathAttributes
 
 
 _ = gettexter('flumotion-transcoder')
 
+# The reactor thread pool only moves files and walks directories,
+# the files are fingerprinted by the FingerprintPool
 IReactorThreads(reactor).suggestThreadPoolSize(2)
-#---------------------- prevents from computing too many md5 at the same time
 
 
 
@@ -62,7 +86,10 @@ class MonitorMedium(BaseComponentMedium):
 
     # called when a file is moved to the failed directory
     def remote_moveFiles(self, virtSrcBase, virtDestBase, relFiles):
-        self.comp.moveFiles(virtSrcBase, virtDestBase, relFiles)
+        return self.comp.moveFiles(virtSrcBase, virtDestBase, relFiles)
+
+    def remote_getPendingFiles(self, since=None):
+        return self.comp.getPendingFiles(since)
 
 
 
@@ -84,22 +111,52 @@ class MonitorBase(BaseComponent):
         self.uiState.addListKey('monitored-profiles', [])
         self.uiState.addListKey('active-profiles', [])
         self.uiState.addListKey('http-profiles', [])
-        self.uiState.addDictKey('pending-files', {})
+        # (sequence, changes) batches of pending files records changes,
+        # see flumotion.transcoder.pendingfiles
+        self.uiState.addKey('pending-changes', None)
+        self.uiState.addKey('pending-count', 0)
         self.uiState.addDictKey('virtbase-map', {})
+        self.uiState.addDictKey('fingerprint-stats', {})
+        self.uiState.addDictKey('cooperator-stats', {})
         self._local = None
         self._pathAttr = None
         self.active_profiles = []
         self.watchers = []
         self.http_profiles = []
         self.profiles_virtualbase = {}
+        self.watcher_backend = compconsts.DEFAULT_WATCHER_BACKEND
+        self.profiles_watcher_backend = {}
+        self.full_scan_period = compconsts.POLLING_FULL_SCAN_PERIOD
+        self.completion_method = None
+        self.completion_quiet_time = compconsts.COMPLETION_QUIET_TIME
+        self.shard_index = 0
+        self.shard_count = 1
+        self.fingerprint_mode = FINGERPRINT_MD5
+        self.profiles_fingerprint_mode = {}
+        self.profiles_growing = set()
+        self._fingerprints = None
+        self._movePool = None
+        self._fingerprintCaches = {}
+        self._fingerprintCacheLoads = {} # {profile name: [Deferred]}
+        self._fingerprintCacheDir = None
+        self._fingerprintCacheSize = compconsts.FINGERPRINT_CACHE_SIZE
+        self._cooperator = None
+        self._statsUpdater = None
+        self._lastStatsUpdate = None
+        self._lastFingerprintStats = None
+        self._pendingFiles = PendingFilesJournal(
+            compconsts.PENDING_FILES_HISTORY)
+        self._pendingPublisher = None
 
     def do_setup(self):
         try:
             properties = self.config['properties']
             self._local = Local.createFromComponentProperties(properties)
             self._pathAttr = PathAttributes.createFromComponentProperties(properties)
+            # The profiles of a monitor shared by many customers
+            # have an additional customer field, see makeProfileKey
             for s in properties.get("named-profile", []):
-                profile, path, active = s.split('!')
+                profile, path, active = self._split_profile_property(s, 3)
                 vpath = VirtualPath(path)
                 active = bool(int(active))
                 self.profiles_virtualbase[profile] = vpath
@@ -111,11 +168,85 @@ class MonitorBase(BaseComponent):
                 else:
                     self.http_profiles.append(profile)
                     self.uiState.append('http-profiles', profile)
+            self.watcher_backend = properties.get("watcher-backend",
+                                                  self.watcher_backend)
+            for s in properties.get("profile-watcher", []):
+                profile, backend = self._split_profile_property(s, 2)
+                self.profiles_watcher_backend[profile] = backend
+            self.full_scan_period = properties.get("full-scan-period",
+                                                   self.full_scan_period)
+            self.completion_method = self._get_completion_method(
+                properties.get("completion-method",
+                               compconsts.DEFAULT_COMPLETION_METHOD))
+            self.completion_quiet_time = properties.get(
+                "completion-quiet-time", self.completion_quiet_time)
+            self.shard_index = properties.get("shard-index", self.shard_index)
+            self.shard_count = properties.get("shard-count", self.shard_count)
+            if self.shard_count > 1:
+                self.info("Monitoring the shard %d of %d",
+                          self.shard_index, self.shard_count)
+            self.fingerprint_mode = properties.get("fingerprint-mode",
+                                                   self.fingerprint_mode)
+            for s in properties.get("profile-fingerprint", []):
+                profile, mode = self._split_profile_property(s, 2)
+                self.profiles_fingerprint_mode[profile] = mode
+            for s in properties.get("profile-growing", []):
+                profile, = self._split_profile_property(s, 1)
+                self.profiles_growing.add(profile)
+            threads = properties.get("fingerprint-threads",
+                                     compconsts.FINGERPRINT_THREADS)
+            budget = properties.get("fingerprint-budget",
+                                    compconsts.FINGERPRINT_BUDGET)
+            self._fingerprints = FingerprintPool(self, threads, budget,
+                                            compconsts.FINGERPRINT_SIZE_RATE)
+            self._fingerprints.start()
+            self._movePool = ThreadPool(1, compconsts.MOVE_COPY_THREADS,
+                                        "move")
+            self._movePool.start()
+            reactor.addSystemEventTrigger('during', 'shutdown',
+                                          self._stop_move_pool)
+            self._fingerprintCacheDir = properties.get(
+                "fingerprint-cache-dir",
+                os.path.join(configure.cachedir,
+                             compconsts.FINGERPRINT_CACHE_DIR))
+            self._fingerprintCacheSize = properties.get(
+                "fingerprint-cache-size", self._fingerprintCacheSize)
+            time_slice = properties.get("cooperator-time-slice",
+                                        compconsts.COOPERATOR_TIME_SLICE)
+            self._cooperator = MonitorCooperator(self, time_slice,
+                                                 compconsts.COOPERATOR_PERIOD)
+            self._cooperator.start()
+            self._statsUpdater = LoopingCall(self._update_stats)
+            self._statsUpdater.start(compconsts.MONITOR_STATS_PERIOD)
+            self._pendingPublisher = LoopingCall(self._publish_pending_files)
+            self._pendingPublisher.start(
+                compconsts.PENDING_FILES_PUBLISH_PERIOD, False)
         except:
             return fail(self._unexpected_error(task="component setup"))
 
     def do_stop(self):
-        pass
+        stops = []
+        if self._statsUpdater and self._statsUpdater.running:
+            self._statsUpdater.stop()
+        if self._pendingPublisher and self._pendingPublisher.running:
+            self._pendingPublisher.stop()
+        if self._fingerprints:
+            stops.append(self._fingerprints.stop())
+        if self._cooperator:
+            self._cooperator.stop()
+        self._stop_move_pool()
+        # The last updates of the caches are written before stopping
+        for cache in self._fingerprintCaches.values():
+            if cache:
+                stops.append(cache.close())
+        self._fingerprintCaches.clear()
+        loads, self._fingerprintCacheLoads = self._fingerprintCacheLoads, {}
+        for waiters in loads.values():
+            for waiter in waiters:
+                waiter.errback(TranscoderError("Monitor stopped"))
+        d = DeferredList(stops)
+        d.addCallback(lambda _: None)
+        return d
 
     #=================================================================
     # UIState update methods
@@ -142,6 +273,68 @@ class MonitorBase(BaseComponent):
         except KeyError:
             pass
 
+    def _set_pending_file(self, key, state, fileinfo, detection_time=None,
+                          mime=None, checksum=None, params=None):
+        record = makeRecord(state, fileinfo, detection_time,
+                            mime, checksum, params)
+        self._pendingFiles.set(key, record)
+
+    def _del_pending_file(self, key):
+        self._pendingFiles.remove(key)
+
+    def _publish_pending_files(self):
+        batch = self._pendingFiles.flush()
+        if batch is None:
+            return
+        self.log("Publishing %d pending files changes with sequence %d",
+                 len(batch[1]), batch[0])
+        self.uiState.set('pending-changes', batch)
+        if self.uiState.get('pending-count') != len(self._pendingFiles):
+            self.uiState.set('pending-count', len(self._pendingFiles))
+
+    def _update_stats(self):
+        now = time.time()
+        if self._lastStatsUpdate is not None:
+            # Also measure the reactor lag when the cooperator is idle
+            lag = now - self._lastStatsUpdate - compconsts.MONITOR_STATS_PERIOD
+            self._cooperator.sampleLag(lag)
+        self._lastStatsUpdate = now
+        self._update_fingerprint_stats(now)
+        self._update_cooperator_stats()
+
+    def _update_cooperator_stats(self):
+        backlogs, suspended, _, lag, max_lag = self._cooperator.getStats()
+        values = {"suspended": suspended,
+                  "reactor-lag": round(lag, 3),
+                  "max-reactor-lag": round(max_lag, 3)}
+        for name, backlog in zip(LANE_NAMES, backlogs):
+            values[name + "-backlog"] = backlog
+        current = self.uiState.get('cooperator-stats')
+        for name, value in values.iteritems():
+            if current.get(name) != value:
+                self._set_ui_item('cooperator-stats', name, value)
+
+    def _update_fingerprint_stats(self, now):
+        stats = self._fingerprints.getStats()
+        queued, running, running_bytes, done_files, done_bytes = stats
+        files_rate = bytes_rate = 0.0
+        if self._lastFingerprintStats:
+            last_time, last_files, last_bytes = self._lastFingerprintStats
+            elapsed = now - last_time
+            if elapsed > 0:
+                files_rate = (done_files - last_files) / elapsed
+                bytes_rate = (done_bytes - last_bytes) / elapsed
+        self._lastFingerprintStats = (now, done_files, done_bytes)
+        values = {"queued": queued,
+                  "running": running,
+                  "running-bytes": running_bytes,
+                  "files-per-second": round(files_rate, 2),
+                  "bytes-per-second": int(bytes_rate)}
+        current = self.uiState.get('fingerprint-stats')
+        for name, value in values.iteritems():
+            if current.get(name) != value:
+                self._set_ui_item('fingerprint-stats', name, value)
+
 
     #=================================================================
     # Public methods
@@ -149,73 +342,234 @@ class MonitorBase(BaseComponent):
 
     def setFileState(self, virtBase, relFile, status):
         key = (virtBase, relFile)
-        state = self.uiState.get('pending-files')
-        substate = state.get(key)
-        # substate can be None, probably because it has already been
-        # added to the internal dictionaries, but has not been updated
-        # in the UIState. In that case don't bother with updating the
-        # UIState - we don't want to overwrite the file state in the
-        # smooth update structure.
-        if substate is None:
+        record = self._pendingFiles.get(key)
+        # The file may have been removed in between
+        if record is None:
             return
-        substate = list(substate)
-        substate[0] = status
-        substate = tuple(substate)
-        self._update_ui_item('pending-files', key, substate)
+        self._pendingFiles.set(key, setRecordState(record, status))
+
+    def getPendingFiles(self, since=None):
+        """
+        Returns (sequence, full, changes) with the pending files changes
+        since the given published sequence, or all the pending files
+        if full is True. See PendingFilesJournal.getChanges.
+        """
+        # Publish first so the result matches the published sequence
+        self._publish_pending_files()
+        return self._pendingFiles.getChanges(since)
 
 
     def moveFiles(self, virtSrcBase, virtDestBase, relFiles):
+        """
+        Moves the files from a virtual base to another.
+        The files are renamed right away; only the files on another
+        device are moved in the copy thread pool.
+        Returns a deferred fired with a dict {relFile: None if moved
+        or the error message}.
+        """
         self.debug("MOVING: %r, %r, %r", virtSrcBase, virtDestBase, relFiles)
         if not self._local:
             raise TranscoderError("Component not properly setup yet")
 
-        def move_failed(failure, src, dest):
-            msg = ("Fail to move file '%s' to '%s': %s"
-                   % (src, dest, log.getFailureMessage(failure)))
-            self.warning("%s", msg)
-            raise TranscoderError(msg, cause=failure)
-
-        def move_file(src, dest, attr=None):
-            self.debug("Moving file '%s' to '%s'", src, dest)
-            dest_dir = os.path.dirname(dest)
-            safe_mkdirs(dest_dir, "input file destination", attr)
-            d = deferToThread(shutil.move, src, dest)
-            d.addErrback(move_failed, src, dest)
-            return d
-
-        def move_files_failed(results):
-            first_failure = None
-            for ok, result in results:
-                if not ok:
-                    if not first_failure:
-                        first_failure = result
-            return first_failure
-
-        sem = DeferredSemaphore(1)
-        move_tasks = []
-
+        results = {}
+        copies = []
+        created = set()
         for file in relFiles:
             source_path = virtSrcBase.append(file).localize(self._local)
             dest_path = virtDestBase.append(file).localize(self._local)
             source_path = os.path.realpath(source_path)
             dest_path = os.path.realpath(dest_path)
-            d = sem.run(move_file, source_path, dest_path, self._pathAttr)
-            move_tasks.append(d)
+            try:
+                dest_dir = os.path.dirname(dest_path)
+                if dest_dir not in created:
+                    safe_mkdirs(dest_dir, "input file destination",
+                                self._pathAttr)
+                    created.add(dest_dir)
+                self.debug("Moving file '%s' to '%s'", source_path, dest_path)
+                os.rename(source_path, dest_path)
+                results[file] = None
+            except OSError, e:
+                if e.errno == errno.EXDEV:
+                    copies.append((file, source_path, dest_path))
+                    continue
+                results[file] = self._move_failed(source_path, dest_path,
+                                                  log.getExceptionMessage(e))
+            except Exception, e:
+                results[file] = self._move_failed(source_path, dest_path,
+                                                  log.getExceptionMessage(e))
+
+        if not copies:
+            return succeed(results)
+
+        def file_copied(_, file):
+            results[file] = None
+
+        def copy_failed(failure, file, src, dest):
+            results[file] = self._move_failed(src, dest,
+                                              log.getFailureMessage(failure))
 
-        dl = DeferredList(move_tasks, consumeErrors=True)
-        dl.addErrback(move_files_failed)
-        return d
+        move_tasks = []
+        for file, source_path, dest_path in copies:
+            self.debug("Moving file '%s' to '%s' on another device",
+                       source_path, dest_path)
+            d = deferToThreadPool(reactor, self._movePool,
+                                  shutil.move, source_path, dest_path)
+            d.addCallbacks(file_copied, copy_failed,
+                           callbackArgs=(file,),
+                           errbackArgs=(file, source_path, dest_path))
+            move_tasks.append(d)
+        dl = DeferredList(move_tasks)
+        dl.addCallback(lambda _: results)
+        return dl
 
 
     #=================================================================
     # Protected methods
     #=================================================================
 
+    def setup_directory_watcher(self, profile_name, virt_dir, local_dir,
+                                timeout):
+        """
+        Creates and starts the watcher of an active profile directory
+        with the backend selected for the profile.
+        Falls back to the polling watcher if the kernel
+        notifications cannot be used for this directory.
+        """
+        backend = self.profiles_watcher_backend.get(profile_name,
+                                                    self.watcher_backend)
+        owner = self._get_shard_owner(profile_name)
+        watcher = createDirectoryWatcher(self, local_dir, profile_name,
+                                         backend, self.full_scan_period,
+                                         self.completion_method,
+                                         self.completion_quiet_time,
+                                         timeout=timeout,
+                                         cooperator=self._cooperator,
+                                         owner=owner)
+        try:
+            self._connect_watcher(watcher, virt_dir, profile_name)
+            watcher.start()
+        except OSError, e:
+            self.warning("Cannot use the %s watcher for directory '%s', "
+                         "falling back to polling: %s", backend, local_dir,
+                         log.getExceptionMessage(e))
+            watcher.stop()
+            watcher = DirectoryWatcher(self, local_dir, profile_name,
+                                       timeout=timeout,
+                                       full_scan_period=self.full_scan_period,
+                                       completion_method=self.completion_method,
+                                       quiet_time=self.completion_quiet_time,
+                                       cooperator=self._cooperator,
+                                       owner=owner)
+            self._connect_watcher(watcher, virt_dir, profile_name)
+            watcher.start()
+        self.watchers.append(watcher)
+        return watcher
+
+    def schedule_file_info(self, *args, **kwargs):
+        """
+        Calls get_file_info with the given arguments when the
+        monitor cooperator is done with the files discovery.
+        """
+        d = self._cooperator.call(LANE_FINGERPRINT, self.get_file_info,
+                                  *args, **kwargs)
+        d.addErrback(self._ebFileInfoDropped)
+        return d
+
+    def _ebFileInfoDropped(self, failure):
+        # The monitor is stopping
+        failure.trap(CooperatorStoppedError)
+
+    def _connect_watcher(self, watcher, virt_dir, profile_name):
+        watcher.connect('file-added', self._file_added, virt_dir, profile_name)
+        watcher.connect('file-completed', self._file_completed,
+                        virt_dir, profile_name)
+        watcher.connect('file-removed', self._file_removed,
+                        virt_dir, profile_name)
+
+    def _get_shard_owner(self, profile_name):
+        if self.shard_count <= 1:
+            return None
+
+        def owner(name):
+            return (getEntryShard(profile_name, name, self.shard_count)
+                    == self.shard_index)
+
+        return owner
+
+    def _split_profile_property(self, value, count):
+        fields = value.split('!')
+        if len(fields) > count:
+            fields[0] = makeProfileKey(fields[0], fields[count])
+        return fields[:count]
+
+    def _get_completion_method(self, method):
+        if method == compconsts.COMPLETION_METHOD_NONE:
+            return None
+        if method not in openfiles.METHODS:
+            self.warning("Unknown completion method '%s', "
+                         "using the file size", method)
+            return None
+        if not openfiles.isAvailable(method):
+            self.warning("Completion method '%s' not supported, "
+                         "using the file size", method)
+            return None
+        if method in (openfiles.METHOD_LEASE, openfiles.METHOD_AUTO):
+            # Must be done from the main thread, before the
+            # watchers take any lease from their threads
+            if not openfiles.ignoreLeaseBreaks():
+                self.warning("Cannot ignore the lease breaks, "
+                             "file leases will not be used")
+        return method
+
+    def _stop_move_pool(self):
+        if self._movePool:
+            self._movePool.stop()
+            self._movePool = None
+
+    def _move_failed(self, src, dest, message):
+        msg = "Fail to move file '%s' to '%s': %s" % (src, dest, message)
+        self.warning("%s", msg)
+        return msg
+
+    def get_fingerprint_mode(self, profile_name):
+        return self.profiles_fingerprint_mode.get(profile_name,
+                                                  self.fingerprint_mode)
+
+    def set_file_as_growing(self, file, fileinfo, detection_time,
+                            virt_base, profile_name):
+        """
+        Sets a file still being written as pending right away
+        if its profile transcodes the files while they are written.
+        It is fingerprinted as usual when complete.
+        Returns True if the file was set as pending.
+        """
+        if profile_name not in self.profiles_growing:
+            return False
+        local_file = virt_base.append(file).localize(self._local)
+        self.debug("File '%s' pending while being written", local_file)
+        method = self.completion_method or compconsts.COMPLETION_METHOD_NONE
+        params = {"growing-completion": method}
+        self._set_pending_file((profile_name, file),
+                               MonitorFileStateEnum.pending, fileinfo,
+                               detection_time, params=params)
+        return True
+
     def get_file_info(self, file, fileinfo, incoming_folder,
-                                  virt_base, profile_name=None, params={}):
-        d = deferToThread(
-            self.get_mime_and_checksum, incoming_folder + file
-        ).addErrback(
+                                  virt_base, profile_name=None, params={},
+                                  precomputed=None):
+        """
+        Fingerprints the file and sets it as pending.
+        precomputed can be the (mime, checksum) already computed
+        while importing the file, to not read it again.
+        """
+        path = incoming_folder + file
+        mode = self.get_fingerprint_mode(profile_name)
+        # Record the fingerprint mode with the activity parameters
+        params = dict(params or {})
+        params["checksum-type"] = mode
+        d = self._get_fingerprint_cache(profile_name, virt_base)
+        d.addCallback(self._cbFingerprintCacheReady, path, mode, precomputed)
+        d.addErrback(
             self.fallback_mime_and_checksum_none
         ).addCallback(
             self.check_whether_not_removed, file, virt_base
@@ -227,16 +581,123 @@ class MonitorBase(BaseComponent):
         )
         return d
 
+    def forget_fingerprint(self, profile_name, local_file):
+        cache = self._fingerprintCaches.get(profile_name)
+        if cache:
+            cache.forget(local_file)
+
     #=================================================================
     # Private methods and callbacks. Subclasses might not use them
     #=================================================================
 
-    def get_mime_and_checksum(self, path):
-        self.debug("Computing checksum: %r", path)
+    def _cbFingerprintCacheReady(self, cache, path, mode, precomputed):
+        d = deferToThread(self._stat_file, path)
+        d.addCallback(self._cbFileStated, cache, path, mode, precomputed)
+        return d
+
+    def _stat_file(self, path):
+        # Called from a thread
+        try:
+            return os.stat(path)
+        except OSError:
+            return None
+
+    def _cbFileStated(self, statinfo, cache, path, mode, precomputed):
+        identity = cached = None
+        if statinfo:
+            identity = getFileIdentity(statinfo)
+        if cache and identity:
+            cached = cache.lookup(path, identity)
+        if precomputed and fingerprint_mode(precomputed[1]) == mode:
+            self.debug("Fingerprint of '%s' computed while importing", path)
+            d = succeed(tuple(precomputed) + (identity,))
+            d.addCallback(self._cbFingerprinted, cache, path)
+        elif cached and fingerprint_mode(cached[1]) == mode:
+            self.debug("Fingerprint of '%s' found in cache", path)
+            d = succeed(cached)
+        else:
+            size = statinfo and statinfo.st_size or 0
+            d = self._fingerprints.submit(size, self.compute_fingerprint,
+                                          path, mode)
+            d.addCallback(self._cbFingerprinted, cache, path)
+        return d
+
+    def get_mime_and_checksum(self, path, mode=FINGERPRINT_MD5):
+        self.debug("Computing %s checksum: %r", mode, path)
         mime = magic_mimetype(path)
-        chksum = checksum(path)
+        chksum = fingerprint(path, mode)
         return (mime, chksum)
 
+    def compute_fingerprint(self, path, mode=FINGERPRINT_MD5):
+        """
+        Returns (mime, checksum, identity), with identity None
+        if the file changed while being read.
+        """
+        before = getFileIdentity(os.stat(path))
+        mime, chksum = self.get_mime_and_checksum(path, mode)
+        identity = getFileIdentity(os.stat(path))
+        if identity != before:
+            identity = None
+        return (mime, chksum, identity)
+
+    def _cbFingerprinted(self, result, cache, path):
+        mime, chksum, identity = result
+        if cache and identity and chksum:
+            cache.store(path, identity, mime, chksum)
+        return (mime, chksum)
+
+    def _get_fingerprint_cache(self, profile_name, virt_base):
+        """
+        Returns a deferred fired with the fingerprint cache of the
+        profile, or None if it has none. The cache is loaded in a thread.
+        """
+        if profile_name in self._fingerprintCaches:
+            return succeed(self._fingerprintCaches[profile_name])
+        d = Deferred()
+        if profile_name in self._fingerprintCacheLoads:
+            self._fingerprintCacheLoads[profile_name].append(d)
+            return d
+        self._fingerprintCacheLoads[profile_name] = [d]
+        cache = None
+        if self._fingerprintCacheDir and self._fingerprintCacheSize:
+            local_root = virt_base.localize(self._local)
+            name = "%s.fingerprints" % hashlib.md5(local_root).hexdigest()
+            cache = FingerprintCache(self,
+                                     os.path.join(self._fingerprintCacheDir,
+                                                  name),
+                                     self._fingerprintCacheSize,
+                                compconsts.FINGERPRINT_CACHE_FLUSH_PERIOD)
+        if cache is None:
+            self._cbFingerprintCacheLoaded(None, profile_name)
+            return d
+        load = deferToThread(self._load_fingerprint_cache, cache)
+        load.addErrback(self._ebFingerprintCacheLoadFailed, cache, local_root)
+        load.addCallback(self._cbFingerprintCacheLoaded, profile_name)
+        return d
+
+    def _load_fingerprint_cache(self, cache):
+        # Called from a thread
+        safe_mkdirs(self._fingerprintCacheDir, "fingerprint cache")
+        cache.load()
+        return cache
+
+    def _ebFingerprintCacheLoadFailed(self, failure, cache, local_root):
+        self.warning("Cannot use fingerprint cache '%s' for '%s': %s",
+                     cache.path, local_root, log.getFailureMessage(failure))
+        return None
+
+    def _cbFingerprintCacheLoaded(self, cache, profile_name):
+        waiters = self._fingerprintCacheLoads.pop(profile_name, None)
+        if waiters is None:
+            # Stopped while loading
+            return
+        if cache is not None:
+            cache.open()
+            self.debug("Using fingerprint cache '%s'", cache.path)
+        self._fingerprintCaches[profile_name] = cache
+        for waiter in waiters:
+            waiter.callback(cache)
+
     def fallback_mime_and_checksum_none(self, failure):
         log.notifyFailure(self, failure, "Failure during checksum / mime type")
         return (None, None)
@@ -257,16 +718,10 @@ class MonitorBase(BaseComponent):
         self.warning('%r %r' % (profile, filename))
         key = (profile, filename)
         self.warning('%r' % (key,))
-        try:
-            detection_time = self.uiState['pending-files'][key][2]
-        except (TypeError, KeyError):
-            detection_time = None
-        except Exception, e:
-            self.warning('Unexpected %r' % e)
-        substate = (MonitorFileStateEnum.pending, file_info, detection_time,
-                    mime, chksum, params)
-        self.warning('%r' % (substate,))
-        self._set_ui_item('pending-files', key, substate)
+        record = self._pendingFiles.get(key)
+        detection_time = record and record[5]
+        self._set_pending_file(key, MonitorFileStateEnum.pending, file_info,
+                               detection_time, mime, chksum, params)
 
     def _notifyDebug(self, msg, info=None, debug=None, failure=None,
                       exception=None, documents=None):
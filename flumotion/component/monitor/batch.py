@@ -0,0 +1,365 @@
+# -*- Mode: Python -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+# Flumotion - a streaming media server
+# Copyright (C) 2004,2005,2006,2007,2008,2009 Fluendo, S.L.
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+#
+# This file may be distributed and/or modified under the terms of
+# the GNU Lesser General Public License version 2.1 as published by
+# the Free Software Foundation.
+# This file is distributed without any warranty; without even the implied
+# warranty of merchantability or fitness for a particular purpose.
+# See "LICENSE.LGPL" in the source distribution for more information.
+#
+# Headers in this file shall remain intact.
+
+"""
+Batch submission of files to the HTTP monitor.
+
+A POST to /PROFILE/batch with a JSON body submits many files at once:
+
+  {"files": ["relative/path.mp4",
+             {"file": "/absolute/path.mp4",
+              "params": {"cue-points": "..."},
+              "profile": "profile hint"}]}
+
+The whole list is validated before anything is done; if an entry is
+invalid, nothing is submitted and the errors are answered with a 400.
+Otherwise the files are imported (linked or copied) to the incoming
+directory, a bounded number at the same time for the whole monitor,
+and the answer lists the result of each file, in the same order:
+
+  {"results": [{"file": "...", "status": "queued", "method": "link"},
+               {"file": "...", "status": "failed", "error": "..."}]}
+
+With an idempotency key (Idempotency-Key header or key argument),
+a retry of the same batch does not submit again the files already
+queued: it waits for the batch if it is still running, and only
+submits again the files that failed. Reusing a key with another
+batch is answered with a 409.
+"""
+
+import os
+import cgi
+import time
+from collections import deque
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from twisted.internet.defer import Deferred, DeferredList
+from twisted.internet.defer import DeferredSemaphore
+from twisted.internet.threads import deferToThread
+from twisted.web import http, server
+from twisted.web.resource import Resource
+
+from flumotion.common import log
+
+from flumotion.component.transcoder import compconsts
+from flumotion.ovp import hashlib
+
+
+BATCH_CHILD = "batch"
+
+STATUS_QUEUED = "queued"
+STATUS_FAILED = "failed"
+
+
+class BatchConflict(Exception):
+    pass
+
+
+class BatchEntry(object):
+    """
+    Results of a batch submitted with an idempotency key.
+    results is None while the batch is running.
+    """
+
+    def __init__(self, digest, expires):
+        self.digest = digest
+        self.expires = expires
+        self.results = None
+        self._waiters = []
+
+    def isRunning(self):
+        return self.results is None
+
+    def wait(self):
+        """
+        Returns a deferred fired with the results
+        when the batch is done.
+        """
+        d = Deferred()
+        if self.results is None:
+            self._waiters.append(d)
+        else:
+            d.callback(self.results)
+        return d
+
+    def done(self, results):
+        self.results = results
+        waiters, self._waiters = self._waiters, []
+        for d in waiters:
+            d.callback(results)
+
+
+class BatchRegistry(log.Loggable):
+    """
+    Shared by the batch resources of a monitor; limits the number
+    of files imported at the same time and keeps the results of the
+    batches submitted with an idempotency key for ttl seconds,
+    at most max_keys of them.
+    """
+
+    logCategory = compconsts.HTTP_MONITOR_LOG_CATEGORY
+
+    def __init__(self, max_imports, ttl=compconsts.BATCH_KEY_TTL,
+                 max_keys=compconsts.BATCH_MAX_KEYS):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._semaphore = DeferredSemaphore(max(1, max_imports))
+        self._entries = {} # {(profile, key): BatchEntry}
+        self._order = deque() # (profile, key) by registration order
+
+    def run(self, function, *args):
+        """
+        Calls function(*args) in a thread when an import slot is free.
+        Returns a deferred fired with the result.
+        """
+        return self._semaphore.run(deferToThread, function, *args)
+
+    def lookup(self, profile, key, digest):
+        """
+        Returns the entry of a batch already submitted with the given
+        key, or None. Raises BatchConflict if the key was used for
+        another batch.
+        """
+        self._expire()
+        entry = self._entries.get((profile, key))
+        if entry is None:
+            return None
+        if entry.digest != digest:
+            raise BatchConflict("Key '%s' already used for another batch"
+                                % key)
+        return entry
+
+    def register(self, profile, key, digest):
+        self._expire()
+        entry = BatchEntry(digest, time.time() + self.ttl)
+        self._entries[(profile, key)] = entry
+        self._order.append((profile, key))
+        return entry
+
+    def getKeyCount(self):
+        return len(self._entries)
+
+
+    ## Private Methods ##
+
+    def _expire(self):
+        now = time.time()
+        while self._order:
+            ident = self._order[0]
+            entry = self._entries.get(ident)
+            if entry is not None:
+                if entry.isRunning():
+                    break
+                if ((entry.expires > now)
+                    and (len(self._entries) <= self.max_keys)):
+                    break
+                del self._entries[ident]
+            self._order.popleft()
+
+
+class BatchResource(Resource, log.Loggable):
+    """
+    Receives the batches of files of a profile,
+    submitted through the profile's RequestHandler.
+    """
+
+    logCategory = compconsts.HTTP_MONITOR_LOG_CATEGORY
+    isLeaf = True
+
+    def __init__(self, handler, registry, max_files=None):
+        Resource.__init__(self)
+        self.handler = handler
+        self.registry = registry
+        self.max_files = max_files
+
+    def render_GET(self, request):
+        request.setResponseCode(http.NOT_ALLOWED)
+        return self._answer(request, {"errors": ["Please use a POST request"]})
+
+    def render_POST(self, request):
+        try:
+            batch = json.loads(request.content.read())
+        except ValueError, e:
+            request.setResponseCode(http.BAD_REQUEST)
+            return self._answer(request, {"errors": [
+                "Invalid JSON body: %s" % log.getExceptionMessage(e)]})
+        # The files are checked in a thread, the file system may be slow
+        d = deferToThread(self._validate, batch)
+        d.addCallback(self._cbValidated, request)
+        d.addErrback(self._ebBatchFailed, request)
+        return server.NOT_DONE_YET
+
+
+    ## Private Methods ##
+
+    def _validate(self, batch):
+        """
+        Returns the list of (local path, params) of the files of the
+        batch, and the list of the errors.
+        """
+        if not (isinstance(batch, dict)
+                and isinstance(batch.get("files"), list)):
+            return None, ["The body must be an object with a files list"]
+        entries = batch["files"]
+        if not entries:
+            return None, ["The files list is empty"]
+        if self.max_files and (len(entries) > self.max_files):
+            return None, ["Too many files, the maximum is %d"
+                          % self.max_files]
+        files = []
+        errors = []
+        for index, entry in enumerate(entries):
+            if isinstance(entry, basestring):
+                entry = {"file": entry}
+            if not (isinstance(entry, dict)
+                    and isinstance(entry.get("file"), basestring)
+                    and entry["file"]):
+                errors.append("File %d: a file path is required" % index)
+                continue
+            params = entry.get("params") or {}
+            profile = entry.get("profile")
+            if not (isinstance(params, dict)
+                    and [v for v in params.values()
+                         if not isinstance(v, (basestring, type(None)))]
+                    == []):
+                errors.append("File %d: params must be strings" % index)
+                continue
+            if not isinstance(profile, (basestring, type(None))):
+                errors.append("File %d: invalid profile" % index)
+                continue
+            path = self.handler.localize_path(entry["file"].encode("utf8"))
+            if not os.path.isfile(path):
+                errors.append("File %d: cannot access file %s"
+                              % (index, path))
+                continue
+            fileParams = {"cue-points": None}
+            for name, value in params.iteritems():
+                if value is not None:
+                    value = cgi.escape(value.encode("utf8"))
+                fileParams[name.encode("utf8")] = value
+            profile = self.handler.profile_name or profile
+            if profile:
+                fileParams["profile-name"] = profile.encode("utf8")
+            files.append((path, fileParams))
+        return files, errors
+
+    def _cbValidated(self, result, request):
+        files, errors = result
+        if errors:
+            request.setResponseCode(http.BAD_REQUEST)
+            self._finish(request, {"errors": errors})
+            return
+
+        key = (request.getHeader("idempotency-key")
+               or request.args.get("key", [None])[0])
+        entry = None
+        if key:
+            digest = hashlib.md5(json.dumps(files, sort_keys=True))
+            digest = digest.hexdigest()
+            try:
+                entry = self.registry.lookup(self.handler.profile_name,
+                                             key, digest)
+            except BatchConflict, e:
+                request.setResponseCode(http.CONFLICT)
+                self._finish(request, {"errors": [str(e)]})
+                return
+            if entry is not None:
+                d = entry.wait()
+                d.addCallback(self._retryFailed, entry, files)
+                d.addCallback(self._cbBatchDone, request)
+                return d
+            entry = self.registry.register(self.handler.profile_name,
+                                           key, digest)
+
+        self.debug("Submitting a batch of %d files", len(files))
+        d = self._submit(files, [None] * len(files))
+        if entry is not None:
+            d.addCallback(self._cbEntryDone, entry)
+        d.addCallback(self._cbBatchDone, request)
+        return d
+
+    def _ebBatchFailed(self, failure, request):
+        self.warning("Fail to process a batch: %s",
+                     log.getFailureMessage(failure))
+        request.setResponseCode(http.INTERNAL_SERVER_ERROR)
+        self._finish(request, {"errors": [failure.getErrorMessage()]})
+
+    def _submit(self, files, results):
+        """
+        Submits the files with a None result,
+        returns a deferred fired with the updated results.
+        """
+        indexes = [i for i, r in enumerate(results) if r is None]
+        defs = []
+        for index in indexes:
+            path, params = files[index]
+            d = self.handler.submit_file(path, params, self.registry.run)
+            defs.append(d)
+        d = DeferredList(defs, consumeErrors=True)
+        d.addCallback(self._cbSubmitted, files, results, indexes)
+        return d
+
+    def _cbSubmitted(self, submitted, files, results, indexes):
+        results = list(results)
+        for index, (ok, value) in zip(indexes, submitted):
+            path = files[index][0]
+            if ok:
+                results[index] = {"file": path, "status": STATUS_QUEUED,
+                                  "method": value}
+            else:
+                self.warning("Fail to import %r: %s", path,
+                             value.getErrorMessage())
+                results[index] = {"file": path, "status": STATUS_FAILED,
+                                  "error": value.getErrorMessage()}
+        return results
+
+    def _retryFailed(self, results, entry, files):
+        if entry.isRunning():
+            # Another retry is submitting the failed files
+            return entry.wait()
+        failed = [r for r in results if r["status"] == STATUS_FAILED]
+        if not failed:
+            return results
+        # Only the files that failed are submitted again
+        self.debug("Retrying %d failed files of a batch", len(failed))
+        retried = [r["status"] == STATUS_QUEUED and r or None
+                   for r in results]
+        entry.results = None
+        d = self._submit(files, retried)
+        d.addCallback(self._cbEntryDone, entry)
+        return d
+
+    def _cbEntryDone(self, results, entry):
+        entry.done(results)
+        return results
+
+    def _cbBatchDone(self, results, request):
+        self._finish(request, {"results": results})
+
+    def _finish(self, request, data):
+        if request._disconnected:
+            return
+        request.write(self._answer(request, data))
+        request.finish()
+
+    def _answer(self, request, data):
+        request.setHeader("content-type", "application/json")
+        return json.dumps(data)
@@ -0,0 +1,236 @@
+# -*- Mode: Python -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+# Flumotion - a streaming media server
+# Copyright (C) 2004,2005,2006,2007,2008,2009 Fluendo, S.L.
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+#
+# This file may be distributed and/or modified under the terms of
+# the GNU Lesser General Public License version 2.1 as published by
+# the Free Software Foundation.
+# This file is distributed without any warranty; without even the implied
+# warranty of merchantability or fitness for a particular purpose.
+# See "LICENSE.LGPL" in the source distribution for more information.
+#
+# Headers in this file shall remain intact.
+
+import time
+from collections import deque
+
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred
+from twisted.python.failure import Failure
+
+from flumotion.inhouse import log
+
+from flumotion.transcoder.errors import TranscoderError
+
+
+# Lanes in priority order
+LANE_COMPLETION = 0
+LANE_DISCOVERY = 1
+LANE_FINGERPRINT = 2
+LANE_NAMES = ("completion", "discovery", "fingerprint")
+
+
+class CooperatorStoppedError(TranscoderError):
+    def __init__(self, *args, **kwargs):
+        TranscoderError.__init__(self, *args, **kwargs)
+
+
+class _Task(object):
+
+    __slots__ = ("iterator", "deferred", "remaining")
+
+    def __init__(self, iterator, remaining):
+        self.iterator = iterator
+        self.deferred = Deferred()
+        self.remaining = remaining
+
+
+class MonitorCooperator(log.LoggerProxy):
+    """
+    Runs the iterations of the monitor tasks in the reactor thread,
+    without blocking it more than time_slice seconds at a time;
+    the reactor is given back for period seconds between the slices.
+
+    The tasks are queued in lanes; a lane is only served when the
+    lanes before it are empty, so the completion checks are never
+    delayed by the discovery of new files, and the discovery is never
+    delayed by the fingerprinting. The tasks of a lane are iterated
+    in turn. An iteration returning a deferred suspends its task
+    until the deferred is fired.
+
+    The delay between the planned and the real start of the slices
+    is measured as the reactor lag.
+    """
+
+    def __init__(self, logger, time_slice, period):
+        log.LoggerProxy.__init__(self, logger)
+        self.time_slice = time_slice
+        self.period = period
+        self._lanes = [deque() for n in LANE_NAMES]
+        self._backlogs = [0] * len(LANE_NAMES)
+        self._suspended = set()
+        self._delayed = None
+        self._planned = None
+        self._running = False
+        self._steps = 0
+        self._lag = 0.0
+        self._maxLag = 0.0
+
+    def start(self):
+        self._running = True
+        self._schedule(0)
+
+    def stop(self):
+        """
+        Stops the cooperator and drops the queued and suspended tasks,
+        their deferreds are errbacked with a CooperatorStoppedError.
+        """
+        self._running = False
+        if self._delayed is not None and self._delayed.active():
+            self._delayed.cancel()
+        self._delayed = None
+        tasks = list(self._suspended)
+        self._suspended.clear()
+        for lane in self._lanes:
+            tasks.extend(lane)
+            lane.clear()
+        self._backlogs = [0] * len(LANE_NAMES)
+        for task in tasks:
+            task.deferred.errback(CooperatorStoppedError(
+                "Monitor cooperator stopped"))
+
+    def cooperate(self, iterator, lane, size=1):
+        """
+        Queues an iterator in the given lane; size is the expected
+        number of iterations, only used for the backlog statistics.
+        Returns a deferred fired with None when the iterator is exhausted.
+        """
+        task = _Task(iter(iterator), max(1, size))
+        self._queue(lane, task)
+        return task.deferred
+
+    def call(self, lane, func, *args, **kwargs):
+        """
+        Queues a single call in the given lane.
+        Returns a deferred fired with the call result.
+        """
+        d = Deferred()
+        called = []
+        task = self.cooperate(self._iterCall(d, called, func, args, kwargs),
+                              lane)
+        task.addErrback(self._ebCallDropped, d, called)
+        return d
+
+    def getStats(self):
+        """
+        Returns (backlog by lane, suspended tasks, iterations done,
+                 average lag, maximum lag since the last call).
+        """
+        maxLag, self._maxLag = self._maxLag, 0.0
+        return (tuple(self._backlogs), len(self._suspended), self._steps,
+                self._lag, maxLag)
+
+    def sampleLag(self, lag):
+        """
+        Accounts a reactor lag measured by someone else,
+        so the lag is known even when the cooperator is idle.
+        """
+        lag = max(0.0, lag)
+        # Exponentially weighted average over about ten samples
+        self._lag += (lag - self._lag) * 0.1
+        self._maxLag = max(self._maxLag, lag)
+
+
+    ## Private Methods ##
+
+    def _iterCall(self, d, called, func, args, kwargs):
+        called.append(True)
+        try:
+            result = func(*args, **kwargs)
+        except:
+            d.errback(Failure())
+            return
+        if isinstance(result, Deferred):
+            result.chainDeferred(d)
+        else:
+            d.callback(result)
+        yield None
+
+    def _ebCallDropped(self, failure, d, called):
+        # Only the calls stopped before being done are left unfired
+        if not called:
+            d.errback(failure)
+
+    def _queue(self, lane, task):
+        self._lanes[lane].append(task)
+        self._backlogs[lane] += task.remaining
+        if self._delayed is None:
+            self._schedule(0)
+
+    def _schedule(self, delay):
+        if not self._running or self._delayed is not None:
+            return
+        self._planned = time.time() + delay
+        self._delayed = reactor.callLater(delay, self._tick)
+
+    def _tick(self):
+        self._delayed = None
+        start = time.time()
+        self.sampleLag(start - self._planned)
+        deadline = start + self.time_slice
+        while self._running:
+            lane = self._nextLane()
+            if lane is None:
+                return
+            queue = self._lanes[lane]
+            task = queue.popleft()
+            self._step(lane, task)
+            if time.time() >= deadline:
+                break
+        self._schedule(self.period)
+
+    def _nextLane(self):
+        for lane, queue in enumerate(self._lanes):
+            if queue:
+                return lane
+        return None
+
+    def _step(self, lane, task):
+        self._steps += 1
+        if task.remaining > 1:
+            task.remaining -= 1
+            self._backlogs[lane] -= 1
+        try:
+            result = task.iterator.next()
+        except StopIteration:
+            self._backlogs[lane] -= task.remaining
+            task.deferred.callback(None)
+            return
+        except:
+            self._backlogs[lane] -= task.remaining
+            task.deferred.errback(Failure())
+            return
+        if isinstance(result, Deferred):
+            self._suspended.add(task)
+            result.addBoth(self._resume, lane, task)
+            return
+        # Round robin between the tasks of the same lane
+        self._lanes[lane].append(task)
+
+    def _resume(self, result, lane, task):
+        if task not in self._suspended:
+            # Already errbacked by stop()
+            return None
+        self._suspended.remove(task)
+        if isinstance(result, Failure):
+            self._backlogs[lane] -= task.remaining
+            task.deferred.errback(result)
+            return None
+        self._lanes[lane].append(task)
+        if self._delayed is None:
+            self._schedule(0)
+        return None
@@ -18,7 +18,6 @@
 from twisted.internet.defer import fail
 
 from flumotion.component.transcoder import compconsts
-from flumotion.component.transcoder.watcher import DirectoryWatcher
 from flumotion.component.monitor.base import MonitorBase
 from flumotion.ovp.utils import safe_mkdirs
 from flumotion.transcoder.enums import MonitorFileStateEnum
@@ -41,7 +40,8 @@ class FileMonitor(MonitorBase):
 
     def do_setup(self):
         try:
-            self._scanPeriod = self._properties["scan-period"]
+            properties = self.config['properties']
+            self._scanPeriod = properties["scan-period"]
             self.do_setup_watchers()
         except:
             return fail(self._unexpected_error(task="component setup"))
@@ -49,17 +49,15 @@ class FileMonitor(MonitorBase):
     def do_stop(self, *args, **kwargs):
         while self.watchers:
             self.watchers.pop().stop()
+        return MonitorBase.do_stop(self)
 
     def do_setup_watchers(self):
-        for name, virt_dir in self._named_profiles.items():
+        for name in self.active_profiles:
+            virt_dir = self.profiles_virtualbase[name]
             local_dir = virt_dir.localize(self._local)
             safe_mkdirs(local_dir, "monitored", self._pathAttr)
-            watcher = DirectoryWatcher(self, local_dir, timeout=self._scanPeriod)
-            watcher.connect('file-added', self._file_added, virt_dir, name)
-            watcher.connect('file-completed', self._file_completed, virt_dir, name)
-            watcher.connect('file-removed', self._file_removed, virt_dir, name)
-            watcher.start()
-            self.watchers.append(watcher)
+            self.setup_directory_watcher(name, virt_dir, local_dir,
+                                         self._scanPeriod)
 
 
     ## Signal Handler Methods ##
@@ -68,19 +66,23 @@ class FileMonitor(MonitorBase):
         localFile = virt_base.append(file).localize(self._local)
         self.debug("File added : '%s'", localFile)
 
+        if self.set_file_as_growing(file, fileinfo, detection_time,
+                                    virt_base, profile_name):
+            return
         # put here the parameters
-        self._set_ui_item('pending-files', (profile_name, file),
-                         (MonitorFileStateEnum.downloading, fileinfo,
-                          detection_time, None, None, None))
+        self._set_pending_file((profile_name, file),
+                               MonitorFileStateEnum.downloading, fileinfo,
+                               detection_time)
 
     def _file_completed(self, watcher, file, fileinfo, virt_base, profile_name):
-        self.get_file_info(file, fileinfo, watcher.path, virt_base,
+        self.schedule_file_info(file, fileinfo, watcher.path, virt_base,
             profile_name=profile_name, params={})
         
 
     def _file_removed(self, watcher, file, virtBase, profile_name):
         localFile = virtBase.append(file).localize(self._local)
         self.debug("File removed '%s'", localFile)
-        self._del_ui_item('pending-files', (profile_name, file))
+        self._del_pending_file((profile_name, file))
+        self.forget_fingerprint(profile_name, localFile)
 
 
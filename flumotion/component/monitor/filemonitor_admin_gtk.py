@@ -19,6 +19,7 @@ import os
 import gtk
 
 from flumotion.transcoder.i18n import _
+from flumotion.transcoder.pendingfiles import PendingFilesMirror
 from flumotion.component.base.admin_gtk import BaseAdminGtk
 from flumotion.component.base.baseadminnode import BaseAdminGtkNode
 
@@ -33,6 +34,8 @@ class FileMonitorAdminGtkNode(BaseAdminGtkNode):
         self.view = None
         self.model = gtk.TreeStore(str, str)
         self.directories = {}
+        self.pending = PendingFilesMirror()
+        self._resyncing = False
 
     def error_dialog(self, message):
         # FIXME: dialogize
@@ -64,8 +67,32 @@ class FileMonitorAdminGtkNode(BaseAdminGtkNode):
         self.model.clear()
         for p in self.uiState.get("monitored-profiles").items():
             self._add_profile(p)
-        for i, fileinfo in self.uiState.get("pending-files").iteritems():
-            self._addFile(i, fileinfo[0])
+        self.pending.clear()
+        self._resync()
+
+    def _resync(self):
+        if self._resyncing:
+            return
+        self._resyncing = True
+        d = self.callRemote("getPendingFiles", self.pending.getSequence())
+        d.addCallback(self._cbResynced)
+        d.addErrback(self._ebResyncFailed)
+
+    def _cbResynced(self, result):
+        self._resyncing = False
+        self._updateFiles(self.pending.reset(*result))
+
+    def _ebResyncFailed(self, failure):
+        self._resyncing = False
+        self.warning("Failed to retrieve the pending files: %s",
+                     failure.getErrorMessage())
+
+    def _updateFiles(self, updated):
+        for key, old, new in updated:
+            if new is None:
+                self._removeFile(key)
+            else:
+                self._addFile(key, new[1])
 
     def _add_profile(self, profile):
         vdir = self.uiState.get('virtbase-map', {}).get(profile, None)
@@ -122,13 +149,15 @@ class FileMonitorAdminGtkNode(BaseAdminGtkNode):
         if key == "monitored-profiles":
             self._removeDirectory(value)
 
-    def stateSetitem(self, state, key, subkey, fileinfo):
-        if key == "pending-files":
-            self._addFile(subkey, fileinfo[0])
-
-    def stateDelitem(self, state, key, subkey, value):
-        if key == "pending-files":
-            self._removeFile(subkey)
+    def stateSet(self, state, key, value):
+        if key == "pending-changes" and value:
+            sequence, changes = value
+            if self._resyncing:
+                return
+            if self.pending.accept(sequence):
+                self._updateFiles(self.pending.apply(sequence, changes))
+            elif sequence > self.pending.getSequence():
+                self._resync()
 
 
 class FileMonitorAdminGtk(BaseAdminGtk):
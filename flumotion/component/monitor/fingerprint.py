@@ -0,0 +1,392 @@
+# -*- Mode: Python -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+# Flumotion - a streaming media server
+# Copyright (C) 2004,2005,2006,2007,2008,2009 Fluendo, S.L.
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+#
+# This file may be distributed and/or modified under the terms of
+# the GNU Lesser General Public License version 2.1 as published by
+# the Free Software Foundation.
+# This file is distributed without any warranty; without even the implied
+# warranty of merchantability or fitness for a particular purpose.
+# See "LICENSE.LGPL" in the source distribution for more information.
+#
+# Headers in this file shall remain intact.
+
+import os
+import time
+import heapq
+import threading
+
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, succeed
+from twisted.internet.task import LoopingCall
+from twisted.internet.threads import deferToThread, deferToThreadPool
+from twisted.python.failure import Failure
+from twisted.python.threadpool import ThreadPool
+
+from flumotion.inhouse import log
+
+from flumotion.transcoder.errors import TranscoderError
+
+
+class FingerprintPool(log.LoggerProxy):
+    """
+    Runs the files fingerprinting (mime type sniffing and checksum)
+    in a dedicated thread pool, so a burst of big files does not
+    starve the reactor thread pool used to move files and walk trees.
+
+    threads : number of files fingerprinted at the same time
+    budget : maximum sum of the sizes of the files being read at the
+             same time, in bytes; a file bigger than the budget
+             is read alone. None or 0 for no limit.
+    size_rate : bytes per second used to order the queue; a file waits
+                size / size_rate seconds more than an empty file would,
+                so small files go first without starving the big ones.
+    lookahead : number of queued files looked at when the next one does
+                not fit in the budget; the smaller files behind it
+                go first until it is due (see size_rate).
+    """
+
+    def __init__(self, logger, threads, budget=None, size_rate=None,
+                 lookahead=64):
+        log.LoggerProxy.__init__(self, logger)
+        self.threads = max(1, threads)
+        self.budget = budget
+        self.size_rate = size_rate
+        self.lookahead = lookahead
+        self._pool = self._createThreadPool()
+        self._queue = [] # heap of (priority, sequence, size, deferred, call)
+        self._sequence = 0
+        self._active = 0
+        self._activeBytes = 0
+        self._doneFiles = 0
+        self._doneBytes = 0
+        self._shutdownTrigger = None
+
+    def start(self):
+        if self._pool.started:
+            return
+        self._pool.start()
+        self._shutdownTrigger = reactor.addSystemEventTrigger(
+            'during', 'shutdown', self._shutdown)
+
+    def stop(self):
+        """
+        Returns a deferred fired when the files being
+        fingerprinted are done and the threads stopped.
+        """
+        if self._shutdownTrigger is not None:
+            reactor.removeSystemEventTrigger(self._shutdownTrigger)
+            self._shutdownTrigger = None
+        queue, self._queue = self._queue, []
+        for _, _, _, d, _ in queue:
+            d.errback(TranscoderError("Fingerprinting pool stopped"))
+        if not self._pool.started:
+            return succeed(None)
+        # Joining the threads waits for the files being read
+        pool, self._pool = self._pool, self._createThreadPool()
+        d = Deferred()
+        thread = threading.Thread(target=self._joinThreadPool,
+                                  args=(pool, d))
+        thread.setDaemon(True)
+        thread.start()
+        return d
+
+    def submit(self, size, func, *args, **kwargs):
+        """
+        Queues the call of func(*args, **kwargs) for a file of the given
+        size in bytes. Returns a deferred fired with the call result.
+        """
+        size = max(0, size or 0)
+        priority = time.time()
+        if self.size_rate:
+            priority += size / float(self.size_rate)
+        d = Deferred()
+        heapq.heappush(self._queue, (priority, self._sequence, size, d,
+                                     (func, args, kwargs)))
+        self._sequence += 1
+        self._dispatch()
+        return d
+
+    def getStats(self):
+        """
+        Returns (queued files, running files, running bytes,
+                 fingerprinted files, fingerprinted bytes).
+        """
+        return (len(self._queue), self._active, self._activeBytes,
+                self._doneFiles, self._doneBytes)
+
+
+    ## Private Methods ##
+
+    def _shutdown(self):
+        self._shutdownTrigger = None
+        return self.stop()
+
+    def _createThreadPool(self):
+        return ThreadPool(self.threads, self.threads, "fingerprint")
+
+    def _joinThreadPool(self, pool, d):
+        # Called from its own thread
+        pool.stop()
+        reactor.callFromThread(d.callback, None)
+
+    def _fits(self, size):
+        return ((not self._active) or (not self.budget)
+                or ((self._activeBytes + size) <= self.budget))
+
+    def _dispatch(self):
+        now = time.time()
+        skipped = []
+        while self._queue and (self._active < self.threads):
+            entry = heapq.heappop(self._queue)
+            priority, _, size, d, (func, args, kwargs) = entry
+            if not self._fits(size):
+                skipped.append(entry)
+                # The files behind a due one wait for it,
+                # so the big files are not starved
+                if (priority <= now) or (len(skipped) >= self.lookahead):
+                    break
+                continue
+            self._active += 1
+            self._activeBytes += size
+            job = deferToThreadPool(reactor, self._pool, func,
+                                    *args, **kwargs)
+            job.addBoth(self._jobDone, size, d)
+        for entry in skipped:
+            heapq.heappush(self._queue, entry)
+
+    def _jobDone(self, result, size, d):
+        self._active -= 1
+        self._activeBytes -= size
+        self._doneFiles += 1
+        self._doneBytes += size
+        self._dispatch()
+        if isinstance(result, Failure):
+            d.errback(result)
+        else:
+            d.callback(result)
+
+
+def getFileIdentity(statinfo):
+    """
+    Returns the (device, inode, size, mtime in nanoseconds) tuple
+    identifying a version of a file from the given os.stat result.
+    """
+    mtime_ns = getattr(statinfo, "st_mtime_ns", None)
+    if mtime_ns is None:
+        mtime_ns = int(round(statinfo.st_mtime * 1000000000))
+    return (statinfo.st_dev, statinfo.st_ino, statinfo.st_size, mtime_ns)
+
+
+class FingerprintCache(log.LoggerProxy):
+    """
+    Persistent cache of the files fingerprints (mime type and checksum)
+    keyed by the file identity (see getFileIdentity), so unchanged
+    files are not read again after a rescan or a restart.
+    A replaced or modified file gets a new identity and is not found.
+
+    The cache is a journal where each update is appended as a line;
+    a line truncated by a crash is ignored when loading.
+    When the journal has too many obsolete lines, it is rewritten
+    to a temporary file that is renamed over the journal.
+    When there is more than max_entries entries,
+    the least recently used ones are evicted.
+
+    The journal is read by load(), that can be called from a thread,
+    then open() must be called from the reactor thread. The updates are
+    written every flush_period seconds, and the journal is rewritten,
+    in the reactor thread pool, one write after the other.
+    The updates of the last period are lost by a crash.
+    A None mime type is written as an empty string.
+    """
+
+    def __init__(self, logger, path, max_entries, flush_period=5):
+        log.LoggerProxy.__init__(self, logger)
+        self.path = path
+        self.max_entries = max_entries
+        self.flush_period = flush_period
+        self._entries = {} # {identity: [mime, checksum, last use]}
+        self._paths = {} # {path: identity}
+        self._uses = 0
+        self._lines = 0
+        self._pending = [] # journal lines not written yet
+        self._writes = None # Deferred of the last scheduled write
+        self._flusher = None # LoopingCall
+        # Only used by the writes, from the thread pool
+        self._journal = None
+
+    def load(self):
+        """
+        Reads the journal; can be called from a thread.
+        """
+        self._entries = {}
+        self._lines = 0
+        try:
+            f = open(self.path, "r")
+        except IOError:
+            return
+        try:
+            for line in f:
+                self._lines += 1
+                if not line.endswith("\n"):
+                    # Truncated by a crash
+                    break
+                fields = line[:-1].split(" ", 6)
+                try:
+                    identity = tuple([int(v) for v in fields[1:5]])
+                    if fields[0] == "+" and len(fields) == 7:
+                        self._uses += 1
+                        self._entries[identity] = [fields[6] or None,
+                                                   fields[5], self._uses]
+                    elif fields[0] == "-":
+                        self._entries.pop(identity, None)
+                except ValueError:
+                    continue
+        finally:
+            f.close()
+        self.debug("Loaded %d fingerprints from '%s'",
+                   len(self._entries), self.path)
+
+    def open(self):
+        self._compact()
+        self._flusher = LoopingCall(self.flush)
+        self._flusher.start(self.flush_period, False)
+
+    def close(self):
+        """
+        Writes the pending updates and closes the journal.
+        Returns a deferred fired when done.
+        """
+        if self._flusher is not None:
+            if self._flusher.running:
+                self._flusher.stop()
+            self._flusher = None
+        self.flush()
+        d, self._writes = self._writes, None
+        if d is None:
+            d = succeed(None)
+        d.addCallback(self._closeJournal)
+        return d
+
+    def flush(self):
+        """
+        Schedules the writing of the pending updates.
+        """
+        if not self._pending:
+            return
+        lines, self._pending = self._pending, []
+        self._schedule(self._writeLines, lines)
+
+    def lookup(self, path, identity):
+        """
+        Returns (mime, checksum) for the given file identity or None.
+        """
+        entry = self._entries.get(identity)
+        if entry is None:
+            return None
+        self._paths[os.path.normpath(path)] = identity
+        self._uses += 1
+        entry[2] = self._uses
+        return entry[0], entry[1]
+
+    def store(self, path, identity, mime, checksum):
+        self._uses += 1
+        self._entries[identity] = [mime, checksum, self._uses]
+        self._paths[os.path.normpath(path)] = identity
+        self._append(_formatEntry(identity, mime, checksum))
+        if len(self._entries) > self.max_entries:
+            self._evict()
+        if self._lines > (2 * len(self._entries) + 1000):
+            self._compact()
+
+    def forget(self, path):
+        """
+        Forgets the fingerprint of a removed file.
+        """
+        identity = self._paths.pop(os.path.normpath(path), None)
+        if identity is None or identity not in self._entries:
+            return
+        del self._entries[identity]
+        self._append("- %d %d %d %d" % identity)
+
+    def getStats(self):
+        """
+        Returns (entries, updates not written yet).
+        """
+        return len(self._entries), len(self._pending)
+
+
+    ## Private Methods ##
+
+    def _evict(self):
+        excess = len(self._entries) - self.max_entries
+        # Evict a tenth more to not sort the entries on each store
+        count = excess + self.max_entries / 10
+        uses = [(e[2], i) for i, e in self._entries.iteritems()]
+        uses.sort()
+        for _, identity in uses[:count]:
+            del self._entries[identity]
+        self._paths = dict([(p, i) for p, i in self._paths.iteritems()
+                            if i in self._entries])
+        self.debug("Evicted %d fingerprints from '%s'", count, self.path)
+        self._compact()
+
+    def _compact(self):
+        # The pending updates are in the snapshot
+        self._pending = []
+        entries = [(e[2], i, e[0], e[1])
+                   for i, e in self._entries.iteritems()]
+        self._lines = len(entries)
+        self._schedule(self._writeJournal, entries)
+
+    def _append(self, line):
+        self._pending.append(line)
+        self._lines += 1
+
+    def _schedule(self, func, *args):
+        d = self._writes
+        if d is None:
+            d = succeed(None)
+        d.addCallback(lambda _: deferToThread(func, *args))
+        d.addErrback(self._ebWriteFailed)
+        self._writes = d
+
+    def _ebWriteFailed(self, failure):
+        self.warning("Fail to update fingerprint cache '%s': %s",
+                     self.path, log.getFailureMessage(failure))
+
+    def _closeJournal(self, _=None):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def _writeLines(self, lines):
+        # Called from the thread pool, like _writeJournal
+        if self._journal is None:
+            return
+        self._journal.write("".join([l + "\n" for l in lines]))
+        self._journal.flush()
+
+    def _writeJournal(self, entries):
+        self._closeJournal()
+        tmppath = self.path + ".tmp"
+        f = open(tmppath, "w")
+        try:
+            # Keep the use order when loading
+            entries.sort()
+            for _, identity, mime, checksum in entries:
+                f.write(_formatEntry(identity, mime, checksum) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            f.close()
+        os.rename(tmppath, self.path)
+        self._journal = open(self.path, "a")
+
+
+def _formatEntry(identity, mime, checksum):
+    return "+ %d %d %d %d %s %s" % (identity + (checksum, mime or ""))
@@ -3,7 +3,6 @@ import os
 from socket import gethostname
 
 from twisted.web.client import getPage
-from twisted.web.server import Site
 from twisted.web.resource import Resource
 from twisted.internet import reactor
 from twisted.internet.defer import fail
@@ -14,7 +13,10 @@ from flumotion.transcoder.enums import MonitorFileStateEnum
 from flumotion.ovp.utils import safe_mkdirs
 from flumotion.component.monitor.base import MonitorBase
 from flumotion.component.monitor.resource import RequestHandler
-from flumotion.component.transcoder.watcher import DirectoryWatcher
+from flumotion.component.monitor.upload import UploadSite, UploadResource
+from flumotion.component.monitor.upload import UPLOAD_CHILD
+from flumotion.component.monitor.batch import BatchRegistry, BatchResource
+from flumotion.component.monitor.batch import BATCH_CHILD
 
 
 class HttpMonitor(MonitorBase):
@@ -37,12 +39,32 @@ class HttpMonitor(MonitorBase):
             # setup the passive profiles
             if self.http_profiles:
                 root = Resource()
+                maxSize = properties.get("upload-max-size",
+                                         compconsts.UPLOAD_MAX_SIZE)
+                maxUploads = properties.get("upload-max-concurrent",
+                                            compconsts.UPLOAD_MAX_CONCURRENT)
+                maxFiles = properties.get("batch-max-files",
+                                          compconsts.BATCH_MAX_FILES)
+                maxImports = properties.get("batch-max-imports",
+                                            compconsts.BATCH_MAX_IMPORTS)
+                batches = BatchRegistry(maxImports)
                 for p in self.http_profiles:
                     vdir = self.profiles_virtualbase[p]
-                    root.putChild(p, RequestHandler(self, vdir, callback=self._file_added_http, profile_name=p))
+                    handler = RequestHandler(self, vdir, callback=self._file_added_http, profile_name=p)
+                    # streaming uploads to /PROFILE/upload/NAME
+                    handler.putChild(UPLOAD_CHILD,
+                                     UploadResource(self, vdir,
+                                                    callback=self._file_added_http,
+                                                    profile_name=p,
+                                                    max_size=maxSize))
+                    # batch submissions to /PROFILE/batch
+                    handler.putChild(BATCH_CHILD,
+                                     BatchResource(handler, batches,
+                                                   max_files=maxFiles))
+                    root.putChild(p, handler)
                     local_dir = vdir.localize(self._local)
                     safe_mkdirs(local_dir, "monitored")
-                factory = Site(root)
+                factory = UploadSite(root, maxUploads)
                 self.port = properties.get("port", 7680)
                 self._listener = IReactorTCP(reactor).listenTCP(self.port, factory)
                 if not self.port:
@@ -54,12 +76,8 @@ class HttpMonitor(MonitorBase):
                 vdir = self.profiles_virtualbase[p]
                 local_dir = vdir.localize(self._local)
                 safe_mkdirs(local_dir, "monitored", self._pathAttr)
-                watcher = DirectoryWatcher(self, local_dir, p, timeout=self._scanPeriod)
-                watcher.connect('file-added', self._file_added, vdir, p)
-                watcher.connect('file-completed', self._file_completed, vdir, p)
-                watcher.connect('file-removed', self._file_removed, vdir, p)
-                watcher.start()
-                self.watchers.append(watcher)
+                self.setup_directory_watcher(p, vdir, local_dir,
+                                             self._scanPeriod)
             setup_callback = properties.get('setup-callback')
             if setup_callback:
                 data = {'hostname': gethostname(), 'port': self.port}
@@ -80,6 +98,7 @@ class HttpMonitor(MonitorBase):
         for w in self.watchers:
             w.stop()
         self.watchers[:] = []
+        return MonitorBase.do_stop(self)
 
 
     ## Signal Handler Methods ##
@@ -87,33 +106,38 @@ class HttpMonitor(MonitorBase):
         localFile = virt_base.append(file).localize(self._local)
         self.debug("File added : '%s'", localFile)
 
+        if self.set_file_as_growing(file, fileinfo, detection_time,
+                                    virt_base, profile_name):
+            return
         # put here the parameters
-        self._set_ui_item('pending-files', (profile_name, file),
-                         (MonitorFileStateEnum.downloading, fileinfo,
-                          detection_time, None, None, None))
+        self._set_pending_file((profile_name, file),
+                               MonitorFileStateEnum.downloading, fileinfo,
+                               detection_time)
 
     def _file_completed(self, watcher, file, fileinfo, virt_base, profile_name):
-        self.get_file_info(file, fileinfo, watcher.path, virt_base,
+        self.schedule_file_info(file, fileinfo, watcher.path, virt_base,
             profile_name=profile_name, params={})
         
 
     def _file_removed(self, watcher, file, virtBase, profile_name):
         localFile = virtBase.append(file).localize(self._local)
         self.debug("File removed '%s'", localFile)
-        self._del_ui_item('pending-files', (profile_name, file))
+        self._del_pending_file((profile_name, file))
+        self.forget_fingerprint(profile_name, localFile)
 
 
 
     # a new request was received
-    def _file_added_http(self, _, file_path, file, fileinfo, detection_time,
-            virt_base, profile_name, params):
+    def _file_added_http(self, precomputed, file_path, file, fileinfo,
+            detection_time, virt_base, profile_name, params):
         local_file = virt_base.append(file).localize(self._local)
         self.debug("File added : '%s'", local_file)
         incoming_folder = os.path.dirname(file_path) + '/'
         # Set what we know in the UI. We'll set the rest after computing
         # the checksum
-        self._set_ui_item('pending-files', (profile_name, file),
-            (MonitorFileStateEnum.downloading, fileinfo, detection_time, None, None, params))
+        self._set_pending_file((profile_name, file),
+            MonitorFileStateEnum.downloading, fileinfo, detection_time,
+            params=params)
 
-        self.get_file_info(file, fileinfo, incoming_folder, virt_base,
-            profile_name=profile_name, params=params)
+        self.schedule_file_info(file, fileinfo, incoming_folder, virt_base,
+            profile_name=profile_name, params=params, precomputed=precomputed)
@@ -19,6 +19,7 @@ import os
 import gtk
 
 from flumotion.transcoder.i18n import _
+from flumotion.transcoder.pendingfiles import PendingFilesMirror
 from flumotion.component.base.admin_gtk import BaseAdminGtk
 from flumotion.component.base.baseadminnode import BaseAdminGtkNode
 
@@ -41,6 +42,8 @@ class HttpMonitorAdminGtkNode(BaseAdminGtkNode):
         self.view = None
         self.model = gtk.TreeStore(str, str)
         self.model_lookup = {}
+        self.pending = PendingFilesMirror()
+        self._resyncing = False
 
     def stateAppend(self, state, key, value):
         """ listens to uiState's "append" event """
@@ -52,23 +55,25 @@ class HttpMonitorAdminGtkNode(BaseAdminGtkNode):
         if key == "monitored-profiles":
             self._remove_profile(value)
 
-    def stateSetitem(self, state, key, subkey, fileinfo):
-        """ listens to uiState's "setitem" event """
-        if key == "pending-files":
-            self._add_file(subkey, fileinfo[0])
-
-    def stateDelitem(self, state, key, subkey, value):
-        """ listens to uiState's "delitem" event """
-        if key == "pending-files":
-            self._remove_file(subkey)
+    def stateSet(self, state, key, value):
+        """ listens to uiState's "set" event """
+        if key == "pending-changes" and value:
+            sequence, changes = value
+            if self._resyncing:
+                return
+            if self.pending.accept(sequence):
+                self._update_files(self.pending.apply(sequence, changes))
+            elif sequence > self.pending.getSequence():
+                self._resync()
 
     def setUIState(self, state):
         BaseAdminGtkNode.setUIState(self, state)
         self.model.clear()
+        self.model_lookup.clear()
+        self.pending.clear()
         for profile in self.uiState.get("monitored-profiles"):
             self.stateAppend(self.uiState, "monitored-profiles", profile)
-        for subkey, fileinfo in self.uiState.get("pending-files").items():
-            self.stateSetitem(self.uiState, "pending-files", subkey, fileinfo)
+        self._resync()
 
     #==========================================================================
     # Widget things
@@ -116,13 +121,37 @@ class HttpMonitorAdminGtkNode(BaseAdminGtkNode):
     def _remove_file(self, file):
         profile, name = file
         try:
-            del self.model[self.model_lookup[file]]
+            del self.model[self.model_lookup.pop(file)]
         except KeyError:
             if profile in self.model_lookup:
                 self.warning("Unknown file '%s'" % name)
             else:
                 self.warning("Unknown profile '%s'" % profile)
 
+    def _update_files(self, updated):
+        for file, old, new in updated:
+            if new is None:
+                self._remove_file(file)
+            else:
+                self._add_file(file, new[1])
+
+    def _resync(self):
+        if self._resyncing:
+            return
+        self._resyncing = True
+        d = self.callRemote("getPendingFiles", self.pending.getSequence())
+        d.addCallback(self._resynced)
+        d.addErrback(self._resync_failed)
+
+    def _resynced(self, result):
+        self._resyncing = False
+        self._update_files(self.pending.reset(*result))
+
+    def _resync_failed(self, failure):
+        self._resyncing = False
+        self.warning("Failed to retrieve the pending files: %s",
+                     failure.getErrorMessage())
+
     def _remove_profile(self, profile):
         try:
             del self.model[self.model_lookup[profile]]
@@ -5,15 +5,16 @@ Created on Jun 6, 2011
 '''
 import cgi
 import os
-import shutil
 from datetime import datetime
 
 from twisted.web.resource import Resource
 from twisted.internet.threads import deferToThread
+from twisted.internet.defer import succeed
 
 from flumotion.common import log
 
 from flumotion.component.transcoder import compconsts
+from flumotion.ovp.fileutils import import_file, magic_mimetype
 
 
 
@@ -44,10 +45,7 @@ class RequestHandler(Resource, log.Loggable):
             request.setResponseCode(500)
             return answer
 
-        if not file_path.startswith('/'):
-            #-------------------- Assume that the path is relative to virtDir
-            vir_file = self.virt_dir.append(file_path)
-            file_path = vir_file.localize(self.monitor._local)
+        file_path = self.localize_path(file_path)
 
         if not os.path.isfile(file_path):
             answer = ("<html><body>"
@@ -70,6 +68,33 @@ class RequestHandler(Resource, log.Loggable):
         if requested_profile:
             params.update({"profile-name": requested_profile})
 
+        d = self.submit_file(file_path, params)
+        d.addErrback(self._ebImportFailed, file_path)
+
+        answer = ("<html><body>"
+                  "<p>%s was queued for transcoding.</p>%s"
+                  "</body></html>") % (file_path, cue_string)
+        return answer
+
+    def localize_path(self, file_path):
+        """
+        Returns the local path of a submitted file,
+        relative paths being relative to the virtual directory.
+        """
+        if not file_path.startswith('/'):
+            #-------------------- Assume that the path is relative to virtDir
+            vir_file = self.virt_dir.append(file_path)
+            file_path = vir_file.localize(self.monitor._local)
+        return file_path
+
+    def submit_file(self, file_path, params, run=deferToThread):
+        """
+        Imports the file to the incoming directory, if not already there,
+        and queues it for transcoding. The import is done by calling
+        run(function, *args), returning a deferred.
+        Returns a deferred fired with the import method:
+        "reused", "link", "clone" or "copy".
+        """
         now = datetime.utcnow()
 
         file_name = os.path.basename(file_path)
@@ -79,17 +104,36 @@ class RequestHandler(Resource, log.Loggable):
         if (file_path == incoming_file):
             # FIXME: check that the file size isn't changing?
             self.debug("Reusing already existing file: %r" % file_path)
-            d = deferToThread(self.callback, None,
-                                      incoming_file, file_name,
-                                      None, now, self.virt_dir,
-                                      self.profile_name, params)
+            d = succeed(("reused", None))
         else:
-            self.debug("Copying %r to %r", file_path, incoming_file)
-            d = deferToThread(shutil.copy, file_path, incoming_file)
-            d.addCallback(self.callback, incoming_file, file_name,
-                          None, now, self.virt_dir, self.profile_name, params)
-
-        answer = ("<html><body>"
-                  "<p>%s was queued for transcoding.</p>%s"
-                  "</body></html>") % (file_path, cue_string)
-        return answer
+            self.debug("Importing %r to %r", file_path, incoming_file)
+            mode = self.monitor.get_fingerprint_mode(self.profile_name)
+            d = run(self._import_file, file_path, incoming_file, mode)
+            d.addCallback(self._cbFileImported, file_path, incoming_file)
+        d.addCallback(self._cbFileSubmitted, incoming_file, file_name,
+                      now, params)
+        return d
+
+    def _import_file(self, src, dest, mode):
+        # Called in a thread; hard links or clones the file if possible,
+        # otherwise copies it computing the fingerprint at the same time
+        method, chksum = import_file(src, dest, mode)
+        if chksum is None:
+            return method, None
+        return method, (magic_mimetype(dest), chksum)
+
+    def _cbFileImported(self, result, src, dest):
+        method, precomputed = result
+        self.debug("Imported %r to %r by %s", src, dest, method)
+        return result
+
+    def _cbFileSubmitted(self, result, incoming_file, file_name,
+                         now, params):
+        method, precomputed = result
+        self.callback(precomputed, incoming_file, file_name, None, now,
+                      self.virt_dir, self.profile_name, params)
+        return method
+
+    def _ebImportFailed(self, failure, src):
+        self.warning("Fail to import %r: %s", src,
+                     failure.getErrorMessage())
@@ -0,0 +1,357 @@
+# -*- Mode: Python -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+# Flumotion - a streaming media server
+# Copyright (C) 2004,2005,2006,2007,2008,2009 Fluendo, S.L.
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+#
+# This file may be distributed and/or modified under the terms of
+# the GNU Lesser General Public License version 2.1 as published by
+# the Free Software Foundation.
+# This file is distributed without any warranty; without even the implied
+# warranty of merchantability or fitness for a particular purpose.
+# See "LICENSE.LGPL" in the source distribution for more information.
+#
+# Headers in this file shall remain intact.
+
+"""
+Streaming uploads to the HTTP monitor.
+
+The body of a PUT (or raw POST) request to /PROFILE/upload/NAME is
+written to a temporary file of the profile's incoming directory as it
+is received, with the fingerprint computed on the fly. When the body
+is complete, the file is renamed to its final name and is handed to
+the monitor as completed; the body is never buffered in memory, and
+the reactor is never blocked waiting for a whole upload.
+"""
+
+import os
+import cgi
+import urllib
+import tempfile
+from datetime import datetime
+
+from twisted.internet.threads import deferToThread
+from twisted.web import http, server
+from twisted.web.resource import Resource
+
+from flumotion.common import log
+
+from flumotion.component.transcoder import compconsts
+from flumotion.ovp.fileutils import fingerprint, fingerprint_digest
+from flumotion.ovp.fileutils import format_fingerprint, magic_mimetype
+
+
+UPLOAD_CHILD = "upload"
+UPLOAD_SUFFIX = ".upload"
+
+
+class DiscardedBody(object):
+    """
+    Content of a rejected upload request, the body is dropped.
+    error is the (HTTP code, message) to answer.
+    """
+
+    def __init__(self, code, message):
+        self.error = (code, message)
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+
+    def seek(self, offset, whence=0):
+        pass
+
+    def read(self, size=-1):
+        return ""
+
+    def tell(self):
+        return self.size
+
+    def close(self):
+        pass
+
+
+class UploadFile(DiscardedBody):
+    """
+    Content of an upload request, writing the body in a temporary
+    file of the destination directory as it is received.
+    If the upload fails (too big, write error), the temporary file
+    is removed, the rest of the body is dropped and error is set.
+    If the request is closed before being committed (connection lost),
+    the temporary file is removed.
+    """
+
+    def __init__(self, dest, mode=None, max_size=None, pathAttr=None,
+                 closed=None):
+        DiscardedBody.__init__(self, None, None)
+        self.error = None
+        self.dest = dest
+        self.mode = mode
+        self.max_size = max_size
+        self._pathAttr = pathAttr
+        self._closed = closed
+        self._digest = None
+        if mode:
+            self._digest = fingerprint_digest(mode)
+        dirname, basename = os.path.split(dest)
+        fd, self.path = tempfile.mkstemp(suffix=UPLOAD_SUFFIX,
+                                         prefix=".%s." % basename,
+                                         dir=dirname)
+        self._file = os.fdopen(fd, "wb")
+        self._committing = False
+
+    def write(self, data):
+        self.size += len(data)
+        if self._file is None:
+            return
+        if self.max_size and (self.size > self.max_size):
+            self.fail(http.REQUEST_ENTITY_TOO_LARGE,
+                      "Upload bigger than %d bytes" % self.max_size)
+            return
+        try:
+            self._file.write(data)
+        except IOError, e:
+            self.fail(http.INTERNAL_SERVER_ERROR,
+                      "Fail to write upload: %s"
+                      % log.getExceptionMessage(e))
+            return
+        if self._digest is not None:
+            self._digest.update(data)
+
+    def fail(self, code, message):
+        self.error = (code, message)
+        self._discard()
+
+    def commit(self):
+        """
+        Renames the upload to its destination name in a thread.
+        Returns a deferred fired with the (mime, checksum) of the file.
+        """
+        self._committing = True
+        d = deferToThread(self._commit)
+        d.addBoth(self._cbCommitted)
+        return d
+
+    def close(self):
+        if not self._committing:
+            self._discard()
+
+
+    ## Private Methods ##
+
+    def _commit(self):
+        try:
+            self._file.close()
+            os.chmod(self.path, compconsts.UPLOAD_FILE_MODE)
+            if self._pathAttr:
+                self._pathAttr.apply(self.path)
+            os.rename(self.path, self.dest)
+        except:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            raise
+        if self._digest is not None:
+            chksum = format_fingerprint(self.mode, self._digest.hexdigest())
+        else:
+            chksum = fingerprint(self.dest, self.mode)
+        return (magic_mimetype(self.dest), chksum)
+
+    def _cbCommitted(self, result):
+        self._file = None
+        self._done()
+        return result
+
+    def _discard(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            self._done()
+
+    def _done(self):
+        if self._closed is not None:
+            closed, self._closed = self._closed, None
+            closed(self)
+
+
+class UploadRequest(server.Request):
+    """
+    Request giving the upload resources the chance to receive
+    the body instead of the default buffer (memory or temporary file).
+    """
+
+    def gotLength(self, length):
+        content = None
+        command = getattr(self.channel, "_command", None)
+        path = getattr(self.channel, "_path", None)
+        if command in ("PUT", "POST") and path:
+            content = self.channel.site.startUpload(self, path, length)
+        if content is None:
+            server.Request.gotLength(self, length)
+        else:
+            self.content = content
+
+
+class UploadSite(server.Site, log.Loggable):
+    """
+    Site routing the upload requests to their UploadResource
+    while their headers are received, and limiting the number
+    of uploads received at the same time.
+    """
+
+    logCategory = compconsts.HTTP_MONITOR_LOG_CATEGORY
+    requestFactory = UploadRequest
+
+    def __init__(self, resource, max_uploads=None, *args, **kwargs):
+        server.Site.__init__(self, resource, *args, **kwargs)
+        self.max_uploads = max_uploads
+        self._uploads = set()
+
+    def startUpload(self, request, path, length):
+        """
+        Returns the content receiving the body of the given request,
+        or None if it is not an upload.
+        """
+        path = path.split("?", 1)[0]
+        request.prepath = []
+        request.postpath = map(urllib.unquote, path[1:].split("/"))
+        resource = self.getResourceFor(request)
+        if not isinstance(resource, UploadResource):
+            return None
+        if self.max_uploads and (len(self._uploads) >= self.max_uploads):
+            self.warning("Too many uploads, rejecting '%s'", path)
+            return DiscardedBody(http.SERVICE_UNAVAILABLE,
+                                 "Too many uploads, retry later")
+        content = resource.startUpload(request, length, self._uploadDone)
+        if isinstance(content, UploadFile):
+            self._uploads.add(content)
+        return content
+
+    def getUploadCount(self):
+        return len(self._uploads)
+
+
+    ## Private Methods ##
+
+    def _uploadDone(self, upload):
+        self._uploads.discard(upload)
+
+
+class UploadResource(Resource, log.Loggable):
+    """
+    Receives the uploads of a profile, the remaining path
+    of the request being the name of the uploaded file.
+    """
+
+    logCategory = compconsts.HTTP_MONITOR_LOG_CATEGORY
+    isLeaf = True
+
+    def __init__(self, monitor, virt_dir, callback, profile_name=None,
+                 max_size=None):
+        Resource.__init__(self)
+        self.monitor = monitor
+        self.virt_dir = virt_dir
+        self.callback = callback
+        self.profile_name = profile_name
+        self.max_size = max_size
+
+    def startUpload(self, request, length, closed=None):
+        """
+        Returns the content receiving the body of the given request.
+        Called with the headers received, before the request is parsed.
+        """
+        file_name = "/".join(request.postpath)
+        if (not file_name or "/" in file_name
+            or file_name.startswith(".")):
+            return DiscardedBody(http.BAD_REQUEST,
+                                 "Invalid file name '%s'" % file_name)
+        if self.max_size and length and (length > self.max_size):
+            return DiscardedBody(http.REQUEST_ENTITY_TOO_LARGE,
+                                 "Upload bigger than %d bytes"
+                                 % self.max_size)
+        dest = self.virt_dir.append(file_name).localize(self.monitor._local)
+        mode = self.monitor.get_fingerprint_mode(self.profile_name)
+        try:
+            upload = UploadFile(dest, mode, self.max_size,
+                                self.monitor._pathAttr, closed)
+        except (IOError, OSError), e:
+            self.warning("Fail to create upload file for %r: %s", dest,
+                         log.getExceptionMessage(e))
+            return DiscardedBody(http.INTERNAL_SERVER_ERROR,
+                                 "Cannot create the file '%s'" % file_name)
+        self.debug("Receiving upload of %r", dest)
+        upload.started = datetime.utcnow()
+        return upload
+
+    def render_GET(self, request):
+        request.setResponseCode(http.NOT_ALLOWED)
+        return ("<html><body>"
+                "<p>Please use a PUT request.</p>"
+                "</body></html>")
+
+    def render_PUT(self, request):
+        upload = request.content
+        error = getattr(upload, "error", None)
+        if not isinstance(upload, DiscardedBody):
+            error = (http.INTERNAL_SERVER_ERROR, "Upload not received")
+        if error:
+            code, message = error
+            self.warning("Upload %s failed: %s", request.path, message)
+            request.setResponseCode(code)
+            return ("<html><body>"
+                    "<p>%s</p>"
+                    "</body></html>") % cgi.escape(message)
+
+        params = {"cue-points": None}
+        cue_points = request.args.get("cue-points", [None])[0]
+        if cue_points is not None:
+            params["cue-points"] = cgi.escape(cue_points)
+        if self.profile_name:
+            params["profile-name"] = self.profile_name
+
+        file_name = os.path.basename(upload.dest)
+        d = upload.commit()
+        d.addCallback(self._cbUploadCommitted, upload)
+        d.addCallback(self.callback, upload.dest, file_name, None,
+                      upload.started, self.virt_dir, self.profile_name,
+                      params)
+        d.addCallbacks(self._cbUploadQueued, self._ebUploadFailed,
+                       callbackArgs=(request, upload),
+                       errbackArgs=(request, upload))
+        return server.NOT_DONE_YET
+
+    render_POST = render_PUT
+
+
+    ## Private Methods ##
+
+    def _cbUploadCommitted(self, precomputed, upload):
+        self.debug("Received upload of %r, %d bytes",
+                   upload.dest, upload.size)
+        return precomputed
+
+    def _cbUploadQueued(self, _, request, upload):
+        if request._disconnected:
+            return
+        request.setResponseCode(http.CREATED)
+        request.write(("<html><body>"
+                       "<p>%s was queued for transcoding.</p>"
+                       "</body></html>")
+                      % cgi.escape(os.path.basename(upload.dest)))
+        request.finish()
+
+    def _ebUploadFailed(self, failure, request, upload):
+        self.warning("Fail to complete upload of %r: %s",
+                     upload.dest, failure.getErrorMessage())
+        if request._disconnected:
+            return
+        request.setResponseCode(http.INTERNAL_SERVER_ERROR)
+        request.write(("<html><body>"
+                       "<p>Fail to complete the upload.</p>"
+                       "</body></html>"))
+        request.finish()
@@ -17,17 +17,37 @@
 
 import os
 import stat
+import time
+import errno
 from datetime import datetime
 import gobject
 
-from twisted.internet import reactor
-from twisted.internet.defer import maybeDeferred
-from twisted.internet.interfaces import IReactorTime
-from twisted.internet.task import LoopingCall, Cooperator
+from twisted.internet.defer import maybeDeferred, DeferredList
+from twisted.internet.task import LoopingCall
 from twisted.internet.threads import deferToThread
 
 from flumotion.inhouse import log
 
+from flumotion.ovp import inotify, openfiles
+from flumotion.ovp.fileutils import is_network_filesystem
+from flumotion.component.monitor.cooperator import MonitorCooperator
+from flumotion.component.monitor.cooperator import CooperatorStoppedError
+from flumotion.component.monitor.cooperator import LANE_COMPLETION
+from flumotion.component.monitor.cooperator import LANE_DISCOVERY
+from flumotion.component.transcoder import compconsts
+
+
+# Events a directory is watched for by the InotifyWatcher
+INOTIFY_WATCH_MASK = (inotify.IN_CREATE | inotify.IN_CLOSE_WRITE
+                      | inotify.IN_MOVED_TO | inotify.IN_MOVED_FROM
+                      | inotify.IN_DELETE | inotify.IN_DELETE_SELF
+                      | inotify.IN_MOVE_SELF | inotify.IN_ONLYDIR)
+
+# Directory listings more recent than this (in seconds) compared to the
+# directory modification time are done again by the DirectoryWatcher,
+# to not miss changes with coarse mtime resolution (NFS, CIFS, ext3).
+DIRECTORY_MTIME_GRANULARITY = 2
+
 
 class Watcher(gobject.GObject, log.LoggerProxy):
     """
@@ -60,23 +80,44 @@ class Watcher(gobject.GObject, log.LoggerProxy):
             (gobject.TYPE_STRING,))
         }
 
-    def __init__(self, logger):
+    def __init__(self, logger, cooperator=None, owner=None):
+        """
+        cooperator : the MonitorCooperator used to process the changes,
+                     usually shared by all the watchers of a monitor;
+                     if None, the watcher uses its own.
+        owner : function called with the name of an entry of the watched
+                directory, returning False if the entry and everything
+                below it must be ignored; None to watch all the entries.
+        """
         gobject.GObject.__init__(self)
         log.LoggerProxy.__init__(self, logger)
+        self.owner = owner
+        self._ownCooperator = cooperator is None
+        if self._ownCooperator:
+            cooperator = MonitorCooperator(self,
+                                           compconsts.COOPERATOR_TIME_SLICE,
+                                           compconsts.COOPERATOR_PERIOD)
+        self.cooperator = cooperator
 
     def start(self):
         """
         Start the watcher.
         """
+        if self._ownCooperator:
+            self.cooperator.start()
 
     def stop(self):
         """
         Stop the watcher.
         """
+        if self._ownCooperator:
+            self.cooperator.stop()
 
-def scheduler(x):
-    """ Schedule the iterations for the cooperator """
-    return IReactorTime(reactor).callLater(0.02, x)
+    def owns(self, name):
+        """
+        Tells if an entry of the watched directory is watched.
+        """
+        return (self.owner is None) or self.owner(name)
 
 
 class PeriodicalWatcher(Watcher):
@@ -91,6 +132,7 @@ class PeriodicalWatcher(Watcher):
         self.looping_check = LoopingCall(self.check_for_changes)
 
     def start(self, reset=False):
+        Watcher.start(self)
         if not self.looping_check.running:
             self.looping_check.start(self.timeout, True)
         if reset:
@@ -99,6 +141,7 @@ class PeriodicalWatcher(Watcher):
     def stop(self):
         if self.looping_check.running:
             self.looping_check.stop()
+        Watcher.stop(self)
 
     def check_for_changes(self):
         self.log("Watching...")
@@ -115,17 +158,31 @@ class PeriodicalWatcher(Watcher):
     def list_files_ok(self, newfiles):
         self.log("Comparing new files (%d) to old files (%d)",
                  len(newfiles), len(self._files))
-        processor = self.process_files(self._files, newfiles)
-        # process the file comparison one at a time
-        cooperator = Cooperator(scheduler=scheduler)
-        cooperator.cooperate(processor)
+        old = self._files
+        added = set(newfiles).difference(old)
+        removed = set(old).difference(newfiles)
+        # The completed files don't need to be checked again
+        changed = [f for f in set(newfiles).intersection(old)
+                   if old[f] is not None]
+        # Process the file comparison one at a time; the completion
+        # checks go first, the files discovery after. The next scan
+        # waits for the comparison to be processed.
+        completion = self.cooperator.cooperate(
+            self.process_changed(old, newfiles, changed),
+            LANE_COMPLETION, len(changed))
+        discovery = self.cooperator.cooperate(
+            self.process_discovered(old, newfiles, added, removed),
+            LANE_DISCOVERY, len(added) + len(removed))
+        completion.addErrback(self.process_files_failed)
+        discovery.addErrback(self.process_files_failed)
+        return DeferredList([completion, discovery])
 
+    def process_files_failed(self, failure):
+        if failure.check(CooperatorStoppedError):
+            return
+        log.notifyFailure(self, failure, "Failure during file processing")
 
-    def process_files(self, old, new):
-        yield None
-        added = set(new).difference(old)
-        removed = set(old).difference(new)
-        changed = set(new).intersection(old)
+    def process_discovered(self, old, new, added, removed):
         for f in removed:
             self.log("File '%s' removed", f)
             self.emit('file-removed', f)
@@ -135,21 +192,35 @@ class PeriodicalWatcher(Watcher):
             self.log("File '%s' added", f)
             self.emit('file-added', f, new[f], datetime.utcnow())
             old[f] = new[f]
+            if self.is_completed(f, None, new[f]):
+                self.log("File '%s' completed", f)
+                self.emit('file-completed', f, new[f])
+                old[f] = None
             yield None
+
+    def process_changed(self, old, new, changed):
         for f in changed:
-            if old[f] == None:
-                pass
+            if old.get(f) is None:
+                continue
+            if self.is_completed(f, old[f], new[f]):
+                self.log("File '%s' completed", f)
+                self.emit('file-completed', f, new[f])
+                old[f] = None
             elif old[f][stat.ST_SIZE] != new[f][stat.ST_SIZE]:
                 self.log("File '%s' size change from %s to %s", f,
                     str(old[f][stat.ST_SIZE]),
                     str(new[f][stat.ST_SIZE]))
                 old[f] = new[f]
-            else:
-                self.log("File '%s' completed", f)
-                self.emit('file-completed', f, new[f])
-                old[f] = None
             yield None
 
+    def is_completed(self, f, old, new):
+        """
+        Returns True if the file with the given previous
+        and current stat tuples can be considered completed.
+        old is None for the files seen for the first time.
+        """
+        return (old is not None) and (old[stat.ST_SIZE] == new[stat.ST_SIZE])
+
     def list_files(self):
         """
         Returns a dict of filename->(stat tuple) mapping.
@@ -162,26 +233,217 @@ class DirectoryWatcher(PeriodicalWatcher):
     Directory Watcher
     Watches a directory for new files.
     path : path to check for new/removed files
+    full_scan_period : seconds between full verification scans,
+                       None or 0 to only rescan modified directories
+
+    completion_method : None to complete the files when their size
+                        did not change between two scans, or a method
+                        of flumotion.ovp.openfiles to complete them when
+                        they are not open for writing anymore
+    quiet_time : seconds a file not open for writing must not have been
+                 modified before being completed
+    check_period : seconds between the checks of the files not
+                   completed yet, when using a completion method
+
+    The listing of each directory is cached with the directory
+    modification time, so only the directories modified since the last
+    scan are listed again. In unmodified directories, only the files
+    that are not completed yet are stated again, to check their size.
+
+    With a completion method, the files are completed as soon as they
+    are closed by their writer and quiet, without waiting for the next
+    scan. When it cannot be known if a file is open (permissions,
+    network file system), the file size is checked between scans.
     """
     def __init__(self, logger, path, profile_name, *args, **kwargs):
+        full_scan_period = kwargs.pop('full_scan_period', None)
+        completion_method = kwargs.pop('completion_method', None)
+        quiet_time = kwargs.pop('quiet_time',
+                                compconsts.COMPLETION_QUIET_TIME)
+        check_period = kwargs.pop('check_period',
+                                  compconsts.COMPLETION_CHECK_PERIOD)
         PeriodicalWatcher.__init__(self, logger, *args, **kwargs)
         self.path = path
+        self.full_scan_period = full_scan_period
+        self.completion_method = completion_method
+        self.quiet_time = quiet_time
+        # {absolute dir path: (mtime, listing time, subdirs, {name: stat})}
+        self._dirs = {}
+        self._last_full_scan = None
+        self._scan_stats = (0, 0, 0, False)
+        # {relpath: True if open for writing, None if unknown,
+        #           or the precise mtime of a closed file}
+        self._writers = {}
+        self._checking = False
+        self.completion_check = None
+        if completion_method and check_period:
+            self.completion_check = LoopingCall(self.check_incomplete_files)
+            self.check_period = check_period
+
+    def start(self, reset=False):
+        if reset:
+            self._dirs = {}
+            self._last_full_scan = None
+            self._writers = {}
+        PeriodicalWatcher.start(self, reset)
+        self._checking = False
+        if self.completion_check and not self.completion_check.running:
+            self.completion_check.start(self.check_period, False)
+
+    def stop(self):
+        if self.completion_check and self.completion_check.running:
+            self.completion_check.stop()
+        PeriodicalWatcher.stop(self)
+
+    def is_completed(self, f, old, new):
+        writing = self._writers.get(f)
+        if writing is None:
+            return PeriodicalWatcher.is_completed(self, f, old, new)
+        if writing is True:
+            return False
+        return (time.time() - writing) >= self.quiet_time
+
+    def check_incomplete_files(self):
+        if self._checking:
+            return
+        relpaths = [f for f, s in self._files.iteritems() if s is not None]
+        if not relpaths:
+            return
+        self._checking = True
+        d = deferToThread(self.defer_check_files, relpaths)
+        d.addCallback(self._cbFilesChecked)
+        d.addErrback(self.list_files_failed)
+        d.addBoth(self._cbCheckDone)
+        return d
+
+    def defer_check_files(self, relpaths):
+        stats = {}
+        for relpath in relpaths:
+            try:
+                stats[relpath] = tuple(os.stat(self.path + relpath))
+            except OSError:
+                # Removed, the next scan will notice
+                continue
+        return stats, self.defer_check_writers(stats.keys())
+
+    def defer_check_writers(self, relpaths):
+        if not (self.completion_method and relpaths):
+            return {}
+        paths = dict([(self.path + f, f) for f in relpaths])
+        # The processes scan is shared with the other watchers
+        results = openfiles.checkWriters(paths.keys(),
+                                         self.completion_method,
+                                         compconsts.COMPLETION_SCAN_MAX_AGE)
+        writers = {}
+        for path, writing in results.iteritems():
+            if writing is False:
+                # The stat tuples only have a one second resolution
+                try:
+                    writing = os.stat(path).st_mtime
+                except OSError:
+                    writing = None
+            writers[paths[path]] = writing
+        return writers
 
     def list_files(self):
-        return deferToThread(self.defer_tree_walk, self.path)
+        full = False
+        now = time.time()
+        if (self._last_full_scan is None
+            or (self.full_scan_period
+                and (now - self._last_full_scan) >= self.full_scan_period)):
+            self._last_full_scan = now
+            full = True
+        # Completed files are snapshot here, the walk runs in a thread
+        completed = set([f for f, s in self._files.iteritems() if s is None])
+        return deferToThread(self.defer_scan, self.path, completed, full)
+
+    def defer_scan(self, start, completed=(), full=True):
+        file_list = self.defer_tree_walk(start, completed, full)
+        incomplete = [f for f in file_list if f not in completed]
+        self._writers = self.defer_check_writers(incomplete)
+        return file_list
 
-    def defer_tree_walk(self, start):
+    def defer_tree_walk(self, start, completed=(), full=True):
         file_list = {}
-        for root, dirs, files in os.walk(start):
-            for file in files:
-                abspath = os.path.join(root, file)
-                relpath = abspath[len(start):]
+        dirs = {}
+        listed = stated = 0
+        pending = [start]
+        while pending:
+            dirpath = pending.pop()
+            try:
+                mtime = os.stat(dirpath).st_mtime
+            except OSError:
+                continue
+            cached = self._dirs.get(dirpath)
+            if (not full and cached is not None and cached[0] == mtime
+                # A change in the same mtime tick as the listing
+                # would not be noticed, so recent listings are not trusted
+                and (cached[1] - mtime) > DIRECTORY_MTIME_GRANULARITY):
+                _, listtime, subdirs, cachedfiles = cached
+                entries = {}
+                for name, s in cachedfiles.iteritems():
+                    abspath = os.path.join(dirpath, name)
+                    if abspath[len(start):] not in completed:
+                        stated += 1
+                        try:
+                            s = tuple(os.stat(abspath))
+                        except OSError:
+                            continue
+                    entries[name] = s
+            else:
+                listed += 1
+                listtime = time.time()
                 try:
-                    file_list[relpath] = tuple(os.stat(abspath))
+                    names = os.listdir(dirpath)
                 except OSError:
                     continue
+                if dirpath == start:
+                    names = [n for n in names if self.owns(n)]
+                subdirs = []
+                entries = {}
+                for name in names:
+                    abspath = os.path.join(dirpath, name)
+                    stated += 1
+                    try:
+                        s = os.stat(abspath)
+                    except OSError:
+                        continue
+                    if stat.S_ISDIR(s.st_mode):
+                        # like os.walk, do not follow directory links
+                        if not os.path.islink(abspath):
+                            subdirs.append(abspath)
+                        continue
+                    entries[name] = tuple(s)
+            dirs[dirpath] = (mtime, listtime, subdirs, entries)
+            for name, s in entries.iteritems():
+                abspath = os.path.join(dirpath, name)
+                file_list[abspath[len(start):]] = s
+            pending.extend(subdirs)
+        self._dirs = dirs
+        self._scan_stats = (len(dirs), listed, stated, full)
         return file_list
 
+    def list_files_ok(self, newfiles):
+        total, listed, stated, full = self._scan_stats
+        self.log("%s scan: %d directories, %d listed, %d stat calls",
+                 full and "Full" or "Incremental", total, listed, stated)
+        return PeriodicalWatcher.list_files_ok(self, newfiles)
+
+
+    ## Private Methods ##
+
+    def _cbFilesChecked(self, result):
+        stats, writers = result
+        self._writers.update(writers)
+        # The files with an unknown writer state wait for the next scan
+        known = [f for f, w in writers.iteritems() if w is not None]
+        processor = self.process_changed(self._files, stats, known)
+        return self.cooperator.cooperate(processor, LANE_COMPLETION,
+                                         len(known))
+
+    def _cbCheckDone(self, _):
+        self._checking = False
+
 
 class FilesWatcher(PeriodicalWatcher):
     """
@@ -202,3 +464,358 @@ class FilesWatcher(PeriodicalWatcher):
                 continue
             results[filename] = tuple(os.stat(filename))
         return results
+
+
+class InotifyWatcher(Watcher):
+    """
+    Inotify Watcher
+    Watches a directory tree for new files using kernel notifications,
+    so the detection cost depends on the rate of change instead of
+    the size of the tree.
+    path : path to check for new/removed files
+
+    Emits the same signals than the DirectoryWatcher:
+    _ file-added on IN_CREATE
+    _ file-completed on IN_CLOSE_WRITE or when a file is moved in
+    _ file-removed on IN_DELETE or when a file is moved out
+
+    Files found by scanning (at startup, for new sub-directories
+    and after an event queue overflow) may have lost their events,
+    and hard linked files do not get any close event, so they are
+    completed when their size and modification time did not change
+    between two checks, like the DirectoryWatcher does.
+    """
+    def __init__(self, logger, path, profile_name=None, timeout=5,
+                 *args, **kwargs):
+        Watcher.__init__(self, logger, *args, **kwargs)
+        self.path = path
+        self.timeout = timeout
+        self._files = {} # {relpath: stat tuple or None when completed}
+        self._unstable = {} # {relpath: stat tuple}
+        self._watches = {} # {wd: absolute directory path}
+        self._pendingEvents = [] # events of not yet registered watches
+        self._scanQueue = [] # [absolute directory path]
+        self._scanning = False
+        self._checking = False
+        self._rootLost = False
+        self._notifier = None
+        self.looping_check = LoopingCall(self.check_unstable_files)
+
+    def start(self, reset=False):
+        if reset:
+            self._files = {}
+            self._unstable = {}
+        if self._notifier is not None:
+            return
+        Watcher.start(self)
+        # The processing may have been interrupted by a stop
+        self._checking = False
+        self._notifier = inotify.INotify(self._on_event)
+        self._notifier.startReading()
+        try:
+            self._watch_root()
+        except:
+            self._notifier.close()
+            self._notifier = None
+            raise
+        if not self.looping_check.running:
+            self.looping_check.start(self.timeout, False)
+
+    def stop(self):
+        if self.looping_check.running:
+            self.looping_check.stop()
+        if self._notifier is not None:
+            self._notifier.close()
+            self._notifier = None
+        self._watches.clear()
+        del self._pendingEvents[:]
+        del self._scanQueue[:]
+        Watcher.stop(self)
+
+    def check_unstable_files(self):
+        if self._rootLost and os.path.isdir(self.path):
+            self.debug("Monitored directory '%s' is back", self.path)
+            try:
+                self._watch_root()
+            except OSError, e:
+                self.warning("Cannot watch directory '%s': %s",
+                             self.path, log.getExceptionMessage(e))
+            return
+        if self._checking or not self._unstable:
+            return
+        self._checking = True
+        d = deferToThread(self.defer_stat_files, self._unstable.keys())
+        d.addCallbacks(self._cbFilesChecked, self._ebFilesCheckFailed)
+        return d
+
+    def defer_stat_files(self, relpaths):
+        results = {}
+        for relpath in relpaths:
+            try:
+                results[relpath] = tuple(os.stat(self.path + relpath))
+            except OSError:
+                results[relpath] = None
+        return results
+
+    def defer_tree_walk(self, notifier, start):
+        """
+        Adds a watch to each directory before listing it,
+        so no file created after the listing can be missed.
+        Returns the new watches and the files found.
+        """
+        watches = {}
+        file_list = {}
+        dirs = [start]
+        while dirs:
+            dirpath = dirs.pop()
+            try:
+                wd = notifier.addWatch(dirpath, INOTIFY_WATCH_MASK)
+            except OSError, e:
+                if e.errno == errno.ENOSPC:
+                    raise
+                continue
+            watches[wd] = dirpath
+            try:
+                names = os.listdir(dirpath)
+            except OSError:
+                continue
+            if dirpath == self.path:
+                names = [n for n in names if self.owns(n)]
+            for name in names:
+                abspath = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(abspath)
+                except OSError:
+                    continue
+                if stat.S_ISDIR(st.st_mode):
+                    if not os.path.islink(abspath):
+                        dirs.append(abspath)
+                    continue
+                file_list[abspath[len(self.path):]] = tuple(st)
+        return watches, file_list
+
+
+    ## Private Methods ##
+
+    def _watch_root(self):
+        wd = self._notifier.addWatch(self.path, INOTIFY_WATCH_MASK)
+        self._watches[wd] = self.path
+        self._rootLost = False
+        self._scan(self.path)
+
+    def _scan(self, dirpath):
+        if dirpath == self.path:
+            # A full scan supersedes all the pending ones
+            del self._scanQueue[:]
+        if dirpath not in self._scanQueue:
+            self._scanQueue.append(dirpath)
+        self._next_scan()
+
+    def _next_scan(self):
+        if self._scanning or not self._scanQueue or not self._notifier:
+            return
+        self._scanning = True
+        dirpath = self._scanQueue.pop(0)
+        self.log("Scanning '%s'", dirpath)
+        d = deferToThread(self.defer_tree_walk, self._notifier, dirpath)
+        d.addCallbacks(self._cbScanDone, self._ebScanFailed,
+                       callbackArgs=(dirpath,))
+
+    def _cbScanDone(self, result, dirpath):
+        self._scanning = False
+        if self._notifier is None:
+            return
+        watches, found = result
+        self._watches.update(watches)
+        prefix = dirpath[len(self.path):]
+        if prefix and not prefix.endswith('/'):
+            prefix += '/'
+        removed = [f for f in self._files
+                   if f.startswith(prefix) and f not in found]
+        self.log("Scan of '%s' found %d files (%d removed)",
+                 dirpath, len(found), len(removed))
+        processor = self._process_scan(removed, found)
+        d = self.cooperator.cooperate(processor, LANE_DISCOVERY,
+                                      len(removed) + len(found))
+        d.addCallbacks(self._cbScanProcessed, self._ebScanFailed)
+
+    def _cbScanProcessed(self, _):
+        # Replay the events received for the newly registered watches
+        events = self._pendingEvents
+        self._pendingEvents = []
+        for event in events:
+            self._on_event(*event)
+        self._next_scan()
+
+    def _ebScanFailed(self, failure):
+        self._scanning = False
+        if failure.check(CooperatorStoppedError):
+            return
+        log.notifyFailure(self, failure, "Failure during directory scan")
+        del self._pendingEvents[:]
+        self._next_scan()
+
+    def _process_scan(self, removed, found):
+        for f in removed:
+            self._remove_file(f)
+            yield None
+        for f, s in found.iteritems():
+            if f not in self._files:
+                self._add_file(f, s)
+                self._unstable[f] = s
+            elif self._files[f] is not None:
+                # The completion event may have been lost
+                self._unstable[f] = s
+            yield None
+
+    def _cbFilesChecked(self, results):
+        processor = self._process_checked(results)
+        d = self.cooperator.cooperate(processor, LANE_COMPLETION, len(results))
+        d.addCallbacks(self._cbCheckProcessed, self._ebFilesCheckFailed)
+
+    def _cbCheckProcessed(self, _):
+        self._checking = False
+
+    def _process_checked(self, results):
+        for f, s in results.iteritems():
+            old = self._unstable.get(f)
+            if old is None:
+                continue
+            if s is None:
+                self._remove_file(f)
+            elif ((s[stat.ST_SIZE] == old[stat.ST_SIZE])
+                  and (s[stat.ST_MTIME] == old[stat.ST_MTIME])):
+                self._complete_file(f, s)
+            else:
+                self.log("File '%s' size change from %s to %s", f,
+                         str(old[stat.ST_SIZE]), str(s[stat.ST_SIZE]))
+                self._unstable[f] = s
+            yield None
+
+    def _ebFilesCheckFailed(self, failure):
+        self._checking = False
+        if failure.check(CooperatorStoppedError):
+            return
+        log.notifyFailure(self, failure, "Failure during file checking")
+
+    def _on_event(self, wd, mask, cookie, name):
+        if mask & inotify.IN_Q_OVERFLOW:
+            self.warning("Inotify event queue overflow for '%s', "
+                         "rescanning", self.path)
+            self._scan(self.path)
+            return
+        dirpath = self._watches.get(wd)
+        if dirpath is None:
+            if self._scanning:
+                self._pendingEvents.append((wd, mask, cookie, name))
+            return
+        if mask & inotify.IN_IGNORED:
+            del self._watches[wd]
+            if dirpath == self.path:
+                self._lose_root()
+            return
+        if name is None:
+            if ((dirpath == self.path) and (mask & (inotify.IN_DELETE_SELF
+                                                    | inotify.IN_MOVE_SELF))):
+                self._lose_root()
+            return
+        if (dirpath == self.path) and not self.owns(name):
+            return
+        abspath = os.path.join(dirpath, name)
+        relpath = abspath[len(self.path):]
+        if mask & inotify.IN_ISDIR:
+            if mask & (inotify.IN_CREATE | inotify.IN_MOVED_TO):
+                self._scan(abspath)
+            elif mask & (inotify.IN_DELETE | inotify.IN_MOVED_FROM):
+                self._remove_tree(abspath)
+            return
+        if mask & inotify.IN_CREATE:
+            s = self._stat(abspath)
+            if s is not None and relpath not in self._files:
+                self._add_file(relpath, s)
+                # Hard links and files created without being written
+                # never get a close event, complete them when stable
+                self._unstable[relpath] = s
+        elif mask & (inotify.IN_CLOSE_WRITE | inotify.IN_MOVED_TO):
+            s = self._stat(abspath)
+            if s is not None:
+                if relpath not in self._files:
+                    self._add_file(relpath, s)
+                self._complete_file(relpath, s)
+        elif mask & (inotify.IN_DELETE | inotify.IN_MOVED_FROM):
+            self._remove_file(relpath)
+
+    def _lose_root(self):
+        if self._rootLost:
+            return
+        self.warning("Monitored directory '%s' has been removed "
+                     "or moved", self.path)
+        self._rootLost = True
+        for f in self._files.keys():
+            self._remove_file(f)
+
+    def _stat(self, abspath):
+        try:
+            return tuple(os.stat(abspath))
+        except OSError:
+            return None
+
+    def _add_file(self, f, s):
+        self.log("File '%s' added", f)
+        self._files[f] = s
+        self.emit('file-added', f, s, datetime.utcnow())
+
+    def _complete_file(self, f, s):
+        self._unstable.pop(f, None)
+        if self._files.get(f, True) is None:
+            # Already completed
+            return
+        self.log("File '%s' completed", f)
+        self._files[f] = None
+        self.emit('file-completed', f, s)
+
+    def _remove_file(self, f):
+        self._unstable.pop(f, None)
+        if f not in self._files:
+            return
+        self.log("File '%s' removed", f)
+        del self._files[f]
+        self.emit('file-removed', f)
+
+    def _remove_tree(self, abspath):
+        prefix = abspath[len(self.path):] + '/'
+        for f in [f for f in self._files if f.startswith(prefix)]:
+            self._remove_file(f)
+        dirprefix = abspath + '/'
+        for wd, dirpath in self._watches.items():
+            if dirpath == abspath or dirpath.startswith(dirprefix):
+                del self._watches[wd]
+                try:
+                    self._notifier.removeWatch(wd)
+                except OSError:
+                    pass
+
+
+def createDirectoryWatcher(logger, path, profile_name, backend,
+                           full_scan_period=None, completion_method=None,
+                           quiet_time=None, *args, **kwargs):
+    """
+    Creates the directory watcher for the given backend name.
+    The "auto" backend uses inotify when the system supports it,
+    unless the path is on a network file system, where the changes
+    made by the other hosts are not notified.
+    full_scan_period, completion_method and quiet_time are only used
+    by the polling watcher, inotify already tells when files are closed.
+    """
+    if backend == compconsts.WATCHER_BACKEND_AUTO:
+        if inotify.isAvailable() and not is_network_filesystem(path):
+            backend = compconsts.WATCHER_BACKEND_INOTIFY
+        else:
+            backend = compconsts.WATCHER_BACKEND_POLLING
+    if backend == compconsts.WATCHER_BACKEND_INOTIFY:
+        return InotifyWatcher(logger, path, profile_name, *args, **kwargs)
+    if quiet_time is not None:
+        kwargs['quiet_time'] = quiet_time
+    return DirectoryWatcher(logger, path, profile_name, *args,
+                            full_scan_period=full_scan_period,
+                            completion_method=completion_method, **kwargs)
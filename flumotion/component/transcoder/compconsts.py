@@ -25,6 +25,91 @@ MAX_INTERLEAVE = 2
 
 SMOOTH_UPTDATE_DELAY = 0.2
 
+# Monitor directory watcher backends
+WATCHER_BACKEND_POLLING = "polling"
+WATCHER_BACKEND_INOTIFY = "inotify"
+WATCHER_BACKEND_AUTO = "auto"
+DEFAULT_WATCHER_BACKEND = WATCHER_BACKEND_POLLING
+# Period in second of the polling watcher full verification scans;
+# in between, only the modified directories are listed again.
+# Set to 0 to disable the full scans.
+POLLING_FULL_SCAN_PERIOD = 3600
+# Polling watcher completion detection method, "none" or one of
+# flumotion.ovp.openfiles methods to complete the files as soon as
+# they are not open for writing anymore, instead of waiting for
+# their size to be the same on two scans.
+COMPLETION_METHOD_NONE = "none"
+DEFAULT_COMPLETION_METHOD = COMPLETION_METHOD_NONE
+# Seconds a file not open for writing anymore must not have been
+# modified before being completed
+COMPLETION_QUIET_TIME = 3
+# Period in second of the checks of the files not completed yet
+COMPLETION_CHECK_PERIOD = 2
+# Maximum age in second of a scan of the processes open files
+# reused by the completion checks of all the monitor watchers
+COMPLETION_SCAN_MAX_AGE = COMPLETION_CHECK_PERIOD
+
+# Maximum time in second the monitors process files in the reactor
+# thread before giving it back, and the time given back in second
+COOPERATOR_TIME_SLICE = 0.01
+COOPERATOR_PERIOD = 0.01
+
+# Maximum files moved to another device at the same time by the monitors
+MOVE_COPY_THREADS = 4
+
+# Period in second of the monitors pending files changes publication;
+# the changes done in between are coalesced in a single batch.
+PENDING_FILES_PUBLISH_PERIOD = 0.5
+# Number of published batches a monitor remembers to resynchronize
+# the clients that missed some; older clients get all the files.
+PENDING_FILES_HISTORY = 240
+
+# Monitor fingerprinting (mime type and checksum) pool
+FINGERPRINT_THREADS = 4
+# Maximum bytes of the files being fingerprinted at the same time
+FINGERPRINT_BUDGET = 1024 * 1024 * 1024
+# Bytes per second used to give precedence to small files
+FINGERPRINT_SIZE_RATE = 50 * 1024 * 1024
+# Monitor statistics (fingerprinting, cooperator) update period in second
+MONITOR_STATS_PERIOD = 2
+# Fingerprint cache directory, relative to flumotion cache directory
+FINGERPRINT_CACHE_DIR = "transcoder-fingerprints"
+# Maximum number of fingerprints cached by monitored directory
+FINGERPRINT_CACHE_SIZE = 100000
+# Period in second of the fingerprint cache journal writes
+FINGERPRINT_CACHE_FLUSH_PERIOD = 5
+
+# HTTP monitor uploads maximum size in bytes, 0 for no limit
+UPLOAD_MAX_SIZE = 20 * 1024 * 1024 * 1024
+# Maximum number of uploads received at the same time by a monitor
+UPLOAD_MAX_CONCURRENT = 256
+# Access mode of the uploaded files, before applying the path attributes
+UPLOAD_FILE_MODE = 0644
+
+# HTTP monitor batches maximum number of files
+BATCH_MAX_FILES = 10000
+# Maximum number of files imported at the same time by a monitor
+BATCH_MAX_IMPORTS = 4
+# Seconds the results of a batch are kept for its idempotency key
+BATCH_KEY_TTL = 24 * 3600
+# Maximum number of idempotency keys remembered by a monitor
+BATCH_MAX_KEYS = 10000
+
+# Transcoding of the source files still being written (growing profiles):
+# period in second of the checks of the source file size and writers
+GROWING_CHECK_PERIOD = 1
+# Seconds a source file not open for writing anymore must not have been
+# modified before being complete
+GROWING_QUIET_TIME = 3
+# Seconds a source file must not have been modified before being complete
+# when its writers cannot be told (no completion method, remote writer)
+GROWING_UNKNOWN_QUIET_TIME = 30
+# Maximum seconds a source file still open for writing may not grow
+GROWING_STALL_TIMEOUT = 600
+# Maximum time in second the source element waits for more data
+# before checking again if the source file is complete
+GROWING_READ_WAIT = 0.5
+
 # Falling back thumbnailing interval in second
 FALLING_BACK_THUMBS_PERIOD_VALUE = 1
 
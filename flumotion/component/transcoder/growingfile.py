@@ -0,0 +1,226 @@
+# -*- Mode: Python -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+# Flumotion - a streaming media server
+# Copyright (C) 2004,2005,2006,2007,2008,2009 Fluendo, S.L.
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+#
+# This file may be distributed and/or modified under the terms of
+# the GNU Lesser General Public License version 2.1 as published by
+# the Free Software Foundation.
+# This file is distributed without any warranty; without even the implied
+# warranty of merchantability or fitness for a particular purpose.
+# See "LICENSE.LGPL" in the source distribution for more information.
+#
+# Headers in this file shall remain intact.
+
+"""
+Transcoding of source files still being written.
+
+The files of the growing profiles are handed to the transcoder as soon
+as they are detected. Only the streamable container formats, that can
+be demuxed from their head without an index at their end, are
+transcoded while being written; the other files are transcoded as usual
+when complete.
+"""
+
+import os
+import time
+
+from twisted.internet import reactor, threads
+
+from flumotion.inhouse import log, defer
+
+from flumotion.ovp import openfiles
+
+from flumotion.transcoder.errors import TranscoderError
+from flumotion.component.transcoder import compconsts
+
+
+# Source types (as found by the source analysis)
+# that can be transcoded while being written
+STREAMABLE_TYPES = set(["video/mpegts",
+                        "video/mpeg",
+                        "video/x-flv",
+                        "video/x-matroska",
+                        "video/webm",
+                        "video/x-dv",
+                        "application/ogg",
+                        "audio/ogg",
+                        "video/ogg",
+                        "audio/mpeg",
+                        "application/x-id3"])
+
+
+def isStreamable(mimeType):
+    """
+    Returns True if a source of the given type
+    can be transcoded while being written.
+    """
+    if not mimeType:
+        return False
+    return mimeType.split(";", 1)[0].strip().lower() in STREAMABLE_TYPES
+
+
+def getCompletionMethod(method):
+    """
+    Returns the flumotion.ovp.openfiles method to use on this
+    system to tell if a growing file is complete, or None if
+    only its size can tell.
+    """
+    if (not method) or (method == compconsts.COMPLETION_METHOD_NONE):
+        return None
+    if method not in openfiles.METHODS:
+        return None
+    if not openfiles.isAvailable(method):
+        return None
+    if method in (openfiles.METHOD_LEASE, openfiles.METHOD_AUTO):
+        # The files are checked from threads, only
+        # the main thread can ignore the lease breaks
+        openfiles.ignoreLeaseBreaks()
+    return method
+
+
+class GrowingFile(log.LoggerProxy):
+    """
+    Follows a file still being written until it is complete.
+    The file is complete when not open for writing anymore and not
+    modified for quietTime seconds, or, if its writers cannot be
+    told, when not modified for unknownQuietTime seconds.
+    If the file is not modified for stallTimeout seconds while still
+    open for writing, or if it is removed, it is stalled.
+    """
+
+    def __init__(self, logger, path, method=None,
+                 quietTime=compconsts.GROWING_QUIET_TIME,
+                 unknownQuietTime=compconsts.GROWING_UNKNOWN_QUIET_TIME,
+                 stallTimeout=compconsts.GROWING_STALL_TIMEOUT,
+                 period=compconsts.GROWING_CHECK_PERIOD):
+        log.LoggerProxy.__init__(self, logger)
+        self.path = path
+        self.method = getCompletionMethod(method)
+        self.quietTime = quietTime
+        self.unknownQuietTime = unknownQuietTime
+        self.stallTimeout = stallTimeout
+        self.period = period
+        self._identity = None
+        self._size = None
+        self._lastChange = None
+        self._complete = False
+        self._error = None
+        self._call = None
+        self._running = False
+        self._checking = False
+        self._waiters = []
+
+    def start(self):
+        if self._complete or self._error:
+            return
+        self.debug("Following source file '%s' while it is written, "
+                   "completion method: %s", self.path, self.method)
+        self._lastChange = time.time()
+        self._running = True
+        self._schedule(0)
+
+    def stop(self):
+        self._running = False
+        if self._call and self._call.active():
+            self._call.cancel()
+        self._call = None
+
+    def isComplete(self):
+        return self._complete
+
+    def getSize(self):
+        return self._size
+
+    def wait(self):
+        """
+        Returns a deferred fired with the file size when the file
+        is complete, or failed with a TranscoderError if it stalled.
+        """
+        if self._complete:
+            return defer.succeed(self._size)
+        if self._error:
+            return defer.fail(self._error)
+        d = defer.Deferred()
+        self._waiters.append(d)
+        return d
+
+
+    ## Private Methods ##
+
+    def _schedule(self, delay):
+        self._call = reactor.callLater(delay, self._check)
+
+    def _check(self):
+        self._call = None
+        if self._checking:
+            return
+        self._checking = True
+        d = threads.deferToThread(self._stat, self.path, self.method)
+        d.addCallbacks(self._cbChecked, self._ebCheckFailed)
+
+    def _stat(self, path, method):
+        """
+        Called in a thread, returns the file identity
+        and if it is open for writing (True, False or None).
+        """
+        st = os.stat(path)
+        writing = None
+        if method:
+            writing = openfiles.checkWriters([path], method)[path]
+        return (st.st_size, st.st_mtime), writing
+
+    def _cbChecked(self, result):
+        self._checking = False
+        if not self._running:
+            return
+        identity, writing = result
+        now = time.time()
+        if identity != self._identity:
+            self._identity = identity
+            self._size = identity[0]
+            self._lastChange = now
+        quiet = now - self._lastChange
+        if writing is None:
+            if quiet >= self.unknownQuietTime:
+                self._completed()
+                return
+        elif not writing:
+            if quiet >= self.quietTime:
+                self._completed()
+                return
+        elif quiet >= self.stallTimeout:
+            self._failed(TranscoderError("Source file '%s' stalled while "
+                                         "being written" % self.path))
+            return
+        if self._call is None:
+            self._schedule(self.period)
+
+    def _ebCheckFailed(self, failure):
+        self._checking = False
+        if not self._running:
+            return
+        self._failed(TranscoderError("Cannot follow source file '%s' "
+                                     "being written: %s"
+                                     % (self.path, failure.getErrorMessage()),
+                                     cause=failure))
+
+    def _completed(self):
+        self.debug("Source file '%s' complete, %s bytes",
+                   self.path, self._size)
+        self._complete = True
+        self.stop()
+        waiters, self._waiters = self._waiters, []
+        for d in waiters:
+            d.callback(self._size)
+
+    def _failed(self, error):
+        self.warning("%s", str(error))
+        self._error = error
+        self.stop()
+        waiters, self._waiters = self._waiters, []
+        for d in waiters:
+            d.errback(error)
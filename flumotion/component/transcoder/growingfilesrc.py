@@ -0,0 +1,170 @@
+# -*- Mode: Python -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+# Flumotion - a streaming media server
+# Copyright (C) 2004,2005,2006,2007,2008,2009 Fluendo, S.L.
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+#
+# This file may be distributed and/or modified under the terms of
+# the GNU Lesser General Public License version 2.1 as published by
+# the Free Software Foundation.
+# This file is distributed without any warranty; without even the implied
+# warranty of merchantability or fitness for a particular purpose.
+# See "LICENSE.LGPL" in the source distribution for more information.
+#
+# Headers in this file shall remain intact.
+
+import threading
+
+import gst
+import gobject
+
+from flumotion.component.transcoder import compconsts
+
+
+class GrowingFileSrc(gst.BaseSrc):
+    """
+    Reads a file still being written. At the end of the file,
+    the streaming thread waits for more data instead of sending EOS,
+    until the 'complete' property is set. Only works in push mode,
+    the file cannot be seeked.
+    """
+
+    __gstdetails__ = ('GrowingFileSrc', 'Source/File',
+                      'Read from a file still being written',
+                      'Flumotion Dev Team')
+
+    __gproperties__ = {
+        'location': (str,
+                     'Location',
+                     'Location of the file to read',
+                     None, gobject.PARAM_READWRITE),
+        'complete': (bool,
+                     'Complete',
+                     'The file is complete, its end is the end of stream',
+                     False, gobject.PARAM_READWRITE),
+        }
+
+    __gsttemplates__ = (
+        gst.PadTemplate("src",
+                        gst.PAD_SRC,
+                        gst.PAD_ALWAYS,
+                        gst.caps_new_any()),
+        )
+
+    def __init__(self, name=None):
+        gst.BaseSrc.__init__(self)
+        if name:
+            self.set_name(name)
+        self.location = None
+        self._file = None
+        self._position = 0
+        self._complete = False
+        self._flushing = False
+        self._waiting = False
+        self._cond = threading.Condition()
+
+    def isWaiting(self):
+        """
+        Returns True if the streaming thread is waiting
+        for the file to grow.
+        """
+        return self._waiting
+
+    def do_get_property(self, property):
+        if property.name == "location":
+            return self.location
+        elif property.name == "complete":
+            return self._complete
+        raise AttributeError('unknown property %s' % property.name)
+
+    def do_set_property(self, property, value):
+        if property.name == "location":
+            self.location = value
+        elif property.name == "complete":
+            self._cond.acquire()
+            try:
+                self._complete = value
+                self._cond.notifyAll()
+            finally:
+                self._cond.release()
+        else:
+            raise AttributeError('unknown property %s' % property.name)
+
+    def do_start(self):
+        try:
+            self._file = open(self.location, "rb")
+        except IOError, e:
+            self.error("Cannot open '%s': %s" % (self.location, str(e)))
+            return False
+        self._position = 0
+        return True
+
+    def do_stop(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+        return True
+
+    def do_is_seekable(self):
+        return False
+
+    def do_unlock(self):
+        self._cond.acquire()
+        try:
+            self._flushing = True
+            self._cond.notifyAll()
+        finally:
+            self._cond.release()
+        return True
+
+    def do_unlock_stop(self):
+        self._cond.acquire()
+        try:
+            self._flushing = False
+        finally:
+            self._cond.release()
+        return True
+
+    def do_create(self, offset, size):
+        if offset != self._position:
+            self._file.seek(offset)
+            self._position = offset
+        while True:
+            data = self._file.read(size)
+            if data:
+                self._waiting = False
+                return gst.FLOW_OK, self._makeBuffer(data)
+            self._cond.acquire()
+            try:
+                if self._flushing:
+                    self._waiting = False
+                    return gst.FLOW_WRONG_STATE, None
+                if self._complete:
+                    # The file may have grown before being complete
+                    self._waiting = False
+                    self._file.seek(self._position)
+                    data = self._file.read(size)
+                    if not data:
+                        return gst.FLOW_UNEXPECTED, None
+                    return gst.FLOW_OK, self._makeBuffer(data)
+                self._waiting = True
+                self._cond.wait(compconsts.GROWING_READ_WAIT)
+            finally:
+                self._cond.release()
+            # Clear the end of file condition before reading again
+            self._file.seek(self._position)
+
+
+    ## Private Methods ##
+
+    def _makeBuffer(self, data):
+        buffer = gst.Buffer(data)
+        buffer.offset = self._position
+        self._position += len(data)
+        buffer.offset_end = self._position
+        return buffer
+
+
+gobject.type_register(GrowingFileSrc)
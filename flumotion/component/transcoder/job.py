@@ -33,6 +33,8 @@ from flumotion.common import enum
 from flumotion.inhouse import process, log, defer, utils, fileutils
 from flumotion.inhouse.errors import FlumotionError
 
+from flumotion.ovp.fileutils import magic_description
+
 from flumotion.transcoder import enums
 from flumotion.transcoder.enums import TargetTypeEnum
 from flumotion.transcoder.enums import JobStateEnum
@@ -43,6 +45,8 @@ from flumotion.component.transcoder import basetargets, transtargets, thumbtarge
 from flumotion.component.transcoder.context import Context, TaskContext
 from flumotion.component.transcoder.context import TargetContext
 from flumotion.component.transcoder.transcoder import MediaTranscoder
+from flumotion.component.transcoder.growingfile import GrowingFile
+from flumotion.component.transcoder.growingfile import isStreamable
 
 #FIXME: get ride of having to set a TaskContext as TranscoderError data
 
@@ -109,6 +113,7 @@ class TranscodingJob(log.LoggerProxy):
         self._acknowledged = False
         self._analyst = analyst.MediaAnalyst()
         self._transcoder = None
+        self._growingSource = None
         self._runningState = RunningState.initializing
         self._stopping = False
         self._stoppingDefer = None
@@ -160,12 +165,8 @@ class TranscodingJob(log.LoggerProxy):
         if os.path.exists(inputPath):
             # The input file size
             sourceCtx.reporter.report.fileSize = os.stat(inputPath).st_size
-            # The input file type (with the file command)
-            try:
-                arg = utils.mkCmdArg(inputPath)
-                fileType = commands.getoutput("file -bL" + arg)
-            except Exception, e:
-                fileType = "ERROR: %s" % str(e)
+            # The input file type (like the file command)
+            fileType = magic_description(inputPath)
             sourceCtx.reporter.report.fileType = fileType
 
             try:
@@ -269,6 +270,8 @@ class TranscodingJob(log.LoggerProxy):
                 abortDefs.append(self._transcoder.abort())
             # if there is pending analysis, try to abort them
             abortDefs.append(self._analyst.abort())
+            # stop following the source file being written
+            self.__stopGrowingSource()
             # if there is running process, try to abort them
             for process in self._processes:
                 abortDefs.append(process.abort())
@@ -573,13 +576,93 @@ class TranscodingJob(log.LoggerProxy):
         sourceCtx = context.getSourceContext()
         inputPath = sourceCtx.getInputPath()
         analyseTimeout = compconsts.SOURCE_ANALYSE_TIMEOUT
-        d = self._analyst.analyse(inputPath, timeout=analyseTimeout)
         args = (context,)
+        method = sourceCtx.config.growingCompletion
+        if method and (self._growingSource is None):
+            # The source file is still being written
+            self._growingSource = GrowingFile(context, inputPath, method)
+            self._growingSource.start()
+            if sourceCtx.config.cuePoints or sourceCtx.config.preProcess:
+                context.info("Source file with cue points or pre-processing, "
+                             "waiting for it to be complete")
+                return self.__waitGrowingSource(None, context)
+            d = self._analyst.analyse(inputPath, timeout=analyseTimeout)
+            d.addCallbacks(self.__cbGrowingSourceAnalyzed,
+                           self.__waitGrowingSource,
+                           callbackArgs=args, errbackArgs=args)
+            return d
+        d = self._analyst.analyse(inputPath, timeout=analyseTimeout)
         d.addCallbacks(self.__cbSourceFileAnalyzed,
                        self.__ebSourceFileNotAMedia,
                        callbackArgs=args, errbackArgs=args)
         return d
 
+    ### Called by Deferreds ###
+    def __cbGrowingSourceAnalyzed(self, analyse, context):
+        if self._isStopping(): return
+        if not isStreamable(analyse.mimeType):
+            context.info("Source file type %s cannot be transcoded "
+                         "while being written, waiting for it to be "
+                         "complete", analyse.mimeType)
+            return self.__waitGrowingSource(None, context)
+        context.info("Transcoding source file of type %s while "
+                     "it is being written", analyse.mimeType)
+        return self.__cbSourceFileAnalyzed(analyse, context)
+
+    ### Called by Deferreds ###
+    def __waitGrowingSource(self, failure, context):
+        """
+        Waits for the source file to be complete, and analyses it again.
+        """
+        if self._isStopping(): return
+        if failure:
+            context.info("Source file analysis failed while it is "
+                         "being written, waiting for it to be complete: %s",
+                         log.getFailureMessage(failure))
+        d = self._growingSource.wait()
+        d.addCallback(self.__cbGrowingSourceComplete, context)
+        d.addCallback(self.__cbAnalyseSourceFile, context)
+        return d
+
+    ### Called by Deferreds ###
+    def __cbGrowingSourceComplete(self, size, context):
+        sourceCtx = context.getSourceContext()
+        sourceCtx.reporter.report.fileSize = size
+        return None
+
+    ### Called by Deferreds ###
+    def __bbGrowingSourceTranscoded(self, result, context):
+        complete = self._growingSource.isComplete()
+        if complete:
+            size = self._growingSource.getSize()
+            self.__cbGrowingSourceComplete(size, context)
+        self.__stopGrowingSource()
+        if isinstance(result, Failure) or not complete or self._isStopping():
+            return result
+        # The source was analysed before being complete,
+        # its duration and the sourceDuration variable were too short
+        sourceCtx = context.getSourceContext()
+        analyseTimeout = compconsts.SOURCE_ANALYSE_TIMEOUT
+        args = (context,)
+        d = self._analyst.analyse(sourceCtx.getInputPath(),
+                                  timeout=analyseTimeout)
+        d.addCallbacks(self.__cbSourceFileAnalyzed,
+                       self.__ebCompleteSourceNotAnalyzed,
+                       callbackArgs=args, errbackArgs=args)
+        d.addCallback(defer.overrideResult, result)
+        return d
+
+    ### Called by Deferreds ###
+    def __ebCompleteSourceNotAnalyzed(self, failure, context):
+        context.warning("Complete source file analysis failed, keeping "
+                        "the analysis done while it was written: %s",
+                        log.getFailureMessage(failure))
+        return None
+
+    def __stopGrowingSource(self):
+        if self._growingSource:
+            self._growingSource.stop()
+
     ### Called by Deferreds ###
     def __cbSourceFileAnalyzed(self, analyse, context):
         sourceCtx = context.getSourceContext()
@@ -676,9 +759,12 @@ class TranscodingJob(log.LoggerProxy):
         context.reporter.startUsageMeasure("transcoding")
         stallTimeout = context.config.transcodingTimeout
         p = {"cue-points": sourceCtx.config.cuePoints}
+        growing = self._growingSource
         d = transcoder.start(sourceCtx.getInputPath(), p, sourceAnalysis,
-                             timeout=stallTimeout)
+                             timeout=stallTimeout, growingSource=growing)
         self._transcoder = transcoder
+        if growing and not growing.isComplete():
+            d.addBoth(self.__bbGrowingSourceTranscoded, context)
         d.addBoth(_stopMeasureCallback, context.reporter, "transcoding")
         d.addCallback(defer.overrideResult, result)
         return d
@@ -33,6 +33,7 @@ from flumotion.component.transcoder import compconsts
 from flumotion.component.transcoder import analyst
 from flumotion.component.transcoder.watcher import FilesWatcher
 from flumotion.component.transcoder.cuepointsfilesrc import CuePointsFileSrc
+from flumotion.component.transcoder.growingfilesrc import GrowingFileSrc
 
 
 class ITranscoderProducer(Interface):
@@ -108,12 +109,15 @@ class MediaTranscoder(log.LoggerProxy):
         self._progressCallback = progressCB
         self._sourcePath = None
         self._cuePoints = None
+        self._growingSource = None
+        self._source = None
         self._sourceAnalysis = None
         self._analyst = None
         self._pipeline = None
         self._bus = None
         self._watcher = None
         self._started = False
+        self._playing = False
         self._aborted = False
         self._deferred = None
         self._progressSetup = False
@@ -135,10 +139,15 @@ class MediaTranscoder(log.LoggerProxy):
     def getProducers(self):
         return self._producers.keys()
 
-    def start(self, sourcePath, params=None, sourceAnalysis=None, timeout=30):
+    def start(self, sourcePath, params=None, sourceAnalysis=None, timeout=30,
+              growingSource=None):
         """
         Start transcoding and return a defer.Deferred
         that will be call when all producer terminate.
+        If the source file is still being written, growingSource is the
+        growingfile.GrowingFile following it; the source is then read
+        until the file is complete, and the outputs are not considered
+        stalled while the transcoding waits for the source to grow.
         """
         if self._aborted: return
         self.__checkIfStarted()
@@ -154,6 +163,8 @@ class MediaTranscoder(log.LoggerProxy):
         self._sourcePath = sourcePath
         self._cuePoints = params.get("cue-points", None)
         self._stallTimeout = timeout
+        if growingSource and not growingSource.isComplete():
+            self._growingSource = growingSource
         self._deferred = defer.Deferred()
 
         # Analyse the source media if needed
@@ -220,7 +231,16 @@ class MediaTranscoder(log.LoggerProxy):
             # Only process the first message, prevent multiple call to __failed
             # if more than one producer timeout at the same time
             watcher.stop()
-            if self._watcher == None:
+            if self._watcher is not watcher:
+                return
+            if self.__isWaitingForSource():
+                # The outputs cannot grow while the source waits for its
+                # writer, the source itself is followed by the growing file
+                self.log("Output file '%s' not growing while waiting "
+                         "for the source file to grow", file)
+                # The watcher is rescheduled after this callback
+                utils.callNext(watcher.stop)
+                self.__startWatcher()
                 return
             self._watcher = None
             producer = self._monitoredFiles.get(file, None)
@@ -338,7 +358,12 @@ class MediaTranscoder(log.LoggerProxy):
 
     def __onPipelinePlaying(self):
         utils.cancelTimeout(self._playStateTimeout)
-        self.__startProgress()
+        self._playing = True
+        if self._source and not self._source.get_property("complete"):
+            # The duration is not known until the source is complete
+            self.__fireProgressCallback(None)
+        else:
+            self.__startProgress()
         self.__firePlayingCallback()
 
     def __shutdownPipeline(self):
@@ -350,6 +375,7 @@ class MediaTranscoder(log.LoggerProxy):
         if self._pipeline:
             self._pipeline.set_state(gst.STATE_NULL)
         self._pipeline = None
+        self._source = None
         if self._watcher:
             self._watcher.stop()
             self._watcher = None
@@ -433,8 +459,15 @@ class MediaTranscoder(log.LoggerProxy):
             self.debug("CUE POINTS: %r", dbin)
             pipeline.add(dbin)
         else:
-            src = gst.element_factory_make("filesrc")
-            src.props.location = self._sourcePath
+            if self._growingSource:
+                self.debug("Reading source file '%s' while it is written",
+                           self._sourcePath)
+                src = GrowingFileSrc()
+                src.set_property("location", self._sourcePath)
+                self._source = src
+            else:
+                src = gst.element_factory_make("filesrc")
+                src.props.location = self._sourcePath
             dbin = gst.element_factory_make("decodebin2")
             pipeline.add(src, dbin)
             src.link(dbin)
@@ -497,12 +530,40 @@ class MediaTranscoder(log.LoggerProxy):
                 assert not (path in self._monitoredFiles)
                 self._monitoredFiles[path] = producer
 
+        self.__startWatcher()
+
+        if self._source:
+            d = self._growingSource.wait()
+            d.addCallbacks(self.__cbSourceComplete, self.__ebSourceStalled)
+
+    def __startWatcher(self):
         self._watcher = FilesWatcher(self, self._monitoredFiles.keys(),
                                      timeout=self._stallTimeout)
         self._watcher.connect('file-completed', self._watcher_callback)
         self._watcher.connect('file-not-present', self._watcher_callback)
         self._watcher.start()
 
+    def __isWaitingForSource(self):
+        return ((self._source is not None)
+                and not self._source.get_property("complete")
+                and self._source.isWaiting())
+
+    def __cbSourceComplete(self, size):
+        if self._aborted or (self._source is None): return
+        self.debug("Source file '%s' complete (%s bytes), "
+                   "reading it to the end", self._sourcePath, size)
+        self._source.set_property("complete", True)
+        # The outputs had no chance to grow while waiting for the source
+        if self._watcher:
+            self._watcher.stop()
+            self.__startWatcher()
+        if self._playing:
+            self.__startProgress()
+
+    def __ebSourceStalled(self, failure):
+        if self._aborted or (self._source is None): return
+        self.__failed(failure)
+
     def __finalizeProducers(self):
         if self._aborted: return
         self.log('Finalizing transcoding pipeline')
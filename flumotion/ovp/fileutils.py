@@ -4,8 +4,46 @@ Created on Jun 7, 2011
 @author: strioni
 '''
 from flumotion.ovp import hashlib
+from flumotion.ovp import libmagic
 from flumotion.inhouse.utils import mkCmdArg
 import commands
+import errno
+import fcntl
+import os
+import shutil
+import zlib
+
+# Fingerprint modes
+FINGERPRINT_MD5 = "md5"
+FINGERPRINT_SAMPLED = "sampled-md5"
+FINGERPRINT_ADLER32 = "adler32"
+FINGERPRINT_CRC32 = "crc32"
+FINGERPRINT_MODES = (FINGERPRINT_MD5, FINGERPRINT_SAMPLED,
+                     FINGERPRINT_ADLER32, FINGERPRINT_CRC32)
+
+# Size and number of the strided blocks of the sampled fingerprint,
+# in addition to the head and the tail of the file
+SAMPLE_BLOCK_SIZE = 1 << 20
+SAMPLE_BLOCKS = 16
+
+# Linux ioctl cloning a file (reflink) on btrfs, xfs, ocfs2...
+FICLONE = 0x40049409
+
+# File systems shared between hosts, where the kernel of a host
+# does not see the changes and the open files of the other hosts
+NETWORK_FILESYSTEMS = set(["nfs", "nfs4", "cifs", "smbfs", "smb3", "ncpfs",
+                           "afs", "ceph", "glusterfs", "fuse.glusterfs",
+                           "fuse.sshfs", "9p", "lustre", "gpfs", "gfs2",
+                           "ocfs2"])
+MOUNTS_PATH = "/proc/mounts"
+
+# Errors that make import_file() clone or copy instead of linking
+_LINK_FALLBACK_ERRORS = (errno.EXDEV, errno.EPERM, errno.EACCES,
+                         errno.EMLINK, errno.ENOTSUP, errno.EOPNOTSUPP)
+# Errors that make import_file() copy instead of cloning
+_CLONE_FALLBACK_ERRORS = (errno.EXDEV, errno.EINVAL, errno.ENOTTY,
+                          errno.ENOTSUP, errno.EOPNOTSUPP, errno.ENOSYS,
+                          errno.EPERM)
 
 def checksum(path):
     """ Computes the md5 checksum of the file """
@@ -15,15 +53,211 @@ def checksum(path):
     h = hashlib.md5()
     SIZE = 1 << 16
     fd = open(path, "rb")
-    for chunk in iter(lambda: fd.read(SIZE), ""):
-        h.update(chunk)
+    try:
+        for chunk in iter(lambda: fd.read(SIZE), ""):
+            h.update(chunk)
+    finally:
+        fd.close()
     return h.hexdigest()
-    fd.close()
 
-def magic_mimetype(path):
+def sampled_checksum(path, block_size=SAMPLE_BLOCK_SIZE, blocks=SAMPLE_BLOCKS):
+    """
+    Computes the md5 of the file size, the head and tail blocks
+    and the given number of blocks evenly spread in between.
+    Files smaller than the sampled blocks are completely read.
+    """
+    if not path:
+        raise ValueError("'path' must be an absolute path.")
+    size = os.path.getsize(path)
+    h = hashlib.md5()
+    h.update("%d\n" % size)
+    fd = open(path, "rb")
+    try:
+        if size <= block_size * (blocks + 2):
+            for chunk in iter(lambda: fd.read(block_size), ""):
+                h.update(chunk)
+        else:
+            last = size - block_size
+            stride = last / (blocks + 1)
+            for i in range(blocks + 2):
+                fd.seek(min(i * stride, last))
+                h.update(fd.read(block_size))
+    finally:
+        fd.close()
+    return h.hexdigest()
+
+class ChainedChecksum(object):
+    """ hashlib-like object for zlib.adler32 and zlib.crc32 """
+
+    def __init__(self, function):
+        self._function = function
+        self._value = function("")
+
+    def update(self, data):
+        self._value = self._function(data, self._value)
+
+    def hexdigest(self):
+        return "%08x" % (self._value & 0xffffffff)
+
+def fingerprint_digest(mode):
+    """
+    Returns a hashlib-like object computing the fingerprint value
+    from the file data, or None if the mode does not read
+    the whole file sequentially.
+    """
+    if mode == FINGERPRINT_MD5:
+        return hashlib.md5()
+    if mode == FINGERPRINT_ADLER32:
+        return ChainedChecksum(zlib.adler32)
+    if mode == FINGERPRINT_CRC32:
+        return ChainedChecksum(zlib.crc32)
+    if mode == FINGERPRINT_SAMPLED:
+        return None
+    raise ValueError("Unknown fingerprint mode '%s'" % mode)
+
+def format_fingerprint(mode, value):
+    if mode == FINGERPRINT_MD5:
+        return value
+    return "%s:%s" % (mode, value)
+
+def fingerprint(path, mode=FINGERPRINT_MD5):
+    """
+    Computes the fingerprint of the file with the given mode.
+    The md5 fingerprint is the same than checksum(), the others
+    are prefixed by the mode, so fingerprints computed with
+    different modes never compare equal.
+    """
+    if mode == FINGERPRINT_MD5:
+        return checksum(path)
+    if mode == FINGERPRINT_SAMPLED:
+        return format_fingerprint(mode, sampled_checksum(path))
+    digest = fingerprint_digest(mode)
+    SIZE = 1 << 20
+    fd = open(path, "rb")
+    try:
+        for chunk in iter(lambda: fd.read(SIZE), ""):
+            digest.update(chunk)
+    finally:
+        fd.close()
+    return format_fingerprint(mode, digest.hexdigest())
+
+def import_file(src, dest, mode=None):
+    """
+    Makes the file src available as dest, trying in order to
+    hard link it, to clone it (reflink) and to copy it.
+    The file is first imported with a temporary name in the destination
+    directory then renamed, so dest is never seen partially written,
+    and an existing dest is replaced without being modified.
+    Returns (method, fingerprint) with method one of "link", "clone"
+    or "copy". The fingerprint is only computed while copying,
+    if mode is specified and reads the whole file, otherwise it is None.
+    """
+    dirname, basename = os.path.split(dest)
+    tmp = os.path.join(dirname, ".%s.import" % basename)
+    if os.path.lexists(tmp):
+        os.unlink(tmp)
+    try:
+        method, value = _import_file(src, tmp, mode)
+        os.rename(tmp, dest)
+    finally:
+        # Renaming a link to the same file does nothing
+        if os.path.lexists(tmp):
+            os.unlink(tmp)
+    return method, value
+
+def _import_file(src, dest, mode):
+    try:
+        os.link(src, dest)
+        return "link", None
+    except OSError, e:
+        if e.errno not in _LINK_FALLBACK_ERRORS:
+            raise
+    digest = None
+    if mode:
+        digest = fingerprint_digest(mode)
+    fsrc = open(src, "rb")
+    try:
+        fdest = open(dest, "wb")
+        try:
+            try:
+                fcntl.ioctl(fdest.fileno(), FICLONE, fsrc.fileno())
+                method, digest = "clone", None
+            except IOError, e:
+                if e.errno not in _CLONE_FALLBACK_ERRORS:
+                    raise
+                method = "copy"
+                SIZE = 1 << 20
+                for chunk in iter(lambda: fsrc.read(SIZE), ""):
+                    fdest.write(chunk)
+                    if digest is not None:
+                        digest.update(chunk)
+        finally:
+            fdest.close()
+    finally:
+        fsrc.close()
+    shutil.copymode(src, dest)
+    if digest is None:
+        return method, None
+    return method, format_fingerprint(mode, digest.hexdigest())
+
+def fingerprint_mode(value):
+    """ Returns the mode of a fingerprint computed by fingerprint() """
+    if value and ":" in value:
+        return value.split(":", 1)[0]
+    return FINGERPRINT_MD5
+
+def filesystem_type(path, mounts_path=MOUNTS_PATH):
+    """
+    Returns the type of the file system holding the given path,
+    or None if it cannot be known.
+    """
+    path = os.path.realpath(path)
+    try:
+        f = open(mounts_path)
+    except IOError:
+        return None
+    best, fstype = None, None
+    try:
+        for line in f:
+            fields = line.split()
+            if len(fields) < 3:
+                continue
+            # Spaces and tabs are escaped as octal
+            mount = fields[1].decode("string_escape")
+            if not ((path == mount) or (mount == "/")
+                    or path.startswith(mount.rstrip("/") + "/")):
+                continue
+            # The last of the stacked mounts wins
+            if (best is None) or (len(mount) >= len(best)):
+                best, fstype = mount, fields[2]
+    finally:
+        f.close()
+    return fstype
+
+def is_network_filesystem(path, mounts_path=MOUNTS_PATH):
+    """
+    Returns True if the given path is on a file system shared
+    between hosts, False if not or if it cannot be known.
+    """
+    return filesystem_type(path, mounts_path) in NETWORK_FILESYSTEMS
+
+def _file_command(options, path):
     try:
         arg = mkCmdArg(path)
-        mime_type = commands.getoutput("file -biL" + arg)
+        return commands.getoutput("file %s" % options + arg)
     except Exception, e:
-        mime_type = "ERROR: %s" % str(e)
+        return "ERROR: %s" % str(e)
+
+def magic_mimetype(path):
+    """ Same than "file -biL", without spawning a process if possible """
+    mime_type = libmagic.getMimeType(path)
+    if mime_type is None:
+        mime_type = _file_command("-biL", path)
     return mime_type
+
+def magic_description(path):
+    """ Same than "file -bL", without spawning a process if possible """
+    description = libmagic.getDescription(path)
+    if description is None:
+        description = _file_command("-bL", path)
+    return description
@@ -0,0 +1,177 @@
+# -*- Mode: Python -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+# Flumotion - a streaming media server
+# Copyright (C) 2004,2005,2006,2007,2008,2009 Fluendo, S.L.
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+#
+# This file may be distributed and/or modified under the terms of
+# the GNU Lesser General Public License version 2.1 as published by
+# the Free Software Foundation.
+# This file is distributed without any warranty; without even the implied
+# warranty of merchantability or fitness for a particular purpose.
+# See "LICENSE.LGPL" in the source distribution for more information.
+#
+# Headers in this file shall remain intact.
+
+"""
+Minimal ctypes binding of the Linux inotify API,
+integrated with the twisted reactor.
+
+Unlike twisted.internet.inotify, the raw events are given to the
+callback, including the queue overflow events (wd == -1) that
+twisted silently drops, so the user can fall back to a full rescan.
+"""
+
+import os
+import errno
+import fcntl
+import struct
+import ctypes
+import ctypes.util
+
+from twisted.internet import abstract, fdesc, main
+from twisted.python.failure import Failure
+
+
+IN_ACCESS = 0x00000001
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_CLOSE_NOWRITE = 0x00000010
+IN_OPEN = 0x00000020
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_UNMOUNT = 0x00002000
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_MASK_ADD = 0x20000000
+IN_ISDIR = 0x40000000
+IN_ONESHOT = 0x80000000
+
+IN_MOVE = IN_MOVED_FROM | IN_MOVED_TO
+IN_CLOSE = IN_CLOSE_WRITE | IN_CLOSE_NOWRITE
+
+EVENT_HEADER = "iIII"
+EVENT_HEADER_SIZE = struct.calcsize(EVENT_HEADER)
+
+
+_libc = None
+
+
+def _getLibC():
+    global _libc
+    if _libc is None:
+        name = ctypes.util.find_library("c")
+        libc = ctypes.CDLL(name, use_errno=True)
+        libc.inotify_init.argtypes = []
+        libc.inotify_init.restype = ctypes.c_int
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                           ctypes.c_uint32]
+        libc.inotify_add_watch.restype = ctypes.c_int
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        libc.inotify_rm_watch.restype = ctypes.c_int
+        _libc = libc
+    return _libc
+
+
+def isAvailable():
+    """
+    Returns True if the inotify API can be used on this system.
+    """
+    try:
+        libc = _getLibC()
+        fd = libc.inotify_init()
+    except (OSError, AttributeError, TypeError):
+        return False
+    if fd < 0:
+        return False
+    os.close(fd)
+    return True
+
+
+def _raiseErrno(what, path=None):
+    code = ctypes.get_errno()
+    if path:
+        raise OSError(code, "%s: %s" % (what, os.strerror(code)), path)
+    raise OSError(code, "%s: %s" % (what, os.strerror(code)))
+
+
+class INotify(abstract.FileDescriptor):
+    """
+    Reads inotify events from the reactor and calls
+    callback(wd, mask, cookie, name) for each of them.
+    name is None for events concerning the watched path itself.
+    """
+
+    def __init__(self, callback, reactor=None):
+        abstract.FileDescriptor.__init__(self, reactor=reactor)
+        libc = _getLibC()
+        fd = libc.inotify_init()
+        if fd < 0:
+            _raiseErrno("inotify_init failed")
+        self._fd = fd
+        self.connected = 1
+        self._callback = callback
+        self._buffer = ""
+        fdesc.setNonBlocking(fd)
+        flags = fcntl.fcntl(fd, fcntl.F_GETFD)
+        fcntl.fcntl(fd, fcntl.F_SETFD, flags | fcntl.FD_CLOEXEC)
+
+    def fileno(self):
+        return self._fd
+
+    def addWatch(self, path, mask):
+        """
+        Adds or updates a watch; returns the watch descriptor.
+        Raises OSError on failure (ENOSPC when the user
+        reached max_user_watches).
+        """
+        wd = _getLibC().inotify_add_watch(self._fd, path, mask)
+        if wd < 0:
+            _raiseErrno("inotify_add_watch failed", path)
+        return wd
+
+    def removeWatch(self, wd):
+        if self._fd < 0:
+            return
+        result = _getLibC().inotify_rm_watch(self._fd, wd)
+        if result < 0 and ctypes.get_errno() != errno.EINVAL:
+            _raiseErrno("inotify_rm_watch failed")
+
+    def close(self):
+        self.stopReading()
+        self.connectionLost(Failure(main.CONNECTION_DONE))
+
+    def connectionLost(self, reason):
+        abstract.FileDescriptor.connectionLost(self, reason)
+        if self._fd >= 0:
+            try:
+                os.close(self._fd)
+            except OSError:
+                pass
+            self._fd = -1
+
+    def doRead(self):
+        return fdesc.readFromFD(self._fd, self._dataReceived)
+
+    def _dataReceived(self, data):
+        self._buffer += data
+        while len(self._buffer) >= EVENT_HEADER_SIZE:
+            wd, mask, cookie, size = struct.unpack(
+                EVENT_HEADER, self._buffer[:EVENT_HEADER_SIZE])
+            end = EVENT_HEADER_SIZE + size
+            if len(self._buffer) < end:
+                break
+            name = None
+            if size:
+                name = self._buffer[EVENT_HEADER_SIZE:end].rstrip("\0")
+            self._buffer = self._buffer[end:]
+            self._callback(wd, mask, cookie, name)
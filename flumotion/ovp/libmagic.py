@@ -0,0 +1,135 @@
+# -*- Mode: Python -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+# Flumotion - a streaming media server
+# Copyright (C) 2004,2005,2006,2007,2008,2009 Fluendo, S.L.
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+#
+# This file may be distributed and/or modified under the terms of
+# the GNU Lesser General Public License version 2.1 as published by
+# the Free Software Foundation.
+# This file is distributed without any warranty; without even the implied
+# warranty of merchantability or fitness for a particular purpose.
+# See "LICENSE.LGPL" in the source distribution for more information.
+#
+# Headers in this file shall remain intact.
+
+"""
+Minimal ctypes binding of libmagic, the library behind the file command,
+to detect file types without spawning a process for each file.
+
+The libmagic cookies are not thread-safe, so each thread uses its own.
+The functions return None when libmagic is not available or fails,
+the caller can then fall back to the file command.
+"""
+
+import threading
+import ctypes
+import ctypes.util
+
+
+MAGIC_NONE = 0x000000
+MAGIC_SYMLINK = 0x000002
+MAGIC_MIME_TYPE = 0x000010
+MAGIC_MIME_ENCODING = 0x000400
+MAGIC_MIME = MAGIC_MIME_TYPE | MAGIC_MIME_ENCODING
+
+# Same flags than "file -bL" and "file -biL"
+DESCRIPTION_FLAGS = MAGIC_SYMLINK
+MIME_FLAGS = MAGIC_SYMLINK | MAGIC_MIME
+
+
+_libmagic = None
+_local = threading.local()
+
+
+def _getLibMagic():
+    global _libmagic
+    if _libmagic is None:
+        name = ctypes.util.find_library("magic")
+        if name is None:
+            raise OSError("libmagic not found")
+        lib = ctypes.CDLL(name)
+        lib.magic_open.argtypes = [ctypes.c_int]
+        lib.magic_open.restype = ctypes.c_void_p
+        lib.magic_close.argtypes = [ctypes.c_void_p]
+        lib.magic_close.restype = None
+        lib.magic_load.argtypes = [ctypes.c_void_p, ctypes.c_char_p]
+        lib.magic_load.restype = ctypes.c_int
+        lib.magic_file.argtypes = [ctypes.c_void_p, ctypes.c_char_p]
+        lib.magic_file.restype = ctypes.c_char_p
+        lib.magic_buffer.argtypes = [ctypes.c_void_p, ctypes.c_void_p,
+                                     ctypes.c_size_t]
+        lib.magic_buffer.restype = ctypes.c_char_p
+        lib.magic_error.argtypes = [ctypes.c_void_p]
+        lib.magic_error.restype = ctypes.c_char_p
+        _libmagic = lib
+    return _libmagic
+
+
+def _getCookie(flags):
+    cookies = getattr(_local, "cookies", None)
+    if cookies is None:
+        cookies = _local.cookies = {}
+    cookie = cookies.get(flags)
+    if cookie is None:
+        lib = _getLibMagic()
+        cookie = lib.magic_open(flags)
+        if not cookie:
+            raise OSError("magic_open failed")
+        if lib.magic_load(cookie, None) != 0:
+            message = lib.magic_error(cookie)
+            lib.magic_close(cookie)
+            raise OSError("magic_load failed: %s" % message)
+        cookies[flags] = cookie
+    return cookie
+
+
+def isAvailable():
+    """
+    Returns True if libmagic can be used on this system.
+    """
+    try:
+        _getCookie(MIME_FLAGS)
+    except (OSError, AttributeError):
+        return False
+    return True
+
+
+def identifyFile(path, flags):
+    """
+    Returns the libmagic result for the given file and flags,
+    or None if libmagic is not available or failed.
+    """
+    try:
+        cookie = _getCookie(flags)
+    except (OSError, AttributeError):
+        return None
+    return _getLibMagic().magic_file(cookie, path)
+
+
+def identifyBuffer(data, flags):
+    """
+    Returns the libmagic result for the given file header and flags,
+    or None if libmagic is not available or failed.
+    """
+    try:
+        cookie = _getCookie(flags)
+    except (OSError, AttributeError):
+        return None
+    return _getLibMagic().magic_buffer(cookie, data, len(data))
+
+
+def getMimeType(path):
+    """
+    Returns the same than "file -biL", or None.
+    """
+    return identifyFile(path, MIME_FLAGS)
+
+
+def getDescription(path):
+    """
+    Returns the same than "file -bL", or None.
+    """
+    return identifyFile(path, DESCRIPTION_FLAGS)
@@ -0,0 +1,276 @@
+# -*- Mode: Python -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+# Flumotion - a streaming media server
+# Copyright (C) 2004,2005,2006,2007,2008,2009 Fluendo, S.L.
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+#
+# This file may be distributed and/or modified under the terms of
+# the GNU Lesser General Public License version 2.1 as published by
+# the Free Software Foundation.
+# This file is distributed without any warranty; without even the implied
+# warranty of merchantability or fitness for a particular purpose.
+# See "LICENSE.LGPL" in the source distribution for more information.
+#
+# Headers in this file shall remain intact.
+
+"""
+Detects if files are still open for writing by some process,
+so a file can be considered complete as soon as its writer closed it.
+
+Two Linux specific methods are supported:
+ _ proc: looks for the file in the descriptors of all the processes
+   (/proc/PID/fd) and reads their access mode (/proc/PID/fdinfo).
+   The processes of other users can only be inspected by root,
+   and the processes of other hosts writing to a network file system
+   cannot be inspected at all.
+ _ lease: tries to take a read lease on the file (fcntl F_SETLEASE),
+   the kernel refuses it while the file is open for writing.
+   It only works on local file systems, for the files owned by
+   the current user or with the CAP_LEASE capability.
+   If a writer opens the file while the lease is taken, the kernel
+   sends SIGIO to the process, which kills it by default; the leases
+   are only taken once ignoreLeaseBreaks() was called from the main
+   thread.
+
+The result for a file is True if it is open for writing, False if not,
+or None if it cannot be known; the caller should then fall back
+to another way of detecting the completion.
+
+Walking the descriptors of all the processes is expensive, a scan
+can be shared by the callers asking within a given maximum age.
+It is not reused for the files modified after it, their writer may
+have opened them after the scan; the writers closing a file are only
+noticed by the next scan.
+"""
+
+import os
+import time
+import errno
+import fcntl
+import signal
+import threading
+
+from flumotion.ovp.fileutils import is_network_filesystem
+
+
+METHOD_PROC = "proc"
+METHOD_LEASE = "lease"
+METHOD_AUTO = "auto"
+METHODS = (METHOD_PROC, METHOD_LEASE, METHOD_AUTO)
+
+PROC_DIR = "/proc"
+
+# From fcntl.h, not exported by the os module
+O_ACCMODE = 0003
+
+# The file systems update the modification times from a coarser clock,
+# a scan is only reused for the files modified this long before it
+MTIME_MARGIN = 1.0
+
+# The last scan of the processes descriptors, shared between threads
+_procScan = None
+_procScanLock = threading.Lock()
+
+
+def isAvailable(method=METHOD_AUTO):
+    """
+    Returns True if the given method can be used on this system.
+    """
+    if method == METHOD_PROC:
+        return os.path.isdir(os.path.join(PROC_DIR, "self", "fdinfo"))
+    if method == METHOD_LEASE:
+        return hasattr(fcntl, "F_SETLEASE") and hasattr(signal, "SIGIO")
+    if method == METHOD_AUTO:
+        return isAvailable(METHOD_PROC) or isAvailable(METHOD_LEASE)
+    return False
+
+
+def ignoreLeaseBreaks():
+    """
+    Ignores the SIGIO signal sent when a writer breaks a lease,
+    unless the process already handles it. Only works when called
+    from the main thread. Returns True if the leases can be taken.
+    """
+    if not isAvailable(METHOD_LEASE):
+        return False
+    if _areLeaseBreaksHandled():
+        return True
+    try:
+        signal.signal(signal.SIGIO, signal.SIG_IGN)
+    except ValueError:
+        # Not called from the main thread
+        return False
+    return True
+
+
+def checkWriters(paths, method=METHOD_AUTO, maxAge=0):
+    """
+    Returns a dict {path: True, False or None} telling
+    if the given files are open for writing.
+    The auto method tries the leases first, and inspects the
+    processes for the files the leases could not tell about;
+    a scan of the processes younger than maxAge seconds is reused.
+    """
+    results = dict.fromkeys(paths)
+    if method in (METHOD_LEASE, METHOD_AUTO) and isAvailable(METHOD_LEASE):
+        for path in paths:
+            results[path] = leaseWriter(path)
+    if method in (METHOD_PROC, METHOD_AUTO) and isAvailable(METHOD_PROC):
+        unknown = {}
+        networks = {}
+        for path, writing in results.iteritems():
+            if writing is not None:
+                continue
+            realpath = os.path.realpath(path)
+            # The processes of the other hosts are not in /proc
+            directory = os.path.dirname(realpath)
+            if directory not in networks:
+                networks[directory] = is_network_filesystem(directory)
+            if not networks[directory]:
+                unknown[realpath] = path
+        if unknown:
+            writers, complete = procWriters(unknown.keys(), maxAge)
+            for realpath, path in unknown.iteritems():
+                if realpath in writers:
+                    results[path] = True
+                elif complete:
+                    results[path] = False
+    return results
+
+
+def leaseWriter(path):
+    """
+    Returns True if the file is open for writing, False if not,
+    or None if a lease cannot be taken on this file.
+    """
+    if not _areLeaseBreaksHandled():
+        # A lease break would kill the process
+        return None
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+    except OSError:
+        return None
+    try:
+        try:
+            fcntl.fcntl(fd, fcntl.F_SETLEASE, fcntl.F_RDLCK)
+        except IOError, e:
+            if e.errno == errno.EAGAIN:
+                return True
+            # EACCES when not owner, EINVAL on network file systems
+            return None
+        # Released right away, so a writer opening the file
+        # in between is not blocked more than a few microseconds
+        fcntl.fcntl(fd, fcntl.F_SETLEASE, fcntl.F_UNLCK)
+        return False
+    finally:
+        os.close(fd)
+
+
+def procWriters(paths, maxAge=0):
+    """
+    Returns (writers, complete) where writers is the set of the given
+    real paths open for writing by some process, and complete is False
+    if some processes could not be inspected.
+    The last scan of the processes is reused if younger than maxAge
+    and than the modifications of the given files.
+    """
+    newest = 0
+    for path in paths:
+        try:
+            newest = max(newest, os.stat(path).st_mtime)
+        except OSError:
+            continue
+    scan = _getProcScan(maxAge, newest)
+    writers = set([p for p in paths if scan.isWritten(p)])
+    return writers, scan.complete
+
+
+def _areLeaseBreaksHandled():
+    # None if the handler was not installed by python
+    handler = signal.getsignal(signal.SIGIO)
+    return handler not in (None, signal.SIG_DFL)
+
+
+def _getProcScan(maxAge, newest):
+    global _procScan
+    _procScanLock.acquire()
+    try:
+        scan = _procScan
+        if ((scan is None) or (scan.time <= newest + MTIME_MARGIN)
+            or not (0 <= time.time() - scan.time < maxAge)):
+            # Concurrent callers wait for this scan instead of doing theirs
+            scan = _ProcScan()
+            _procScan = scan
+        return scan
+    finally:
+        _procScanLock.release()
+
+
+class _ProcScan(object):
+    """
+    The files opened by all the processes; the access modes are
+    only read for the files asked for, and remembered.
+    """
+
+    def __init__(self):
+        self.time = time.time()
+        self.complete = True
+        # {path: [(pid, fd)]}
+        self._descriptors = {}
+        # {path: True if open for writing}
+        self._writing = {}
+        self._walk()
+
+    def isWritten(self, path):
+        writing = self._writing.get(path)
+        if writing is None:
+            writing = False
+            for pid, fd in self._descriptors.get(path, ()):
+                flags = _fdFlags(pid, fd)
+                if (flags is None) or ((flags & O_ACCMODE) != os.O_RDONLY):
+                    writing = True
+                    break
+            self._writing[path] = writing
+        return writing
+
+    def _walk(self):
+        try:
+            pids = os.listdir(PROC_DIR)
+        except OSError:
+            self.complete = False
+            return
+        for pid in pids:
+            if not pid.isdigit():
+                continue
+            fddir = os.path.join(PROC_DIR, pid, "fd")
+            try:
+                fds = os.listdir(fddir)
+            except OSError, e:
+                if e.errno in (errno.EACCES, errno.EPERM):
+                    self.complete = False
+                # Otherwise the process is gone
+                continue
+            for fd in fds:
+                try:
+                    target = os.readlink(os.path.join(fddir, fd))
+                except OSError:
+                    continue
+                # Not the sockets, pipes and anonymous files
+                if target.startswith("/"):
+                    self._descriptors.setdefault(target, []).append((pid, fd))
+
+
+def _fdFlags(pid, fd):
+    try:
+        f = open(os.path.join(PROC_DIR, pid, "fdinfo", fd))
+    except IOError:
+        return None
+    try:
+        for line in f:
+            if line.startswith("flags:"):
+                return int(line.split()[1], 8)
+    finally:
+        f.close()
+    return None
@@ -0,0 +1,73 @@
+# -*- Mode: Python -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+# Flumotion - a streaming media server
+# Copyright (C) 2004,2005,2006,2007,2008,2009 Fluendo, S.L.
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+#
+# This file may be distributed and/or modified under the terms of
+# the GNU Lesser General Public License version 2.1 as published by
+# the Free Software Foundation.
+# This file is distributed without any warranty; without even the implied
+# warranty of merchantability or fitness for a particular purpose.
+# See "LICENSE.LGPL" in the source distribution for more information.
+#
+# Headers in this file shall remain intact.
+
+"""
+Replays recorded transcoding reports against the scheduler cost models
+and prints their estimation errors. The reports of each directory are
+taken as the reports of one profile, like the profiles done report
+directories, and are replayed in the order they were done.
+
+Usage: env python flumotion/test/bench_costmodel.py REPORT_DIR...
+"""
+
+import os
+import sys
+
+from flumotion.inhouse import inifile
+
+from flumotion.transcoder import transreport
+from flumotion.transcoder.admin import adminconsts, costmodel
+
+
+def load_samples(dirs):
+    samples = []
+    for path in dirs:
+        for dirpath, dirnames, filenames in os.walk(path):
+            for filename in filenames:
+                if not filename.endswith(".rep"):
+                    continue
+                report = transreport.TranscodingReport()
+                try:
+                    inifile.IniFile().loadFromFile(
+                        report, os.path.join(dirpath, filename))
+                except Exception, e:
+                    print "Skipping %s: %s" % (filename, e)
+                    continue
+                sample = costmodel.getReportSample(report)
+                if sample:
+                    samples.append((report.doneTime, dirpath) + sample)
+    samples.sort()
+    return [s[1:] for s in samples]
+
+
+def main(args):
+    if not args:
+        print __doc__
+        return
+    samples = load_samples(args)
+    print "%d transcoding reports" % len(samples)
+    print "%-10s %16s %16s" % ("model", "mean error s", "relative error")
+    for name in (adminconsts.COST_MODEL_SIZE, adminconsts.COST_MODEL_HISTORY):
+        result = costmodel.evaluate(costmodel.createCostModel(name), samples)
+        if not result["count"]:
+            continue
+        print "%-10s %16.1f %15.1f%%" % (name, result["absolute"],
+                                         result["relative"] * 100)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,90 @@
+# -*- Mode: Python -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+# Flumotion - a streaming media server
+# Copyright (C) 2004,2005,2006,2007,2008,2009 Fluendo, S.L.
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+#
+# This file may be distributed and/or modified under the terms of
+# the GNU Lesser General Public License version 2.1 as published by
+# the Free Software Foundation.
+# This file is distributed without any warranty; without even the implied
+# warranty of merchantability or fitness for a particular purpose.
+# See "LICENSE.LGPL" in the source distribution for more information.
+#
+# Headers in this file shall remain intact.
+
+"""
+Measures the bytes read and the time per GB of each fingerprint mode.
+The bytes read are taken from /proc/self/io, so it only works on Linux.
+The file is created once and then read from the page cache,
+so the times measure the algorithms, not the disk.
+
+Usage: env python flumotion/test/bench_fingerprint.py [SIZE_MB] [FILE]
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+from flumotion.ovp import fileutils
+
+
+GB = float(1 << 30)
+
+
+def read_bytes():
+    f = open("/proc/self/io")
+    try:
+        for line in f:
+            if line.startswith("rchar:"):
+                return int(line.split()[1])
+    finally:
+        f.close()
+    return 0
+
+
+def create_file(size_mb):
+    fd, path = tempfile.mkstemp(suffix=".bench")
+    f = os.fdopen(fd, "wb")
+    try:
+        block = os.urandom(1 << 20)
+        for i in xrange(size_mb):
+            f.write(block)
+    finally:
+        f.close()
+    return path
+
+
+def main(args):
+    size_mb = 512
+    if args:
+        size_mb = int(args[0])
+    created = len(args) < 2
+    if created:
+        path = create_file(size_mb)
+    else:
+        path = args[1]
+    try:
+        size = os.path.getsize(path)
+        print "%-12s %14s %10s %10s %12s" % ("mode", "bytes read",
+                                             "read %", "seconds", "s/GB")
+        for mode in fileutils.FINGERPRINT_MODES:
+            before = read_bytes()
+            start = time.time()
+            fileutils.fingerprint(path, mode)
+            elapsed = time.time() - start
+            count = read_bytes() - before
+            print "%-12s %14d %9.2f%% %10.3f %12.3f" % (
+                mode, count, count * 100.0 / max(size, 1),
+                elapsed, elapsed * GB / max(size, 1))
+    finally:
+        if created:
+            os.remove(path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
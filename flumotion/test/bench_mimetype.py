@@ -0,0 +1,66 @@
+# -*- Mode: Python -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+# Flumotion - a streaming media server
+# Copyright (C) 2004,2005,2006,2007,2008,2009 Fluendo, S.L.
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+#
+# This file may be distributed and/or modified under the terms of
+# the GNU Lesser General Public License version 2.1 as published by
+# the Free Software Foundation.
+# This file is distributed without any warranty; without even the implied
+# warranty of merchantability or fitness for a particular purpose.
+# See "LICENSE.LGPL" in the source distribution for more information.
+#
+# Headers in this file shall remain intact.
+
+"""
+Compares the mime type detection with libmagic against
+spawning the file command, on the sample headers of test_fileutils.
+
+Usage: env python flumotion/test/bench_mimetype.py [ITERATIONS]
+"""
+
+import sys
+import time
+import shutil
+import tempfile
+
+from flumotion.ovp import fileutils, libmagic
+from flumotion.test.test_fileutils import writeSampleHeaders
+
+
+def bench(label, function, paths, iterations):
+    start = time.time()
+    for i in xrange(iterations):
+        for path in paths:
+            function(path)
+    elapsed = time.time() - start
+    count = iterations * len(paths)
+    print "%-12s %8d files %8.3f s %8.3f ms/file" % (
+        label, count, elapsed, elapsed * 1000.0 / count)
+    return elapsed
+
+
+def main(args):
+    iterations = 20
+    if args:
+        iterations = int(args[0])
+    directory = tempfile.mkdtemp()
+    try:
+        paths = [p for p, _ in writeSampleHeaders(directory).values()]
+        command = bench("file -biL", lambda p: fileutils._file_command("-biL", p),
+                        paths, iterations)
+        if not libmagic.isAvailable():
+            print "libmagic not available"
+            return 1
+        inprocess = bench("libmagic", libmagic.getMimeType, paths, iterations)
+        print "speedup: %.1fx" % (command / inprocess)
+    finally:
+        shutil.rmtree(directory, True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,617 @@
+# -*- Mode: Python -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+# Flumotion - a streaming media server
+# Copyright (C) 2004,2005,2006,2007,2008,2009 Fluendo, S.L.
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+#
+# This file may be distributed and/or modified under the terms of
+# the GNU Lesser General Public License version 2.1 as published by
+# the Free Software Foundation.
+# This file is distributed without any warranty; without even the implied
+# warranty of merchantability or fitness for a particular purpose.
+# See "LICENSE.LGPL" in the source distribution for more information.
+#
+# Headers in this file shall remain intact.
+
+"""
+Measures how the file monitoring scales on a synthetic tree.
+
+A tree with the given number of files, depth and file size is created
+(use --dir /dev/shm to put it on tmpfs), then each watcher backend
+is run on the reactor for a number of cycles. Each cycle adds, grows
+and removes files at the given churn rate and waits for the watcher
+to notice all the changes. Then the files of the tree are fingerprinted
+with each mode through a FingerprintPool, like the monitors do.
+
+Reported for each watcher backend:
+ _ initial: seconds to discover and complete all the files of the tree
+ _ scan: seconds of each periodical scan, up to the changes processed
+ _ added/completed/removed: detection latencies in seconds
+ _ per cycle: read and write syscalls, bytes read, stat calls
+   and directory listings (polling backend only)
+And for each fingerprint mode: seconds, files/s, bytes read
+and read syscalls for the whole tree.
+
+The syscalls and bytes are taken from /proc/self/io, so they
+are only reported on Linux; they include the benchmark's own
+writes, which are the same for all the backends.
+
+Usage: env python flumotion/test/bench_monitor.py [OPTIONS]
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import optparse
+import tempfile
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from twisted.internet import reactor, defer
+
+from flumotion.inhouse import log
+
+from flumotion.ovp import inotify
+from flumotion.ovp.fileutils import FINGERPRINT_MODES
+from flumotion.ovp.fileutils import fingerprint, magic_mimetype
+from flumotion.component.monitor.watcher import DirectoryWatcher
+from flumotion.component.monitor.watcher import FilesWatcher
+from flumotion.component.monitor.watcher import InotifyWatcher
+from flumotion.component.monitor.fingerprint import FingerprintPool
+
+
+BACKEND_POLLING = "polling"
+BACKEND_INOTIFY = "inotify"
+BACKEND_FILES = "files"
+BACKENDS = (BACKEND_POLLING, BACKEND_INOTIFY, BACKEND_FILES)
+
+POLL_PERIOD = 0.01
+
+
+def read_io():
+    """
+    Returns a dict with the read and write counters of this process,
+    or an empty dict if they are not available.
+    """
+    counters = {}
+    try:
+        f = open("/proc/self/io")
+    except IOError:
+        return counters
+    try:
+        for line in f:
+            name, value = line.split(":", 1)
+            counters[name] = int(value)
+    finally:
+        f.close()
+    return counters
+
+def io_delta(before, after):
+    if not (before and after):
+        return {}
+    return {"read_syscalls": after["syscr"] - before["syscr"],
+            "write_syscalls": after["syscw"] - before["syscw"],
+            "bytes_read": after["rchar"] - before["rchar"]}
+
+def summarize(values):
+    """
+    Returns the count, mean, median, 95th percentile
+    and maximum of a list of values.
+    """
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+    count = len(values)
+    return {"count": count,
+            "mean": float(sum(values)) / count,
+            "median": values[count / 2],
+            "p95": values[min(count - 1, int(count * 0.95))],
+            "max": values[-1]}
+
+
+class SyntheticTree(object):
+    """
+    A tree of files under a root directory, spread over
+    depth levels of fanout directories, with churn operations.
+    """
+
+    def __init__(self, root, files, depth, fanout, size, seed=0):
+        self.root = root
+        self.depth = depth
+        self.fanout = fanout
+        self.size = size
+        self.files = []
+        self._random = random.Random(seed)
+        self._block = os.urandom(min(size, 1 << 16) or 1)
+        self._sequence = 0
+        for i in xrange(files):
+            self.files.append(self.create(self._make_name(i)))
+
+    def create(self, relpath):
+        path = os.path.join(self.root, relpath)
+        dirpath = os.path.dirname(path)
+        if not os.path.isdir(dirpath):
+            os.makedirs(dirpath)
+        f = open(path, "wb")
+        try:
+            left = self.size
+            while left > 0:
+                f.write(self._block[:left])
+                left -= len(self._block)
+        finally:
+            f.close()
+        return relpath
+
+    def grow(self, relpath):
+        f = open(os.path.join(self.root, relpath), "ab")
+        try:
+            f.write(self._block[:1024])
+        finally:
+            f.close()
+
+    def remove(self, relpath):
+        os.remove(os.path.join(self.root, relpath))
+
+    def next_names(self, count):
+        """
+        Returns the names of the next files to be added.
+        """
+        names = []
+        for i in xrange(count):
+            index = self._random.randrange(max(1, len(self.files)))
+            names.append(self._make_name(index, "churn%d" % self._sequence))
+            self._sequence += 1
+        return names
+
+    def churn(self, added, grown, removed):
+        """
+        Adds the given files, then grows and removes random existing
+        ones. Returns ({added name: time}, [grown names], {removed
+        name: time}).
+        """
+        existing = list(self.files)
+        self._random.shuffle(existing)
+        grownNames = existing[:grown]
+        removedNames = existing[grown:grown + removed]
+        createdTimes = {}
+        for relpath in added:
+            createdTimes[self.create(relpath)] = time.time()
+            self.files.append(relpath)
+        for relpath in grownNames:
+            self.grow(relpath)
+        removedTimes = {}
+        for relpath in removedNames:
+            self.remove(relpath)
+            removedTimes[relpath] = time.time()
+            self.files.remove(relpath)
+        return createdTimes, grownNames, removedTimes
+
+
+    ## Private Methods ##
+
+    def _make_name(self, index, basename=None):
+        parts = []
+        for level in range(self.depth):
+            parts.append("d%d" % ((index / self.fanout ** level)
+                                  % self.fanout))
+        parts.append(basename or "f%d" % index)
+        return "/".join(parts)
+
+
+class ScanTimer(object):
+    """
+    Mixin timing the scans of a periodical watcher,
+    from the listing to the changes processed.
+    """
+
+    scan_times = None
+
+    def check_for_changes(self):
+        if self.scan_times is None:
+            self.scan_times = []
+        start = time.time()
+        d = super(ScanTimer, self).check_for_changes()
+        d.addCallback(self._cbScanTimed, start)
+        return d
+
+    def _cbScanTimed(self, result, start):
+        self.scan_times.append(time.time() - start)
+        return result
+
+
+class TimedDirectoryWatcher(ScanTimer, DirectoryWatcher):
+
+    stat_calls = 0
+    listings = 0
+
+    def list_files_ok(self, newfiles):
+        _, listed, stated, _ = self._scan_stats
+        self.stat_calls += stated
+        self.listings += listed
+        return DirectoryWatcher.list_files_ok(self, newfiles)
+
+
+class TimedFilesWatcher(ScanTimer, FilesWatcher):
+    pass
+
+
+class WatcherRun(object):
+    """
+    Runs a watcher backend on a synthetic tree and
+    collects the detection latencies.
+    """
+
+    def __init__(self, logger, tree, backend, options):
+        self.logger = logger
+        self.tree = tree
+        self.backend = backend
+        self.options = options
+        self._added = {} # {relpath: creation time}
+        self._completed = {} # {relpath: creation time}
+        self._removed = {} # {relpath: removal time}
+        self._latencies = {"added": [], "completed": [], "removed": []}
+        self._cycles = []
+
+    def run(self):
+        """
+        Returns a deferred fired with the results dict.
+        """
+        options = self.options
+        # Every file the watcher should see, for the files backend
+        names = list(self.tree.files)
+        churnNames = []
+        for i in range(options.cycles):
+            churnNames.append(self.tree.next_names(options.churn))
+        for cycleNames in churnNames:
+            names.extend(cycleNames)
+        self.watcher = self._create_watcher(names)
+        self.watcher.connect("file-added", self._file_added)
+        self.watcher.connect("file-completed", self._file_completed)
+        self.watcher.connect("file-removed", self._file_removed)
+        now = time.time()
+        for relpath in self.tree.files:
+            self._added[relpath] = now
+            self._completed[relpath] = now
+        start = time.time()
+        before = read_io()
+        self.watcher.start()
+        d = self._wait_changes()
+        d.addCallback(self._cbInitialDone, start, before, churnNames)
+        d.addBoth(self._cbStop)
+        return d
+
+
+    ## Private Methods ##
+
+    def _create_watcher(self, names):
+        options = self.options
+        root = self.tree.root + "/"
+        if self.backend == BACKEND_POLLING:
+            return TimedDirectoryWatcher(
+                self.logger, root, None, timeout=options.period,
+                full_scan_period=options.full_scan_period,
+                completion_method=options.completion_method)
+        if self.backend == BACKEND_INOTIFY:
+            return InotifyWatcher(self.logger, root, None,
+                                  timeout=options.period)
+        return TimedFilesWatcher(self.logger, [root + n for n in names],
+                                 timeout=options.period)
+
+    def _relpath(self, name):
+        if self.backend == BACKEND_FILES:
+            return name[len(self.tree.root) + 1:]
+        return name
+
+    def _file_added(self, watcher, name, *args):
+        created = self._added.pop(self._relpath(name), None)
+        if created is not None:
+            self._latencies["added"].append(time.time() - created)
+
+    def _file_completed(self, watcher, name, *args):
+        created = self._completed.pop(self._relpath(name), None)
+        if created is not None:
+            self._latencies["completed"].append(time.time() - created)
+
+    def _file_removed(self, watcher, name):
+        removed = self._removed.pop(self._relpath(name), None)
+        if removed is not None:
+            self._latencies["removed"].append(time.time() - removed)
+
+    def _pending(self):
+        pending = len(self._completed)
+        if self.backend != BACKEND_FILES:
+            # The files watcher does not notify the removed files
+            pending += len(self._removed)
+        return pending
+
+    def _wait_changes(self):
+        """
+        Returns a deferred fired with the number of changes
+        still pending when all the changes are noticed,
+        or after the timeout.
+        """
+        d = defer.Deferred()
+        deadline = time.time() + self.options.timeout
+
+        def poll():
+            pending = self._pending()
+            if pending and (time.time() < deadline):
+                reactor.callLater(POLL_PERIOD, poll)
+                return
+            d.callback(pending)
+
+        poll()
+        return d
+
+    def _run_cycle(self, _, names, missed):
+        before = read_io()
+        stats = self._watcher_stats()
+        created, grown, removed = self.tree.churn(names,
+                                                  self.options.churn / 2,
+                                                  self.options.churn / 2)
+        self._added.update(created)
+        self._completed.update(created)
+        self._removed.update(removed)
+        start = time.time()
+        d = self._wait_changes()
+        d.addCallback(self._cbCycleDone, start, before, stats, missed)
+        return d
+
+    def _watcher_stats(self):
+        return (getattr(self.watcher, "stat_calls", None),
+                getattr(self.watcher, "listings", None))
+
+    def _cbInitialDone(self, pending, start, before, churnNames):
+        self._initial = {"seconds": time.time() - start,
+                         "missed": pending}
+        self._initial.update(io_delta(before, read_io()))
+        # Only the latencies of the churned files are reported
+        self._latencies = {"added": [], "completed": [], "removed": []}
+        missed = []
+        d = defer.succeed(None)
+        for names in churnNames:
+            d.addCallback(self._run_cycle, names, missed)
+        d.addCallback(self._cbCyclesDone, missed)
+        return d
+
+    def _cbCycleDone(self, pending, start, before, stats, missed):
+        cycle = {"seconds": time.time() - start}
+        cycle.update(io_delta(before, read_io()))
+        after = self._watcher_stats()
+        if stats[0] is not None:
+            cycle["stat_calls"] = after[0] - stats[0]
+            cycle["listings"] = after[1] - stats[1]
+        self._cycles.append(cycle)
+        missed.append(pending)
+        # The missed changes are not waited for by the next cycles
+        self._added.clear()
+        self._completed.clear()
+        self._removed.clear()
+
+    def _cbCyclesDone(self, _, missed):
+        results = {"initial": self._initial,
+                   "missed": sum(missed)}
+        for name, values in self._latencies.iteritems():
+            results[name] = summarize(values)
+        scans = getattr(self.watcher, "scan_times", None)
+        if scans is not None:
+            results["scan"] = summarize(scans)
+        cycles = {}
+        for key in self._cycles and self._cycles[0].keys() or ():
+            cycles[key] = summarize([c[key] for c in self._cycles])
+        results["cycle"] = cycles
+        return results
+
+    def _cbStop(self, result):
+        self.watcher.stop()
+        return result
+
+
+def fingerprint_file(path, mode):
+    mime = magic_mimetype(path)
+    return mime, fingerprint(path, mode)
+
+def bench_fingerprints(logger, tree, modes, threads):
+    """
+    Fingerprints all the files of the tree with each mode.
+    Returns a deferred fired with {mode: results dict}.
+    """
+    results = {}
+    pool = FingerprintPool(logger, threads)
+    pool.start()
+
+    def run(_, mode):
+        before = read_io()
+        start = time.time()
+        jobs = []
+        for relpath in tree.files:
+            path = os.path.join(tree.root, relpath)
+            jobs.append(pool.submit(tree.size, fingerprint_file, path, mode))
+        d = defer.DeferredList(jobs, consumeErrors=True)
+        d.addCallback(done, mode, start, before)
+        return d
+
+    def done(jobs, mode, start, before):
+        elapsed = time.time() - start
+        failed = len([ok for ok, _ in jobs if not ok])
+        count = len(jobs)
+        results[mode] = {"files": count,
+                         "failed": failed,
+                         "seconds": elapsed,
+                         "files_per_second": count / max(elapsed, 1e-6)}
+        results[mode].update(io_delta(before, read_io()))
+
+    def stop(result):
+        d = pool.stop()
+        d.addCallback(lambda _: result)
+        return d
+
+    d = defer.succeed(None)
+    for mode in modes:
+        d.addCallback(run, mode)
+    d.addCallback(lambda _: results)
+    d.addBoth(stop)
+    return d
+
+
+def run_benchmarks(options, backends, modes):
+    logger = log.Logger("bench-monitor")
+    results = {"parameters": dict(options.__dict__),
+               "watchers": {},
+               "fingerprints": {}}
+    root = tempfile.mkdtemp(prefix="bench-monitor-", dir=options.dir)
+
+    def bench_backend(_, backend):
+        treeRoot = os.path.join(root, backend)
+        tree = SyntheticTree(treeRoot, options.files, options.depth,
+                             options.fanout, options.size, options.seed)
+        d = WatcherRun(logger, tree, backend, options).run()
+        d.addCallback(backend_done, backend)
+        return d
+
+    def backend_done(backendResults, backend):
+        results["watchers"][backend] = backendResults
+        print_backend(backend, backendResults)
+
+    def bench_modes(_):
+        tree = SyntheticTree(os.path.join(root, "fingerprints"),
+                             options.files, options.depth,
+                             options.fanout, options.size, options.seed)
+        d = bench_fingerprints(logger, tree, modes, options.threads)
+        d.addCallback(modes_done)
+        return d
+
+    def modes_done(modeResults):
+        results["fingerprints"] = modeResults
+        print_fingerprints(modeResults)
+
+    def cleanup(result):
+        shutil.rmtree(root, True)
+        return result
+
+    d = defer.succeed(None)
+    for backend in backends:
+        d.addCallback(bench_backend, backend)
+    if modes:
+        d.addCallback(bench_modes)
+    d.addCallback(lambda _: results)
+    d.addBoth(cleanup)
+    return d
+
+
+def print_backend(backend, results):
+    print "%s: initial %.3f s, %d missed changes" % (
+        backend, results["initial"]["seconds"], results["missed"])
+    for name in ("scan", "added", "completed", "removed"):
+        summary = results.get(name)
+        if not (summary and summary["count"]):
+            continue
+        print "  %-10s %6d   mean %8.4f s  p95 %8.4f s  max %8.4f s" % (
+            name, summary["count"], summary["mean"],
+            summary["p95"], summary["max"])
+    for name, summary in sorted(results["cycle"].items()):
+        print "  per cycle %-15s mean %12.1f  max %12.1f" % (
+            name, summary["mean"], summary["max"])
+
+def print_fingerprints(results):
+    print "%-12s %10s %12s %14s %10s" % ("mode", "seconds", "files/s",
+                                         "bytes read", "syscalls")
+    for mode, r in sorted(results.items()):
+        print "%-12s %10.3f %12.1f %14s %10s" % (
+            mode, r["seconds"], r["files_per_second"],
+            r.get("bytes_read", "-"), r.get("read_syscalls", "-"))
+
+
+def main(args):
+    usage = "usage: %prog [OPTIONS]"
+    parser = optparse.OptionParser(usage=usage)
+    parser.add_option("--files", type="int", default=1000,
+                      help="number of files of the tree (default: 1000)")
+    parser.add_option("--depth", type="int", default=2,
+                      help="directory levels of the tree (default: 2)")
+    parser.add_option("--fanout", type="int", default=10,
+                      help="sub-directories per level (default: 10)")
+    parser.add_option("--size", type="int", default=4096,
+                      help="size of the files in bytes (default: 4096)")
+    parser.add_option("--churn", type="int", default=20,
+                      help="files added per cycle, half as many are grown "
+                      "and removed (default: 20)")
+    parser.add_option("--cycles", type="int", default=5,
+                      help="number of churn cycles (default: 5)")
+    parser.add_option("--period", type="float", default=0.5,
+                      help="seconds between the scans (default: 0.5)")
+    parser.add_option("--full-scan-period", type="float", default=None,
+                      help="seconds between the full scans of the "
+                      "polling watcher (default: only the first)")
+    parser.add_option("--completion-method", default=None,
+                      help="completion method of the polling watcher")
+    parser.add_option("--timeout", type="float", default=30,
+                      help="seconds to wait for the changes of a cycle "
+                      "(default: 30)")
+    parser.add_option("--backends", default=",".join(BACKENDS),
+                      help="watcher backends to run (default: %s)"
+                      % ",".join(BACKENDS))
+    parser.add_option("--modes", default=",".join(FINGERPRINT_MODES),
+                      help="fingerprint modes to run, empty for none "
+                      "(default: %s)" % ",".join(FINGERPRINT_MODES))
+    parser.add_option("--threads", type="int", default=2,
+                      help="fingerprinting threads (default: 2)")
+    parser.add_option("--seed", type="int", default=0,
+                      help="seed of the churn (default: 0)")
+    parser.add_option("--dir", default=None,
+                      help="where to create the tree, for example "
+                      "/dev/shm for tmpfs (default: the temp directory)")
+    parser.add_option("-o", "--output", default=None,
+                      help="file to write the JSON results to")
+    options, args = parser.parse_args(args)
+    if args:
+        parser.error("unexpected arguments: %s" % " ".join(args))
+
+    backends = [b for b in options.backends.split(",") if b]
+    for backend in backends:
+        if backend not in BACKENDS:
+            parser.error("unknown backend '%s'" % backend)
+    if (BACKEND_INOTIFY in backends) and not inotify.isAvailable():
+        print "inotify not available"
+        backends.remove(BACKEND_INOTIFY)
+    modes = [m for m in options.modes.split(",") if m]
+    for mode in modes:
+        if mode not in FINGERPRINT_MODES:
+            parser.error("unknown fingerprint mode '%s'" % mode)
+
+    status = []
+
+    def done(results):
+        results["timestamp"] = time.time()
+        if options.output:
+            f = open(options.output, "w")
+            try:
+                json.dump(results, f, indent=2, sort_keys=True)
+            finally:
+                f.close()
+            print "results written to %s" % options.output
+        status.append(0)
+
+    def failed(failure):
+        print failure.getTraceback()
+        status.append(1)
+
+    def run():
+        d = run_benchmarks(options, backends, modes)
+        d.addCallbacks(done, failed)
+        d.addBoth(lambda _: reactor.stop())
+
+    reactor.callWhenRunning(run)
+    reactor.run()
+    return status and status[0] or 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,119 @@
+# -*- Mode: Python -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+# Flumotion - a streaming media server
+# Copyright (C) 2004,2005,2006,2007,2008,2009 Fluendo, S.L.
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+#
+# This file may be distributed and/or modified under the terms of
+# the GNU Lesser General Public License version 2.1 as published by
+# the Free Software Foundation.
+# This file is distributed without any warranty; without even the implied
+# warranty of merchantability or fitness for a particular purpose.
+# See "LICENSE.LGPL" in the source distribution for more information.
+#
+# Headers in this file shall remain intact.
+
+"""
+Compares the scheduler queue with the sorted list it replaced,
+for a number of queued profiles (100000 by default).
+The sorted list is too slow to be filled one profile at a time,
+so only its last SAMPLE inserts and removals are timed and the
+total time is extrapolated from them.
+
+Usage: env python flumotion/test/bench_scheduler.py [COUNT] [SAMPLE]
+"""
+
+import sys
+import time
+import random
+
+from flumotion.transcoder.admin.schedqueue import PriorityQueue
+
+
+def make_items(count):
+    rand = random.Random(0)
+    # Customer priority * 1000 + profile priority, like the scheduler
+    return [("puid%d" % i, None,
+             rand.randint(0, 10) * 1000 + rand.randint(0, 100))
+            for i in xrange(count)]
+
+
+def bench_sorted(items, sample):
+    priorities = dict([(k, p) for k, v, p in items])
+    prefill = len(items) - sample
+    order = [k for k, v, p in items[:prefill]]
+    order.sort(key=priorities.get)
+    # Inserts as the scheduler did: append and sort again
+    start = time.time()
+    for key, value, priority in items[prefill:]:
+        order.append(key)
+        order.sort(key=priorities.get)
+    insert = (time.time() - start) / sample
+    removed = random.Random(1).sample(order, sample)
+    start = time.time()
+    for key in removed:
+        order.remove(key)
+    remove = (time.time() - start) / sample
+    start = time.time()
+    while order:
+        order.pop()
+    pop = (time.time() - start) / (len(items) - sample)
+    return insert, remove, pop
+
+
+def bench_heap(items, sample):
+    queue = PriorityQueue()
+    start = time.time()
+    for key, value, priority in items:
+        queue.push(key, value, priority)
+    insert = (time.time() - start) / len(items)
+    removed = random.Random(1).sample([k for k, v, p in items], sample)
+    start = time.time()
+    for key in removed:
+        queue.remove(key)
+    remove = (time.time() - start) / sample
+    start = time.time()
+    for key in random.Random(2).sample(list(queue), sample):
+        queue.update(key, queue.getPriority(key) + 500)
+    update = (time.time() - start) / sample
+    count = len(queue)
+    start = time.time()
+    while queue:
+        queue.pop()
+    pop = (time.time() - start) / count
+    start = time.time()
+    queue.extend(items)
+    bulk = time.time() - start
+    return insert, remove, update, pop, bulk
+
+
+def main(args):
+    count = 100000
+    sample = 1000
+    if args:
+        count = int(args[0])
+    if len(args) > 1:
+        sample = int(args[1])
+    items = make_items(count)
+    print "%d queued profiles, %d sampled operations" % (count, sample)
+    print "%-12s %12s %12s %12s %12s %14s" % ("queue", "insert us",
+                                              "remove us", "update us",
+                                              "pop us", "fill s")
+    insert, remove, pop = bench_sorted(items, sample)
+    # The cost of an insert is linear in the queue size
+    fill = insert * count / 2
+    print "%-12s %12.2f %12.2f %12s %12.2f %13.1f~" % (
+        "sorted list", insert * 1e6, remove * 1e6, "-", pop * 1e6, fill)
+    insert, remove, update, pop, bulk = bench_heap(items, sample)
+    print "%-12s %12.2f %12.2f %12.2f %12.2f %14.3f" % (
+        "heap", insert * 1e6, remove * 1e6, update * 1e6, pop * 1e6,
+        insert * count)
+    print "%-12s %12s %12s %12s %12s %14.3f" % ("heap bulk", "-", "-", "-",
+                                                "-", bulk)
+    print "~ extrapolated from the sampled inserts"
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
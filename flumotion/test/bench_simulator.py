@@ -0,0 +1,127 @@
+# -*- Mode: Python -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+# Flumotion - a streaming media server
+# Copyright (C) 2004,2005,2006,2007,2008,2009 Fluendo, S.L.
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+#
+# This file may be distributed and/or modified under the terms of
+# the GNU Lesser General Public License version 2.1 as published by
+# the Free Software Foundation.
+# This file is distributed without any warranty; without even the implied
+# warranty of merchantability or fitness for a particular purpose.
+# See "LICENSE.LGPL" in the source distribution for more information.
+#
+# Headers in this file shall remain intact.
+
+"""
+Replays a trace of transcoding jobs with each scheduler policy
+and prints their throughput, slot utilization, queue waits and
+customer fairness. The trace file has one job by line:
+
+    ARRIVAL CUSTOMER PROFILE COST [FILE_SIZE]
+
+with the arrival and the cost in second. Without trace file,
+a day of random jobs from a big and a small customer, loading the
+default workers at about 90%, is replayed.
+The workers are given as NAME:SLOTS (3 workers of 2 slots by default).
+
+Usage: env python flumotion/test/bench_simulator.py [TRACE] [WORKER...]
+"""
+
+import sys
+import random
+
+from flumotion.transcoder.admin import adminconsts, simulator
+
+
+def load_trace(path):
+    jobs = []
+    for line in open(path):
+        fields = line.split()
+        if not fields or fields[0].startswith("#"):
+            continue
+        fileSize = None
+        if len(fields) > 4:
+            fileSize = int(fields[4])
+        jobs.append(simulator.TraceJob(float(fields[0]), fields[1],
+                                       fields[2], float(fields[3]),
+                                       fileSize))
+    jobs.sort(key=lambda j: j.arrival)
+    return jobs
+
+
+def make_trace():
+    rand = random.Random(0)
+    jobs = []
+    arrival = 0.0
+    while arrival < 24 * 3600:
+        arrival += rand.expovariate(1 / 150.0)
+        if rand.random() < 0.75:
+            # Re-encodings of long movies
+            cost = rand.choice([120, 600, 1200, 2100])
+            jobs.append(simulator.TraceJob(arrival, "big", "movies", cost))
+        else:
+            cost = rand.choice([30, 60, 120])
+            jobs.append(simulator.TraceJob(arrival, "small", "clips", cost))
+    return jobs
+
+
+def make_workers(specs):
+    if not specs:
+        specs = ["worker1:2", "worker2:2", "worker3:2"]
+    workers = []
+    for spec in specs:
+        name, slots = spec.split(":")
+        workers.append(simulator.SimulatedWorker(name, int(slots)))
+    return workers
+
+
+def format_value(value, format):
+    if value is None:
+        return "-"
+    return format % value
+
+
+def main(args):
+    if args and (":" not in args[0]):
+        jobs = load_trace(args[0])
+        args = args[1:]
+    else:
+        jobs = make_trace()
+    workers = make_workers(args)
+    slots = sum([w.getMaxTask() for w in workers])
+    configs = [{"policy": p} for p in adminconsts.SCHEDULER_POLICIES]
+    print "%d jobs, %d workers, %d slots" % (len(jobs), len(workers), slots)
+    print "%-10s %6s %9s %6s %9s %9s %9s %9s" % ("policy", "done",
+                                                 "jobs/h", "util",
+                                                 "wait p50", "wait p90",
+                                                 "wait p99", "fairness")
+    results = simulator.compare(jobs, workers, configs)
+    for r in results:
+        print "%-10s %6d %9s %6s %9s %9s %9s %9s" % (
+            r["policy"], r["done"],
+            format_value(r["throughput"], "%.1f"),
+            format_value(r["utilization"], "%.2f"),
+            format_value(r["wait50"], "%.0f"),
+            format_value(r["wait90"], "%.0f"),
+            format_value(r["wait99"], "%.0f"),
+            format_value(r["fairness"], "%.3f"))
+    print
+    print "%-10s %-12s %6s %9s %9s %9s" % ("policy", "customer", "jobs",
+                                          "wait avg", "wait p90",
+                                          "slowdown")
+    for r in results:
+        customers = r["customers"].items()
+        customers.sort()
+        for custId, c in customers:
+            print "%-10s %-12s %6d %9.0f %9.0f %9.1f" % (
+                r["policy"], custId, c["count"], c["waitMean"],
+                c["wait90"], c["slowdown"])
+    print "waits in second, fairness is the Jain's index of the customers"
+    print "mean slowdown (time from arrival to done divided by the cost)"
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,47 @@
+# -*- Mode: Python -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+# Flumotion - a streaming media server
+# Copyright (C) 2004,2005,2006,2007,2008,2009 Fluendo, S.L.
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+#
+# This file may be distributed and/or modified under the terms of
+# the GNU Lesser General Public License version 2.1 as published by
+# the Free Software Foundation.
+# This file is distributed without any warranty; without even the implied
+# warranty of merchantability or fitness for a particular purpose.
+# See "LICENSE.LGPL" in the source distribution for more information.
+#
+# Headers in this file shall remain intact.
+
+import os
+
+
+class FakeVirtPath(object):
+    """
+    A virtual path always localized to the same local path.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def append(self, name):
+        return FakeVirtPath(os.path.join(self.path, name))
+
+    def localize(self, local):
+        return self.path
+
+
+class FakeMonitor(object):
+    """
+    The monitor attributes used by the HTTP monitor resources.
+    """
+
+    def __init__(self, mode="md5"):
+        self._local = None
+        self._pathAttr = None
+        self.mode = mode
+
+    def get_fingerprint_mode(self, profile_name):
+        return self.mode
@@ -0,0 +1,123 @@
+# -*- Mode: Python; test-case-name: flumotion.test.test_admission -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+# Flumotion - a streaming media server
+# Copyright (C) 2004,2005,2006,2007,2008,2009 Fluendo, S.L.
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+#
+# This file may be distributed and/or modified under the terms of
+# the GNU Lesser General Public License version 2.1 as published by
+# the Free Software Foundation.
+# This file is distributed without any warranty; without even the implied
+# warranty of merchantability or fitness for a particular purpose.
+# See "LICENSE.LGPL" in the source distribution for more information.
+#
+# Headers in this file shall remain intact.
+
+import common
+
+from twisted.internet import task
+from twisted.trial import unittest
+
+from flumotion.transcoder.admin.admission import TokenBucket
+from flumotion.transcoder.admin.admission import AdmissionController
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def testRate(self):
+        bucket = TokenBucket(2, 3, 0)
+        for i in range(3):
+            self.assertEquals(bucket.getDelay(0), 0)
+            bucket.consume(0)
+        self.assertEquals(bucket.getDelay(0), 0.5)
+        self.assertEquals(bucket.getDelay(0.5), 0)
+        bucket.consume(0.5)
+        self.failIf(bucket.isFull(1))
+        # The tokens do not pile up above the burst
+        self.failUnless(bucket.isFull(100))
+        for i in range(3):
+            bucket.consume(100)
+        self.assertEquals(bucket.getDelay(100), 0.5)
+
+
+class TestAdmissionController(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.admitted = [] # [(time, workerName, label)]
+
+    def admit(self, controller, workerName, label):
+        d = controller.admit(workerName, label)
+        d.addCallback(self.__cbAdmitted, workerName, label)
+        return d
+
+    def times(self, label=None):
+        return [t for t, w, l in self.admitted if label in (None, l)]
+
+    def testDisabled(self):
+        controller = AdmissionController(reactor=self.clock)
+        self.failIf(controller.isEnabled())
+        for i in range(10):
+            self.admit(controller, "worker", i)
+        self.assertEquals(len(self.admitted), 10)
+        self.assertEquals(controller.getWaitingCount(), 0)
+
+    def testRate(self):
+        controller = AdmissionController(1, 2, reactor=self.clock)
+        for i in range(5):
+            self.admit(controller, "worker%d" % i, i)
+        self.assertEquals(self.times(), [0, 0])
+        self.assertEquals(controller.getWaitingCount(), 3)
+        self.clock.pump([0.5] * 8)
+        self.assertEquals(self.times(), [0, 0, 1, 2, 3])
+        self.assertEquals(controller.getWaitingCount(), 0)
+
+    def testWorkerRate(self):
+        controller = AdmissionController(workerRate=0.5, workerBurst=1,
+                                         reactor=self.clock)
+        for i in range(3):
+            self.admit(controller, "busy", "busy%d" % i)
+        self.admit(controller, "idle", "idle")
+        # The busy worker does not delay the idle one
+        self.assertEquals(self.times(), [0, 0])
+        self.assertEquals(controller.getWaitingCount("busy"), 2)
+        self.clock.pump([1] * 4)
+        self.assertEquals(self.times(), [0, 0, 2, 4])
+
+    def testCancel(self):
+        controller = AdmissionController(1, 1, reactor=self.clock)
+        self.admit(controller, "worker", "first")
+        d = self.admit(controller, "worker", "canceled")
+        self.admit(controller, "worker", "last")
+        self.failUnless(controller.cancel(d))
+        self.failIf(controller.cancel(d))
+        self.clock.pump([1] * 3)
+        # The canceled loading did not use a token
+        self.assertEquals([l for t, w, l in self.admitted], ["first", "last"])
+        self.assertEquals(self.times(), [0, 1])
+
+    def testStorm(self):
+        # 40 components on 4 workers started at once, like
+        # when the admin starts or a pause is lifted
+        controller = AdmissionController(2, 10, 0.5, 3, reactor=self.clock)
+        for i in range(40):
+            self.admit(controller, "worker%d" % (i % 4), i)
+        self.clock.pump([0.25] * 200)
+        self.assertEquals(len(self.admitted), 40)
+        for i in range(4):
+            worker = "worker%d" % i
+            times = [t for t, w, l in self.admitted if w == worker]
+            # Never more than the burst plus the rate in a window
+            for start in times:
+                loads = len([t for t in times if start <= t < start + 10])
+                self.failUnless(loads <= 3 + 0.5 * 10)
+        # The workers are used in parallel
+        self.failUnless(max(self.times()) <= 10 / 0.5 + 1)
+
+
+    ## Private Methods ##
+
+    def __cbAdmitted(self, waited, workerName, label):
+        self.admitted.append((self.clock.seconds(), workerName, label))
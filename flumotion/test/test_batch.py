@@ -0,0 +1,218 @@
+# -*- Mode: Python; test-case-name: flumotion.test.test_batch -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+# Flumotion - a streaming media server
+# Copyright (C) 2004,2005,2006,2007,2008,2009 Fluendo, S.L.
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+#
+# This file may be distributed and/or modified under the terms of
+# the GNU Lesser General Public License version 2.1 as published by
+# the Free Software Foundation.
+# This file is distributed without any warranty; without even the implied
+# warranty of merchantability or fitness for a particular purpose.
+# See "LICENSE.LGPL" in the source distribution for more information.
+#
+# Headers in this file shall remain intact.
+
+
+import common
+
+import os
+import time
+import threading
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from twisted.internet import reactor
+from twisted.internet.defer import DeferredList
+from twisted.trial import unittest
+from twisted.web import client, error, server
+from twisted.web.resource import Resource
+
+from flumotion.component.monitor import batch
+from flumotion.component.monitor.resource import RequestHandler
+
+from monitortestutils import FakeVirtPath, FakeMonitor
+
+
+class TestHandler(RequestHandler):
+    """
+    Counts the concurrent imports and fails the imports
+    of the files listed in failing, once.
+    """
+
+    def __init__(self, *args, **kwargs):
+        RequestHandler.__init__(self, *args, **kwargs)
+        self.failing = set()
+        self.running = 0
+        self.maxRunning = 0
+        self._lock = threading.Lock()
+
+    def _import_file(self, src, dest, mode):
+        self._lock.acquire()
+        try:
+            self.running += 1
+            self.maxRunning = max(self.maxRunning, self.running)
+        finally:
+            self._lock.release()
+        try:
+            time.sleep(0.01)
+            if src in self.failing:
+                self.failing.discard(src)
+                raise IOError("Import failed")
+            return RequestHandler._import_file(self, src, dest, mode)
+        finally:
+            self._lock.acquire()
+            self.running -= 1
+            self._lock.release()
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.source = os.path.abspath(self.mktemp())
+        self.incoming = os.path.join(self.source, "incoming")
+        os.makedirs(self.incoming)
+        self.files = []
+        for i in range(10):
+            path = os.path.join(self.source, "file%d" % i)
+            open(path, "w").write("data %d" % i)
+            self.files.append(path)
+        self.queued = []
+        self.handler = TestHandler(FakeMonitor(), FakeVirtPath(self.incoming),
+                                   self._queued, "video")
+        self.registry = batch.BatchRegistry(2)
+        self.handler.putChild(batch.BATCH_CHILD,
+                              batch.BatchResource(self.handler,
+                                                  self.registry, 20))
+        root = Resource()
+        root.putChild("video", self.handler)
+        self.port = reactor.listenTCP(0, server.Site(root),
+                                      interface="127.0.0.1")
+
+    def tearDown(self):
+        return self.port.stopListening()
+
+    def _queued(self, precomputed, path, name, fileinfo, detection_time,
+                virt_base, profile_name, params):
+        self.queued.append((name, params))
+
+    def post(self, body, key=None):
+        url = "http://127.0.0.1:%d/video/batch" % self.port.getHost().port
+        headers = {"Content-Type": "application/json"}
+        if key:
+            headers["Idempotency-Key"] = key
+        if not isinstance(body, str):
+            body = json.dumps(body)
+        d = client.getPage(url, method="POST", postdata=body,
+                           headers=headers)
+        d.addCallback(json.loads)
+        return d
+
+    def postError(self, body, code):
+
+        def check(failure):
+            failure.trap(error.Error)
+            self.assertEquals(failure.value.status, code)
+            return json.loads(failure.value.response)
+
+        d = self.post(body)
+        d.addCallbacks(lambda r: self.fail("Request succeeded: %r" % r),
+                       check)
+        return d
+
+    def testBatch(self):
+        body = {"files": [self.files[0], "../file1",
+                          {"file": self.files[2],
+                           "params": {"cue-points": "1,2"},
+                           "profile": "audio"}]}
+
+        def check(answer):
+            results = answer["results"]
+            self.assertEquals([r["status"] for r in results],
+                              ["queued"] * 3)
+            self.assertEquals(results[1]["file"],
+                              os.path.join(self.incoming, "../file1"))
+            self.assertEquals(sorted(os.listdir(self.incoming)),
+                              ["file0", "file1", "file2"])
+            queued = dict(self.queued)
+            self.assertEquals(queued["file2"],
+                              {"cue-points": "1,2", "profile-name": "video"})
+            self.assertEquals(queued["file0"],
+                              {"cue-points": None, "profile-name": "video"})
+
+        return self.post(body).addCallback(check)
+
+    def testValidation(self):
+
+        def check(answer):
+            self.assertEquals(len(answer["errors"]), 2)
+            self.assertEquals(os.listdir(self.incoming), [])
+            self.assertEquals(self.queued, [])
+
+        d = self.postError({"files": [self.files[0], "missing",
+                                      {"params": {}}]}, "400")
+        d.addCallback(check)
+        d.addCallback(lambda _: self.postError("not json", "400"))
+        d.addCallback(lambda _: self.postError({"files": self.files * 3},
+                                               "400"))
+        return d
+
+    def testConcurrency(self):
+
+        def check(answer):
+            self.assertEquals(len(answer["results"]), 10)
+            self.assertEquals(len(self.queued), 10)
+            self.failUnless(self.handler.maxRunning <= 2)
+
+        return self.post({"files": self.files}).addCallback(check)
+
+    def testIdempotency(self):
+        body = {"files": self.files[:3]}
+        self.handler.failing.add(self.files[1])
+
+        def first(answer):
+            self.assertEquals([r["status"] for r in answer["results"]],
+                              ["queued", "failed", "queued"])
+            self.assertEquals(len(self.queued), 2)
+            return self.post(body, "key")
+
+        def retried(answer):
+            # Only the failed file is submitted again
+            self.assertEquals([r["status"] for r in answer["results"]],
+                              ["queued"] * 3)
+            self.assertEquals(sorted([n for n, p in self.queued]),
+                              ["file0", "file1", "file2"])
+            return self.post(body, "key")
+
+        def replayed(answer):
+            self.assertEquals(len(self.queued), 3)
+            # The same key cannot be used for another batch
+            return self.post({"files": self.files[:2]}, "key")
+
+        def conflict(failure):
+            failure.trap(error.Error)
+            self.assertEquals(failure.value.status, "409")
+
+        d = self.post(body, "key")
+        d.addCallback(first)
+        d.addCallback(retried)
+        d.addCallback(replayed)
+        d.addCallbacks(lambda r: self.fail("Key reused: %r" % r), conflict)
+        return d
+
+    def testConcurrentRetry(self):
+        # A retry while the batch is running waits for its results
+        body = {"files": self.files}
+
+        def check(answers):
+            first, second = [a for _, a in answers]
+            self.assertEquals(first, second)
+            self.assertEquals(len(self.queued), 10)
+
+        d = DeferredList([self.post(body, "key"), self.post(body, "key")])
+        return d.addCallback(check)
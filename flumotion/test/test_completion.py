@@ -0,0 +1,278 @@
+# -*- Mode: Python; test-case-name: flumotion.test.test_completion -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+# Flumotion - a streaming media server
+# Copyright (C) 2004,2005,2006,2007,2008,2009 Fluendo, S.L.
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+#
+# This file may be distributed and/or modified under the terms of
+# the GNU Lesser General Public License version 2.1 as published by
+# the Free Software Foundation.
+# This file is distributed without any warranty; without even the implied
+# warranty of merchantability or fitness for a particular purpose.
+# See "LICENSE.LGPL" in the source distribution for more information.
+#
+# Headers in this file shall remain intact.
+
+
+import common
+
+import os
+import time
+import signal
+
+from twisted.internet import defer, reactor
+from twisted.trial import unittest
+
+from flumotion.inhouse import log
+
+from flumotion.ovp import openfiles
+from flumotion.component.monitor.watcher import DirectoryWatcher
+
+
+SCAN_PERIOD = 0.2
+
+
+class Writer(object):
+    """
+    Writes a file chunk by chunk, waiting between the chunks
+    as given by the pauses list, then closes it.
+    """
+
+    def __init__(self, path, pauses, chunk=1024):
+        self.path = path
+        self.pauses = list(pauses)
+        self.chunk = "x" * chunk
+        self.closed = None
+        self.done = defer.Deferred()
+        self._file = open(path, "wb")
+
+    def start(self):
+        reactor.callLater(0, self._write)
+        return self.done
+
+    def cancel(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def _write(self):
+        self._file.write(self.chunk)
+        self._file.flush()
+        if self.pauses:
+            reactor.callLater(self.pauses.pop(0), self._write)
+            return
+        self._file.close()
+        self.closed = time.time()
+        self.done.callback(self.closed)
+
+
+def slowWriter(path, duration):
+    """A writer pausing longer than the scan period between each chunk."""
+    count = int(duration / (SCAN_PERIOD * 3))
+    return Writer(path, [SCAN_PERIOD * 3] * count)
+
+def burstyWriter(path, bursts):
+    """A writer writing bursts of chunks with long pauses in between."""
+    pauses = []
+    for i in range(bursts):
+        pauses.extend([0.01] * 10)
+        pauses.append(SCAN_PERIOD * 4)
+    return Writer(path, pauses)
+
+
+class TestOpenFiles(unittest.TestCase):
+
+    if not openfiles.isAvailable():
+        skip = "No completion method available"
+
+    def setUp(self):
+        self.directory = self.mktemp()
+        os.makedirs(self.directory)
+        self.path = os.path.join(self.directory, "file")
+
+    def check(self, method):
+        f = open(self.path, "wb")
+        try:
+            f.write("data")
+            self.assertEquals(openfiles.checkWriters([self.path], method),
+                              {self.path: True})
+        finally:
+            f.close()
+        reader = open(self.path, "rb")
+        try:
+            self.assertEquals(openfiles.checkWriters([self.path], method),
+                              {self.path: False})
+        finally:
+            reader.close()
+
+    def testProc(self):
+        if not openfiles.isAvailable(openfiles.METHOD_PROC):
+            raise unittest.SkipTest("/proc not available")
+        self.check(openfiles.METHOD_PROC)
+
+    def testLease(self):
+        if not openfiles.isAvailable(openfiles.METHOD_LEASE):
+            raise unittest.SkipTest("leases not available")
+        open(self.path, "wb").close()
+        if not openfiles.ignoreLeaseBreaks():
+            raise unittest.SkipTest("lease breaks cannot be ignored")
+        if openfiles.leaseWriter(self.path) is None:
+            raise unittest.SkipTest("leases not supported here")
+        self.check(openfiles.METHOD_LEASE)
+
+    def testAuto(self):
+        self.check(openfiles.METHOD_AUTO)
+
+    def testSharedScan(self):
+        if not openfiles.isAvailable(openfiles.METHOD_PROC):
+            raise unittest.SkipTest("/proc not available")
+        method = openfiles.METHOD_PROC
+        open(self.path, "wb").close()
+        # Old enough for the scans to be reused
+        past = time.time() - 10
+        os.utime(self.path, (past, past))
+        self.assertEquals(openfiles.checkWriters([self.path], method, 60),
+                          {self.path: False})
+        f = open(self.path, "ab")
+        try:
+            # The writer opened the file after the scan
+            self.assertEquals(openfiles.checkWriters([self.path], method, 60),
+                              {self.path: False})
+            # The scan is not reused once the file is modified
+            f.write("data")
+            f.flush()
+            self.assertEquals(openfiles.checkWriters([self.path], method, 60),
+                              {self.path: True})
+        finally:
+            f.close()
+
+    def testNetworkFileSystem(self):
+        if not openfiles.isAvailable(openfiles.METHOD_PROC):
+            raise unittest.SkipTest("/proc not available")
+        original = openfiles.is_network_filesystem
+        openfiles.is_network_filesystem = lambda path: True
+        f = open(self.path, "wb")
+        try:
+            # The writers of the other hosts cannot be seen
+            self.assertEquals(openfiles.checkWriters([self.path],
+                                                     openfiles.METHOD_PROC),
+                              {self.path: None})
+        finally:
+            f.close()
+            openfiles.is_network_filesystem = original
+
+    def testLeaseBreaks(self):
+        if not openfiles.isAvailable(openfiles.METHOD_LEASE):
+            raise unittest.SkipTest("leases not available")
+        open(self.path, "wb").close()
+        handler = signal.signal(signal.SIGIO, signal.SIG_DFL)
+        try:
+            # No lease is taken while a break would kill the process
+            self.assertEquals(openfiles.leaseWriter(self.path), None)
+            self.failUnless(openfiles.ignoreLeaseBreaks())
+            self.assertEquals(signal.getsignal(signal.SIGIO),
+                              signal.SIG_IGN)
+        finally:
+            signal.signal(signal.SIGIO, handler or signal.SIG_DFL)
+
+
+class TestCompletion(unittest.TestCase):
+
+    if not openfiles.isAvailable():
+        skip = "No completion method available"
+
+    def setUp(self):
+        self.directory = self.mktemp()
+        os.makedirs(self.directory)
+        self.completed = {}
+        self.writers = []
+        self.watcher = None
+
+    def tearDown(self):
+        for writer in self.writers:
+            writer.cancel()
+        if self.watcher:
+            self.watcher.stop()
+
+    def startWatcher(self, method, quiet_time=0.1):
+        logger = log.Logger("test-completion")
+        self.watcher = DirectoryWatcher(logger, self.directory + "/", None,
+                                        timeout=SCAN_PERIOD,
+                                        completion_method=method,
+                                        quiet_time=quiet_time,
+                                        check_period=SCAN_PERIOD / 2)
+        self.watcher.connect("file-completed", self._completed)
+        self.watcher.start()
+
+    def startWriter(self, writer):
+        self.writers.append(writer)
+        return writer.start()
+
+    def waitCompleted(self, names, timeout):
+        d = defer.Deferred()
+        deadline = time.time() + timeout
+
+        def poll():
+            if [n for n in names if n not in self.completed]:
+                if time.time() < deadline:
+                    reactor.callLater(0.05, poll)
+                    return
+            d.callback(self.completed)
+
+        poll()
+        return d
+
+    def _completed(self, watcher, name, statinfo):
+        self.completed[name] = time.time()
+
+    def testSlowWriter(self):
+        writer = slowWriter(os.path.join(self.directory, "slow"), 2)
+        self.startWatcher(openfiles.METHOD_AUTO)
+
+        def closed(closeTime):
+            self.failIf("slow" in self.completed, "completed before closed")
+            d = self.waitCompleted(["slow"], 2)
+            d.addCallback(check, closeTime)
+            return d
+
+        def check(_, closeTime):
+            self.failUnless("slow" in self.completed)
+            # Completed without waiting for two scans
+            self.failUnless(self.completed["slow"] - closeTime
+                            < SCAN_PERIOD * 2)
+
+        return self.startWriter(writer).addCallback(closed)
+
+    def testBurstyWriters(self):
+        self.startWatcher(openfiles.METHOD_AUTO)
+        names = ["bursty%d" % i for i in range(3)]
+        writers = [burstyWriter(os.path.join(self.directory, n), 3)
+                   for n in names]
+
+        def closed(_):
+            for name, writer in zip(names, writers):
+                self.failIf(self.completed.get(name, writer.closed)
+                            < writer.closed, "completed before closed")
+            return self.waitCompleted(names, 2).addCallback(check)
+
+        def check(_):
+            self.assertEquals(sorted(self.completed.keys()), names)
+
+        d = defer.DeferredList([self.startWriter(w) for w in writers])
+        return d.addCallback(closed)
+
+    def testQuietTime(self):
+        # A file closed but modified recently waits the quiet time
+        writer = Writer(os.path.join(self.directory, "quiet"), [])
+        self.startWatcher(openfiles.METHOD_AUTO, quiet_time=1)
+
+        def closed(closeTime):
+            d = self.waitCompleted(["quiet"], 3)
+            d.addCallback(check, closeTime)
+            return d
+
+        def check(_, closeTime):
+            self.failUnless(self.completed["quiet"] - closeTime >= 0.9)
+
+        return self.startWriter(writer).addCallback(closed)
@@ -0,0 +1,145 @@
+# -*- Mode: Python; test-case-name: flumotion.test.test_cooperator -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+# Flumotion - a streaming media server
+# Copyright (C) 2004,2005,2006,2007,2008,2009 Fluendo, S.L.
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+#
+# This file may be distributed and/or modified under the terms of
+# the GNU Lesser General Public License version 2.1 as published by
+# the Free Software Foundation.
+# This file is distributed without any warranty; without even the implied
+# warranty of merchantability or fitness for a particular purpose.
+# See "LICENSE.LGPL" in the source distribution for more information.
+#
+# Headers in this file shall remain intact.
+
+
+import common
+
+import time
+
+from twisted.internet import defer, reactor
+from twisted.trial import unittest
+
+from flumotion.component.monitor import cooperator
+
+
+class TestMonitorCooperator(unittest.TestCase):
+
+    def setUp(self):
+        self.cooperator = cooperator.MonitorCooperator(None, 0.01, 0.001)
+        self.order = []
+
+    def tearDown(self):
+        self.cooperator.stop()
+
+    def iterate(self, name, count, duration=0):
+        for i in range(count):
+            self.order.append(name)
+            if duration:
+                time.sleep(duration)
+            yield None
+
+    def testLanes(self):
+        c = self.cooperator
+        d3 = c.cooperate(self.iterate("F", 2), cooperator.LANE_FINGERPRINT, 2)
+        d2 = c.cooperate(self.iterate("D", 2), cooperator.LANE_DISCOVERY, 2)
+        d1 = c.cooperate(self.iterate("C", 2), cooperator.LANE_COMPLETION, 2)
+        self.assertEquals(c.getStats()[0], (2, 2, 2))
+        c.start()
+
+        def check(_):
+            self.assertEquals("".join(self.order), "CCDDFF")
+            self.assertEquals(c.getStats()[0], (0, 0, 0))
+
+        d = defer.DeferredList([d1, d2, d3], fireOnOneErrback=True)
+        return d.addCallback(check)
+
+    def testRoundRobin(self):
+        c = self.cooperator
+        d1 = c.cooperate(self.iterate("A", 3), cooperator.LANE_DISCOVERY)
+        d2 = c.cooperate(self.iterate("B", 3), cooperator.LANE_DISCOVERY)
+        c.start()
+
+        def check(_):
+            self.assertEquals("".join(self.order), "ABABAB")
+
+        d = defer.DeferredList([d1, d2], fireOnOneErrback=True)
+        return d.addCallback(check)
+
+    def testTimeSlice(self):
+        c = self.cooperator
+        c.start()
+        ticks = []
+
+        def tick():
+            ticks.append(len(self.order))
+            if len(self.order) < 20:
+                reactor.callLater(0, tick)
+
+        reactor.callLater(0, tick)
+        d = c.cooperate(self.iterate("X", 20, 0.004),
+                        cooperator.LANE_DISCOVERY, 20)
+
+        def check(_):
+            # The reactor ran between the slices of about 3 iterations
+            self.failUnless(len(ticks) > 5, ticks)
+
+        return d.addCallback(check)
+
+    def testCall(self):
+        c = self.cooperator
+        c.start()
+        d = c.call(cooperator.LANE_FINGERPRINT, lambda x: x * 2, 21)
+        d.addCallback(self.assertEquals, 42)
+        return d
+
+    def testSuspended(self):
+        c = self.cooperator
+
+        def iterate():
+            waiting = defer.Deferred()
+            reactor.callLater(0.01, waiting.callback, None)
+            self.order.append("S")
+            yield waiting
+            self.order.append("S")
+
+        d1 = c.cooperate(iterate(), cooperator.LANE_COMPLETION)
+        d2 = c.cooperate(self.iterate("D", 2), cooperator.LANE_DISCOVERY)
+        c.start()
+
+        def check(_):
+            # The discovery lane is served while completion is waiting
+            self.assertEquals("".join(self.order), "SDDS")
+
+        d = defer.DeferredList([d1, d2], fireOnOneErrback=True)
+        return d.addCallback(check)
+
+    def testStop(self):
+        c = self.cooperator
+        waiting = defer.Deferred()
+
+        def iterate():
+            yield waiting
+
+        d1 = c.cooperate(iterate(), cooperator.LANE_COMPLETION)
+        c.start()
+
+        def stop(_):
+            self.assertEquals(c.getStats()[1], 1)
+            d2 = c.cooperate(self.iterate("D", 2), cooperator.LANE_DISCOVERY)
+            d3 = c.call(cooperator.LANE_FINGERPRINT, lambda: 42)
+            c.stop()
+            self.assertEquals(c.getStats()[:2], ((0, 0, 0), 0))
+            # Resuming a dropped task is ignored
+            waiting.callback(None)
+            self.assertEquals(self.order, [])
+            dl = [self.assertFailure(d, cooperator.CooperatorStoppedError)
+                  for d in (d1, d2, d3)]
+            return defer.DeferredList(dl, fireOnOneErrback=True)
+
+        d = defer.Deferred()
+        reactor.callLater(0.05, d.callback, None)
+        return d.addCallback(stop)
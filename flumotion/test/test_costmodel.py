@@ -0,0 +1,99 @@
+# -*- Mode: Python; test-case-name: flumotion.test.test_costmodel -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+# Flumotion - a streaming media server
+# Copyright (C) 2004,2005,2006,2007,2008,2009 Fluendo, S.L.
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+#
+# This file may be distributed and/or modified under the terms of
+# the GNU Lesser General Public License version 2.1 as published by
+# the Free Software Foundation.
+# This file is distributed without any warranty; without even the implied
+# warranty of merchantability or fitness for a particular purpose.
+# See "LICENSE.LGPL" in the source distribution for more information.
+#
+# Headers in this file shall remain intact.
+
+
+import common
+
+from twisted.trial import unittest
+
+from flumotion.transcoder.admin import costmodel
+
+
+class Bag(object):
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def makeReport(realTime, fileSize=None, duration=None):
+    analysis = Bag(videoDuration=duration, audioDuration=None)
+    source = Bag(fileSize=fileSize, analysis=analysis)
+    return Bag(cpuUsageTranscoding=(realTime * 0.45, realTime / 2, 90.0),
+               cpuUsageTotal=(realTime * 0.9, realTime, 90.0), source=source)
+
+
+class TestCostModel(unittest.TestCase):
+
+    def testSize(self):
+        model = costmodel.SizeCostModel(10, 0.5)
+        self.assertEquals(model.estimate("p"), 10)
+        self.assertEquals(model.estimate("p", 100), 60)
+        model.record("p", 1000, 100)
+        self.assertEquals(model.estimate("p", 100), 60)
+
+    def testHistory(self):
+        model = costmodel.HistoryCostModel(10, 0.5, smoothing=0.5)
+        # Without history, like the size model
+        self.assertEquals(model.estimate("hd", 100), 60)
+        model.record("hd", 200, 100, 50)
+        model.record("hd", 400, 100, 50)
+        # Realtime factors 4 and 8, smoothed to 6
+        self.assertEquals(model.estimate("hd", None, 10), 60)
+        # 2 and 4 seconds by byte, smoothed to 3
+        self.assertEquals(model.estimate("hd", 10), 30)
+        self.assertEquals(model.estimate("hd"), 300)
+        self.assertEquals(model.getHistory("hd").count, 2)
+        # Unknown profiles use the history of all the profiles
+        model.record("sd", 10, 10, 10)
+        self.assertEquals(model.getHistory("new"), None)
+        self.assertEquals(model.estimate("new", None, 10), 35)
+        self.assertEquals(model.estimate("sd", None, 10), 10)
+
+    def testReports(self):
+        sample = costmodel.getReportSample(makeReport(60, 1000, 30.0))
+        self.assertEquals(sample, (60, 1000, 30.0))
+        report = makeReport(60)
+        report.cpuUsageTotal = None
+        self.assertEquals(costmodel.getReportSample(report), None)
+        report.cpuUsageTotal = (1.0, 2.0, 50.0)
+        report.source = None
+        self.assertEquals(costmodel.getReportSample(report),
+                          (2.0, None, None))
+        model = costmodel.HistoryCostModel()
+        costmodel.recordReport(model, "p", makeReport(60, 1000, 30.0))
+        self.assertEquals(model.estimate("p", None, 15.0), 30)
+
+    def testEvaluate(self):
+        # Two profiles with a constant realtime factor
+        samples = []
+        for i in range(20):
+            samples.append(("fast", 10.0 * i, 1000 * i, 20.0 * i))
+            samples.append(("slow", 40.0 * i, 1000 * i, 10.0 * i))
+        size = costmodel.evaluate(costmodel.SizeCostModel(), samples)
+        history = costmodel.evaluate(costmodel.HistoryCostModel(), samples)
+        self.assertEquals(size["count"], 40)
+        self.failUnless(history["relative"] < size["relative"] / 2)
+        self.failUnless(history["absolute"] < size["absolute"] / 2)
+        empty = costmodel.evaluate(costmodel.HistoryCostModel(), [])
+        self.assertEquals(empty["count"], 0)
+
+    def testRegistry(self):
+        self.failUnless(isinstance(costmodel.createCostModel("size"),
+                                   costmodel.SizeCostModel))
+        self.assertEquals(costmodel.createCostModel("unknown"), None)
+        costmodel.registerCostModel("test", lambda: "model")
+        self.assertEquals(costmodel.createCostModel("test"), "model")
@@ -0,0 +1,143 @@
+# -*- Mode: Python; test-case-name: flumotion.test.test_fileutils -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+# Flumotion - a streaming media server
+# Copyright (C) 2004,2005,2006,2007,2008,2009 Fluendo, S.L.
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+#
+# This file may be distributed and/or modified under the terms of
+# the GNU Lesser General Public License version 2.1 as published by
+# the Free Software Foundation.
+# This file is distributed without any warranty; without even the implied
+# warranty of merchantability or fitness for a particular purpose.
+# See "LICENSE.LGPL" in the source distribution for more information.
+#
+# Headers in this file shall remain intact.
+
+
+import common
+
+import os
+import commands
+
+from twisted.trial import unittest
+
+from flumotion.ovp import fileutils, libmagic
+
+
+def _ebml(doctype):
+    body = ("\x42\x86\x81\x01\x42\xf7\x81\x01\x42\xf2\x81\x04"
+            "\x42\xf3\x81\x08\x42\x82" + chr(0x80 | len(doctype)) + doctype
+            + "\x42\x87\x81\x04\x42\x85\x81\x02")
+    return ("\x1a\x45\xdf\xa3" + chr(0x80 | len(body)) + body
+            + "\x18\x53\x80\x67\x01\x00\x00\x00\x00\x00\x00\x00")
+
+
+# Headers of the container formats we ingest,
+# with the expected start of the mime type.
+SAMPLE_HEADERS = {
+    "mp4": ("\x00\x00\x00\x18ftypmp42\x00\x00\x00\x00mp42isom"
+            "\x00\x00\x00\x08free", "video/mp4"),
+    "m4a": ("\x00\x00\x00\x18ftypM4A \x00\x00\x00\x00M4A mp42",
+            "audio/"),
+    "3gp": ("\x00\x00\x00\x14ftyp3gp4\x00\x00\x02\x003gp4",
+            "video/3gpp"),
+    "mov": ("\x00\x00\x00\x14ftypqt  \x20\x05\x03\x00qt  ",
+            "video/quicktime"),
+    "avi": ("RIFF\x00\x10\x00\x00AVI LIST\xc0\x00\x00\x00hdrlavih8\x00\x00\x00",
+            "video/x-msvideo"),
+    "wav": ("RIFF$\x00\x00\x00WAVEfmt \x10\x00\x00\x00\x01\x00\x02\x00"
+            "D\xac\x00\x00\x10\xb1\x02\x00\x04\x00\x10\x00data\x00\x00\x00\x00",
+            "audio/"),
+    "mkv": (_ebml("matroska"), "video/x-matroska"),
+    "webm": (_ebml("webm"), "video/webm"),
+    "flv": ("FLV\x01\x05\x00\x00\x00\x09\x00\x00\x00\x00",
+            "video/x-flv"),
+    "asf": ("\x30\x26\xb2\x75\x8e\x66\xcf\x11\xa6\xd9\x00\xaa\x00\x62\xce\x6c"
+            + "\x00" * 14, "video/x-ms-asf"),
+    "mpg": ("\x00\x00\x01\xba\x44\x00\x04\x00\x04\x01\x01\x89\xc3\xf8"
+            "\x00\x00\x01\xbb", "video/mpeg"),
+    "m2v": ("\x00\x00\x01\xb3\x16\x00\xf0\x13\xff\xff\xe0\x18",
+            "video/mpeg"),
+    "ts": (("\x47\x40\x00\x10" + "\x00" * 184) * 4, "video/"),
+    "ogg": ("OggS\x00\x02\x00\x00\x00\x00\x00\x00\x00\x00\x01\x02\x03\x04"
+            "\x00\x00\x00\x00\x00\x00\x00\x00\x01\x1e\x01vorbis\x00\x00\x00"
+            "\x00\x02D\xac\x00\x00", ""),
+    "mp3": ("ID3\x03\x00\x00\x00\x00\x00\x0a" + "\x00" * 10
+            + "\xff\xfb\x90\x64" + "\x00" * 400, "audio/mpeg"),
+    "flac": ("fLaC\x00\x00\x00\x22\x10\x00\x10\x00", "audio/"),
+    "text": ("Hello world\n", "text/plain"),
+    "empty": ("", ""),
+}
+
+
+def writeSampleHeaders(directory):
+    """
+    Writes the sample headers in the given directory,
+    returns a dict {name: (path, expected mime type prefix)}.
+    """
+    samples = {}
+    for name, (header, mime) in SAMPLE_HEADERS.items():
+        path = os.path.join(directory, "sample." + name)
+        f = open(path, "wb")
+        try:
+            f.write(header)
+        finally:
+            f.close()
+        samples[name] = (path, mime)
+    return samples
+
+
+class TestMimeType(unittest.TestCase):
+
+    if not libmagic.isAvailable():
+        skip = "libmagic not available"
+
+    def setUp(self):
+        directory = self.mktemp()
+        os.makedirs(directory)
+        self.samples = writeSampleHeaders(directory)
+
+    def testMimeType(self):
+        for name, (path, expected) in self.samples.items():
+            mime = fileutils.magic_mimetype(path)
+            self.failUnless(mime.startswith(expected),
+                            "%s detected as %r" % (name, mime))
+
+    def testSameAsFileCommand(self):
+        if commands.getstatusoutput("file --version")[0] != 0:
+            raise unittest.SkipTest("file command not available")
+        for name, (path, _) in self.samples.items():
+            self.assertEquals(fileutils.magic_mimetype(path),
+                              commands.getoutput("file -biL " + path))
+            self.assertEquals(fileutils.magic_description(path),
+                              commands.getoutput("file -bL " + path))
+
+    def testMissingFile(self):
+        path = os.path.join(self.mktemp(), "missing")
+        self.failUnless(fileutils.magic_mimetype(path))
+        self.failUnless(fileutils.magic_description(path))
+
+
+class TestFileSystem(unittest.TestCase):
+
+    def testNetworkFileSystem(self):
+        mounts = self.mktemp()
+        f = open(mounts, "w")
+        f.write("/dev/sda1 / ext4 rw 0 0\n"
+                "server:/export /mnt/media nfs4 rw 0 0\n"
+                "/dev/sdb1 /mnt/media/local xfs rw 0 0\n"
+                "//srv/share /mnt/my\\040share cifs rw 0 0\n")
+        f.close()
+        self.assertEquals(fileutils.filesystem_type("/tmp", mounts), "ext4")
+        self.assertEquals(fileutils.filesystem_type("/mnt/media2", mounts),
+                          "ext4")
+        self.failUnless(fileutils.is_network_filesystem("/mnt/media/in",
+                                                        mounts))
+        self.failIf(fileutils.is_network_filesystem("/mnt/media/local/in",
+                                                    mounts))
+        self.failUnless(fileutils.is_network_filesystem("/mnt/my share",
+                                                        mounts))
+        self.assertEquals(fileutils.filesystem_type("/", mounts + ".none"),
+                          None)
@@ -0,0 +1,189 @@
+# -*- Mode: Python; test-case-name: flumotion.test.test_fingerprint -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+# Flumotion - a streaming media server
+# Copyright (C) 2004,2005,2006,2007,2008,2009 Fluendo, S.L.
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+#
+# This file may be distributed and/or modified under the terms of
+# the GNU Lesser General Public License version 2.1 as published by
+# the Free Software Foundation.
+# This file is distributed without any warranty; without even the implied
+# warranty of merchantability or fitness for a particular purpose.
+# See "LICENSE.LGPL" in the source distribution for more information.
+#
+# Headers in this file shall remain intact.
+
+import common
+
+import os
+import threading
+
+from twisted.internet import defer
+from twisted.trial import unittest
+
+from flumotion.inhouse import log
+
+from flumotion.transcoder.errors import TranscoderError
+
+from flumotion.component.monitor.fingerprint import FingerprintPool
+from flumotion.component.monitor.fingerprint import FingerprintCache
+
+
+class TestFingerprintPool(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = log.Loggable()
+        self.release = threading.Event()
+        self.order = []
+
+    def tearDown(self):
+        self.release.set()
+
+    def submit(self, pool, size, name, wait=False):
+        d = pool.submit(size, self._read, name, wait)
+        d.addCallback(self.order.append)
+        return d
+
+    def testBudget(self):
+        pool = FingerprintPool(self.logger, 4, 100, 1)
+        pool.start()
+        jobs = [self.submit(pool, 10, "first", True),
+                self.submit(pool, 200, "big"),
+                self.submit(pool, 10, "small")]
+        # The big file does not fit while the first one is read,
+        # the small one goes first
+        self.assertEquals(pool.getStats()[:3], (1, 2, 20))
+        self.release.set()
+        d = defer.DeferredList(jobs)
+        d.addCallback(lambda _: self.assertEquals(self.order[-1], "big"))
+        d.addCallback(lambda _: pool.stop())
+        return d
+
+    def testDue(self):
+        # Without size rate the big file is due right away
+        pool = FingerprintPool(self.logger, 4, 100)
+        pool.start()
+        jobs = [self.submit(pool, 10, "first", True),
+                self.submit(pool, 200, "big"),
+                self.submit(pool, 10, "small")]
+        self.assertEquals(pool.getStats()[:3], (2, 1, 10))
+        self.release.set()
+        d = defer.DeferredList(jobs)
+        d.addCallback(lambda _: self.assertEquals(self.order,
+                                                  ["first", "big", "small"]))
+        d.addCallback(lambda _: pool.stop())
+        return d
+
+    def testStop(self):
+        pool = FingerprintPool(self.logger, 1)
+        pool.start()
+        self.submit(pool, 10, "first", True)
+        queued = self.submit(pool, 10, "queued")
+        self.assertFailure(queued, TranscoderError)
+        d = pool.stop()
+        # Does not wait for the file being read in the reactor thread
+        self.failIf(d.called)
+        self.release.set()
+        d.addCallback(lambda _: queued)
+        return d
+
+
+    ## Private Methods ##
+
+    def _read(self, name, wait):
+        if wait:
+            self.release.wait(10)
+        return name
+
+
+class TestFingerprintCache(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = log.Loggable()
+        directory = self.mktemp()
+        os.makedirs(directory)
+        self.path = os.path.join(directory, "cache")
+        self.caches = []
+
+    def tearDown(self):
+        for cache in self.caches:
+            cache.close()
+
+    def open(self, max_entries=100):
+        cache = FingerprintCache(self.logger, self.path, max_entries, 3600)
+        cache.load()
+        cache.open()
+        self.caches.append(cache)
+        return cache
+
+    def lines(self):
+        f = open(self.path)
+        try:
+            return f.readlines()
+        finally:
+            f.close()
+
+    def testDeferredWrites(self):
+        cache = self.open()
+        d = cache.close()
+        d.addCallback(self._cbOpened, cache)
+        return d
+
+    def testNoMimeType(self):
+        cache = self.open()
+        cache.store("file", (1, 2, 3, 4), None, "a" * 32)
+        d = cache.close()
+        d.addCallback(self._cbNoMimeType)
+        return d
+
+    def testEviction(self):
+        cache = self.open(10)
+        for i in range(12):
+            cache.store("file%d" % i, (1, i, 10, 0), "text/plain", "%032x" % i)
+        # The two least recently used were evicted on the 11th store
+        self.assertEquals(cache.getStats(), (10, 1))
+        d = cache.close()
+        d.addCallback(self._cbEvicted)
+        return d
+
+
+    ## Private Methods ##
+
+    def _cbOpened(self, _, cache):
+        self.assertEquals(self.lines(), [])
+        cache.load()
+        cache.open()
+        cache.store("file", (1, 2, 3, 4), "text/plain", "a" * 32)
+        cache.store("other", (1, 3, 3, 4), "text/plain", "b" * 32)
+        cache.forget("other")
+        # Nothing written by the reactor thread
+        self.assertEquals(cache.getStats(), (1, 3))
+        self.assertEquals(self.lines(), [])
+        d = cache.close()
+        d.addCallback(self._cbStored)
+        return d
+
+    def _cbStored(self, _):
+        self.assertEquals(len(self.lines()), 3)
+        cache = self.open()
+        self.assertEquals(cache.lookup("file", (1, 2, 3, 4)),
+                          ("text/plain", "a" * 32))
+        self.assertEquals(cache.lookup("other", (1, 3, 3, 4)), None)
+        d = cache.close()
+        # Compacted when opened
+        d.addCallback(lambda _: self.assertEquals(len(self.lines()), 1))
+        return d
+
+    def _cbEvicted(self, _):
+        cache = self.open(10)
+        self.assertEquals(cache.getStats(), (10, 0))
+        self.assertEquals(cache.lookup("file1", (1, 1, 10, 0)), None)
+        self.assertEquals(cache.lookup("file11", (1, 11, 10, 0)),
+                          ("text/plain", "%032x" % 11))
+
+    def _cbNoMimeType(self, _):
+        cache = self.open()
+        self.assertEquals(cache.lookup("file", (1, 2, 3, 4)),
+                          (None, "a" * 32))
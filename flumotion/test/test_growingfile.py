@@ -0,0 +1,139 @@
+# -*- Mode: Python; test-case-name: flumotion.test.test_growingfile -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+# Flumotion - a streaming media server
+# Copyright (C) 2004,2005,2006,2007,2008,2009 Fluendo, S.L.
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+#
+# This file may be distributed and/or modified under the terms of
+# the GNU Lesser General Public License version 2.1 as published by
+# the Free Software Foundation.
+# This file is distributed without any warranty; without even the implied
+# warranty of merchantability or fitness for a particular purpose.
+# See "LICENSE.LGPL" in the source distribution for more information.
+#
+# Headers in this file shall remain intact.
+
+
+import common
+
+import os
+
+from twisted.internet import reactor, task
+from twisted.trial import unittest
+
+from flumotion.common import log
+from flumotion.ovp import openfiles
+from flumotion.transcoder.errors import TranscoderError
+from flumotion.component.transcoder import growingfile
+
+
+class TestStreamable(unittest.TestCase):
+
+    def testTypes(self):
+        self.failUnless(growingfile.isStreamable("video/mpegts"))
+        self.failUnless(growingfile.isStreamable("video/x-flv"))
+        self.failUnless(growingfile.isStreamable("Video/X-Matroska"))
+        self.failUnless(growingfile.isStreamable("application/ogg; x=1"))
+        self.failIf(growingfile.isStreamable("video/quicktime"))
+        self.failIf(growingfile.isStreamable("video/x-msvideo"))
+        self.failIf(growingfile.isStreamable(None))
+
+    def testCompletionMethod(self):
+        self.assertEquals(growingfile.getCompletionMethod(None), None)
+        self.assertEquals(growingfile.getCompletionMethod("none"), None)
+        self.assertEquals(growingfile.getCompletionMethod("unknown"), None)
+        if openfiles.isAvailable(openfiles.METHOD_PROC):
+            self.assertEquals(growingfile.getCompletionMethod("proc"),
+                              "proc")
+
+
+class TestGrowingFile(unittest.TestCase):
+
+    def setUp(self):
+        self.path = os.path.abspath(self.mktemp())
+        self.file = open(self.path, "wb")
+        self.file.write("head")
+        self.file.flush()
+        self.growing = None
+
+    def tearDown(self):
+        if self.growing:
+            self.growing.stop()
+        if not self.file.closed:
+            self.file.close()
+
+    def follow(self, method=None, **kwargs):
+        kwargs.setdefault("period", 0.05)
+        self.growing = growingfile.GrowingFile(log.Loggable(), self.path,
+                                               method, **kwargs)
+        self.growing.start()
+        return self.growing
+
+    def write(self, data):
+        self.file.write(data)
+        self.file.flush()
+
+    def testQuietTime(self):
+        # Without completion method, the file is complete
+        # when not modified for the quiet time
+        growing = self.follow(unknownQuietTime=0.3)
+        sizes = []
+
+        def grow():
+            self.failIf(growing.isComplete())
+            self.write("x" * 10)
+            sizes.append(10)
+
+        def check(size):
+            self.assertEquals(size, 4 + sum(sizes))
+            self.failUnless(growing.isComplete())
+
+        d = growing.wait()
+        d.addCallback(check)
+        loop = task.LoopingCall(grow)
+        loop.start(0.1)
+        reactor.callLater(0.5, loop.stop)
+        return d
+
+    def testWriterClosed(self):
+        if not openfiles.isAvailable(openfiles.METHOD_PROC):
+            raise unittest.SkipTest("No process inspection available")
+        growing = self.follow("proc", quietTime=0, unknownQuietTime=60)
+
+        def closed(_):
+            self.failIf(growing.isComplete())
+            self.write("tail")
+            self.file.close()
+            return growing.wait()
+
+        def check(size):
+            self.assertEquals(size, 8)
+
+        # Still open for writing, not complete
+        d = task.deferLater(reactor, 0.3, lambda: None)
+        d.addCallback(closed)
+        d.addCallback(check)
+        return d
+
+    def testStalled(self):
+        if not openfiles.isAvailable(openfiles.METHOD_PROC):
+            raise unittest.SkipTest("No process inspection available")
+        growing = self.follow("proc", stallTimeout=0.2)
+
+        def check(failure):
+            failure.trap(TranscoderError)
+            self.failIf(growing.isComplete())
+
+        d = growing.wait()
+        d.addCallbacks(lambda _: self.fail("Stalled file complete"), check)
+        return d
+
+    def testRemoved(self):
+        growing = self.follow()
+        os.remove(self.path)
+        d = growing.wait()
+        d.addCallbacks(lambda _: self.fail("Removed file complete"),
+                       lambda f: f.trap(TranscoderError))
+        return d
@@ -0,0 +1,115 @@
+# -*- Mode: Python; test-case-name: flumotion.test.test_monitorpacks -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+# Flumotion - a streaming media server
+# Copyright (C) 2004,2005,2006,2007,2008,2009 Fluendo, S.L.
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+#
+# This file may be distributed and/or modified under the terms of
+# the GNU Lesser General Public License version 2.1 as published by
+# the Free Software Foundation.
+# This file is distributed without any warranty; without even the implied
+# warranty of merchantability or fitness for a particular purpose.
+# See "LICENSE.LGPL" in the source distribution for more information.
+#
+# Headers in this file shall remain intact.
+
+
+import common
+
+from twisted.trial import unittest
+
+from flumotion.transcoder import pendingfiles
+from flumotion.transcoder.admin.property import filemon
+
+
+class FakeProfile(object):
+
+    def __init__(self, name, watcherBackend=None, fingerprintMode=None,
+                 growingInput=None):
+        self.name = name
+        self.inputBase = "default:/%s/" % name
+        self.active = "1"
+        self.watcherBackend = watcherBackend
+        self.fingerprintMode = fingerprintMode
+        self.growingInput = growingInput
+
+
+class FakeCustomer(object):
+
+    def __init__(self, name, profiles, monitoringPeriod=5,
+                 completionMethod="none"):
+        self.name = name
+        self.profiles = profiles
+        self.monitoringPeriod = monitoringPeriod
+        self.completionMethod = completionMethod
+        self.setup_callback = None
+        self.pathAttributes = None
+
+    def iterUnboundProfileContexts(self):
+        return iter(self.profiles)
+
+
+class FakeLocal(object):
+
+    def asComponentProperties(self):
+        return []
+
+
+class FakeWorker(object):
+
+    def getLocal(self):
+        return FakeLocal()
+
+
+class TestProfileKeys(unittest.TestCase):
+
+    def testKeys(self):
+        key = pendingfiles.makeProfileKey("profile")
+        self.assertEquals(key, "profile")
+        self.assertEquals(pendingfiles.splitProfileKey(key),
+                          (None, "profile"))
+        key = pendingfiles.makeProfileKey("profile", "customer")
+        self.assertEquals(pendingfiles.splitProfileKey(key),
+                          ("customer", "profile"))
+
+
+class TestPackProperties(unittest.TestCase):
+
+    def setUp(self):
+        self.customers = [
+            FakeCustomer("alice", [FakeProfile("video"),
+                                   FakeProfile("audio", "inotify")]),
+            FakeCustomer("bob", [FakeProfile("video", None, "md5", True)])]
+
+    def testRoundTrip(self):
+        # The admin finds back the running monitors by their properties
+        worker = FakeWorker()
+        props = filemon.MonitorProperties.createFromPackContexts(
+            "pack", self.customers)
+        compProps = {}
+        for name, value in props.asComponentProperties(worker):
+            if name in ("profile", "named-profile", "profile-watcher",
+                        "profile-fingerprint", "profile-growing"):
+                compProps.setdefault(name, []).append(value)
+            else:
+                compProps[name] = value
+        self.assertEquals(compProps["named-profile"],
+                          ["video!default:/video/!1!alice",
+                           "audio!default:/audio/!1!alice",
+                           "video!default:/video/!1!bob"])
+        self.assertEquals(compProps["profile-watcher"],
+                          ["audio!inotify!alice"])
+        self.assertEquals(compProps["profile-fingerprint"], ["video!md5!bob"])
+        self.assertEquals(compProps["profile-growing"], ["video!bob"])
+        other = filemon.MonitorProperties.createFromComponentDict(worker,
+                                                                  compProps)
+        self.assertEquals(other.getDigest(), props.getDigest())
+
+    def testPackKey(self):
+        getPackKey = filemon.MonitorProperties.getPackKey
+        alice, bob = self.customers
+        self.assertEquals(getPackKey(alice), getPackKey(bob))
+        bob.monitoringPeriod = 10
+        self.assertNotEquals(getPackKey(alice), getPackKey(bob))
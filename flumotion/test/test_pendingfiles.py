@@ -0,0 +1,146 @@
+# -*- Mode: Python; test-case-name: flumotion.test.test_pendingfiles -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+# Flumotion - a streaming media server
+# Copyright (C) 2004,2005,2006,2007,2008,2009 Fluendo, S.L.
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+#
+# This file may be distributed and/or modified under the terms of
+# the GNU Lesser General Public License version 2.1 as published by
+# the Free Software Foundation.
+# This file is distributed without any warranty; without even the implied
+# warranty of merchantability or fitness for a particular purpose.
+# See "LICENSE.LGPL" in the source distribution for more information.
+#
+# Headers in this file shall remain intact.
+
+
+import common
+
+import os
+import stat
+
+from twisted.trial import unittest
+
+from flumotion.transcoder import pendingfiles
+from flumotion.transcoder.errors import TranscoderError
+from flumotion.transcoder.enums import MonitorFileStateEnum
+
+
+class TestRecords(unittest.TestCase):
+
+    def testParse(self):
+        path = self.mktemp()
+        f = open(path, "w")
+        try:
+            f.write("data")
+        finally:
+            f.close()
+        info = os.stat(path)
+        record = pendingfiles.makeRecord(MonitorFileStateEnum.pending,
+                                         info, 42.0, "video/mp4", "abc",
+                                         {"a": "b"})
+        state, fileinfo, detection, mime, checksum, params \
+            = pendingfiles.parseRecord(record)
+        self.assertEquals(state, MonitorFileStateEnum.pending)
+        self.assertEquals(fileinfo[stat.ST_SIZE], info[stat.ST_SIZE])
+        self.assertEquals(fileinfo[stat.ST_MTIME], info[stat.ST_MTIME])
+        self.assertEquals(fileinfo[stat.ST_CTIME], info[stat.ST_CTIME])
+        self.assertEquals((detection, mime, checksum, params),
+                          (42.0, "video/mp4", "abc", {"a": "b"}))
+
+    def testWithoutFileInfo(self):
+        record = pendingfiles.makeRecord(MonitorFileStateEnum.downloading,
+                                         None)
+        state, fileinfo, _, _, _, params = pendingfiles.parseRecord(record)
+        self.assertEquals(state, MonitorFileStateEnum.downloading)
+        self.assertEquals(fileinfo, None)
+        self.assertEquals(params, None)
+        record = pendingfiles.setRecordState(record,
+                                             MonitorFileStateEnum.pending)
+        self.assertEquals(pendingfiles.parseRecord(record)[0],
+                          MonitorFileStateEnum.pending)
+
+    def testUnknownVersion(self):
+        record = pendingfiles.makeRecord(MonitorFileStateEnum.pending, None)
+        record = (pendingfiles.RECORD_VERSION + 1,) + record[1:]
+        self.assertRaises(TranscoderError, pendingfiles.parseRecord, record)
+
+
+class TestJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.journal = pendingfiles.PendingFilesJournal(2)
+        self.mirror = pendingfiles.PendingFilesMirror()
+
+    def record(self, state=MonitorFileStateEnum.downloading):
+        return pendingfiles.makeRecord(state, None)
+
+    def applyNext(self):
+        batch = self.journal.flush()
+        self.failUnless(self.mirror.accept(batch[0]))
+        return self.mirror.apply(*batch)
+
+    def testCoalesced(self):
+        self.journal.set(("p", "a"), self.record())
+        self.journal.set(("p", "a"),
+                         self.record(MonitorFileStateEnum.pending))
+        self.journal.set(("p", "b"), self.record())
+        sequence, changes = self.journal.flush()
+        self.assertEquals(sequence, 1)
+        self.assertEquals(dict(changes)[("p", "a")],
+                          self.record(MonitorFileStateEnum.pending))
+        self.assertEquals(len(changes), 2)
+        self.assertEquals(self.journal.flush(), None)
+        # Setting the same record again is not a change
+        self.journal.set(("p", "b"), self.record())
+        self.assertEquals(self.journal.flush(), None)
+
+    def testMirror(self):
+        self.journal.set(("p", "a"), self.record())
+        updated = self.mirror.reset(*self.journal.getChanges(None))
+        self.assertEquals(updated, [(("p", "a"), None, self.record())])
+        self.journal.set(("p", "b"), self.record())
+        self.journal.remove(("p", "a"))
+        updated = self.applyNext()
+        self.assertEquals(sorted(updated),
+                          [(("p", "a"), self.record(), None),
+                           (("p", "b"), None, self.record())])
+        self.assertEquals(dict(self.mirror.iterRecords()),
+                          dict(self.journal.iterRecords()))
+
+    def testResync(self):
+        self.mirror.reset(*self.journal.getChanges(None))
+        self.journal.set(("p", "a"), self.record())
+        self.applyNext()
+        # The mirror misses one batch
+        self.journal.set(("p", "b"), self.record())
+        self.journal.flush()
+        self.journal.remove(("p", "a"))
+        sequence, changes = self.journal.flush()
+        self.failIf(self.mirror.accept(sequence))
+        result = self.journal.getChanges(self.mirror.getSequence())
+        self.assertEquals(result[:2], (sequence, False))
+        self.mirror.reset(*result)
+        self.assertEquals(dict(self.mirror.iterRecords()),
+                          dict(self.journal.iterRecords()))
+
+    def testResyncTooOld(self):
+        self.mirror.reset(*self.journal.getChanges(None))
+        self.journal.set(("p", "a"), self.record())
+        self.applyNext()
+        for name in "bcd":
+            self.journal.set(("p", name), self.record())
+            self.journal.remove(("p", "a"))
+            self.journal.flush()
+        sequence, full, changes \
+            = self.journal.getChanges(self.mirror.getSequence())
+        self.failUnless(full)
+        updated = self.mirror.reset(sequence, full, changes)
+        self.failUnless((("p", "a"), self.record(), None) in updated)
+        self.assertEquals(dict(self.mirror.iterRecords()),
+                          dict(self.journal.iterRecords()))
+        # A restarted monitor starts again from the first sequence
+        journal = pendingfiles.PendingFilesJournal(2)
+        self.failUnless(journal.getChanges(sequence)[1])
@@ -0,0 +1,428 @@
+# -*- Mode: Python; test-case-name: flumotion.test.test_schedqueue -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+# Flumotion - a streaming media server
+# Copyright (C) 2004,2005,2006,2007,2008,2009 Fluendo, S.L.
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+#
+# This file may be distributed and/or modified under the terms of
+# the GNU Lesser General Public License version 2.1 as published by
+# the Free Software Foundation.
+# This file is distributed without any warranty; without even the implied
+# warranty of merchantability or fitness for a particular purpose.
+# See "LICENSE.LGPL" in the source distribution for more information.
+#
+# Headers in this file shall remain intact.
+
+
+import common
+
+import random
+
+from twisted.trial import unittest
+
+from flumotion.transcoder.admin.schedqueue import PriorityQueue, FairQueue
+from flumotion.transcoder.admin.schedqueue import ShortestQueue, AgingQueue
+from flumotion.transcoder.admin.schedqueue import DeadlineQueue
+
+
+class SortedQueue(object):
+    """
+    The sorted list the scheduler used before, as reference.
+    """
+
+    def __init__(self):
+        self.order = []
+        self.priorities = {}
+
+    def push(self, key, priority):
+        self.priorities[key] = priority
+        self.order.append(key)
+        self.order.sort(key=self.priorities.get)
+
+    def remove(self, key):
+        del self.priorities[key]
+        self.order.remove(key)
+
+    def pop(self):
+        key = self.order.pop()
+        del self.priorities[key]
+        return key
+
+
+class TestPriorityQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.random = random.Random(42)
+
+    def items(self, count, start=0):
+        return [(i, "value%d" % i, self.random.randint(0, 3) * 1000
+                 + self.random.randint(0, 5))
+                for i in range(start, start + count)]
+
+    def popAll(self, queue):
+        result = []
+        while queue:
+            key, value = queue.pop()
+            self.assertEquals(value, "value%d" % key)
+            result.append(key)
+        return result
+
+    def testOrder(self):
+        queue = PriorityQueue()
+        reference = SortedQueue()
+        for key, value, priority in self.items(500):
+            queue.push(key, value, priority)
+            reference.push(key, priority)
+        for key in self.random.sample(range(500), 100):
+            queue.remove(key)
+            reference.remove(key)
+        for i in range(50):
+            self.assertEquals(queue.pop()[0], reference.pop())
+        for key, value, priority in self.items(100, 500):
+            queue.push(key, value, priority)
+            reference.push(key, priority)
+        self.assertEquals(len(queue), len(reference.order))
+        self.assertEquals(queue.peek()[0], reference.order[-1])
+        self.assertEquals(self.popAll(queue), reference.order[::-1])
+        self.assertEquals(queue.peek(), (None, None))
+        self.assertRaises(IndexError, queue.pop)
+
+    def testExtend(self):
+        queue = PriorityQueue()
+        reference = SortedQueue()
+        for items in (self.items(300), self.items(10, 300),
+                      self.items(400, 310)):
+            queue.extend(items)
+            for key, value, priority in items:
+                reference.push(key, priority)
+        self.assertEquals(self.popAll(queue), reference.order[::-1])
+
+    def testUpdate(self):
+        queue = PriorityQueue()
+        queue.extend([("a", "va", 1), ("b", "vb", 1), ("c", "vc", 2)])
+        queue.update("a", 3)
+        self.assertEquals(queue.getPriority("a"), 3)
+        self.assertEquals(queue.peek(), ("a", "va"))
+        queue.update("a", 1)
+        # Back to its place among the values with the same priority
+        self.assertEquals([queue.pop()[0] for i in range(3)],
+                          ["c", "b", "a"])
+
+    def testContent(self):
+        queue = PriorityQueue()
+        queue.push("a", "va", 1)
+        queue.push("b", "vb", 2)
+        self.failUnless("a" in queue)
+        self.assertEquals(queue.get("b"), "vb")
+        self.assertEquals(sorted(queue), ["a", "b"])
+        self.assertEquals(sorted(queue.itervalues()), ["va", "vb"])
+        self.assertEquals(queue.remove("a"), "va")
+        self.failIf("a" in queue)
+        self.assertEquals(queue.get("a"), None)
+        queue.clear()
+        self.failIf(queue)
+        self.assertEquals(len(queue), 0)
+
+
+class TestFairQueue(unittest.TestCase):
+
+    def fill(self, queue, group, count, weight=1, cost=1, priority=0):
+        for i in range(count):
+            key = "%s%d" % (group, i)
+            queue.push(key, i, priority, group, weight, cost)
+
+    def popGroups(self, queue, count=None):
+        result = []
+        while queue and (count is None or len(result) < count):
+            key, value = queue.pop()
+            result.append(key[0])
+        return "".join(result)
+
+    def testShare(self):
+        queue = FairQueue()
+        # A big backlog does not starve the other groups
+        self.fill(queue, "a", 100)
+        self.fill(queue, "b", 3)
+        self.assertEquals(self.popGroups(queue, 8), "abababaa")
+        self.assertEquals(len(queue), 95)
+
+    def testWeight(self):
+        queue = FairQueue()
+        self.fill(queue, "a", 20, weight=2)
+        self.fill(queue, "b", 20)
+        order = self.popGroups(queue, 30)
+        self.assertEquals(order.count("a"), 20)
+        self.assertEquals(order.count("b"), 10)
+
+    def testCost(self):
+        queue = FairQueue()
+        self.fill(queue, "a", 20, cost=1)
+        self.fill(queue, "b", 20, cost=4)
+        order = self.popGroups(queue, 10)
+        self.assertEquals(order.count("a"), 8)
+        self.assertEquals(order.count("b"), 2)
+
+    def testPriority(self):
+        queue = FairQueue()
+        queue.push("a0", None, 1, "a")
+        queue.push("a1", None, 5, "a")
+        queue.push("b0", None, 100, "b")
+        queue.push("a2", None, 3, "a")
+        queue.update("a0", 4)
+        self.assertEquals([queue.pop()[0] for i in range(4)],
+                          ["a1", "b0", "a0", "a2"])
+
+    def testIdleCredit(self):
+        queue = FairQueue()
+        self.fill(queue, "a", 10)
+        self.assertEquals(self.popGroups(queue, 6), "aaaaaa")
+        # A group idle until now gets its share, not a burst
+        self.fill(queue, "b", 10)
+        self.assertEquals(self.popGroups(queue, 6), "ababab")
+
+    def testRemove(self):
+        queue = FairQueue()
+        self.fill(queue, "a", 3)
+        self.fill(queue, "b", 2)
+        self.assertEquals(queue.remove("a0"), 0)
+        self.assertEquals(queue.remove("b0"), 0)
+        self.assertEquals(queue.remove("b1"), 1)
+        self.failIf("b1" in queue)
+        self.assertEquals(queue.get("a1"), 1)
+        self.assertEquals(queue.getGroup("a1"), "a")
+        self.assertEquals(sorted(queue), ["a1", "a2"])
+        self.assertEquals(sorted(queue.itervalues()), [1, 2])
+        self.assertEquals(self.popGroups(queue), "aa")
+        self.assertEquals(queue.peek(), (None, None))
+        self.assertRaises(IndexError, queue.pop)
+
+
+class TestShortestQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0
+        self.queue = ShortestQueue(100, clock=lambda: self.now)
+
+    def testOrder(self):
+        queue = self.queue
+        queue.push("long", 1, 3600)
+        queue.push("short", 2, 10)
+        queue.extend([("medium", 3, 60), ("short2", 4, 10)])
+        queue.update("long", 5)
+        self.assertEquals(queue.getPriority("long"), 5)
+        self.assertEquals([queue.pop()[0] for i in range(4)],
+                          ["long", "short", "short2", "medium"])
+
+    def testStarvation(self):
+        queue = self.queue
+        queue.push("long", None, 3600)
+        for i in range(10):
+            self.now = i * 20
+            queue.push("short%d" % i, None, 10)
+            if i < 5:
+                self.assertEquals(queue.pop()[0], "short%d" % i)
+        # The long value waited for more than 100 seconds
+        self.assertEquals(queue.getQueuingTime("long"), 0)
+        self.assertEquals(queue.peek()[0], "long")
+        self.assertEquals(queue.pop()[0], "long")
+        self.assertEquals(queue.pop()[0], "short5")
+
+    def testRemove(self):
+        queue = self.queue
+        queue.push("a", "va", 10)
+        queue.push("b", "vb", 20)
+        self.assertEquals(queue.remove("a"), "va")
+        self.failIf("a" in queue)
+        self.assertEquals(len(queue), 1)
+        self.now = 1000
+        self.assertEquals(queue.pop(), ("b", "vb"))
+        self.assertEquals(queue.peek(), (None, None))
+        self.assertRaises(IndexError, queue.pop)
+
+
+class TestAgingQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0
+
+    def clock(self):
+        return self.now
+
+    def testOrder(self):
+        queue = AgingQueue(1, 10, clock=self.clock)
+        queue.push("low", None, 0)
+        queue.push("high", None, 5)
+        self.assertEquals(queue.peek()[0], "high")
+        self.now = 4
+        queue.push("new", None, 5)
+        self.assertEquals(queue.getEffectivePriority("low"), 4)
+        self.assertEquals(queue.getEffectivePriority("high"), 9)
+        self.assertEquals(queue.getEffectivePriority("new"), 5)
+        self.assertEquals([queue.pop()[0] for i in range(2)],
+                          ["high", "new"])
+        # Capped
+        self.now = 100
+        self.assertEquals(queue.getEffectivePriority("low"), 10)
+        queue.push("higher", None, 11)
+        queue.push("lower", None, 9)
+        self.assertEquals([queue.pop()[0] for i in range(3)],
+                          ["higher", "low", "lower"])
+
+    def testUpdate(self):
+        queue = AgingQueue(1, 10, clock=self.clock)
+        queue.extend([("a", 1, 0), ("b", 2, 0), ("c", 3, 0)])
+        self.assertEquals(queue.getQueuingTime("a"), 0)
+        queue.update("c", 5)
+        self.now = 20
+        queue.update("b", 3)
+        self.assertEquals(queue.getPriority("b"), 3)
+        self.assertEquals(queue.getEffectivePriority("b"), 13)
+        self.assertEquals(queue.remove("c"), 3)
+        self.failIf("c" in queue)
+        self.assertEquals(len(queue), 2)
+        self.assertEquals(sorted(queue.itervalues()), [1, 2])
+        self.assertEquals(queue.pop(), ("b", 2))
+        self.assertEquals(queue.get("a"), 1)
+        queue.clear()
+        self.assertEquals(queue.peek(), (None, None))
+        self.assertRaises(IndexError, queue.pop)
+
+    def waits(self, queue, arrivals, duration):
+        # One slot starting one value by second
+        queuing = {}
+        waits = {}
+        index = 0
+        for self.now in range(duration):
+            for priority in arrivals(self.now):
+                queue.push(index, priority, priority)
+                queuing[index] = self.now
+                index += 1
+            if queue:
+                key, priority = queue.pop()
+                wait = self.now - queuing.pop(key)
+                waits.setdefault(priority, []).append(wait)
+        return waits, queuing
+
+    def arrivals(self, now):
+        # After a burst, high priority values arrive as fast as they
+        # are started, and a low priority value every 50 seconds
+        if now == 0:
+            return [2000] * 5
+        if now % 50 == 0:
+            return [2000, 0]
+        return [2000]
+
+    def testStarvation(self):
+        queue = PriorityQueue()
+        waits, queued = self.waits(queue, self.arrivals, 1000)
+        # The low priority values are never started
+        self.assertEquals(waits.keys(), [2000])
+        self.assertEquals(list(queue.itervalues()).count(0), 19)
+        # With aging, the low priority values wait for 2000 / 100
+        # seconds plus the backlog they add to the saturated slot
+        queue = AgingQueue(100, 10000, clock=self.clock)
+        waits, queued = self.waits(queue, self.arrivals, 1000)
+        self.assertEquals(len(waits[0]), 19)
+        self.failUnless(max(waits[0]) <= 2000 / 100 + 24)
+        self.failUnless(max(waits[2000]) <= 24)
+        self.failUnless(max([self.now - t for t in queued.values()]) <= 24)
+
+    def testCap(self):
+        # The aging cap keeps the priority differences bigger than it
+        queue = AgingQueue(100, 1000, clock=self.clock)
+        waits, queued = self.waits(queue, self.arrivals, 1000)
+        self.assertEquals(waits.keys(), [2000])
+
+    def testQueuingTime(self):
+        # A preempted value ages from its original queuing time
+        queue = AgingQueue(1, 10, clock=self.clock)
+        self.now = 6
+        queue.push("requeued", None, 0, 2)
+        queue.push("new", None, 3)
+        self.assertEquals(queue.getQueuingTime("requeued"), 2)
+        self.assertEquals(queue.getEffectivePriority("requeued"), 4)
+        self.assertEquals(queue.peek()[0], "requeued")
+        # Already capped
+        queue.push("old", None, 0, -100)
+        self.assertEquals(queue.getEffectivePriority("old"), 10)
+        self.assertEquals(queue.peek()[0], "old")
+
+
+class TestDeadlineQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0
+        self.queue = DeadlineQueue(50, clock=self.clock)
+
+    def clock(self):
+        return self.now
+
+    def testOrder(self):
+        queue = self.queue
+        queue.push("archive", 1, 86400, 3600)
+        queue.push("clip", 2, 600, 60)
+        queue.extend([("news", 3, 300, 60), ("clip2", 4, 600, 60)])
+        self.assertEquals(queue.getPriority("news"), 300)
+        self.assertEquals(queue.getEffectivePriority("news"), 240)
+        queue.update("archive", 400)
+        self.assertEquals(queue.getCost("archive"), 3600)
+        # Already too late to finish the archive in time
+        self.failUnless(queue.isAtRisk("archive"))
+        self.assertEquals([queue.pop()[0] for i in range(4)],
+                          ["archive", "news", "clip", "clip2"])
+
+    def testAtRisk(self):
+        queue = self.queue
+        queue.push("archive", None, 1000, 900)
+        queue.push("clip", None, 300, 60)
+        queue.push("clip2", None, 500, 60)
+        # The archive must start within 100 seconds, not yet at risk
+        self.failIf(queue.isAtRisk("archive"))
+        self.assertEquals(queue.pop()[0], "clip")
+        self.now = 60
+        self.failUnless(queue.isAtRisk("archive"))
+        self.assertEquals(queue.peek()[0], "archive")
+        self.assertEquals(queue.pop()[0], "archive")
+        self.assertEquals(queue.pop()[0], "clip2")
+
+    def testRemove(self):
+        queue = self.queue
+        queue.push("a", "va", 100, 10)
+        queue.push("b", "vb", 200, 10)
+        self.assertEquals(queue.remove("a"), "va")
+        self.failIf("a" in queue)
+        self.assertEquals(len(queue), 1)
+        self.assertEquals(queue.pop(), ("b", "vb"))
+        self.assertEquals(queue.peek(), (None, None))
+        self.assertRaises(IndexError, queue.pop)
+
+    def misses(self, queue, push, jobs):
+        # Runs the jobs (key, turnaround, cost) queued at once
+        # on one slot, returns the keys of the jobs finished late
+        deadlines = {}
+        costs = {}
+        for key, turnaround, cost in jobs:
+            deadlines[key] = self.now + turnaround
+            costs[key] = cost
+            push(queue, key, deadlines[key], cost)
+        missed = []
+        while queue:
+            key = queue.pop()[0]
+            self.now += costs[key]
+            if self.now > deadlines[key]:
+                missed.append(key)
+        return missed
+
+    def testMisses(self):
+        jobs = [("archive%d" % i, 86400, 1000) for i in range(5)]
+        jobs += [("clip%d" % i, 600, 60) for i in range(5)]
+        # In queuing order, the clips wait for the archives
+        missed = self.misses(PriorityQueue(lifo=False),
+                             lambda q, k, d, c: q.push(k, None, 0), jobs)
+        self.assertEquals(missed, ["clip%d" % i for i in range(5)])
+        self.now = 0
+        missed = self.misses(self.queue,
+                             lambda q, k, d, c: q.push(k, None, d, c), jobs)
+        self.assertEquals(missed, [])
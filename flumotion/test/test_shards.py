@@ -0,0 +1,156 @@
+# -*- Mode: Python; test-case-name: flumotion.test.test_shards -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+# Flumotion - a streaming media server
+# Copyright (C) 2004,2005,2006,2007,2008,2009 Fluendo, S.L.
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+#
+# This file may be distributed and/or modified under the terms of
+# the GNU Lesser General Public License version 2.1 as published by
+# the Free Software Foundation.
+# This file is distributed without any warranty; without even the implied
+# warranty of merchantability or fitness for a particular purpose.
+# See "LICENSE.LGPL" in the source distribution for more information.
+#
+# Headers in this file shall remain intact.
+
+
+import common
+
+import os
+
+from zope.interface import implements
+from twisted.internet import defer, reactor
+from twisted.trial import unittest
+
+from flumotion.inhouse import log
+
+from flumotion.transcoder import shards
+from flumotion.transcoder.admin import admintask
+from flumotion.transcoder.admin.monbalancer import MonitorBalancer
+from flumotion.component.monitor.watcher import DirectoryWatcher
+
+
+class TestOwnership(unittest.TestCase):
+
+    def testSubtrees(self):
+        self.assertEquals(shards.getShardEntry("a/b/c.mp4"), "a")
+        self.assertEquals(shards.getShardEntry("/a/b/c.mp4"), "a")
+        self.assertEquals(shards.getShardEntry("c.mp4"), "c.mp4")
+        for i in range(20):
+            self.assertEquals(
+                shards.getFileShard("video", "dir%d/x.mp4" % i, 4),
+                shards.getFileShard("video", "dir%d/y/z.mp4" % i, 4))
+
+    def testDistribution(self):
+        counts = [0] * 4
+        for i in range(1000):
+            counts[shards.getFileShard("video", "dir%d/f" % i, 4)] += 1
+        for count in counts:
+            self.failUnless(200 < count < 300, counts)
+        self.assertEquals(shards.getFileShard("video", "dir/f", 1), 0)
+
+
+class TestShardedWatchers(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = self.mktemp()
+        self.files = []
+        for i in range(10):
+            subdir = os.path.join(self.directory, "dir%d" % i)
+            os.makedirs(subdir)
+            for name in ("dir%d/a" % i, "dir%d/b" % i, "top%d" % i):
+                open(os.path.join(self.directory, name), "w").close()
+                self.files.append(name)
+        self.watchers = []
+        self.found = {}
+
+    def tearDown(self):
+        for watcher in self.watchers:
+            watcher.stop()
+
+    def startShard(self, index, count):
+
+        def owner(name):
+            return shards.getEntryShard("video", name, count) == index
+
+        def added(watcher, name, *args):
+            self.found.setdefault(name, []).append(index)
+
+        logger = log.Logger("test-shards")
+        watcher = DirectoryWatcher(logger, self.directory + "/", None,
+                                   timeout=0.1, owner=owner)
+        watcher.connect("file-added", added)
+        watcher.start()
+        self.watchers.append(watcher)
+
+    def testDisjoint(self):
+        for index in range(3):
+            self.startShard(index, 3)
+        d = defer.Deferred()
+        reactor.callLater(0.5, d.callback, None)
+
+        def check(_):
+            # Every file is found once, by the shard owning it
+            self.assertEquals(sorted(self.found.keys()), sorted(self.files))
+            for name, indexes in self.found.iteritems():
+                self.assertEquals(indexes,
+                                  [shards.getFileShard("video", name, 3)])
+
+        return d.addCallback(check)
+
+
+class FakeTask(object):
+    implements(admintask.IAdminTask)
+
+    def __init__(self, label, group=None):
+        self.label = label
+        self.group = group
+        self.worker = None
+
+    def getShardGroup(self):
+        return self.group
+
+    def suggestWorker(self, worker):
+        self.worker = worker
+
+
+class TestBalancer(unittest.TestCase):
+
+    def setUp(self):
+        self.balancer = MonitorBalancer()
+        self.tasks = [FakeTask("%s%d" % (c, i), c)
+                      for c in "ab" for i in range(2)]
+
+    def checkSpread(self):
+        placed = {}
+        for task in self.tasks:
+            self.failIf(task.worker is None, task.label)
+            key = (task.worker, task.group)
+            self.failIf(key in placed, "%s and %s on the same worker"
+                        % (placed.get(key), task.label))
+            placed[key] = task.label
+
+    def testSpread(self):
+        self.balancer.addWorker("w1")
+        self.balancer.addWorker("w2")
+        for task in self.tasks:
+            self.balancer.addTask(task)
+        self.balancer.balance()
+        self.checkSpread()
+
+    def testRebalance(self):
+        self.balancer.addWorker("w1")
+        for task in self.tasks:
+            self.balancer.addTask(task, "w1")
+        self.balancer.balance()
+        # A worker joins, a shard of each customer moves to it
+        self.balancer.addWorker("w2")
+        self.balancer.balance()
+        self.checkSpread()
+        # The worker leaves, its shards go back to the remaining one
+        self.balancer.removeWorker("w2")
+        self.balancer.balance()
+        for task in self.tasks:
+            self.assertEquals(task.worker, "w1")
@@ -0,0 +1,167 @@
+# -*- Mode: Python; test-case-name: flumotion.test.test_simulator -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+# Flumotion - a streaming media server
+# Copyright (C) 2004,2005,2006,2007,2008,2009 Fluendo, S.L.
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+#
+# This file may be distributed and/or modified under the terms of
+# the GNU Lesser General Public License version 2.1 as published by
+# the Free Software Foundation.
+# This file is distributed without any warranty; without even the implied
+# warranty of merchantability or fitness for a particular purpose.
+# See "LICENSE.LGPL" in the source distribution for more information.
+#
+# Headers in this file shall remain intact.
+
+import common
+
+import datetime
+
+from twisted.trial import unittest
+
+from flumotion.transcoder.admin import simulator
+from flumotion.transcoder.admin.simulator import TraceJob, SimulatedWorker
+from flumotion.transcoder.admin.simulator import Simulation
+
+
+class DummyReport(object):
+
+    def __init__(self, customerId, profileId, queueingTime,
+                 totalRealTime=None, start=None, finish=None):
+        self.customerId = customerId
+        self.profileId = profileId
+        self.queueingTime = queueingTime
+        self.detectionTime = None
+        self.transcodingStartTime = start
+        self.transcodingFinishTime = finish
+        self.totalRealTime = totalRealTime
+        self.fileSize = None
+
+
+class TestStatistics(unittest.TestCase):
+
+    def testPercentile(self):
+        values = range(101)
+        self.assertEquals(simulator.getPercentile(values, 0.5), 50)
+        self.assertEquals(simulator.getPercentile(values, 0.99), 99)
+        self.assertEquals(simulator.getPercentile([], 0.5), None)
+
+    def testFairness(self):
+        self.assertEquals(simulator.getFairness([2, 2, 2]), 1.0)
+        self.assertEquals(simulator.getFairness([1, 0, 0, 0]), 0.25)
+        self.assertEquals(simulator.getFairness([]), None)
+
+
+class TestTrace(unittest.TestCase):
+
+    def testReportTrace(self):
+        base = datetime.datetime(2011, 1, 1)
+        second = datetime.timedelta(seconds=1)
+        reports = [DummyReport("c1", "p1", base + 90 * second, 30),
+                   DummyReport("c2", "p2", base, None,
+                               base + 10 * second, base + 70 * second),
+                   # Never transcoded
+                   DummyReport("c1", "p1", base, None)]
+        jobs = simulator.loadReportTrace(reports)
+        self.assertEquals([(j.arrival, j.customer, j.cost) for j in jobs],
+                          [(0, "c2", 60), (90, "c1", 30)])
+
+
+class TestSimulation(unittest.TestCase):
+
+    def testReplay(self):
+        jobs = [TraceJob(0, "cust", "prof", 10) for i in range(3)]
+        workers = [SimulatedWorker("worker1", 1),
+                   SimulatedWorker("worker2", 1)]
+        results = Simulation(jobs, workers).run()
+        self.assertEquals(results["done"], 3)
+        self.assertEquals(results["span"], 20)
+        self.assertEquals(results["throughput"], 3 * 3600 / 20.0)
+        self.assertEquals(results["utilization"], 30 / 40.0)
+        self.assertEquals(results["wait50"], 0)
+        self.assertEquals(results["wait90"], 10)
+        self.assertEquals(results["customers"]["cust"]["count"], 3)
+
+    def testSpeed(self):
+        jobs = [TraceJob(0, "cust", "prof", 10)]
+        workers = [SimulatedWorker("worker", 1, speed=2.0)]
+        results = Simulation(jobs, workers).run()
+        self.assertEquals(results["span"], 5)
+
+    def testPolicies(self):
+        # A long job of an important customer blocks the only slot
+        # while a short job of another customer is waiting
+        jobs = [TraceJob(0, "first", "prof", 1),
+                TraceJob(0.5, "big", "prof", 100),
+                TraceJob(0.5, "small", "prof", 1)]
+        workers = [SimulatedWorker("worker", 1)]
+        customers = {"big": {"customerPriority": 200}}
+        configs = [{"policy": "priority"}, {"policy": "shortest"}]
+        history = [("prof", 1, None)]
+        byPriority, byCost = simulator.compare(jobs, workers, configs,
+                                               customers, None, history)
+        self.assertEquals(byPriority["policy"], "priority")
+        self.assertEquals(byPriority["customers"]["small"]["waitMean"],
+                          100.5)
+        self.assertEquals(byCost["policy"], "shortest")
+        self.assertEquals(byCost["done"], 3)
+
+    def testPreemption(self):
+        # An urgent job arrives while a long low priority job
+        # is using the only slot
+        jobs = [TraceJob(0, "low", "prof", 1000),
+                TraceJob(400, "urgent", "prof", 10)]
+        workers = [SimulatedWorker("worker", 1)]
+        customers = {"urgent": {"customerPriority": 200}}
+        config = {"policy": "priority", "preemptionGap": 1000,
+                  "preemptionMinRunTime": 60, "preemptionMaxCount": 1}
+        results = Simulation(jobs, workers, config, customers).run()
+        self.assertEquals(results["preemptions"], 1)
+        self.assertEquals(results["customers"]["urgent"]["waitMean"], 0)
+        # The preempted job started again from the beginning
+        self.assertEquals(results["span"], 400 + 10 + 1000)
+        self.assertEquals(results["customers"]["low"]["busyTime"], 1400)
+        # Disabled by default
+        results = Simulation(jobs, workers, None, customers).run()
+        self.assertEquals(results["preemptions"], 0)
+        self.assertEquals(results["customers"]["urgent"]["waitMean"], 600)
+
+    def testPreemptionLimits(self):
+        jobs = [TraceJob(0, "low", "prof", 1000),
+                # Too early, the low job runs for less than 60 seconds
+                TraceJob(30, "urgent", "prof", 10),
+                TraceJob(200, "urgent", "prof", 10),
+                # Too late, the low job was already preempted
+                TraceJob(500, "urgent", "prof", 10)]
+        workers = [SimulatedWorker("worker", 1)]
+        customers = {"urgent": {"customerPriority": 200}}
+        config = {"policy": "priority", "preemptionGap": 1000,
+                  "preemptionMinRunTime": 60, "preemptionMaxCount": 1}
+        results = Simulation(jobs, workers, config, customers).run()
+        self.assertEquals(results["preemptions"], 1)
+        urgent = results["customers"]["urgent"]
+        self.assertEquals(urgent["count"], 3)
+        # The first urgent job waits for the preemption at 200,
+        # the second one for the first, and the last one for
+        # the restarted low job
+        self.assertEquals(urgent["waitMean"], (170 + 10 + 720) / 3.0)
+        # Not enough priority gap
+        config["preemptionGap"] = 200000
+        results = Simulation(jobs, workers, config, customers).run()
+        self.assertEquals(results["preemptions"], 0)
+
+    def testVictim(self):
+        # The job with the most remaining work is preempted
+        jobs = [TraceJob(0, "long", "prof", 1000),
+                TraceJob(0, "short", "prof", 200),
+                TraceJob(100, "urgent", "prof", 10)]
+        workers = [SimulatedWorker("worker", 2)]
+        customers = {"urgent": {"customerPriority": 200}}
+        config = {"policy": "priority", "preemptionGap": 1000,
+                  "preemptionMinRunTime": 60}
+        results = Simulation(jobs, workers, config, customers).run()
+        self.assertEquals(results["preemptions"], 1)
+        self.assertEquals(results["customers"]["short"]["slowdown"], 1)
+        self.assertEquals(results["customers"]["long"]["slowdown"], 1.11)
@@ -0,0 +1,187 @@
+# -*- Mode: Python; test-case-name: flumotion.test.test_upload -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+# Flumotion - a streaming media server
+# Copyright (C) 2004,2005,2006,2007,2008,2009 Fluendo, S.L.
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+#
+# This file may be distributed and/or modified under the terms of
+# the GNU Lesser General Public License version 2.1 as published by
+# the Free Software Foundation.
+# This file is distributed without any warranty; without even the implied
+# warranty of merchantability or fitness for a particular purpose.
+# See "LICENSE.LGPL" in the source distribution for more information.
+#
+# Headers in this file shall remain intact.
+
+
+import common
+
+import os
+
+from twisted.internet import defer, reactor, protocol, task
+from twisted.trial import unittest
+from twisted.web.resource import Resource
+
+from flumotion.ovp import hashlib
+from flumotion.component.monitor import upload
+
+from monitortestutils import FakeVirtPath, FakeMonitor
+
+
+class RawClient(protocol.Protocol):
+    """
+    Sends a raw request in chunks and collects the response.
+    """
+
+    def __init__(self, chunks, abort=False):
+        self.chunks = list(chunks)
+        self.abort = abort
+        self.response = []
+        self.done = defer.Deferred()
+        self._call = None
+
+    def connectionMade(self):
+        self._send()
+
+    def dataReceived(self, data):
+        self.response.append(data)
+
+    def connectionLost(self, reason):
+        if self._call and self._call.active():
+            self._call.cancel()
+        self.done.callback("".join(self.response))
+
+    def _send(self):
+        self._call = None
+        if self.chunks:
+            self.transport.write(self.chunks.pop(0))
+            self._call = reactor.callLater(0, self._send)
+        elif self.abort:
+            self.transport.loseConnection()
+
+
+class TestUpload(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = os.path.abspath(self.mktemp())
+        os.makedirs(self.directory)
+        self.queued = []
+        self.monitor = FakeMonitor()
+        handler = Resource()
+        handler.putChild(upload.UPLOAD_CHILD,
+                         upload.UploadResource(self.monitor,
+                                               FakeVirtPath(self.directory),
+                                               self._queued, "video",
+                                               max_size=1 << 20))
+        root = Resource()
+        root.putChild("video", handler)
+        self.site = upload.UploadSite(root, max_uploads=2)
+        self.port = reactor.listenTCP(0, self.site, interface="127.0.0.1")
+
+    def tearDown(self):
+        return self.port.stopListening()
+
+    def _queued(self, precomputed, path, name, fileinfo, detection_time,
+                virt_base, profile_name, params):
+        # The file is complete when handed to the monitor
+        self.queued.append((name, precomputed, open(path).read()))
+
+    def send(self, chunks, abort=False):
+        client = RawClient(chunks, abort)
+        creator = protocol.ClientCreator(reactor, lambda: client)
+        d = creator.connectTCP("127.0.0.1", self.port.getHost().port)
+        d.addCallback(lambda _: client.done)
+        return d
+
+    def put(self, name, body, chunk=4096):
+        head = ("PUT /video/upload/%s HTTP/1.0\r\n"
+                "Content-Length: %d\r\n\r\n" % (name, len(body)))
+        chunks = [head]
+        for i in range(0, len(body), chunk):
+            chunks.append(body[i:i + chunk])
+        return self.send(chunks)
+
+    def listing(self):
+        return sorted(os.listdir(self.directory))
+
+    def testUpload(self):
+        body = os.urandom(100000)
+
+        def check(response):
+            self.failUnless(response.startswith("HTTP/1.0 201"), response)
+            self.assertEquals(self.listing(), ["movie.mp4"])
+            [(name, (mime, chksum), data)] = self.queued
+            self.assertEquals(name, "movie.mp4")
+            self.assertEquals(chksum, hashlib.md5(body).hexdigest())
+            self.assertEquals(data, body)
+
+        d = self.put("movie.mp4", body)
+        d.addCallback(check)
+        return d
+
+    def testSampledFingerprint(self):
+        self.monitor.mode = "sampled-md5"
+
+        def check(response):
+            self.failUnless(response.startswith("HTTP/1.0 201"), response)
+            self.failUnless(self.queued[0][1][1].startswith("sampled-md5:"))
+
+        return self.put("movie.mp4", "data").addCallback(check)
+
+    def testTooBig(self):
+
+        def check(response, expected):
+            self.assertEquals(response.split(" ", 2)[1], "413")
+            self.assertEquals(self.listing(), expected)
+            self.assertEquals(self.queued, [])
+
+        # Rejected from the headers, no file is created
+        d = self.put("big.mp4", "x" * ((1 << 20) + 1), 65536)
+        d.addCallback(check, [])
+        # Without a length the upload is dropped when it gets too big
+        head = "PUT /video/upload/big.mp4 HTTP/1.1\r\nHost: test\r\n" \
+               "Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n"
+        chunk = "%x\r\n%s\r\n" % (65536, "x" * 65536)
+        d.addCallback(lambda _: self.send([head] + [chunk] * 20
+                                          + ["0\r\n\r\n"]))
+        d.addCallback(check, [])
+        return d
+
+    def testInvalidName(self):
+
+        def check(response):
+            self.failUnless(response.startswith("HTTP/1.0 400"), response)
+            self.assertEquals(self.listing(), [])
+
+        return self.put(".hidden", "data").addCallback(check)
+
+    def testAborted(self):
+        head = ("PUT /video/upload/movie.mp4 HTTP/1.0\r\n"
+                "Content-Length: 10000\r\n\r\n")
+
+        def check(response):
+            self.assertEquals(response, "")
+            self.assertEquals(self.listing(), [])
+            self.assertEquals(self.site.getUploadCount(), 0)
+            self.assertEquals(self.queued, [])
+
+        d = self.send([head, "x" * 1000], abort=True)
+        # Let the server notice the connection is lost
+        d.addCallback(lambda r: task.deferLater(reactor, 0.1, lambda: r))
+        return d.addCallback(check)
+
+    def testConcurrent(self):
+        bodies = [os.urandom(20000) for i in range(2)]
+
+        def check(responses):
+            for ok, response in responses:
+                self.failUnless(response.startswith("HTTP/1.0 201"))
+            self.assertEquals(self.listing(), ["f0", "f1"])
+            self.assertEquals(sorted([q[2] for q in self.queued]),
+                              sorted(bodies))
+
+        d = defer.DeferredList([self.put("f%d" % i, b, 1000)
+                                for i, b in enumerate(bodies)])
+        return d.addCallback(check)
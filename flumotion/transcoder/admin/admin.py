@@ -42,9 +42,9 @@ from flumotion.transcoder.admin.proxy.workerset import WorkerSet
 from flumotion.transcoder.admin.proxy.transcoderset import TranscoderSet
 from flumotion.transcoder.admin.proxy.monitorset import MonitorSet
 from flumotion.transcoder.admin.monitoring import Monitoring
-from flumotion.transcoder.admin.montask import MonitoringTask
 from flumotion.transcoder.admin.transcoding import Transcoding
 from flumotion.transcoder.admin.scheduler import Scheduler
+from flumotion.transcoder.admin.admission import AdmissionController
 from flumotion.transcoder.admin.notifier import Notifier, notifyEmergency, notifyDebug
 from flumotion.transcoder.admin.api import apiserver
 
@@ -60,6 +60,10 @@ class TranscoderAdmin(log.Loggable):
         self._adminStore = AdminStore(self._datasource)
         self._reportsStore = ReportsStore(self._reportsDataSource)
         self._transcodeReports = {}
+        # Profiles added by the monitors during the reactor iteration,
+        # [(ProfileContext, params, fileSize)]
+        self._profileBurst = []
+        self._profileBurstCall = None
         self._storeCtx = self._adminCtx.getStoreContextFor(self._adminStore)
         notifierCtx = self._adminCtx.getNotifierContext()
         self._notifier = Notifier(notifierCtx, self._storeCtx)
@@ -72,8 +76,17 @@ class TranscoderAdmin(log.Loggable):
         self._janitor = Janitor(self._adminCtx, self._compPxySet)
         self._transPxySet = TranscoderSet(self._managerPxySet)
         self._monPxySet = MonitorSet(self._managerPxySet)
-        self._monitoring = Monitoring(self._workerPxySet, self._monPxySet)
-        self._transcoding = Transcoding(self._workerPxySet, self._transPxySet)
+        adminConfig = self._adminCtx.config.admin
+        # Shared by the monitors and the transcoders
+        self._admission = AdmissionController(adminConfig.admissionRate,
+                                              adminConfig.admissionBurst,
+                                              adminConfig.workerAdmissionRate,
+                                              adminConfig.workerAdmissionBurst)
+        self._monitoring = Monitoring(self._workerPxySet, self._monPxySet,
+                                      adminConfig.monitorPacks,
+                                      self._admission)
+        self._transcoding = Transcoding(self._workerPxySet, self._transPxySet,
+                                        self._admission)
         schedulerCtx = self._adminCtx.getSchedulerContext()
         self._scheduler = Scheduler(schedulerCtx, self._storeCtx, self._notifier,
                                     self._transcoding, self._diagnostician)
@@ -98,6 +111,7 @@ class TranscoderAdmin(log.Loggable):
         d.addCallback(defer.dropResult, self._monPxySet.initialize)
         d.addCallback(defer.dropResult, self._transPxySet.initialize)
         d.addCallback(defer.dropResult, self._scheduler.initialize)
+        d.addCallback(defer.dropResult, self.__loadTranscodingHistory)
         d.addCallback(defer.dropResult, self._monitoring.initialize)
         d.addCallback(defer.dropResult, self._transcoding.initialize)
         d.addCallback(defer.dropResult, self._janitor.initialize)
@@ -206,8 +220,7 @@ class TranscoderAdmin(log.Loggable):
                                   self.__onProfileStoreRemoved)
         custStore.refreshListener(self)
         custCtx = self._storeCtx.getCustomerContextFor(custStore)
-        task = MonitoringTask(self._monitoring, custCtx)
-        self._monitoring.addTask(custCtx.identifier, task)
+        self._monitoring.addCustomer(custCtx)
 
 
     def __onCustomerStoreRemoved(self, admin, custStore):
@@ -215,7 +228,7 @@ class TranscoderAdmin(log.Loggable):
         custStore.disconnectListener("profile-added", self)
         custStore.disconnectListener("profile-removed", self)
         custCtx = self._storeCtx.getCustomerContextFor(custStore)
-        self._monitoring.removeTask(custCtx.identifier)
+        self._monitoring.removeCustomer(custCtx)
 
 
     ## CustomerStore Event Listeners ##
@@ -227,11 +240,15 @@ class TranscoderAdmin(log.Loggable):
         profStore.connectListener("target-removed", self,
                                   self.__onTargetStoreRemoved)
         profStore.refreshListener(self)
+        custCtx = self._storeCtx.getCustomerContextFor(custStore)
+        self._monitoring.updateCustomer(custCtx)
 
     def __onProfileStoreRemoved(self, custStore, profStore):
         self.debug("Profile '%s' Removed", profStore.label)
         profStore.disconnectListener("target-added", self)
         profStore.disconnectListener("target-removed", self)
+        custCtx = self._storeCtx.getCustomerContextFor(custStore)
+        self._monitoring.updateCustomer(custCtx)
 
 
     ## ProfileStore Event Listeners ##
@@ -320,6 +337,8 @@ class TranscoderAdmin(log.Loggable):
     def __onMonitoredFileRemoved(self, montask, profCtx, state):
         self.log("Monitoring task '%s' removed profile '%s'",
                  montask.label, profCtx.inputPath)
+        self._profileBurst = [p for p in self._profileBurst
+                              if p[0].uid != profCtx.uid]
         self._scheduler.removeProfile(profCtx)
 
     def __onFailToRunOnWorker(self, task, workerPxy):
@@ -358,6 +377,7 @@ class TranscoderAdmin(log.Loggable):
         if transcodeReportStore:
             now = datetime.utcnow()
             transcodeReportStore.transcodingFinishTime = now
+            self.__passDeadlineInfo(profCtx, transcodeReportStore, now)
             transcodeReportStore.outcome = False
             transcodeReportStore.successful = False
 
@@ -394,6 +414,7 @@ class TranscoderAdmin(log.Loggable):
         if transcodeReportStore:
             now = datetime.utcnow()
             transcodeReportStore.transcodingFinishTime = now
+            self.__passDeadlineInfo(profCtx, transcodeReportStore, now)
             transcodeReportStore.outcome = True
             transcodeReportStore.successful = True
 
@@ -419,6 +440,22 @@ class TranscoderAdmin(log.Loggable):
 
     ## Private Methods ##
 
+    def __loadTranscodingHistory(self):
+        if not self._scheduler.usesCostModel():
+            self.debug("Scheduler policy not cost based, "
+                       "transcoding history not loaded")
+            return
+        d = self._reportsDataSource.retrieveTranscodingHistory(
+                adminconsts.COST_HISTORY_SIZE)
+        d.addCallbacks(self._scheduler.recordHistory,
+                       self.__ebTranscodingHistoryFailed)
+        return d
+
+    def __ebTranscodingHistoryFailed(self, failure):
+        # The cost model will learn from the next transcodings
+        self.warning("Failed to retrieve the transcoding history: %s",
+                     log.getFailureMessage(failure))
+
     """Gets information from the report and inserts it into the DB"""
     def  __passReportInfo(self, report, task, store):
         if not report or not store:
@@ -442,6 +479,13 @@ class TranscoderAdmin(log.Loggable):
             store.workerName = report.local.name
         store.attemptCount = task.getAttemptCount()
 
+    def __passDeadlineInfo(self, profCtx, store, finishTime):
+        deadline = self._scheduler.getDeadline(profCtx)
+        if deadline is None:
+            return
+        store.deadline = datetime.utcfromtimestamp(deadline)
+        store.deadlineMissed = finishTime > store.deadline
+
     def __prognose(self, report, store):
         prog = self._prognostician
         data = {prog.type_key: report.source.fileType,
@@ -462,14 +506,18 @@ class TranscoderAdmin(log.Loggable):
     def __fileStateChanged(self, montask, profCtx, state, params=None):
 
         def changeState(newState):
-            inputBase = profCtx.inputBase
-            relPath = profCtx.inputRelPath
-            montask.setFileState(inputBase, relPath, newState, profCtx.name)
+            montask.setFileState(profCtx, newState)
 
         # Schedule new file if not already scheduled
         # and synchronize the file states
         queued = self._scheduler.isProfileQueued(profCtx)
         active = self._scheduler.isProfileActive(profCtx)
+        # The source file size, used to estimate the transcoding cost
+        fileSize = None
+        key = profCtx.inputBase, profCtx.inputRelPath
+        transcodeReportStore = self._transcodeReports.get(key, None)
+        if transcodeReportStore:
+            fileSize = transcodeReportStore.fileSize
         if state == MonitorFileStateEnum.pending:
             if queued:
                 changeState(MonitorFileStateEnum.queued)
@@ -477,7 +525,7 @@ class TranscoderAdmin(log.Loggable):
             if active:
                 changeState(MonitorFileStateEnum.transcoding)
                 return
-            self._scheduler.addProfile(profCtx, params)
+            self.__addProfile(profCtx, params, fileSize)
             return
         if state == MonitorFileStateEnum.queued:
             if active:
@@ -485,7 +533,7 @@ class TranscoderAdmin(log.Loggable):
                 return
             if queued:
                 return
-            self._scheduler.addProfile(profCtx, params)
+            self.__addProfile(profCtx, params, fileSize)
             return
         if state == MonitorFileStateEnum.transcoding:
             if queued:
@@ -493,9 +541,28 @@ class TranscoderAdmin(log.Loggable):
                 return
             if active:
                 return
-            self._scheduler.addProfile(profCtx, params)
+            self.__addProfile(profCtx, params, fileSize)
             return
 
+    def __addProfile(self, profCtx, params, fileSize):
+        # The monitors notify their files in bursts, e.g. all the pending
+        # files when they start; the scheduler queues them at once
+        self._profileBurst.append((profCtx, params, fileSize))
+        if self._profileBurstCall is None:
+            self._profileBurstCall = reactor.callLater(0,
+                                                       self.__flushProfileBurst)
+
+    def __flushProfileBurst(self):
+        self._profileBurstCall = None
+        burst, self._profileBurst = self._profileBurst, []
+        profiles = {}
+        order = []
+        for profCtx, params, fileSize in burst:
+            if profCtx.uid not in profiles:
+                order.append(profCtx.uid)
+            profiles[profCtx.uid] = (profCtx, params, fileSize)
+        self._scheduler.addProfiles([profiles[uid] for uid in order])
+
     def pepe_es_un_capullo(self):
         return True
 
@@ -504,7 +571,7 @@ class TranscoderAdmin(log.Loggable):
         inputBase = profCtx.inputBase
         failedBase = profCtx.failedBase
         relPath = profCtx.inputRelPath
-        task = self._monitoring.getTask(custCtx.identifier)
+        task = self._monitoring.getProfileTask(profCtx)
         if not task:
             self.warning("No monitoring task found for customer '%s'; "
                          "cannot move files from '%s' to '%s'",
@@ -515,14 +582,13 @@ class TranscoderAdmin(log.Loggable):
     def __setInputFileState(self, profCtx, state):
         custCtx = profCtx.getCustomerContext()
         inputBase = profCtx.inputBase
-        task = self._monitoring.getTask(custCtx.identifier)
+        task = self._monitoring.getProfileTask(profCtx)
         if not task:
             self.warning("No monitoring task found for customer '%s'; "
                          "cannot set file '%s' state to %s",
                          custCtx.label, inputBase, state.name)
             return
-        relPath = profCtx.inputRelPath
-        task.setFileState(inputBase, relPath, state, profCtx.name)
+        task.setFileState(profCtx, state)
 
     def __startup(self):
         if not (self._state == TaskStateEnum.stopped):
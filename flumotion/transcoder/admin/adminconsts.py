@@ -25,6 +25,8 @@ SCHEDULER_LOG_CATEGORY = "scheduler"
 NOTIFIER_LOG_CATEGORY = "notifier"
 IDLE_LOG_CATEGORY = "idle"
 JANITOR_LOG_CATEGORY = "janitor"
+ADMISSION_LOG_CATEGORY = "admission"
+SIMULATOR_LOG_CATEGORY = "simulator"
 
 GET_REQUEST_AGENT = "Flumotion Transcoder"
 
@@ -44,6 +46,8 @@ MONITORSET_TUNE_PERIOD = 10
 ACTIVITY_LABEL_TEMPLATE = "%(customerName)s/%(profileName)s:%(sourcePath)s"
 TRANSCODER_LABEL_TEMPLATE = "%(customerName)s/%(profileName)s:%(sourcePath)s"
 MONITOR_LABEL_TEMPLATE = "Monitor for %(customerName)s"
+MONITOR_PACK_LABEL_TEMPLATE = "Monitor pack %(packGroup)s-%(packIndex)d"
+MONITOR_SHARD_LABEL_TEMPLATE = "%(monitorLabel)s (shard %(shardIndex)d/%(shardCount)d)"
 
 # Maximum time to wait for the admin to load
 # and initialize all components stats
@@ -70,6 +74,14 @@ TASK_START_DELAY = 3
 TASK_START_DELAY_FACTOR = 4
 # Maximum time to hold a lost component before starting another one
 TASK_HOLD_TIMEOUT = 60
+# Components the admin tasks can load by second on all the workers,
+# and at once after a quiet period, see admission.py
+TASK_ADMISSION_RATE = 2.0
+TASK_ADMISSION_BURST = 10
+# Components the admin tasks can load by second on each worker,
+# and at once after a quiet period
+TASK_WORKER_ADMISSION_RATE = 0.5
+TASK_WORKER_ADMISSION_BURST = 3
 # Maximum time to look for a valid component before starting a new one
 TASK_POTENTIAL_COMPONENT_TIMEOUT = 20
 # Maximum time to wait when retrieving component UI State
@@ -81,6 +93,12 @@ JANITOR_WAIT_FOR_DELETE = 20
 MONITOR_STATE_UPDATE_PERIOD = 1
 MONITOR_MAX_RETRIES = 3
 MONITORING_POTENTIAL_WORKER_TIMEOUT = 20
+# Number of file monitors the customers with compatible settings
+# are packed into, 0 for one monitor by customer
+MONITOR_PACKS = 0
+# Time the changes of the customers of a monitor pack are gathered
+# before its monitor is updated, so a burst of changes restarts it once
+MONITOR_PACK_UPDATE_DELAY = 10
 
 # Maximum time an elected transcoder can stay sad before starting another one
 TRANSCODER_SAD_TIMEOUT = 120
@@ -91,6 +109,61 @@ TRANSCODER_ACK_TIMEOUT = 60*12
 TRANSCODER_MAX_RETRIES = 2
 TRANSCODING_POTENTIAL_WORKER_TIMEOUT = 20
 
+# Scheduler policies: "priority" orders the queued transcodings by
+# customer and profile priority, "fair" shares the transcoding slots
+# between the customers by weight, the profile priority still applying
+# to the transcodings of a customer, "shortest" starts the transcodings
+# expected to be the shortest first, without regard to priorities,
+# "deadline" starts the transcodings with the earliest deadline first,
+# the deadline being the queuing time plus the turnaround time
+SCHEDULER_POLICY_PRIORITY = "priority"
+SCHEDULER_POLICY_FAIR = "fair"
+SCHEDULER_POLICY_SHORTEST = "shortest"
+SCHEDULER_POLICY_DEADLINE = "deadline"
+SCHEDULER_POLICIES = (SCHEDULER_POLICY_PRIORITY, SCHEDULER_POLICY_FAIR,
+                      SCHEDULER_POLICY_SHORTEST, SCHEDULER_POLICY_DEADLINE)
+DEFAULT_SCHEDULER_POLICY = SCHEDULER_POLICY_PRIORITY
+# The policies estimating the cost of the queued transcodings
+SCHEDULER_COST_POLICIES = (SCHEDULER_POLICY_FAIR, SCHEDULER_POLICY_SHORTEST,
+                           SCHEDULER_POLICY_DEADLINE)
+# Maximum time in second a transcoding can wait with the shortest
+# policy before being started before the shorter ones
+SCHEDULER_MAX_WAIT = 2 * 3600
+# Aging of the queued transcodings with the priority policy:
+# priority points gained by minute spent queued, 0 to disable,
+# and maximum points gained (1000 is one customer priority)
+SCHEDULER_AGING_RATE = 0
+SCHEDULER_AGING_CAP = 1000
+# Turnaround time in second of the transcodings of the profiles
+# without target turnaround time with the deadline policy
+SCHEDULER_TURNAROUND_TIME = 24 * 3600
+# With the deadline policy, a transcoding is at risk and started before
+# the earlier deadlines when it must start within this time in second
+# to finish in time, from the estimation of the time it will take
+SCHEDULER_RISK_MARGIN = 5 * 60
+# With the priority policy, when no slot is free, a running transcoding
+# is stopped and queued again for a queued transcoding with a priority
+# higher by this gap at least (1000 is one customer priority), 0 to
+# disable the preemption; the transcodings running for less than
+# the minimum run time in second, or already preempted the maximum
+# number of times, are not preempted
+SCHEDULER_PREEMPTION_GAP = 0
+SCHEDULER_PREEMPTION_MIN_RUN_TIME = 5 * 60
+SCHEDULER_PREEMPTION_MAX_COUNT = 2
+
+# Transcoding cost models, see costmodel.py
+COST_MODEL_SIZE = "size"
+COST_MODEL_HISTORY = "history"
+DEFAULT_COST_MODEL = COST_MODEL_HISTORY
+# Estimated time in second of a transcoding without history,
+# a time by transcoding plus a time by byte of the source file
+COST_JOB_TIME = 10.0
+COST_BYTE_TIME = 1.0 / (2 * 1024 * 1024)
+# Weight of the last transcoding in the profiles history
+COST_HISTORY_SMOOTHING = 0.2
+# Number of stored transcoding reports the history is initialized from
+COST_HISTORY_SIZE = 10000
+
 # Startup timeouts
 MONITORING_START_TIMEOUT = 30
 MONITORING_PAUSE_TIMEOUT = 30
@@ -128,6 +201,10 @@ DEFAULT_LINK_FILE_TEMPLATE = "%(targetPath)s.link"
 DEFAULT_CONFIG_FILE_TEMPLATE = "%(sourcePath)s.ini"
 DEFAULT_REPORT_FILE_TEMPLATE = "%(sourcePath)s.%(id)s.rep"
 DEFAULT_MONITORING_PERIOD = 5
+DEFAULT_WATCHER_BACKEND = "polling"
+DEFAULT_FINGERPRINT_MODE = "md5"
+DEFAULT_COMPLETION_METHOD = "none"
+DEFAULT_MONITOR_SHARDS = 1
 DEFAULT_TRANSCODING_TIMEOUT = 60
 DEFAULT_POSTPROCESS_TIMEOUT = 60
 DEFAULT_PREPROCESS_TIMEOUT = 60
@@ -161,6 +238,7 @@ Profile Name:  %(profileName)s
 
 # Default CustomerStore values
 DEFAULT_CUSTOMER_PRIORITY = 100
+DEFAULT_CUSTOMER_WEIGHT = 1
 
 # Default customer directories
 DEFAULT_INPUT_DIR = "/%s/files/incoming"
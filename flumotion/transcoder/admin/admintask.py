@@ -85,6 +85,12 @@ class IAdminTask(interfaces.IAdminInterface):
     def suggestWorker(self, worker):
         pass
 
+    def setAdmissionController(self, admission):
+        """
+        Set the admission.AdmissionController to ask
+        before loading a component, or None.
+        """
+
     def waitPotentialWorker(self, timeout=None):
         """
         Return a Deferred.
@@ -129,6 +135,8 @@ class AdminTask(log.LoggerProxy, events.EventSourceMixin):
         self._retry = 0
         self._holdTimeout = None
         self._processInterruptions = 0
+        self._admission = None # admission.AdmissionController
+        self._admitting = None # Deferred waiting for admission
 
 
     ## IAdminTask Implementation ##
@@ -210,6 +218,7 @@ class AdminTask(log.LoggerProxy, events.EventSourceMixin):
                                                  self.label)))
         self.log("Pausing admin task '%s'", self.label)
         self._state = TaskStateEnum.paused
+        self.__cancelAdmission()
         # No longer have associated worker
         self._workerPxy = None
         # No longer started
@@ -245,6 +254,7 @@ class AdminTask(log.LoggerProxy, events.EventSourceMixin):
                                                  self.label)))
         self.log("Stopping admin task '%s'", self.label)
         self._state = TaskStateEnum.terminated
+        self.__cancelAdmission()
         self.__relieveComponent()
         for compPxy in self._compPxys:
             self._onComponentRemoved(compPxy)
@@ -261,6 +271,7 @@ class AdminTask(log.LoggerProxy, events.EventSourceMixin):
             return
         self.log("Aborting admin task '%s'", self.label)
         self._state = TaskStateEnum.terminated
+        self.__cancelAdmission()
         self.__relieveComponent()
         for compPxy in self._compPxys:
             self._onComponentRemoved(compPxy)
@@ -272,6 +283,7 @@ class AdminTask(log.LoggerProxy, events.EventSourceMixin):
                  workerPxy and workerPxy.label, self.label)
         if self._doAcceptSuggestedWorker(workerPxy):
             # Cancel pending components if any
+            self.__cancelAdmission()
             self._pendingName = None
             # If we change the worker, reset the retry counter
             self._resetRetryCounter()
@@ -286,6 +298,9 @@ class AdminTask(log.LoggerProxy, events.EventSourceMixin):
             return self._workerPxy
         return None
 
+    def setAdmissionController(self, admission):
+        self._admission = admission
+
     def waitIdle(self, timeout=None):
         compPxy = self.getActiveComponent()
         if compPxy:
@@ -386,6 +401,7 @@ class AdminTask(log.LoggerProxy, events.EventSourceMixin):
         Terminate the task deleting all components.
         """
         self._state = TaskStateEnum.terminated
+        self.__cancelAdmission()
         self.__relieveComponent()
         # Stop all components
         defs = [self._waitDeleteComponent(c) for c in self._compPxys]
@@ -678,7 +694,7 @@ class AdminTask(log.LoggerProxy, events.EventSourceMixin):
         log.notifyFailure(self, failure,
                           "Failure looking for a potential component "
                           "for admin task '%s'", self.label)
-        self.__loadNewComponent()
+        self.__admitNewComponent()
 
     def __cbGotPotentialComponent(self, compPxy):
         if compPxy:
@@ -689,7 +705,43 @@ class AdminTask(log.LoggerProxy, events.EventSourceMixin):
         else:
             self.log("Admin task '%s' doesn't found potential component",
                      self.label)
+            self.__admitNewComponent()
+
+    def __admitNewComponent(self):
+        # The load and happy timeouts only start once admitted,
+        # so waiting for the other components to be loaded is not
+        # taken for a failure to start and does not use up the retries
+        if self._admission is None:
             self.__loadNewComponent()
+            return
+        componentName = self._pendingName
+        workerName = self._workerPxy.getName()
+        self.log("Admin task '%s' waiting for admission to load "
+                 "component '%s' on worker '%s'",
+                 self.label, componentName, workerName)
+        d = self._admission.admit(workerName, self.label)
+        self._admitting = d
+        d.addCallback(self.__cbComponentAdmitted, componentName, workerName)
+
+    def __cbComponentAdmitted(self, waited, componentName, workerName):
+        self._admitting = None
+        if (not self.isStarted()) or (componentName != self._pendingName):
+            return
+        if ((not self._workerPxy)
+            or (workerName != self._workerPxy.getName())):
+            self.__cancelComponentStartup()
+            return
+        self.__loadNewComponent()
+
+    def __cancelAdmission(self):
+        if self._admitting is None:
+            return
+        self.log("Admin task '%s' gives up loading component '%s'",
+                 self.label, self._pendingName)
+        self._admission.cancel(self._admitting)
+        self._admitting = None
+        # The component was never loaded
+        self._pendingName = None
 
     def __loadNewComponent(self):
         # component is started here
@@ -0,0 +1,191 @@
+# vi:si:et:sw=4:sts=4:ts=4
+
+# Flumotion - a streaming media server
+# Copyright (C) 2004,2005,2006,2007,2008,2009 Fluendo, S.L.
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+#
+# This file may be distributed and/or modified under the terms of
+# the GNU Lesser General Public License version 2.1 as published by
+# the Free Software Foundation.
+# This file is distributed without any warranty; without even the implied
+# warranty of merchantability or fitness for a particular purpose.
+# See "LICENSE.LGPL" in the source distribution for more information.
+#
+# Headers in this file shall remain intact.
+
+"""
+Admission control of the component loading.
+
+When the admin starts or resumes, lots of admin tasks want to load
+their component at the same time, and every worker forks, imports
+GStreamer and loads its plugins for all of them at once. The components
+then take so long to become happy that the task timeouts are triggered
+and the tasks retry, adding even more load.
+
+The admin tasks ask the admission controller before loading a component,
+and the controller spreads the loadings with token buckets, one for all
+the workers and one by worker. The load and happy timeouts of the tasks
+only start once admitted.
+"""
+
+from twisted.internet import reactor
+
+from flumotion.inhouse import log, defer
+
+from flumotion.transcoder.admin import adminconsts
+
+
+class TokenBucket(object):
+    """
+    Allows rate operations by second on average,
+    with bursts of up to burst operations.
+    """
+
+    def __init__(self, rate, burst, now):
+        assert rate > 0
+        self.rate = float(rate)
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._last = now
+
+    def isFull(self, now):
+        self.__refill(now)
+        return self._tokens >= self.burst
+
+    def getDelay(self, now):
+        """
+        Returns the time in second to wait for an operation
+        to be allowed, 0 if it is allowed right now.
+        """
+        self.__refill(now)
+        if self._tokens >= 1:
+            return 0
+        return (1 - self._tokens) / self.rate
+
+    def consume(self, now):
+        self.__refill(now)
+        assert self._tokens >= 1
+        self._tokens -= 1
+
+
+    ## Private Methods ##
+
+    def __refill(self, now):
+        elapsed = max(now - self._last, 0)
+        self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+        self._last = now
+
+
+class AdmissionController(log.Loggable):
+    """
+    Admits the component loadings in the order they were asked for,
+    at most rate by second for all the workers, and workerRate by
+    second for each worker, allowing bursts of burst and workerBurst
+    loadings. A loading waiting for a busy worker does not delay the
+    loadings on the other workers. A rate of 0 or None disables
+    the corresponding limit.
+    """
+
+    logCategory = adminconsts.ADMISSION_LOG_CATEGORY
+
+    def __init__(self, rate=None, burst=None,
+                 workerRate=None, workerBurst=None, reactor=reactor):
+        self._reactor = reactor
+        now = reactor.seconds()
+        self._bucket = None
+        if rate:
+            self._bucket = TokenBucket(rate, burst or 1, now)
+        self._workerRate = workerRate
+        self._workerBurst = workerBurst or 1
+        self._workerBuckets = {} # {workerName: TokenBucket}
+        self._waiters = [] # [(workerName, label, Deferred, time)]
+        self._delayed = None # IDelayedCall
+
+
+    ## Public Methods ##
+
+    def isEnabled(self):
+        return bool(self._bucket or self._workerRate)
+
+    def getWaitingCount(self, workerName=None):
+        if workerName is None:
+            return len(self._waiters)
+        return len([w for w in self._waiters if w[0] == workerName])
+
+    def admit(self, workerName, label=None):
+        """
+        Returns a deferred fired with the time in second waited
+        when a component can be loaded on the specified worker.
+        """
+        if not self.isEnabled():
+            return defer.succeed(0)
+        d = defer.Deferred()
+        now = self._reactor.seconds()
+        self._waiters.append((workerName, label, d, now))
+        self.__process()
+        return d
+
+    def cancel(self, d):
+        """
+        Gives up a loading not admitted yet, its deferred
+        returned by admit() will never be fired.
+        """
+        for index, waiter in enumerate(self._waiters):
+            if waiter[2] is d:
+                del self._waiters[index]
+                self.log("Canceled admission of '%s' on worker '%s'",
+                         waiter[1], waiter[0])
+                self.__process()
+                return True
+        return False
+
+
+    ## Private Methods ##
+
+    def __getWorkerBucket(self, workerName, now):
+        if not self._workerRate:
+            return None
+        bucket = self._workerBuckets.get(workerName, None)
+        if bucket is None:
+            bucket = TokenBucket(self._workerRate, self._workerBurst, now)
+            self._workerBuckets[workerName] = bucket
+        return bucket
+
+    def __process(self):
+        if self._delayed is not None:
+            if self._delayed.active():
+                self._delayed.cancel()
+            self._delayed = None
+        now = self._reactor.seconds()
+        admitted = []
+        waiting = []
+        delay = None
+        for waiter in self._waiters:
+            workerName = waiter[0]
+            bucket = self.__getWorkerBucket(workerName, now)
+            buckets = [b for b in (self._bucket, bucket) if b is not None]
+            wait = max([b.getDelay(now) for b in buckets])
+            if wait > 0:
+                waiting.append(waiter)
+                if (delay is None) or (wait < delay):
+                    delay = wait
+                continue
+            for b in buckets:
+                b.consume(now)
+            admitted.append(waiter)
+        self._waiters = waiting
+        # Forget the idle workers
+        busy = set([w[0] for w in waiting])
+        for workerName, bucket in self._workerBuckets.items():
+            if (workerName not in busy) and bucket.isFull(now):
+                del self._workerBuckets[workerName]
+        if delay is not None:
+            self._delayed = self._reactor.callLater(delay, self.__process)
+        for workerName, label, d, since in admitted:
+            waited = now - since
+            if waited > 0:
+                self.debug("Admitted '%s' on worker '%s' after %.1f second(s)"
+                           ", %d loading(s) still waiting", label,
+                           workerName, waited, len(self._waiters))
+            d.callback(waited)
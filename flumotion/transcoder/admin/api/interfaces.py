@@ -43,7 +43,15 @@ class ITranscoderGateway(IMedium):
 
 
 class ISchedulerMedium(IMedium):
-    pass
+
+    def getPolicy(self):
+        pass
+
+    def getQueuedProfiles(self):
+        pass
+
+    def getDeadlineStatistics(self):
+        pass
 
 
 class IWorkerSetMedium(IMedium):
@@ -123,6 +131,9 @@ class ICustomerMedium(IIdentifiedMedium):
     def getCustomerPriority(self):
         pass
 
+    def getCustomerWeight(self):
+        pass
+
     def getOutputMediaTemplate(self):
         pass
 
@@ -174,6 +185,9 @@ class ICustomerMedium(IIdentifiedMedium):
     def getTranscodingTimeout(self):
         pass
 
+    def getTurnaroundTime(self):
+        pass
+
     def getMonitoringPeriod(self):
         pass
 
@@ -285,6 +299,9 @@ class IProfileMedium(IIdentifiedMedium):
     def getTranscodingTimeout(self):
         pass
 
+    def getTurnaroundTime(self):
+        pass
+
     def getMonitoringPeriod(self):
         pass
 
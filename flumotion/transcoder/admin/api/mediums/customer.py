@@ -41,6 +41,7 @@ class CustomerMedium(api.IdentifiedMedium):
     api.readonly_property("failedRepDir")
     api.readonly_property("doneRepDir")
     api.readonly_property("customerPriority")
+    api.readonly_property("customerWeight")
     api.readonly_property("outputMediaTemplate")
     api.readonly_property("outputThumbTemplate")
     api.readonly_property("linkFileTemplate")
@@ -58,6 +59,7 @@ class CustomerMedium(api.IdentifiedMedium):
     api.readonly_property("preprocessTimeout")
     api.readonly_property("postprocessTimeout")
     api.readonly_property("transcodingTimeout")
+    api.readonly_property("turnaroundTime")
     api.readonly_property("monitoringPeriod")
     api.readonly_property("accessForceUser")
     api.readonly_property("accessForceGroup")
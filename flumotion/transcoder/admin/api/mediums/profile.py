@@ -57,6 +57,7 @@ class ProfileMedium(api.IdentifiedMedium):
     api.readonly_property("preprocessTimeout")
     api.readonly_property("postprocessTimeout")
     api.readonly_property("transcodingTimeout")
+    api.readonly_property("turnaroundTime")
     api.readonly_property("monitoringPeriod")
 
     def __init__(self, profStore):
@@ -28,6 +28,21 @@ class SchedulerMedium(api.Medium):
     api.register_medium(interfaces.ISchedulerMedium,
                        scheduler.IScheduler)
 
+    def __init__(self, scheduler):
+        api.Medium.__init__(self, scheduler)
+
 
     ## ISchedulerMedium Methodes ##
 
+    @api.make_remote()
+    def getPolicy(self):
+        return self.reference.getPolicy()
+
+    @api.make_remote()
+    def getQueuedProfiles(self):
+        return self.reference.getQueuedProfiles()
+
+    @api.make_remote()
+    def getDeadlineStatistics(self):
+        return self.reference.getDeadlineStatistics()
+
@@ -19,6 +19,7 @@ from flumotion.transcoder.admin.diagnostic import Prognostician
 from flumotion.transcoder.admin.datasource import filesource
 from flumotion.transcoder.admin.datasource import sqlsource
 from flumotion.transcoder.admin.context import base, worker, notifier, store, api, manager
+from flumotion.transcoder.admin.context import scheduler
 
 
 class AdminContext(base.BaseContext):
@@ -40,7 +41,8 @@ class AdminContext(base.BaseContext):
         return notifier.NotifierContext(self, notifierConfig)
 
     def getSchedulerContext(self):
-        return None
+        schedulerConfig = self.config.admin.scheduler
+        return scheduler.SchedulerContext(self, schedulerConfig)
 
     def getLocal(self):
         return local.Local("admin", self.config.admin.roots)
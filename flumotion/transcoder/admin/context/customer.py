@@ -29,6 +29,7 @@ class ICustomerContext(base.IBaseStoreContext):
     name                 = Attribute("Name of the customer")
     subdir               = Attribute("Customer files sub-directory")
     customerPriority     = Attribute("Customer transcoding priority")
+    customerWeight       = Attribute("Customer share of the transcoding slots")
     outputMediaTemplate  = Attribute("Output media file template")
     outputThumbTemplate  = Attribute("Output thumbnail file temaplte")
     linkFileTemplate     = Attribute("Link file template")
@@ -46,9 +47,14 @@ class ICustomerContext(base.IBaseStoreContext):
     preprocessTimeout    = Attribute("Pre-processing timeout")
     postprocessTimeout   = Attribute("Post-processing timeout")
     transcodingTimeout   = Attribute("Transcoding timeout")
+    turnaroundTime       = Attribute("Target transcoding turnaround time")
     monitoringPeriod     = Attribute("Monitoring period")
     monitorType          = Attribute("Monitor type (http or file monitor)")
     monitorPort          = Attribute("Port the monitor listens to (default: 7680)")
+    watcherBackend       = Attribute("Directory watcher backend")
+    fingerprintMode      = Attribute("Monitored files fingerprint mode")
+    completionMethod     = Attribute("Monitored files completion method")
+    monitorShards        = Attribute("Number of monitors sharing the incoming files")
     setup_callback       = Attribute("Where to notify the worker's hostname and port")
     accessForceUser      = Attribute("Force user of new files and directories")
     accessForceGroup     = Attribute("Force group of new files and directories")
@@ -145,6 +151,8 @@ class CustomerContext(base.BaseStoreContext, notification.NotifyStoreMixin):
     name                 = base.StoreProxy("name")
     customerPriority     = base.StoreProxy("customerPriority",
                                            adminconsts.DEFAULT_CUSTOMER_PRIORITY)
+    customerWeight       = base.StoreProxy("customerWeight",
+                                           adminconsts.DEFAULT_CUSTOMER_WEIGHT)
     preprocessCommand    = base.StoreProxy("preprocessCommand")
     postprocessCommand   = base.StoreProxy("postprocessCommand")
     enablePostprocessing = base.StoreProxy("enablePostprocessing")
@@ -162,10 +170,15 @@ class CustomerContext(base.BaseStoreContext, notification.NotifyStoreMixin):
     preprocessTimeout    = base.StoreParentProxy("preprocessTimeout")
     postprocessTimeout   = base.StoreParentProxy("postprocessTimeout")
     transcodingTimeout   = base.StoreParentProxy("transcodingTimeout")
+    turnaroundTime       = base.StoreParentProxy("turnaroundTime")
     monitoringPeriod     = base.StoreParentProxy("monitoringPeriod")
     monitorType          = base.StoreParentProxy("monitorType")
     monitorPort          = base.StoreParentProxy("monitorPort")
     setup_callback       = base.StoreParentProxy("setup_callback")
+    watcherBackend       = base.StoreParentProxy("watcherBackend")
+    fingerprintMode      = base.StoreParentProxy("fingerprintMode")
+    completionMethod     = base.StoreParentProxy("completionMethod")
+    monitorShards        = base.StoreParentProxy("monitorShards")
     accessForceUser      = base.StoreParentProxy("accessForceUser")
     accessForceGroup     = base.StoreParentProxy("accessForceGroup")
     accessForceDirMode   = base.StoreParentProxy("accessForceDirMode")
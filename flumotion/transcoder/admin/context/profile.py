@@ -45,7 +45,11 @@ class IUnboundProfileContext(base.IBaseStoreContext):
     preprocessTimeout    = Attribute("Pre-processing timeout")
     postprocessTimeout   = Attribute("Post-processing timeout")
     transcodingTimeout   = Attribute("Transcoding timeout")
+    turnaroundTime       = Attribute("Target transcoding turnaround time")
     monitoringPeriod     = Attribute("Monitoring period")
+    watcherBackend       = Attribute("Directory watcher backend")
+    fingerprintMode      = Attribute("Monitored files fingerprint mode")
+    growingInput         = Attribute("Transcode the files while written")
     inputBase            = Attribute("Input file base directory")
     outputBase           = Attribute("Output file base directory")
     failedBase           = Attribute("Failed transcoding base directory")
@@ -218,7 +222,11 @@ class UnboundProfileContext(base.BaseStoreContext, notification.NotifyStoreMixin
     preprocessTimeout    = base.StoreParentProxy("preprocessTimeout")
     postprocessTimeout   = base.StoreParentProxy("postprocessTimeout")
     transcodingTimeout   = base.StoreParentProxy("transcodingTimeout")
+    turnaroundTime       = base.StoreParentProxy("turnaroundTime")
     monitoringPeriod     = base.StoreParentProxy("monitoringPeriod")
+    watcherBackend       = base.StoreParentProxy("watcherBackend")
+    fingerprintMode      = base.StoreParentProxy("fingerprintMode")
+    growingInput         = base.StoreProxy("growingInput", False)
     outputBase           = BaseDir("output")
     linkBase             = BaseDir("link")
     workBase             = BaseDir("work")
@@ -30,6 +30,10 @@ class IStoreContext(base.IBaseStoreContext):
     reportFileTemplate    = Attribute("Report file template")
     linkTemplate          = Attribute("Link template")
     monitoringPeriod      = Attribute("Monitoring period")
+    watcherBackend        = Attribute("Directory watcher backend")
+    fingerprintMode       = Attribute("Monitored files fingerprint mode")
+    completionMethod      = Attribute("Monitored files completion method")
+    monitorShards         = Attribute("Number of monitors sharing the incoming files")
     accessForceUser       = Attribute("Force user of new files and directories")
     accessForceGroup      = Attribute("Force group of new files and directories")
     accessForceDirMode    = Attribute("Force rights of new directories")
@@ -37,6 +41,7 @@ class IStoreContext(base.IBaseStoreContext):
     processPriority       = Attribute("Transcoding process priority")
     transcodingPriority   = Attribute("Transcoding priority")
     transcodingTimeout    = Attribute("Transcoding timeout")
+    turnaroundTime        = Attribute("Target transcoding turnaround time")
     postprocessTimeout    = Attribute("Post-processing timeout")
     preprocessTimeout     = Attribute("Pre-processing timeout")
     mailSubjectTemplate   = Attribute("Mail notifications subject template")
@@ -88,6 +93,14 @@ class StoreContext(base.BaseStoreContext, notification.NotifyStoreMixin):
                                             constants.LINK_TEMPLATE)
     monitoringPeriod      = base.StoreProxy("monitoringPeriod",
                                             adminconsts.DEFAULT_MONITORING_PERIOD)
+    watcherBackend        = base.StoreProxy("watcherBackend",
+                                            adminconsts.DEFAULT_WATCHER_BACKEND)
+    fingerprintMode       = base.StoreProxy("fingerprintMode",
+                                            adminconsts.DEFAULT_FINGERPRINT_MODE)
+    completionMethod      = base.StoreProxy("completionMethod",
+                                            adminconsts.DEFAULT_COMPLETION_METHOD)
+    monitorShards         = base.StoreProxy("monitorShards",
+                                            adminconsts.DEFAULT_MONITOR_SHARDS)
     accessForceUser       = base.StoreProxy("accessForceUser",
                                             adminconsts.DEFAULT_ACCESS_FORCE_USER)
     accessForceGroup      = base.StoreProxy("accessForceGroup",
@@ -102,6 +115,7 @@ class StoreContext(base.BaseStoreContext, notification.NotifyStoreMixin):
                                             adminconsts.DEFAULT_TRANSCODING_PRIORITY)
     transcodingTimeout    = base.StoreProxy("transcodingTimeout",
                                             adminconsts.DEFAULT_TRANSCODING_TIMEOUT)
+    turnaroundTime        = base.StoreProxy("turnaroundTime")
     postprocessTimeout    = base.StoreProxy("postprocessTimeout",
                                             adminconsts.DEFAULT_POSTPROCESS_TIMEOUT)
     preprocessTimeout     = base.StoreProxy("preprocessTimeout",
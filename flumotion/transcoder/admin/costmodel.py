@@ -0,0 +1,222 @@
+# vi:si:et:sw=4:sts=4:ts=4
+
+# Flumotion - a streaming media server
+# Copyright (C) 2004,2005,2006,2007,2008,2009 Fluendo, S.L.
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+#
+# This file may be distributed and/or modified under the terms of
+# the GNU Lesser General Public License version 2.1 as published by
+# the Free Software Foundation.
+# This file is distributed without any warranty; without even the implied
+# warranty of merchantability or fitness for a particular purpose.
+# See "LICENSE.LGPL" in the source distribution for more information.
+#
+# Headers in this file shall remain intact.
+
+"""
+Estimation of the time a transcoding will take.
+
+The cost models do not depend on the admin contexts so they can be
+evaluated offline against recorded transcoding reports, see evaluate().
+"""
+
+from zope.interface import Interface, implements
+
+from flumotion.transcoder.admin import adminconsts
+
+
+class ICostModel(Interface):
+
+    def estimate(self, profileKey, fileSize=None, duration=None):
+        """
+        Returns the estimated time in second the transcoding of
+        a source file with the specified profile will take.
+        The file size in bytes and the media duration in second
+        can be None if not known.
+        """
+
+    def record(self, profileKey, realTime, fileSize=None, duration=None):
+        """
+        Learns from a transcoding that took realTime seconds.
+        """
+
+
+class SizeCostModel(object):
+    """
+    Estimates the transcoding time from the source file size
+    with a fixed throughput, the same for all the profiles.
+    """
+
+    implements(ICostModel)
+
+    def __init__(self, jobTime=adminconsts.COST_JOB_TIME,
+                 byteTime=adminconsts.COST_BYTE_TIME):
+        self.jobTime = jobTime
+        self.byteTime = byteTime
+
+    def estimate(self, profileKey, fileSize=None, duration=None):
+        if fileSize:
+            return self.jobTime + fileSize * self.byteTime
+        return self.jobTime
+
+    def record(self, profileKey, realTime, fileSize=None, duration=None):
+        pass
+
+
+class ProfileHistory(object):
+    """
+    Smoothed transcoding statistics of a profile.
+    """
+
+    def __init__(self, smoothing):
+        self.smoothing = smoothing
+        self.count = 0
+        self.realTime = None # seconds by transcoding
+        self.realtimeFactor = None # seconds by second of media
+        self.byteTime = None # seconds by byte of source file
+
+    def update(self, realTime, fileSize=None, duration=None):
+        self.count += 1
+        self.realTime = self.__smooth(self.realTime, realTime)
+        if duration:
+            factor = realTime / float(duration)
+            self.realtimeFactor = self.__smooth(self.realtimeFactor, factor)
+        if fileSize:
+            byteTime = realTime / float(fileSize)
+            self.byteTime = self.__smooth(self.byteTime, byteTime)
+
+    def estimate(self, fileSize=None, duration=None):
+        if duration and (self.realtimeFactor is not None):
+            return duration * self.realtimeFactor
+        if fileSize and (self.byteTime is not None):
+            return fileSize * self.byteTime
+        return self.realTime
+
+
+    ## Private Methods ##
+
+    def __smooth(self, average, value):
+        if average is None:
+            return value
+        return average + self.smoothing * (value - average)
+
+
+class HistoryCostModel(SizeCostModel):
+    """
+    Estimates the transcoding time from the realtime factor and the
+    throughput of the previous transcodings of the same profile,
+    then of all the profiles if the profile has no history yet.
+    The media duration is used first when known, then the file size.
+    """
+
+    def __init__(self, jobTime=adminconsts.COST_JOB_TIME,
+                 byteTime=adminconsts.COST_BYTE_TIME,
+                 smoothing=adminconsts.COST_HISTORY_SMOOTHING):
+        SizeCostModel.__init__(self, jobTime, byteTime)
+        self.smoothing = smoothing
+        self._profiles = {} # {profileKey: ProfileHistory}
+        self._global = ProfileHistory(smoothing)
+
+    def getHistory(self, profileKey):
+        return self._profiles.get(profileKey, None)
+
+    def estimate(self, profileKey, fileSize=None, duration=None):
+        history = self._profiles.get(profileKey, None)
+        for h in (history, self._global):
+            if h is None:
+                continue
+            estimation = h.estimate(fileSize, duration)
+            if estimation is not None:
+                return estimation
+        return SizeCostModel.estimate(self, profileKey, fileSize, duration)
+
+    def record(self, profileKey, realTime, fileSize=None, duration=None):
+        if realTime is None:
+            return
+        history = self._profiles.get(profileKey, None)
+        if history is None:
+            history = ProfileHistory(self.smoothing)
+            self._profiles[profileKey] = history
+        history.update(realTime, fileSize, duration)
+        self._global.update(realTime, fileSize, duration)
+
+
+_costModels = {adminconsts.COST_MODEL_SIZE: SizeCostModel,
+               adminconsts.COST_MODEL_HISTORY: HistoryCostModel}
+
+
+def registerCostModel(name, factory):
+    """
+    Registers a cost model factory, called without arguments,
+    that can then be selected in the scheduler configuration.
+    """
+    _costModels[name] = factory
+
+
+def createCostModel(name):
+    factory = _costModels.get(name, None)
+    if factory is None:
+        return None
+    return factory()
+
+
+def getReportSample(report):
+    """
+    Returns the (realTime, fileSize, duration) of a transcoding
+    from its report (flumotion.transcoder.transreport.TranscodingReport),
+    or None if the report does not tell how long the transcoding took.
+    """
+    # The total time, like the total_real_time of the database reports
+    # the cost model is initialized from, see Scheduler.recordHistory
+    usage = report.cpuUsageTotal
+    if not usage:
+        return None
+    realTime = usage[1]
+    fileSize = None
+    duration = None
+    source = report.source
+    if source:
+        fileSize = source.fileSize
+        analysis = source.analysis
+        if analysis:
+            durations = [d for d in (analysis.videoDuration,
+                                     analysis.audioDuration) if d]
+            if durations:
+                duration = max(durations)
+    return (realTime, fileSize, duration)
+
+
+def recordReport(model, profileKey, report):
+    """
+    Makes a cost model learn from a transcoding report.
+    """
+    sample = getReportSample(report)
+    if sample:
+        model.record(profileKey, *sample)
+
+
+def evaluate(model, samples):
+    """
+    Replays recorded transcodings against a cost model.
+    The samples are (profileKey, realTime, fileSize, duration)
+    in the order the transcodings were done; each transcoding is
+    estimated before the model learns from it.
+    Returns a dict with the number of samples, the mean absolute
+    error in second and the mean error relative to the real time.
+    """
+    count = 0
+    absolute = 0.0
+    relative = 0.0
+    for profileKey, realTime, fileSize, duration in samples:
+        estimation = model.estimate(profileKey, fileSize, duration)
+        error = abs(estimation - realTime)
+        count += 1
+        absolute += error
+        relative += error / max(realTime, 1.0)
+        model.record(profileKey, realTime, fileSize, duration)
+    if not count:
+        return {"count": 0, "absolute": None, "relative": None}
+    return {"count": count,
+            "absolute": absolute / count,
+            "relative": relative / count}
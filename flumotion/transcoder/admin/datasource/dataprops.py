@@ -139,9 +139,13 @@ class ProfileData(properties.PropertyBag):
     preprocesstimeout = properties.Integer('pre-process-timeout', None, False, True)
     postprocessTimeout = properties.Integer('post-process-timeout', None, False, True)
     transcodingTimeout = properties.Integer('transcoding-timeout', None, False, True)
+    turnaroundTime = properties.Integer('turnaround-time', None, False, True)
     monitoringPeriod = properties.Integer('monitoring-period', None, False, True)
     monitorType = properties.String('monitor-type', None)
     monitorPort = properties.Integer('monitor-port', 7680, False, True)
+    watcherBackend = properties.String('watcher-backend', None)
+    fingerprintMode = properties.String('fingerprint-mode', None)
+    growingInput = properties.Boolean('growing-input', None)
     notifyParams = properties.Dict(properties.String('notify', None))
     notifyDoneSQL = properties.List(properties.String('notify-done-sql', None))
     notifyFailedSQL = properties.List(properties.String('notify-failed-sql', None))
@@ -207,6 +211,15 @@ class CustomerData(properties.RootPropertyBag):
     # Customer's transcoding priority (different from transcoding-priority)
     #customer-priority = 100
 
+    # Customer's share of the transcoding slots
+    # with the fair scheduler policy
+    #customer-weight = 1
+
+    # Target time in seconds to transcode the customer's files
+    # from when they are queued; used to order the transcodings
+    # with the deadline scheduler policy and to report the misses
+    #turnaround-time =
+
     # Default Process Priority to use for this customer tasks with value
     # between 0 and 200 with 0 low priority, 100 normal and 200 very high
     # For priority > 100, root privileges may be needed
@@ -297,6 +310,7 @@ class CustomerData(properties.RootPropertyBag):
     #pre-process-timeout =
     #post-process-timeout =
     #transcoding-timeout =
+    #turnaround-time =
     #monitoring-period =
 
     # Target Properties
@@ -412,6 +426,7 @@ class CustomerData(properties.RootPropertyBag):
     enablePreprocessing = properties.Boolean('pre-processing-enabled', None)
     enableLinkFiles = properties.Boolean('link-files-enabled', None)
     customerPriority = properties.Integer('customer-priority', None, False, True)
+    customerWeight = properties.Integer('customer-weight', None, False, True)
     transcodingPriority = properties.Integer('transcoding-priority', None, False, True)
     processPriority = properties.Integer('process-priority', None, False, True)
     preprocessCommand = properties.String('pre-process-command', None)
@@ -419,10 +434,15 @@ class CustomerData(properties.RootPropertyBag):
     preprocesstimeout = properties.Integer('pre-process-timeout', None, False, True)
     postprocessTimeout = properties.Integer('post-process-timeout', None, False, True)
     transcodingTimeout = properties.Integer('transcoding-timeout', None, False, True)
+    turnaroundTime = properties.Integer('turnaround-time', None, False, True)
     monitoringPeriod = properties.Integer('monitoring-period', None, False, True)
     monitorType = properties.String('monitor-type', None)
     monitorPort = properties.Integer('monitor-port', 7680, False, True)
     setup_callback = properties.String("setup-callback", "")
+    watcherBackend = properties.String('watcher-backend', None)
+    fingerprintMode = properties.String('fingerprint-mode', None)
+    completionMethod = properties.String('completion-method', None)
+    monitorShards = properties.Integer('monitor-shards', None, False, True)
     accessForceGroup = properties.String('access-force-group', None)
     accessForceUser = properties.String('access-force-user', None)
     accessForceDirMode = properties.Octal('access-force-dir-mode', None)
@@ -470,9 +490,14 @@ class AdminData(properties.RootPropertyBag):
     # about the templates variables.notifyFailedRequests =
     #monitoring-period = 5
     #monitoring-type = http-monitor
+    #watcher-backend = polling
+    #fingerprint-mode = md5
+    #completion-method = none
+    #monitor-shards = 1
     #process-priority = 100
     #transcoding-priority = 100
     #transcoding-timeout = 60
+    #turnaround-time =
     #post-process-timeout = 60
     #pre-process-timeout = 60
     #mail-timeout = 30
@@ -500,8 +525,13 @@ class AdminData(properties.RootPropertyBag):
     monitoringPeriod = properties.Integer('monitoring-period', None, False, True)
     monitorType = properties.String('monitor-type', None)
     monitorPort = properties.Integer('monitor-port', 7680, False, True)
+    watcherBackend = properties.String('watcher-backend', None)
+    fingerprintMode = properties.String('fingerprint-mode', None)
+    completionMethod = properties.String('completion-method', None)
+    monitorShards = properties.Integer('monitor-shards', None, False, True)
     transcodingPriority = properties.Integer('transcoding-priority', None, False, True)
     transcodingTimeout = properties.Integer('transcoding-timeout', None, False, True)
+    turnaroundTime = properties.Integer('turnaround-time', None, False, True)
     postprocessTimeout = properties.Integer('post-process-timeout', None, False, True)
     preprocessTimeout = properties.Integer('pre-process-timeout', None, False, True)
     outputMediaTemplate = properties.String('output-media-template', None)
@@ -122,6 +122,14 @@ class IReportsSource(IDataSource):
         Createas a new transcoding report container object.
         """
 
+    def retrieveTranscodingHistory(self, limit):
+        """
+        Returns a deferred.
+        The result on success is a list of at most limit
+        (profileId, totalRealTime, fileSize) of the last
+        successful transcodings, the oldest first.
+        """
+
 
 class IInformationSource(IDataSource):
     """
@@ -160,6 +168,8 @@ class IInformationSource(IDataSource):
                 Gives the default scheduler priority of the transcoding jobs.
             transcodingTimeout (int) can be None:
                 Gives the default timeout of the transcoding jobs.
+            turnaroundTime (int) can be None:
+                Gives the default target turnaround time of the transcodings.
             postprocessTimeout (int) can be None:
                 Gives the default timeout of the post-processing.
             preprocessTimeout (int) can be None:
@@ -219,6 +229,7 @@ class IInformationSource(IDataSource):
             enablePreprocessing (bool) can be None
             enableLinkFiles (bool) can be None
             customerPriority (int) can be None
+            customerWeight (int) can be None
             transcodingPriority (int) can be None
             processPriority (int) can be None
             preprocessCommand (str) can be None
@@ -226,6 +237,7 @@ class IInformationSource(IDataSource):
             preprocesstimeout (int) can be None
             postprocessTimeout (int) can be None
             transcodingTimeout (int) can be None
+            turnaroundTime (int) can be None
             monitoringPeriod (int) can be None
             accessForceGroup (str) can be None
             accessForceUser (str) can be None
@@ -280,6 +292,7 @@ class IInformationSource(IDataSource):
             preprocesstimeout (int) can be None
             postprocessTimeout (int) can be None
             transcodingTimeout (int) can be None
+            turnaroundTime (int) can be None
             monitoringPeriod (int) can be None
         """
 
@@ -45,6 +45,8 @@ class TranscodeReport(object):
         self.queueingTime = None
         self.transcodingStartTime = None
         self.transcodingFinishTime = None
+        self.deadline = None
+        self.deadlineMissed = None
         self.totalCpuTime = None
         self.totalRealTime = None
         self.attemptCount = None
@@ -77,6 +79,8 @@ INSERT INTO transcoder_reports(
   queueing_time,
   transcoding_start_time,
   transcoding_finish_time,
+  deadline,
+  deadline_missed,
   total_cpu_time,
   total_real_time,
   attempt_count,
@@ -88,7 +92,15 @@ INSERT INTO transcoder_reports(
 )
 VALUES
   (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-   %s, %s, %s, %s, %s)
+   %s, %s, %s, %s, %s, %s, %s)
+  """
+
+    historyQueryTemplate = """
+SELECT profile_id, total_real_time, file_size
+FROM transcoder_reports
+WHERE successful AND total_real_time IS NOT NULL
+ORDER BY transcoding_finish_time DESC
+LIMIT %s
   """
 
     implements(datasource.IReportsSource)
@@ -128,6 +140,8 @@ VALUES
                       report.queueingTime,
                       report.transcodingStartTime,
                       report.transcodingFinishTime,
+                      report.deadline,
+                      report.deadlineMissed,
                       report.totalCpuTime,
                       report.totalRealTime,
                       report.attemptCount,
@@ -142,9 +156,23 @@ VALUES
             d = self._connection.query(self.queryTemplate, params)
             return d
 
+    def retrieveTranscodingHistory(self, limit):
+        self.debug("Running query %s with params %r",
+                   self.historyQueryTemplate, (limit,))
+        d = self._connection.query(self.historyQueryTemplate, (limit,))
+        d.addCallback(self.__cbGotHistory)
+        return d
+
     def reset(self, *data):
         raise NotImplementedError
 
     def delete(self, *data):
         raise NotImplementedError
 
+
+    ## Private Methods ##
+
+    def __cbGotHistory(self, rows):
+        history = [tuple(r) for r in rows]
+        history.reverse()
+        return history
@@ -37,6 +37,7 @@ class ICustomerStore(base.IBaseStore):
     failedRepDir         = Attribute("Reports failure directory")
     doneRepDir           = Attribute("Reports success directory")
     customerPriority     = Attribute("Customer transcoding priority")
+    customerWeight       = Attribute("Customer share of the transcoding slots")
     outputMediaTemplate  = Attribute("Output media file template")
     outputThumbTemplate  = Attribute("Output thumbnail file temaplte")
     linkFileTemplate     = Attribute("Link file template")
@@ -54,8 +55,13 @@ class ICustomerStore(base.IBaseStore):
     preprocessTimeout    = Attribute("Pre-processing timeout")
     postprocessTimeout   = Attribute("Post-processing timeout")
     transcodingTimeout   = Attribute("Transcoding timeout")
+    turnaroundTime       = Attribute("Target transcoding turnaround time")
     monitoringPeriod     = Attribute("Monitoring period")
     monitorType          = Attribute("Monitor type")
+    watcherBackend       = Attribute("Directory watcher backend")
+    fingerprintMode      = Attribute("Monitored files fingerprint mode")
+    completionMethod     = Attribute("Monitored files completion method")
+    monitorShards        = Attribute("Number of monitors sharing the incoming files")
     setup_callback       = Attribute("Where to notify the worker's hostname and port")
     accessForceUser      = Attribute("Force user of new files and directories")
     accessForceGroup     = Attribute("Force group of new files and directories")
@@ -91,6 +97,7 @@ class CustomerStore(base.NotifyStore):
     failedRepDir         = base.ReadOnlyProxy("failedRepDir")
     doneRepDir           = base.ReadOnlyProxy("doneRepDir")
     customerPriority     = base.ReadOnlyProxy("customerPriority")
+    customerWeight       = base.ReadOnlyProxy("customerWeight")
     outputMediaTemplate  = base.ReadOnlyProxy("outputMediaTemplate")
     outputThumbTemplate  = base.ReadOnlyProxy("outputThumbTemplate")
     linkFileTemplate     = base.ReadOnlyProxy("linkFileTemplate")
@@ -108,10 +115,15 @@ class CustomerStore(base.NotifyStore):
     preprocessTimeout    = base.ReadOnlyProxy("preprocessTimeout")
     postprocessTimeout   = base.ReadOnlyProxy("postprocessTimeout")
     transcodingTimeout   = base.ReadOnlyProxy("transcodingTimeout")
+    turnaroundTime       = base.ReadOnlyProxy("turnaroundTime")
     monitoringPeriod     = base.ReadOnlyProxy("monitoringPeriod")
     monitorType          = base.ReadOnlyProxy("monitorType")
     monitorPort          = base.ReadOnlyProxy("monitorPort")
     setup_callback       = base.ReadOnlyProxy("setup_callback")
+    watcherBackend       = base.ReadOnlyProxy("watcherBackend")
+    fingerprintMode      = base.ReadOnlyProxy("fingerprintMode")
+    completionMethod     = base.ReadOnlyProxy("completionMethod")
+    monitorShards        = base.ReadOnlyProxy("monitorShards")
     accessForceUser      = base.ReadOnlyProxy("accessForceUser")
     accessForceGroup     = base.ReadOnlyProxy("accessForceGroup")
     accessForceDirMode   = base.ReadOnlyProxy("accessForceDirMode")
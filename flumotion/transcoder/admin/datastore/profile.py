@@ -54,7 +54,11 @@ class IProfileStore(base.IBaseStore):
     preprocessTimeout    = Attribute("Pre-processing timeout")
     postprocessTimeout   = Attribute("Post-processing timeout")
     transcodingTimeout   = Attribute("Transcoding timeout")
+    turnaroundTime       = Attribute("Target transcoding turnaround time")
     monitoringPeriod     = Attribute("Monitoring period")
+    watcherBackend       = Attribute("Directory watcher backend")
+    fingerprintMode      = Attribute("Monitored files fingerprint mode")
+    growingInput         = Attribute("Transcode the files while written")
 
     def getCustomerStore(self):
         pass
@@ -105,7 +109,11 @@ class ProfileStore(base.NotifyStore):
     preprocessTimeout    = base.ReadOnlyProxy("preprocessTimeout")
     postprocessTimeout   = base.ReadOnlyProxy("postprocessTimeout")
     transcodingTimeout   = base.ReadOnlyProxy("transcodingTimeout")
+    turnaroundTime       = base.ReadOnlyProxy("turnaroundTime")
     monitoringPeriod     = base.ReadOnlyProxy("monitoringPeriod")
+    watcherBackend       = base.ReadOnlyProxy("watcherBackend")
+    fingerprintMode      = base.ReadOnlyProxy("fingerprintMode")
+    growingInput         = base.ReadOnlyProxy("growingInput")
 
 
     def __init__(self, logger, custStore, dataSource, profData):
@@ -48,6 +48,8 @@ class TranscodeReportStore(base.DataStore):
     queueingTime = activity.ReadWriteProxy("queueingTime")
     transcodingStartTime = activity.ReadWriteProxy("transcodingStartTime")
     transcodingFinishTime = activity.ReadWriteProxy("transcodingFinishTime")
+    deadline = activity.ReadWriteProxy("deadline")
+    deadlineMissed = activity.ReadWriteProxy("deadlineMissed")
     totalCpuTime = activity.ReadWriteProxy("totalCpuTime")
     totalRealTime = activity.ReadWriteProxy("totalRealTime")
     attemptCount = activity.ReadWriteProxy("attemptCount")
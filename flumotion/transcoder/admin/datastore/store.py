@@ -32,6 +32,10 @@ class IAdminStore(base.IBaseStore):
     reportFileTemplate    = Attribute("Report file template")
     linkTemplate          = Attribute("Link template")
     monitoringPeriod      = Attribute("Monitoring period")
+    watcherBackend        = Attribute("Directory watcher backend")
+    fingerprintMode       = Attribute("Monitored files fingerprint mode")
+    completionMethod      = Attribute("Monitored files completion method")
+    monitorShards         = Attribute("Number of monitors sharing the incoming files")
     accessForceUser       = Attribute("Force user of new files and directories")
     accessForceGroup      = Attribute("Force group of new files and directories")
     accessForceDirMode    = Attribute("Force rights of new directories")
@@ -39,6 +43,7 @@ class IAdminStore(base.IBaseStore):
     processPriority       = Attribute("Transcoding process priority")
     transcodingPriority   = Attribute("Transcoding priority")
     transcodingTimeout    = Attribute("Transcoding timeout")
+    turnaroundTime        = Attribute("Target transcoding turnaround time")
     postprocessTimeout    = Attribute("Post-processing timeout")
     preprocessTimeout     = Attribute("Pre-processing timeout")
     mailSubjectTemplate   = Attribute("Mail notifications subject template")
@@ -83,6 +88,10 @@ class AdminStore(base.NotifyStore):
     reportFileTemplate    = base.ReadOnlyProxy("reportFileTemplate")
     linkTemplate          = base.ReadOnlyProxy("linkTemplate")
     monitoringPeriod      = base.ReadOnlyProxy("monitoringPeriod")
+    watcherBackend        = base.ReadOnlyProxy("watcherBackend")
+    fingerprintMode       = base.ReadOnlyProxy("fingerprintMode")
+    completionMethod      = base.ReadOnlyProxy("completionMethod")
+    monitorShards         = base.ReadOnlyProxy("monitorShards")
     accessForceUser       = base.ReadOnlyProxy("accessForceUser")
     accessForceGroup      = base.ReadOnlyProxy("accessForceGroup")
     accessForceDirMode    = base.ReadOnlyProxy("accessForceDirMode")
@@ -90,6 +99,7 @@ class AdminStore(base.NotifyStore):
     processPriority       = base.ReadOnlyProxy("processPriority")
     transcodingPriority   = base.ReadOnlyProxy("transcodingPriority")
     transcodingTimeout    = base.ReadOnlyProxy("transcodingTimeout")
+    turnaroundTime        = base.ReadOnlyProxy("turnaroundTime")
     postprocessTimeout    = base.ReadOnlyProxy("postprocessTimeout")
     preprocessTimeout     = base.ReadOnlyProxy("preprocessTimeout")
     mailSubjectTemplate   = base.ReadOnlyProxy("mailSubjectTemplate")
@@ -24,6 +24,8 @@ from flumotion.transcoder.admin import admintask
 class MonitorBalancer(object):
     """
     Handle the distribution of monitoring tasks to a set of worker.
+    The shards of a customer are spread over different workers
+    when there is enough of them.
     """
 
     def __init__(self):
@@ -77,12 +79,9 @@ class MonitorBalancer(object):
                 tasks = self._workerTasks[workerPxy]
                 l = len(tasks)
                 if l > max:
-                    self._orphanes.extend(tasks[max:])
-                    del tasks[max:]
+                    self._orphanes.extend(self.__releaseTasks(tasks, l - max))
                 elif l < max:
-                    i = -(max - l)
-                    migrated = self._orphanes[i:]
-                    del self._orphanes[i:]
+                    migrated = self.__takeOrphanes(tasks, max - l)
                     tasks.extend(migrated)
                     for j in migrated:
                         j.suggestWorker(workerPxy)
@@ -91,3 +90,49 @@ class MonitorBalancer(object):
             for j in self._orphanes:
                 j.suggestWorker(None)
 
+
+    ## Private Methods ##
+
+    def __releaseTasks(self, tasks, count):
+        # Prefer the shards of customers the worker monitors many times
+        groups = set()
+        duplicates = []
+        for task in tasks:
+            group = task.getShardGroup()
+            if group is None:
+                continue
+            if group in groups:
+                duplicates.append(task)
+            groups.add(group)
+        released = duplicates[-count:]
+        for task in reversed(tasks):
+            if len(released) == count:
+                break
+            if task not in released:
+                released.append(task)
+        for task in released:
+            tasks.remove(task)
+        return released
+
+    def __takeOrphanes(self, tasks, count):
+        # Prefer the shards of customers the worker doesn't monitor yet
+        groups = set([t.getShardGroup() for t in tasks])
+        groups.discard(None)
+        taken = []
+        for task in reversed(self._orphanes):
+            if len(taken) == count:
+                break
+            group = task.getShardGroup()
+            if group in groups:
+                continue
+            if group is not None:
+                groups.add(group)
+            taken.append(task)
+        for task in reversed(self._orphanes):
+            if len(taken) == count:
+                break
+            if task not in taken:
+                taken.append(task)
+        for task in taken:
+            self._orphanes.remove(task)
+        return taken
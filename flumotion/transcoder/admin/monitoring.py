@@ -14,6 +14,8 @@
 #
 # Headers in this file shall remain intact.
 
+import zlib
+
 from zope.interface import Interface, implements
 from twisted.internet import reactor
 from twisted.python.failure import Failure
@@ -22,18 +24,29 @@ from flumotion.common.planet import moods
 
 from flumotion.inhouse import log, defer, utils, errors as iherrors
 
+from flumotion.ovp import hashlib
+
+from flumotion.transcoder.shards import getFileShard
 from flumotion.transcoder.admin import adminconsts, taskmanager, monbalancer
+from flumotion.transcoder.admin import montask
+from flumotion.transcoder.admin.property import filemon
 
 
 class Monitoring(taskmanager.TaskManager):
 
     logCategory = adminconsts.MONITORING_LOG_CATEGORY
 
-    def __init__(self, workerPxySet, monitorPxySet):
-        taskmanager.TaskManager.__init__(self)
+    def __init__(self, workerPxySet, monitorPxySet,
+                 packs=adminconsts.MONITOR_PACKS, admission=None):
+        taskmanager.TaskManager.__init__(self, admission)
         self._workerPxySet = workerPxySet
         self._monitorPxySet = monitorPxySet
         self._balancer = monbalancer.MonitorBalancer()
+        self._packs = packs
+        self._customerPacks = {} # {customer identifier: pack identifier}
+        self._packCustomers = {} # {pack identifier: {identifier: custCtx}}
+        self._packUpdates = {} # {pack identifier: IDelayedCall}
+        self._customerShards = {} # {customer identifier: shard count}
         # Registering Events
         self._register("task-added")
         self._register("task-removed")
@@ -55,6 +68,76 @@ class Monitoring(taskmanager.TaskManager):
         self._monitorPxySet.refreshListener(self)
         return taskmanager.TaskManager.initialize(self)
 
+    def addCustomer(self, custCtx):
+        """
+        Adds the monitoring task of a customer, the tasks of its shards,
+        or adds the customer to the monitoring task of its pack.
+        The changes of the customers of a pack are gathered for
+        MONITOR_PACK_UPDATE_DELAY seconds, then its task is replaced,
+        and its monitor restarted, if the monitor properties changed.
+        """
+        shards = self.__getShardCount(custCtx)
+        if shards > 1:
+            self.log("Customer '%s' monitored by %d shards",
+                     custCtx.label, shards)
+            self._customerShards[custCtx.identifier] = shards
+            for index in range(shards):
+                task = montask.MonitoringTask(self, custCtx, (index, shards))
+                self.addTask((custCtx.identifier, index), task)
+            return
+        packId = self.__getPackIdentifier(custCtx)
+        if packId is None:
+            task = montask.MonitoringTask(self, custCtx)
+            self.addTask(custCtx.identifier, task)
+            return
+        self.log("Customer '%s' packed in monitor pack %s",
+                 custCtx.label, packId)
+        self._customerPacks[custCtx.identifier] = packId
+        custCtxs = self._packCustomers.setdefault(packId, {})
+        custCtxs[custCtx.identifier] = custCtx
+        self.__schedulePackUpdate(packId)
+
+    def removeCustomer(self, custCtx):
+        shards = self._customerShards.pop(custCtx.identifier, None)
+        if shards:
+            for index in range(shards):
+                self.removeTask((custCtx.identifier, index))
+            return
+        packId = self._customerPacks.pop(custCtx.identifier, None)
+        if packId is None:
+            self.removeTask(custCtx.identifier)
+            return
+        custCtxs = self._packCustomers[packId]
+        del custCtxs[custCtx.identifier]
+        if not custCtxs:
+            del self._packCustomers[packId]
+        self.__schedulePackUpdate(packId)
+
+    def updateCustomer(self, custCtx):
+        """
+        Takes into account a change of the monitoring settings
+        or of the profiles of a packed customer. When the update
+        of its pack is applied, the customer is moved to another
+        pack if its pack key changed.
+        """
+        packId = self._customerPacks.get(custCtx.identifier)
+        if packId is None:
+            return
+        self._packCustomers[packId][custCtx.identifier] = custCtx
+        self.__schedulePackUpdate(packId)
+
+    def getProfileTask(self, profCtx, default=None):
+        """
+        Returns the task monitoring the incoming file of a profile.
+        """
+        identifier = profCtx.getCustomerContext().identifier
+        shards = self._customerShards.get(identifier)
+        if shards:
+            index = getFileShard(profCtx.name, profCtx.inputRelPath, shards)
+            return self.getTask((identifier, index), default)
+        identifier = self._customerPacks.get(identifier, identifier)
+        return self.getTask(identifier, default)
+
 
     ## Overrided Virtual Methods ##
 
@@ -77,6 +160,9 @@ class Monitoring(taskmanager.TaskManager):
 
     def _doAbort(self):
         self.log("Aborting monitoring")
+        for delayed in self._packUpdates.values():
+            delayed.cancel()
+        self._packUpdates.clear()
         self._balancer.clearTasks()
 
     def _onTaskAdded(self, task):
@@ -127,6 +213,80 @@ class Monitoring(taskmanager.TaskManager):
 
     ## Private Methods ##
 
+    def __isFileMonitored(self, custCtx):
+        try:
+            monitorType = custCtx.monitorType
+        except:
+            monitorType = None
+        # The HTTP monitors serve each customer on its own port,
+        # they cannot be packed nor sharded
+        return monitorType == adminconsts.FILE_MONITOR
+
+    def __getShardCount(self, custCtx):
+        if not self.__isFileMonitored(custCtx):
+            return 1
+        return custCtx.monitorShards or 1
+
+    def __getPackIdentifier(self, custCtx):
+        if (self._packs <= 0) or not self.__isFileMonitored(custCtx):
+            return None
+        # Stable between admin restarts, so the running
+        # monitors are found back with the same properties
+        key = filemon.MonitorProperties.getPackKey(custCtx)
+        group = hashlib.md5(repr(key)).hexdigest()[:8]
+        index = (zlib.crc32(custCtx.name) & 0xffffffff) % self._packs
+        return group, index
+
+    def __schedulePackUpdate(self, packId):
+        if packId in self._packUpdates:
+            # Will be taken into account by the pending update
+            return
+        delayed = reactor.callLater(adminconsts.MONITOR_PACK_UPDATE_DELAY,
+                                    self.__updatePack, packId)
+        self._packUpdates[packId] = delayed
+
+    def __updatePack(self, packId):
+        del self._packUpdates[packId]
+        # The settings may have changed since the customers were added
+        moved = [c for c in self._packCustomers.get(packId, {}).values()
+                 if self.__getPackIdentifier(c) != packId]
+        for custCtx in moved:
+            self.log("Customer '%s' monitor settings changed, "
+                     "moving it out of monitor pack %s",
+                     custCtx.label, packId)
+            del self._customerPacks[custCtx.identifier]
+            del self._packCustomers[packId][custCtx.identifier]
+        self.__replacePackTask(packId)
+        for custCtx in moved:
+            self.addCustomer(custCtx)
+
+    def __replacePackTask(self, packId):
+        custCtxs = self._packCustomers.get(packId)
+        if not custCtxs:
+            self._packCustomers.pop(packId, None)
+            self.removeTask(packId)
+            return
+        group, index = packId
+        label = adminconsts.MONITOR_PACK_LABEL_TEMPLATE % {"packGroup": group,
+                                                            "packIndex": index}
+        # Sorted so the properties only depend on the customers
+        custCtxs = custCtxs.values()
+        custCtxs.sort(key=lambda c: c.name)
+        task = self.getTask(packId)
+        if task is not None:
+            props = filemon.MonitorProperties.createFromPackContexts(label,
+                                                                     custCtxs)
+            if props.getDigest() == task.getProperties().getDigest():
+                # Nothing the monitor knows about changed, keep it running
+                self.log("Monitor pack %s customers updated", packId)
+                task.updateCustomerContexts(custCtxs)
+                return
+            self.log("Monitor pack %s changed, restarting its monitor",
+                     packId)
+            self.removeTask(packId)
+        task = montask.PackedMonitoringTask(self, label, custCtxs)
+        self.addTask(packId, task)
+
     def __cbStartResumeMonitoring(self, result):
         if (isinstance(result, Failure)
             and not result.check(iherrors.TimeoutError)):
@@ -22,21 +22,21 @@ from flumotion.common.planet import moods
 from flumotion.inhouse import log
 
 from flumotion.transcoder.enums import MonitorFileStateEnum
+from flumotion.transcoder.pendingfiles import makeProfileKey, splitProfileKey
 from flumotion.transcoder.admin import adminconsts, admintask
 from flumotion.transcoder.admin.property import filemon
 from flumotion.transcoder.admin.proxy import monitor
 
-#TODO: Schedule the component startup to prevent starting
-#      lots of component at the same time.
-#      Because when starting lots of components, the monitors
-#      happy timeout may be triggered. For now, just using a large timeout.
-
 
 class MonitoringTask(admintask.AdminTask):
 
     MAX_RETRIES = adminconsts.MONITOR_MAX_RETRIES
 
-    def __init__(self, logger, custCtx):
+    def __init__(self, logger, custCtx, shard=None):
+        """
+        shard : (index, count) for the tasks of the file monitors
+                sharing the incoming files of a customer
+        """
         try:
             monitor_type = custCtx.monitorType
         except:
@@ -45,10 +45,20 @@ class MonitoringTask(admintask.AdminTask):
         if monitor_type == adminconsts.HTTP_MONITOR:
             props = filemon.HttpMonitorProperties.createFromContext(custCtx)
         else:
-            props = filemon.MonitorProperties.createFromContext(custCtx)
-
-        admintask.AdminTask.__init__(self, logger, custCtx.monitorLabel, props)
+            props = filemon.MonitorProperties.createFromContext(custCtx, shard)
+
+        label = custCtx.monitorLabel
+        if shard:
+            label = adminconsts.MONITOR_SHARD_LABEL_TEMPLATE % {
+                "monitorLabel": label,
+                "shardIndex": shard[0] + 1,
+                "shardCount": shard[1]}
+        self._initTask(logger, label, props)
         self._custCtx = custCtx
+        self._shard = shard
+
+    def _initTask(self, logger, label, props):
+        admintask.AdminTask.__init__(self, logger, label, props)
         self._pendingMoves = [] # [VirtualPath, VirutalPath, [str]]
         self._movingFiles = False
         # Registering Events
@@ -61,7 +71,21 @@ class MonitoringTask(admintask.AdminTask):
 
     ## Public Methods ##
 
-    def setFileState(self, virtBase, relPath, state, profile_name):
+    def iterCustomerContexts(self):
+        yield self._custCtx
+
+    def getShardGroup(self):
+        """
+        Returns an identifier shared by the tasks of the shards
+        of the same customer, or None if the task is not a shard.
+        """
+        if self._shard:
+            return self._custCtx.identifier
+        return None
+
+    def setFileState(self, profCtx, state):
+        virtBase = profCtx.inputBase
+        relPath = profCtx.inputRelPath
         monPxy = self.getActiveComponent()
         if not monPxy:
             self.warning("Monitoring task '%s' file '%s' state changed to %s "
@@ -70,7 +94,8 @@ class MonitoringTask(admintask.AdminTask):
             return
         self.log("Monitoring task '%s' file '%s' state changed to %s",
                  self.label, virtBase.append(relPath), state.name)
-        monPxy.setFileStateBuffered(virtBase, relPath, state, profile_name)
+        monPxy.setFileStateBuffered(virtBase, relPath, state,
+                                    self._getProfileKey(profCtx))
 
     def moveFiles(self, virtSrcBase, virtDestBase, relFiles):
         args = virtSrcBase, virtDestBase, relFiles
@@ -119,22 +144,22 @@ class MonitoringTask(admintask.AdminTask):
     def __on_monitor_file_removed(self, monPxy, profile_name, file, state):
         if not self._isElectedComponent(monPxy): return
         if (state == MonitorFileStateEnum.downloading): return
-        profile_context = self.__file_to_profile_context(profile_name, file)
+        profile_context = self._getProfileContext(profile_name, file)
         if not profile_context:
             self.warning("File '%s' removed but no corresponding profile "
-                         "found for customer '%s'", profile_name + file,
-                         self._custCtx.name)
+                         "found for monitoring task '%s'", profile_name + file,
+                         self.label)
             return
         self.emit("file-removed", profile_context, state)
 
     def __on_monitor_file_added(self, monPxy, profile_name, file, state, fileinfo,
                              detection_time, mime_type, checksum, params=None):
         if not self._isElectedComponent(monPxy): return
-        profile_context = self.__file_to_profile_context(profile_name, file)
+        profile_context = self._getProfileContext(profile_name, file)
         if not profile_context:
             self.warning("File '%s' added but no corresponding profile "
-                         "%s found for customer '%s'", file, profile_name,
-                         self._custCtx.name)
+                         "%s found for monitoring task '%s'", file,
+                         profile_name, self.label)
             return
         self.emit("file-added", profile_context, state, fileinfo, detection_time,
                   mime_type, checksum, params)
@@ -142,11 +167,11 @@ class MonitoringTask(admintask.AdminTask):
     def __on_monitor_file_changed(self, monPxy, profile_name, file, state, fileinfo,
                                mime_type, checksum, params=None):
         if not self._isElectedComponent(monPxy): return
-        profile_context = self.__file_to_profile_context(profile_name, file)
+        profile_context = self._getProfileContext(profile_name, file)
         if not profile_context:
             self.warning("File '%s' state changed but no corresponding "
-                         "profile %s found for customer '%s'", file, profile_name,
-                         self._custCtx.name)
+                         "profile %s found for monitoring task '%s'", file,
+                         profile_name, self.label)
             return
         self.emit("file-state-changed", profile_context, state, fileinfo,
                   mime_type, checksum, params)
@@ -212,29 +237,49 @@ class MonitoringTask(admintask.AdminTask):
     def _doLoadComponent(self, worker_proxy, component_name, component_label,
                          component_properties, load_timeout):
         # decide, in function of the type of monitor, what type of monitor should be loaded.
-        try:
-            monitor_type = self._custCtx.monitorType
-        except:
-            monitor_type = adminconsts.HTTP_MONITOR
-
+        monitor_type = self._getMonitorType()
         monitor_proxy_class = MONITOR_TYPES.get(monitor_type, MONITOR_TYPES.get(adminconsts.HTTP_MONITOR))
         return monitor_proxy_class.loadTo(worker_proxy, component_name,
             component_label, component_properties, load_timeout)
 
 
-    ## Private Methods ##
+    ## Protected Methods ##
+
+    def _getMonitorType(self):
+        try:
+            return self._custCtx.monitorType
+        except:
+            return adminconsts.HTTP_MONITOR
 
-    def __file_to_profile_context(self, profile_name, file):
-        for profile_context in self._custCtx.iterProfileContexts(file):
+    def _getProfileKey(self, profCtx):
+        return profCtx.name
+
+    def _getProfileContext(self, profile_key, file):
+        return self._findProfileContext(self._custCtx, profile_key, file)
+
+    def _findProfileContext(self, custCtx, profile_name, file):
+        for profile_context in custCtx.iterProfileContexts(file):
             if profile_name == profile_context.name:
                 return profile_context
         return None
 
+
+    ## Private Methods ##
+
     def __async_move_pending_files(self):
         if not self._pendingMoves:
             self._movingFiles = False
             return
         virtSrcBase, virtDestBase, relFiles = self._pendingMoves.pop()
+        # Move all the pending files with the same destination together
+        relFiles = list(relFiles)
+        remaining = []
+        for args in self._pendingMoves:
+            if (args[0] == virtSrcBase) and (args[1] == virtDestBase):
+                relFiles.extend([f for f in args[2] if f not in relFiles])
+            else:
+                remaining.append(args)
+        self._pendingMoves[:] = remaining
         monPxy = self.getActiveComponent()
         if not monPxy:
             self.warning("No monitor found to move files '%s' to '%s'",
@@ -242,8 +287,9 @@ class MonitoringTask(admintask.AdminTask):
             # Stop moving files
             self._movingFiles = False
             return
-        self.debug("Ask monitor '%s' to move files form '%s' to '%s'",
-                   monPxy.getName(), virtSrcBase, virtDestBase)
+        self.debug("Ask monitor '%s' to move %d files form '%s' to '%s'",
+                   monPxy.getName(), len(relFiles), virtSrcBase, virtDestBase)
+        self._movingFiles = True
         d = monPxy.moveFiles(virtSrcBase, virtDestBase, relFiles)
         args = (monPxy, virtSrcBase, virtDestBase, relFiles)
         d.addCallbacks(
@@ -254,10 +300,19 @@ class MonitoringTask(admintask.AdminTask):
         )
 
     def __file_moved(self, result, monPxy, virtSrcBase, virtDestBase, relFiles):
+        # The result is a dict {relFile: error message or None}
+        errors = result or {}
         for relFile in relFiles:
-            self.log("File '%s' moved to '%s'",
-                      virtSrcBase.append(relFile),
-                      virtDestBase.append(relFile))
+            error = errors.get(relFile)
+            if error:
+                self.warning("Monitoring task '%s' monitor '%s' fail to "
+                             "move file '%s' to '%s': %s", self.label,
+                             monPxy.getName(), virtSrcBase.append(relFile),
+                             virtDestBase.append(relFile), error)
+            else:
+                self.log("File '%s' moved to '%s'",
+                          virtSrcBase.append(relFile),
+                          virtDestBase.append(relFile))
         # Continue moving files
         self.__async_move_pending_files()
 
@@ -275,6 +330,54 @@ class MonitoringTask(admintask.AdminTask):
         self.__async_move_pending_files()
 
 
+class PackedMonitoringTask(MonitoringTask):
+    """
+    Monitoring task of a file monitor watching the profiles
+    of many customers, see MonitorProperties.createFromPackContexts.
+    The monitor identifies the profiles by their name qualified
+    with the customer name.
+    """
+
+    def __init__(self, logger, label, custCtxs):
+        props = filemon.MonitorProperties.createFromPackContexts(label,
+                                                                 custCtxs)
+        self._initTask(logger, label, props)
+        self._custCtxs = dict([(c.name, c) for c in custCtxs])
+
+
+    ## Public Methods ##
+
+    def iterCustomerContexts(self):
+        return self._custCtxs.itervalues()
+
+    def updateCustomerContexts(self, custCtxs):
+        """
+        Replaces the customer contexts; the monitor
+        properties they give must not have changed.
+        """
+        self._custCtxs = dict([(c.name, c) for c in custCtxs])
+
+    def getShardGroup(self):
+        return None
+
+
+    ## Overriden Protected Methods ##
+
+    def _getMonitorType(self):
+        return adminconsts.FILE_MONITOR
+
+    def _getProfileKey(self, profCtx):
+        custCtx = profCtx.getCustomerContext()
+        return makeProfileKey(profCtx.name, custCtx.name)
+
+    def _getProfileContext(self, profile_key, file):
+        custName, profName = splitProfileKey(profile_key)
+        custCtx = self._custCtxs.get(custName)
+        if custCtx is None:
+            return None
+        return self._findProfileContext(custCtx, profName, file)
+
+
 MONITOR_TYPES = {
         adminconsts.HTTP_MONITOR: monitor.HttpMonitorProxy,
         adminconsts.FILE_MONITOR: monitor.MonitorProxy,
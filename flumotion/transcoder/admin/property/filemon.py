@@ -35,27 +35,131 @@ class BaseMonitorProperties(base.ComponentPropertiesMixin):
         named_profiles = map(lambda s: s.split('!'), named_profiles)
         profiles = props.get("profile", list())
         name = props.get("admin-id", "")
-        return cls(name, profiles=profiles, named_profiles=named_profiles, **kwargs)
+        watcher_backend = props.get("watcher-backend", None)
+        profile_watchers = props.get("profile-watcher", list())
+        profile_watchers = map(lambda s: tuple(s.split('!')), profile_watchers)
+        fingerprint_mode = props.get("fingerprint-mode", None)
+        profile_fingerprints = props.get("profile-fingerprint", list())
+        profile_fingerprints = map(lambda s: tuple(s.split('!')),
+                                   profile_fingerprints)
+        profile_growing = props.get("profile-growing", list())
+        profile_growing = map(lambda s: tuple(s.split('!')), profile_growing)
+        completion_method = props.get("completion-method", None)
+        shard = None
+        if "shard-count" in props:
+            shard = (props.get("shard-index", 0), props["shard-count"])
+        return cls(name, profiles=profiles, named_profiles=named_profiles,
+                   watcher_backend=watcher_backend,
+                   profile_watchers=profile_watchers,
+                   fingerprint_mode=fingerprint_mode,
+                   profile_fingerprints=profile_fingerprints,
+                   profile_growing=profile_growing,
+                   completion_method=completion_method, shard=shard,
+                   **kwargs)
 
     @classmethod
     def createFromContext(cls, custCtx, **kwargs):
         profiles = []
         named_profiles = []
+        profile_watchers = []
+        watcher_backend = custCtx.watcherBackend
+        profile_fingerprints = []
+        fingerprint_mode = custCtx.fingerprintMode
+        profile_growing = []
         for profCtx in custCtx.iterUnboundProfileContexts():
             profiles.append(profCtx.inputBase)
             if int(profCtx.active):
                 named_profiles.append((profCtx.name, profCtx.inputBase, 1))
             else:            
                 named_profiles.append((profCtx.name, profCtx.inputBase, 0))
-        return cls(custCtx.name, profiles=profiles, named_profiles=named_profiles, **kwargs)
+            if profCtx.watcherBackend != watcher_backend:
+                profile_watchers.append((profCtx.name, profCtx.watcherBackend))
+            if profCtx.fingerprintMode != fingerprint_mode:
+                profile_fingerprints.append((profCtx.name,
+                                             profCtx.fingerprintMode))
+            if profCtx.growingInput:
+                profile_growing.append((profCtx.name,))
+        return cls(custCtx.name, profiles=profiles, named_profiles=named_profiles,
+                   watcher_backend=watcher_backend,
+                   profile_watchers=profile_watchers,
+                   fingerprint_mode=fingerprint_mode,
+                   profile_fingerprints=profile_fingerprints,
+                   profile_growing=profile_growing,
+                   completion_method=custCtx.completionMethod, **kwargs)
 
+    @classmethod
+    def createFromPackContexts(cls, name, custCtxs, **kwargs):
+        """
+        Creates the properties of a monitor watching the profiles
+        of many customers. The profiles are qualified with the customer
+        name, and all their watcher and fingerprint modes are given
+        explicitly. The customers must have the same pack key.
+        """
+        profiles = []
+        named_profiles = []
+        profile_watchers = []
+        profile_fingerprints = []
+        profile_growing = []
+        for custCtx in custCtxs:
+            custName = custCtx.name
+            for profCtx in custCtx.iterUnboundProfileContexts():
+                profiles.append(profCtx.inputBase)
+                if int(profCtx.active):
+                    active = 1
+                else:
+                    active = 0
+                named_profiles.append((profCtx.name, profCtx.inputBase,
+                                       active, custName))
+                if profCtx.watcherBackend:
+                    profile_watchers.append((profCtx.name,
+                                             profCtx.watcherBackend,
+                                             custName))
+                if profCtx.fingerprintMode:
+                    profile_fingerprints.append((profCtx.name,
+                                                 profCtx.fingerprintMode,
+                                                 custName))
+                if profCtx.growingInput:
+                    profile_growing.append((profCtx.name, custName))
+        return cls(name, profiles=profiles, named_profiles=named_profiles,
+                   profile_watchers=profile_watchers,
+                   profile_fingerprints=profile_fingerprints,
+                   profile_growing=profile_growing,
+                   completion_method=custCtxs[0].completionMethod, **kwargs)
 
-    def __init__(self, name, profiles, named_profiles=None, **kwargs):
+    @classmethod
+    def getPackKey(cls, custCtx):
+        """
+        Returns the monitor wide settings of a customer;
+        only the customers with the same key can share a monitor.
+        """
+        return (custCtx.completionMethod,)
+
+
+    def __init__(self, name, profiles, named_profiles=None,
+                 watcher_backend=None, profile_watchers=None,
+                 fingerprint_mode=None, profile_fingerprints=None,
+                 profile_growing=None, completion_method=None, shard=None,
+                 **kwargs):
+        """
+        shard : (index, count) if the monitor only watches a shard
+                of the incoming files, see flumotion.transcoder.shards
+        """
         assert isinstance(profiles, (list, tuple))
         self._name = name
         self._profiles = tuple(profiles)
-        self._digest = a_better_digest((name, profiles, named_profiles, kwargs))
+        self._digest = a_better_digest((name, profiles, named_profiles,
+                                        watcher_backend, profile_watchers,
+                                        fingerprint_mode, profile_fingerprints,
+                                        profile_growing, completion_method,
+                                        shard, kwargs))
         self._named_profiles = named_profiles
+        self._watcher_backend = watcher_backend
+        self._profile_watchers = profile_watchers or []
+        self._fingerprint_mode = fingerprint_mode
+        self._profile_fingerprints = profile_fingerprints or []
+        self._profile_growing = profile_growing or []
+        self._completion_method = completion_method
+        self._shard = shard
         
 
     def asComponentProperties(self, workerCtx):
@@ -65,6 +169,21 @@ class BaseMonitorProperties(base.ComponentPropertiesMixin):
             props.append(("profile", str(p)))
         for np in self._named_profiles:
             props.append(("named-profile", '!'.join(map(str, np))))
+        if self._watcher_backend:
+            props.append(("watcher-backend", self._watcher_backend))
+        for pw in self._profile_watchers:
+            props.append(("profile-watcher", '!'.join(map(str, pw))))
+        if self._fingerprint_mode:
+            props.append(("fingerprint-mode", self._fingerprint_mode))
+        for pf in self._profile_fingerprints:
+            props.append(("profile-fingerprint", '!'.join(map(str, pf))))
+        for pg in self._profile_growing:
+            props.append(("profile-growing", '!'.join(map(str, pg))))
+        if self._completion_method:
+            props.append(("completion-method", self._completion_method))
+        if self._shard:
+            props.append(("shard-index", self._shard[0]))
+            props.append(("shard-count", self._shard[1]))
         props.append(("admin-id", self._name))
         props.extend(local.asComponentProperties())
         return props
@@ -94,14 +213,33 @@ class MonitorProperties(BaseMonitorProperties):
         )
 
     @classmethod
-    def createFromContext(cls, custCtx):
+    def createFromContext(cls, custCtx, shard=None):
         return super(MonitorProperties, cls).createFromContext(
             custCtx,
             scanPeriod=custCtx.monitoringPeriod,
             setup_callback=custCtx.setup_callback,
+            pathAttr=custCtx.pathAttributes,
+            shard=shard
+        )
+
+    @classmethod
+    def createFromPackContexts(cls, name, custCtxs):
+        custCtx = custCtxs[0]
+        return super(MonitorProperties, cls).createFromPackContexts(
+            name, custCtxs,
+            scanPeriod=custCtx.monitoringPeriod,
+            setup_callback=custCtx.setup_callback,
             pathAttr=custCtx.pathAttributes
         )
 
+    @classmethod
+    def getPackKey(cls, custCtx):
+        pathAttr = custCtx.pathAttributes
+        if pathAttr:
+            pathAttr = tuple(pathAttr.asComponentProperties())
+        return (super(MonitorProperties, cls).getPackKey(custCtx)
+                + (custCtx.monitoringPeriod, custCtx.setup_callback, pathAttr))
+
     def __init__(self, name, scanPeriod=None, setup_callback=None, pathAttr=None, **kwargs):
         super(MonitorProperties, self).__init__(name, **kwargs)
         self._directories = self._profiles # old name
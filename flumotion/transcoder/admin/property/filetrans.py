@@ -108,6 +108,8 @@ def createTranscodingConfigFromContext(profCtx):
 def update_config(config, params):
     if params.has_key("cue-points"):
         config.source.cuePoints = params["cue-points"]
+    if params.get("growing-completion"):
+        config.source.growingCompletion = params["growing-completion"]
 
 
 class TranscoderProperties(base.ComponentPropertiesMixin):
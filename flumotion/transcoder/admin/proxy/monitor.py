@@ -19,7 +19,8 @@ from zope.interface import implements
 from flumotion.inhouse import utils, defer, log
 
 from flumotion.transcoder import virtualpath
-from flumotion.transcoder.enums import MonitorFileStateEnum
+from flumotion.transcoder.errors import TranscoderError
+from flumotion.transcoder.pendingfiles import PendingFilesMirror, parseRecord
 from flumotion.transcoder.admin import adminconsts
 from flumotion.transcoder.admin.proxy import base, component
 from flumotion.transcoder.admin.property import filemon
@@ -47,7 +48,9 @@ class MonitorProxy(component.ComponentProxy):
         component.ComponentProxy.__init__(self, logger, parentPxy,
                                           identifier, managerPxy,
                                           compCtx, compState, domain)
-        self._alreadyAdded = {} # {file: None}
+        self._pendingFiles = PendingFilesMirror()
+        # Batches received while resynchronizing, None otherwise
+        self._pendingBatches = None
         self._stateUpdateDelta = {}
         self._stateUpdateDelay = None
         self._stateUpdateResult = None
@@ -61,7 +64,7 @@ class MonitorProxy(component.ComponentProxy):
 
     def waitFiles(self, timeout=None):
         d = self._waitUIState(timeout)
-        d.addCallback(self.__cbRetrieveFiles)
+        d.addCallback(self.__cbRetrieveFiles, timeout)
         return d
 
     def setFileStateBuffered(self, virtBase, relFile, state, profile_name):
@@ -85,15 +88,18 @@ class MonitorProxy(component.ComponentProxy):
     ## Overriden Methods ##
 
     def _doBroadcastUIState(self, uiState):
-        pending = uiState.get("pending-files", None)
-        if pending:
-            for file, value in pending.iteritems():
-                profile_name, relFile = file
-                state, fileinfo, detection_time, mime_type, checksum, params = value
-                self.emit("file-added", profile_name, relFile, state, fileinfo,
-                          detection_time, mime_type, checksum, params)
+        if self._pendingFiles.getSequence() is None:
+            # The files will be added when retrieved
+            self.__resyncPendingFiles()
+            return
+        self.__emitPendingChanges([(key, None, record) for key, record
+                                   in self._pendingFiles.iterRecords()])
 
     def _onUIStateSet(self, uiState, key, value):
+        if key == "pending-changes":
+            if value:
+                self._onMonitorPendingChanges(*value)
+            return
         self.log("Monitor UI State '%s' set to '%s'", key, value)
 
     def _onUIStateAppend(self, uiState, key, value):
@@ -105,42 +111,36 @@ class MonitorProxy(component.ComponentProxy):
     def _onUIStateSetitem(self, uiState, key, subkey, value):
         self.log("Monitor UI State '%s' item '%s' set to '%s'",
                  key, subkey, value)
-        if key == "pending-files":
-            virtBase, relFile = subkey
-            self._onMonitorSetFile(virtBase, relFile, value)
 
     def _onUIStateDelitem(self, uiState, key, subkey, value):
         self.log("Monitor UI State '%s' item '%s' deleted",
                  key, subkey)
-        if key == "pending-files":
-            virtBase, relFile = subkey
-            self._onMonitorDelFile(virtBase, relFile, value)
 
     def _onUnsetUIState(self, uiState):
         component.ComponentProxy._onUnsetUIState(self, uiState)
-        self._alreadyAdded.clear()
+        self._pendingFiles.clear()
+        self._pendingBatches = None
 
 
     ## UI State Handlers Methods ##
 
-    def _onMonitorSetFile(self, profile_name, relFile, filedata):
-        state, fileinfo, detection_time, mime_type, checksum, params = filedata
-        ident = (profile_name, relFile)
-
-        if ident in self._alreadyAdded:
-            self.emit("file-changed", profile_name, relFile, state, fileinfo,
-                      mime_type, checksum, params)
-        else:
-            self._alreadyAdded[ident] = None
-            self.emit("file-added", profile_name, relFile, state, fileinfo,
-                      detection_time, mime_type, checksum, params)
-
-    def _onMonitorDelFile(self, virtBase, relFile, filedata):
-        state, _fileinfo, _detection_time, _mime_type, _checksum, _params = filedata
-        ident = (virtBase, relFile)
-        if ident in self._alreadyAdded:
-            del self._alreadyAdded[ident]
-            self.emit("file-removed", virtBase, relFile, state)
+    def _onMonitorPendingChanges(self, sequence, changes):
+        if self._pendingBatches is not None:
+            # Applied when the resynchronization is done
+            self._pendingBatches.append((sequence, changes))
+            return
+        if not self._pendingFiles.accept(sequence):
+            last = self._pendingFiles.getSequence()
+            if (last is not None) and (sequence <= last):
+                # Already included in the last resynchronization
+                return
+            self.debug("Missed pending files changes between %s and %s, "
+                       "resynchronizing", last, sequence)
+            self.__resyncPendingFiles()
+            return
+        self.log("Applying %d pending files changes with sequence %d",
+                 len(changes), sequence)
+        self.__emitPendingChanges(self._pendingFiles.apply(sequence, changes))
 
 
     ## Overriden Methods ##
@@ -181,15 +181,74 @@ class MonitorProxy(component.ComponentProxy):
                           "Failed to update file states")
         self.__updateFilesState()
 
-    def __cbRetrieveFiles(self, ui):
+    def __resyncPendingFiles(self):
+        if self._pendingBatches is not None:
+            return
+        batches = self._pendingBatches = []
+        d = utils.callWithTimeout(adminconsts.REMOTE_CALL_TIMEOUT,
+                                  self._callRemote, "getPendingFiles",
+                                  self._pendingFiles.getSequence())
+        d.addCallbacks(self.__cbPendingFilesResync,
+                       self.__ebPendingFilesResync,
+                       callbackArgs=(batches,), errbackArgs=(batches,))
+
+    def __cbPendingFilesResync(self, result, batches):
+        if batches is not self._pendingBatches:
+            # The UI state has been unset in between
+            return
+        self._pendingBatches = None
+        sequence, full, changes = result
+        self.debug("Resynchronized %s pending files changes with "
+                   "sequence %d", full and "all" or "the", sequence)
+        updated = self._pendingFiles.reset(sequence, full, changes)
+        self.__emitPendingChanges(updated)
+        for sequence, changes in batches:
+            self._onMonitorPendingChanges(sequence, changes)
+
+    def __ebPendingFilesResync(self, failure, batches):
+        if batches is not self._pendingBatches:
+            return
+        # The next batch received will retry
+        self._pendingBatches = None
+        log.notifyFailure(self, failure,
+                          "Failed to resynchronize pending files")
+
+    def __emitPendingChanges(self, updated):
+        for (profile_name, relFile), old, new in updated:
+            try:
+                if new is None:
+                    state = parseRecord(old)[0]
+                    self.emit("file-removed", profile_name, relFile, state)
+                    continue
+                state, fileinfo, detection_time, mime_type, checksum, params \
+                    = parseRecord(new)
+            except TranscoderError, e:
+                self.warning("Pending file %s%s: %s", profile_name, relFile,
+                             log.getExceptionMessage(e))
+                continue
+            if old is None:
+                self.emit("file-added", profile_name, relFile, state, fileinfo,
+                          detection_time, mime_type, checksum, params)
+            else:
+                self.emit("file-changed", profile_name, relFile, state,
+                          fileinfo, mime_type, checksum, params)
+
+    def __cbRetrieveFiles(self, ui, timeout):
+        assert ui != None
+        d = utils.callWithTimeout(timeout or adminconsts.REMOTE_CALL_TIMEOUT,
+                                  self._callRemote, "getPendingFiles", None)
+        d.addCallback(self.__cbGotPendingFiles)
+        return d
+
+    def __cbGotPendingFiles(self, result):
         files = []
         workerPxy = self.getWorkerProxy()
-        assert ui != None
         assert workerPxy != None
         workerCtx = workerPxy.getWorkerContext()
         local = workerCtx.getLocal()
-        for (p, f), s in ui.get("pending-files", {}).iteritems():
-            files.append((virtualpath.VirtualPath.virtualize(p, local), f, s))
+        for (p, f), record in result[2]:
+            files.append((virtualpath.VirtualPath.virtualize(p, local), f,
+                          parseRecord(record)))
         return files
 
 class HttpMonitorProxy(MonitorProxy):
@@ -0,0 +1,698 @@
+# vi:si:et:sw=4:sts=4:ts=4
+
+# Flumotion - a streaming media server
+# Copyright (C) 2004,2005,2006,2007,2008,2009 Fluendo, S.L.
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+#
+# This file may be distributed and/or modified under the terms of
+# the GNU Lesser General Public License version 2.1 as published by
+# the Free Software Foundation.
+# This file is distributed without any warranty; without even the implied
+# warranty of merchantability or fitness for a particular purpose.
+# See "LICENSE.LGPL" in the source distribution for more information.
+#
+# Headers in this file shall remain intact.
+
+import time
+
+
+class PriorityQueue(object):
+    """
+    Indexed binary heap of keyed values.
+    The value with the highest priority is popped first, the values
+    with the same priority are popped in the reverse order they were
+    pushed in, like the sorted list the scheduler used before,
+    or in the order they were pushed in if lifo is False.
+    Pushing, removing and changing the priority of a value
+    are done in O(log n).
+    """
+
+    def __init__(self, lifo=True):
+        self._heap = [] # [(-priority, -sequence, key)]
+        self._index = {} # {key: heap position}
+        self._values = {} # {key: value}
+        self._sequence = 0
+        self._order = (lifo and -1) or 1
+
+
+    ## Public Methods ##
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __nonzero__(self):
+        return len(self._heap) > 0
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def get(self, key, default=None):
+        return self._values.get(key, default)
+
+    def getPriority(self, key):
+        return -self._heap[self._index[key]][0]
+
+    def itervalues(self):
+        return self._values.itervalues()
+
+    def push(self, key, value, priority):
+        assert key not in self._index
+        self._values[key] = value
+        pos = len(self._heap)
+        self._heap.append(self.__newEntry(key, priority))
+        self._index[key] = pos
+        self.__siftUp(pos)
+
+    def extend(self, items):
+        """
+        Pushes an iterable of (key, value, priority).
+        When many values are pushed at once, the heap
+        is rebuilt in O(n) instead of pushing them one by one.
+        """
+        items = list(items)
+        if len(items) <= len(self._heap) / 2:
+            for key, value, priority in items:
+                self.push(key, value, priority)
+            return
+        heap = self._heap
+        for key, value, priority in items:
+            assert key not in self._index
+            self._values[key] = value
+            self._index[key] = len(heap)
+            heap.append(self.__newEntry(key, priority))
+        for pos in xrange(len(heap) / 2 - 1, -1, -1):
+            self.__siftDown(pos)
+
+    def update(self, key, priority):
+        """
+        Changes the priority of a queued value,
+        keeping its order among the values with the same priority.
+        """
+        pos = self._index[key]
+        entry = self._heap[pos]
+        if entry[0] == -priority:
+            return
+        self._heap[pos] = (-priority, entry[1], key)
+        if -priority < entry[0]:
+            self.__siftUp(pos)
+        else:
+            self.__siftDown(pos)
+
+    def remove(self, key):
+        pos = self._index[key]
+        self.__removeAt(pos)
+        return self._values.pop(key)
+
+    def peek(self):
+        """
+        Returns the (key, value) that would be popped, or (None, None).
+        """
+        if not self._heap:
+            return (None, None)
+        key = self._heap[0][2]
+        return (key, self._values[key])
+
+    def pop(self):
+        """
+        Removes and returns the (key, value) with the highest priority.
+        """
+        if not self._heap:
+            raise IndexError("pop from an empty queue")
+        key = self._heap[0][2]
+        self.__removeAt(0)
+        return (key, self._values.pop(key))
+
+    def clear(self):
+        del self._heap[:]
+        self._index.clear()
+        self._values.clear()
+
+
+    ## Private Methods ##
+
+    def __newEntry(self, key, priority):
+        self._sequence += 1
+        return (-priority, self._order * self._sequence, key)
+
+    def __removeAt(self, pos):
+        heap = self._heap
+        entry = heap[pos]
+        del self._index[entry[2]]
+        last = heap.pop()
+        if pos == len(heap):
+            return
+        heap[pos] = last
+        self._index[last[2]] = pos
+        if last < entry:
+            self.__siftUp(pos)
+        else:
+            self.__siftDown(pos)
+
+    def __siftUp(self, pos):
+        heap = self._heap
+        index = self._index
+        entry = heap[pos]
+        while pos > 0:
+            parentPos = (pos - 1) >> 1
+            parent = heap[parentPos]
+            if not (entry < parent):
+                break
+            heap[pos] = parent
+            index[parent[2]] = pos
+            pos = parentPos
+        heap[pos] = entry
+        index[entry[2]] = pos
+
+    def __siftDown(self, pos):
+        heap = self._heap
+        index = self._index
+        size = len(heap)
+        entry = heap[pos]
+        childPos = 2 * pos + 1
+        while childPos < size:
+            rightPos = childPos + 1
+            if (rightPos < size) and (heap[rightPos] < heap[childPos]):
+                childPos = rightPos
+            child = heap[childPos]
+            if not (child < entry):
+                break
+            heap[pos] = child
+            index[child[2]] = pos
+            pos = childPos
+            childPos = 2 * pos + 1
+        heap[pos] = entry
+        index[entry[2]] = pos
+
+
+class FairQueue(object):
+    """
+    Shares the dequeued values between groups by weight,
+    with self-clocked weighted fair queuing.
+    Each value has an estimated cost; a group with a weight of 2 gets
+    twice the cost a group with a weight of 1 gets. In a group,
+    the values are popped by priority like with a PriorityQueue.
+    A group starting to queue values does not get any credit
+    for the time it was idle.
+    """
+
+    def __init__(self):
+        self._groups = {} # {group: PriorityQueue}
+        self._groupOf = {} # {key: group}
+        self._costs = {} # {key: cost}
+        self._weights = {} # {group: weight}
+        self._starts = {} # {group: virtual start time of its next value}
+        self._finishes = {} # {group: virtual finish time of its last value}
+        # {group: None} by virtual finish time, the first
+        # group queuing values first when the times are the same
+        self._tags = PriorityQueue(lifo=False)
+        self._virtualTime = 0.0
+        self._count = 0
+
+
+    ## Public Methods ##
+
+    def __len__(self):
+        return self._count
+
+    def __nonzero__(self):
+        return self._count > 0
+
+    def __contains__(self, key):
+        return key in self._groupOf
+
+    def __iter__(self):
+        return iter(self._groupOf)
+
+    def get(self, key, default=None):
+        group = self._groupOf.get(key, None)
+        if group is None:
+            return default
+        return self._groups[group].get(key)
+
+    def getPriority(self, key):
+        return self._groups[self._groupOf[key]].getPriority(key)
+
+    def getGroup(self, key):
+        return self._groupOf[key]
+
+    def getVirtualTime(self):
+        return self._virtualTime
+
+    def itervalues(self):
+        for queue in self._groups.itervalues():
+            for value in queue.itervalues():
+                yield value
+
+    def push(self, key, value, priority, group, weight=1, cost=1):
+        assert key not in self._groupOf
+        self._groupOf[key] = group
+        self._costs[key] = cost
+        self._weights[group] = max(weight, 1)
+        queue = self._groups.get(group, None)
+        if queue is None:
+            queue = PriorityQueue()
+            self._groups[group] = queue
+            start = max(self._virtualTime, self._finishes.get(group, 0.0))
+            self._starts[group] = start
+        head = queue.peek()[0]
+        queue.push(key, value, priority)
+        self._count += 1
+        self.__retag(group, head)
+
+    def extend(self, items):
+        """
+        Pushes an iterable of (key, value, priority, group, weight, cost).
+        """
+        for item in items:
+            self.push(*item)
+
+    def update(self, key, priority):
+        group = self._groupOf[key]
+        queue = self._groups[group]
+        head = queue.peek()[0]
+        queue.update(key, priority)
+        self.__retag(group, head)
+
+    def remove(self, key):
+        group = self._groupOf.pop(key)
+        queue = self._groups[group]
+        head = queue.peek()[0]
+        value = queue.remove(key)
+        del self._costs[key]
+        self._count -= 1
+        if not queue:
+            self.__dropGroup(group)
+        else:
+            self.__retag(group, head)
+        return value
+
+    def peek(self):
+        if not self._tags:
+            return (None, None)
+        group = self._tags.peek()[0]
+        return self._groups[group].peek()
+
+    def pop(self):
+        if not self._tags:
+            raise IndexError("pop from an empty queue")
+        group = self._tags.peek()[0]
+        queue = self._groups[group]
+        key, value = queue.pop()
+        del self._groupOf[key]
+        finish = self.__getFinish(group, self._costs.pop(key))
+        self._count -= 1
+        self._virtualTime = max(self._virtualTime, finish)
+        self._finishes[group] = finish
+        if not queue:
+            self.__dropGroup(group)
+        else:
+            self._starts[group] = finish
+            self._tags.update(group, -self.__getFinish(group))
+        return (key, value)
+
+    def clear(self):
+        self._groups.clear()
+        self._groupOf.clear()
+        self._costs.clear()
+        self._starts.clear()
+        self._finishes.clear()
+        self._tags.clear()
+        self._virtualTime = 0.0
+        self._count = 0
+
+
+    ## Private Methods ##
+
+    def __getFinish(self, group, cost=None):
+        if cost is None:
+            cost = self._costs[self._groups[group].peek()[0]]
+        return self._starts[group] + float(cost) / self._weights[group]
+
+    def __retag(self, group, oldHead):
+        # The virtual finish time of a group only
+        # depends on its start time and its first value
+        if self._groups[group].peek()[0] == oldHead:
+            return
+        priority = -self.__getFinish(group)
+        if group in self._tags:
+            self._tags.update(group, priority)
+        else:
+            self._tags.push(group, None, priority)
+
+    def __dropGroup(self, group):
+        del self._groups[group]
+        del self._starts[group]
+        self._tags.remove(group)
+
+
+class ShortestQueue(object):
+    """
+    Pops the value with the lowest estimated cost first, in the order
+    they were pushed in for the same cost. To prevent the costly values
+    from waiting forever, when the oldest value has been queued for
+    more than maxWait seconds it is popped first.
+    """
+
+    def __init__(self, maxWait, clock=time.time):
+        self.maxWait = maxWait
+        self._clock = clock
+        self._costs = PriorityQueue(lifo=False) # {key: value} by cost
+        self._ages = PriorityQueue(lifo=False) # {key: None} by queuing time
+
+
+    ## Public Methods ##
+
+    def __len__(self):
+        return len(self._costs)
+
+    def __nonzero__(self):
+        return len(self._costs) > 0
+
+    def __contains__(self, key):
+        return key in self._costs
+
+    def __iter__(self):
+        return iter(self._costs)
+
+    def get(self, key, default=None):
+        return self._costs.get(key, default)
+
+    def getPriority(self, key):
+        return -self._costs.getPriority(key)
+
+    def getQueuingTime(self, key):
+        return -self._ages.getPriority(key)
+
+    def itervalues(self):
+        return self._costs.itervalues()
+
+    def push(self, key, value, cost):
+        self._costs.push(key, value, -cost)
+        self._ages.push(key, None, -self._clock())
+
+    def extend(self, items):
+        """
+        Pushes an iterable of (key, value, cost).
+        """
+        now = self._clock()
+        items = list(items)
+        self._costs.extend([(k, v, -c) for k, v, c in items])
+        self._ages.extend([(k, None, -now) for k, v, c in items])
+
+    def update(self, key, cost):
+        self._costs.update(key, -cost)
+
+    def remove(self, key):
+        self._ages.remove(key)
+        return self._costs.remove(key)
+
+    def peek(self):
+        key = self.__getNextKey()
+        if key is None:
+            return (None, None)
+        return (key, self._costs.get(key))
+
+    def pop(self):
+        key = self.__getNextKey()
+        if key is None:
+            raise IndexError("pop from an empty queue")
+        return (key, self.remove(key))
+
+    def clear(self):
+        self._costs.clear()
+        self._ages.clear()
+
+
+    ## Private Methods ##
+
+    def __getNextKey(self):
+        if not self._costs:
+            return None
+        oldest = self._ages.peek()[0]
+        waited = self._clock() + self._ages.getPriority(oldest)
+        if (self.maxWait is not None) and (waited >= self.maxWait):
+            return oldest
+        return self._costs.peek()[0]
+
+
+class AgingQueue(object):
+    """
+    Pops the value with the highest effective priority first.
+    The effective priority of a value rises by rate every second
+    it is queued, by cap at most, so the values with a low priority
+    cannot wait forever behind the values with a higher priority.
+    As all the values rise at the same rate, the values still aging
+    keep the same order and are never reordered; the values reaching
+    the cap are only moved once to the queue of the capped values.
+    """
+
+    def __init__(self, rate, cap, clock=time.time):
+        assert rate > 0
+        self.rate = rate
+        self.cap = cap
+        self._clock = clock
+        self._values = {} # {key: value}
+        self._entries = {} # {key: (priority, queuing time)}
+        # {key: None} by priority minus the rate times the queuing time
+        self._aging = PriorityQueue(lifo=False)
+        # {key: None} by capped priority
+        self._capped = PriorityQueue(lifo=False)
+        # {key: None} by time the values reach the cap
+        self._deadlines = PriorityQueue(lifo=False)
+
+
+    ## Public Methods ##
+
+    def __len__(self):
+        return len(self._values)
+
+    def __nonzero__(self):
+        return len(self._values) > 0
+
+    def __contains__(self, key):
+        return key in self._values
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def get(self, key, default=None):
+        return self._values.get(key, default)
+
+    def getPriority(self, key):
+        return self._entries[key][0]
+
+    def getQueuingTime(self, key):
+        return self._entries[key][1]
+
+    def getEffectivePriority(self, key, now=None):
+        priority, queuingTime = self._entries[key]
+        if now is None:
+            now = self._clock()
+        aging = min(self.cap, self.rate * max(now - queuingTime, 0))
+        return priority + aging
+
+    def itervalues(self):
+        return self._values.itervalues()
+
+    def push(self, key, value, priority, queuingTime=None):
+        """
+        The value ages from the given queuing time, or from now.
+        """
+        if queuingTime is None:
+            queuingTime = self._clock()
+        self.__push(key, value, priority, queuingTime)
+
+    def extend(self, items):
+        """
+        Pushes an iterable of (key, value, priority).
+        """
+        now = self._clock()
+        for key, value, priority in items:
+            self.__push(key, value, priority, now)
+
+    def update(self, key, priority):
+        queuingTime = self._entries[key][1]
+        self._entries[key] = (priority, queuingTime)
+        if key in self._aging:
+            self._aging.update(key, priority - self.rate * queuingTime)
+        else:
+            self._capped.update(key, priority + self.cap)
+
+    def remove(self, key):
+        del self._entries[key]
+        if key in self._aging:
+            self._aging.remove(key)
+            self._deadlines.remove(key)
+        else:
+            self._capped.remove(key)
+        return self._values.pop(key)
+
+    def peek(self):
+        key = self.__getNextKey()
+        if key is None:
+            return (None, None)
+        return (key, self._values[key])
+
+    def pop(self):
+        key = self.__getNextKey()
+        if key is None:
+            raise IndexError("pop from an empty queue")
+        return (key, self.remove(key))
+
+    def clear(self):
+        self._values.clear()
+        self._entries.clear()
+        self._aging.clear()
+        self._capped.clear()
+        self._deadlines.clear()
+
+
+    ## Private Methods ##
+
+    def __push(self, key, value, priority, now):
+        assert key not in self._values
+        self._values[key] = value
+        self._entries[key] = (priority, now)
+        self._aging.push(key, None, priority - self.rate * now)
+        self._deadlines.push(key, None, -(now + self.cap / self.rate))
+
+    def __getNextKey(self):
+        if not self._values:
+            return None
+        now = self._clock()
+        deadlines = self._deadlines
+        while deadlines:
+            key = deadlines.peek()[0]
+            if -deadlines.getPriority(key) > now:
+                break
+            deadlines.pop()
+            self._aging.remove(key)
+            self._capped.push(key, None, self._entries[key][0] + self.cap)
+        agingKey = self._aging.peek()[0]
+        cappedKey = self._capped.peek()[0]
+        if agingKey is None:
+            return cappedKey
+        if cappedKey is None:
+            return agingKey
+        aging = self._aging.getPriority(agingKey) + self.rate * now
+        if self._capped.getPriority(cappedKey) >= aging:
+            return cappedKey
+        return agingKey
+
+
+class DeadlineQueue(object):
+    """
+    Pops the value with the earliest deadline first, in the order
+    they were pushed in for the same deadline. A value is at risk when
+    it must start within margin seconds to finish before its deadline,
+    from its estimated cost; the value at risk with the earliest latest
+    start time is popped first, so a long transcoding is not started
+    too late behind shorter ones with a slightly earlier deadline.
+    """
+
+    def __init__(self, margin, clock=time.time):
+        self.margin = margin
+        self._clock = clock
+        self._costs = {} # {key: cost}
+        # {key: value} by deadline
+        self._deadlines = PriorityQueue(lifo=False)
+        # {key: None} by deadline minus the cost
+        self._starts = PriorityQueue(lifo=False)
+
+
+    ## Public Methods ##
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __nonzero__(self):
+        return len(self._deadlines) > 0
+
+    def __contains__(self, key):
+        return key in self._deadlines
+
+    def __iter__(self):
+        return iter(self._deadlines)
+
+    def get(self, key, default=None):
+        return self._deadlines.get(key, default)
+
+    def getPriority(self, key):
+        return -self._deadlines.getPriority(key)
+
+    def getEffectivePriority(self, key):
+        """
+        Returns the latest time the value can start
+        to finish before its deadline.
+        """
+        return -self._starts.getPriority(key)
+
+    def getCost(self, key):
+        return self._costs[key]
+
+    def isAtRisk(self, key, now=None):
+        if now is None:
+            now = self._clock()
+        return self.getEffectivePriority(key) <= now + self.margin
+
+    def itervalues(self):
+        return self._deadlines.itervalues()
+
+    def push(self, key, value, deadline, cost):
+        self._costs[key] = cost
+        self._deadlines.push(key, value, -deadline)
+        self._starts.push(key, None, cost - deadline)
+
+    def extend(self, items):
+        """
+        Pushes an iterable of (key, value, deadline, cost).
+        """
+        items = list(items)
+        for k, v, d, c in items:
+            self._costs[k] = c
+        self._deadlines.extend([(k, v, -d) for k, v, d, c in items])
+        self._starts.extend([(k, None, c - d) for k, v, d, c in items])
+
+    def update(self, key, deadline, cost=None):
+        if cost is None:
+            cost = self._costs[key]
+        self._costs[key] = cost
+        self._deadlines.update(key, -deadline)
+        self._starts.update(key, cost - deadline)
+
+    def remove(self, key):
+        del self._costs[key]
+        self._starts.remove(key)
+        return self._deadlines.remove(key)
+
+    def peek(self):
+        key = self.__getNextKey()
+        if key is None:
+            return (None, None)
+        return (key, self._deadlines.get(key))
+
+    def pop(self):
+        key = self.__getNextKey()
+        if key is None:
+            raise IndexError("pop from an empty queue")
+        return (key, self.remove(key))
+
+    def clear(self):
+        self._costs.clear()
+        self._deadlines.clear()
+        self._starts.clear()
+
+
+    ## Private Methods ##
+
+    def __getNextKey(self):
+        if not self._deadlines:
+            return None
+        key = self._starts.peek()[0]
+        if self.isAtRisk(key):
+            return key
+        return self._deadlines.peek()[0]
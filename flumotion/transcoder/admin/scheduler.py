@@ -14,23 +14,24 @@
 #
 # Headers in this file shall remain intact.
 
-from zope.interface import Interface, implements
+from zope.interface import implements
 from twisted.internet import reactor
 
-from flumotion.inhouse import log, defer, utils, events
+from flumotion.inhouse import log, defer, events
 
 from flumotion.transcoder.admin import adminconsts, transtask, notifysubs
+from flumotion.transcoder.admin import schedqueue, costmodel, interfaces
 from flumotion.transcoder.admin.enums import ActivityTypeEnum
 from flumotion.transcoder.admin.enums import ActivityStateEnum
 from flumotion.transcoder.admin.enums import NotificationTriggerEnum
 from flumotion.transcoder.admin.context import profile
 
-#TODO: Implement a faire scheduler and prevent the possibility
-#      of the profile priority making the overhaul customer priority
-#      higher than other customer priorities.
+#TODO: Prevent the possibility of the profile priority making
+#      the overhaul customer priority higher than other customer
+#      priorities with the priority policy.
 
 
-class IScheduler(Interface):
+class IScheduler(interfaces.IAdminInterface):
     pass
 
 
@@ -40,14 +41,29 @@ class Scheduler(log.Loggable, events.EventSourceMixin):
     logCategory = adminconsts.SCHEDULER_LOG_CATEGORY
 
     def __init__(self, schedulerContext, storeContext,
-                 notifier, transcoding, diagnostician):
+                 notifier, transcoding, diagnostician,
+                 reactor=reactor, taskFactory=transtask.TranscodingTask):
+        self._reactor = reactor
+        self._taskFactory = taskFactory
         self._schedulerCtx = schedulerContext
         self._storeCtx = storeContext
         self._notifier = notifier
         self._transcoding = transcoding
         self._diagnostician = diagnostician
-        self._order = [] # [puid]
-        self._queue = {} # {puid: (ProfileContext, params)}
+        self._policy = self.__getPolicy()
+        self._costModel = self.__createCostModel()
+        # {puid: (ProfileContext, params)} ordered by the policy
+        self._queue = self.__createQueue()
+        # {puid: deadline} of the queued and started transcodings
+        # with a turnaround time
+        self._deadlines = {}
+        self._deadlineStats = {"met": 0, "missed": 0}
+        # 0 if the running transcodings are never preempted
+        self._preemptionGap = self.__getPreemptionGap()
+        # {puid: (priority, aging credit, start time, params)}
+        # of the started transcodings that can be preempted
+        self._running = {}
+        self._preemptions = {} # {puid: preemption count}
         self._activities = {} # {transtask.TranscodingTask: ActivityContext}
         self._started = False
         self._paused = False
@@ -100,27 +116,53 @@ class Scheduler(log.Loggable, events.EventSourceMixin):
             self.__startup()
         return defer.succeed(self)
 
-    def addProfile(self, profCtx, params=None):
+    def addProfile(self, profCtx, params=None, fileSize=None):
         assert isinstance(profCtx, profile.ProfileContext)
         if self.isProfileQueued(profCtx):
             self.log("Added an already queued profile '%s'", profCtx.inputPath)
+            self.__requeueProfile(profCtx)
         elif self._transcoding.getTask(profCtx.uid):
             self.log("Profile '%s' already scheduled", profCtx.inputPath)
         else:
             self.debug("Queued profile '%s'", profCtx.inputPath)
-            self.__queueProfile(profCtx, params)
+            self.__queueProfile(profCtx, params, fileSize)
             self.__startupTasks()
             self.emit("profile-queued", profCtx)
 
+    def addProfiles(self, profiles):
+        """
+        Queues an iterable of (ProfileContext, params, fileSize) at once,
+        used when many files are added in a burst.
+        """
+        added = []
+        for profCtx, params, fileSize in profiles:
+            assert isinstance(profCtx, profile.ProfileContext)
+            if self.isProfileQueued(profCtx):
+                self.__requeueProfile(profCtx)
+            elif not self._transcoding.getTask(profCtx.uid):
+                added.append((profCtx, params, fileSize))
+        if not added:
+            return
+        self.debug("Queued %d profile(s)", len(added))
+        now = self._reactor.seconds()
+        self._queue.extend([self.__getQueueItem(now, *a) for a in added])
+        self.__startupTasks()
+        for profCtx, params, fileSize in added:
+            self.emit("profile-queued", profCtx)
+
     def removeProfile(self, profCtx):
         assert isinstance(profCtx, profile.ProfileContext)
         if self.isProfileQueued(profCtx):
             self.debug("Unqueue profile '%s'", profCtx.inputPath)
             self.__unqueuProfile(profCtx)
+            self._deadlines.pop(profCtx.uid, None)
         trantask = self._transcoding.getTask(profCtx.uid, None)
         if trantask and not trantask.isAcknowledging():
             self.debug("Cancel transcoding of profile '%s'", profCtx.inputPath)
             self._transcoding.removeTask(profCtx.uid)
+            self._deadlines.pop(profCtx.uid, None)
+        self._running.pop(profCtx.uid, None)
+        self._preemptions.pop(profCtx.uid, None)
 
     def isProfileQueued(self, profCtx):
         assert isinstance(profCtx, profile.ProfileContext)
@@ -134,6 +176,80 @@ class Scheduler(log.Loggable, events.EventSourceMixin):
     def waitIdle(self, timeout=None):
         return defer.succeed(self)
 
+    def getPolicy(self):
+        return self._policy
+
+    def usesCostModel(self):
+        """
+        Tells if the transcoding costs are estimated, by the policy
+        or to choose the transcodings to preempt.
+        """
+        return ((self._policy in adminconsts.SCHEDULER_COST_POLICIES)
+                or (self._preemptionGap > 0))
+
+    def getQueuedProfiles(self):
+        """
+        Returns a list of dict with the input path, the customer and
+        profile identifiers, the priority and the effective priority,
+        raised by the aging, of the queued profiles, by effective
+        priority. With the shortest policy the priority is the estimated
+        cost, with the deadline policy the deadline and the latest time
+        the transcoding can start to finish in time, and with the fair
+        policy the profile transcoding priority.
+        """
+        queue = self._queue
+        result = []
+        for puid in queue:
+            profCtx, params = queue.get(puid)
+            custCtx = profCtx.getCustomerContext()
+            result.append({"inputPath": profCtx.inputPath,
+                           "customer": custCtx.identifier,
+                           "profile": profCtx.identifier,
+                           "priority": queue.getPriority(puid),
+                           "effectivePriority":
+                               self.__getEffectivePriority(puid)})
+        reverse = self._policy not in (adminconsts.SCHEDULER_POLICY_SHORTEST,
+                                       adminconsts.SCHEDULER_POLICY_DEADLINE)
+        result.sort(key=lambda i: i["effectivePriority"], reverse=reverse)
+        return result
+
+    def getDeadline(self, profCtx):
+        """
+        Returns the time the transcoding of the specified profile
+        should be done by, or None if it has no turnaround time.
+        """
+        assert isinstance(profCtx, profile.ProfileContext)
+        return self._deadlines.get(profCtx.uid, None)
+
+    def getDeadlineStatistics(self):
+        """
+        Returns a dict with the number of transcodings with a deadline
+        that finished in time ("met") and too late ("missed").
+        """
+        return dict(self._deadlineStats)
+
+    def getCostModel(self):
+        return self._costModel
+
+    def setCostModel(self, model):
+        """
+        Replaces the model (costmodel.ICostModel) used to estimate
+        the cost of the transcodings queued from now on.
+        """
+        self._costModel = model
+
+    def recordHistory(self, history):
+        """
+        Makes the cost model learn from the (profileId, realTime, fileSize)
+        of previous transcodings, the oldest first.
+        """
+        count = 0
+        for profileId, realTime, fileSize in history:
+            if realTime:
+                self._costModel.record(profileId, realTime, fileSize)
+                count += 1
+        self.debug("Cost model initialized from %d transcoding(s)", count)
+
 
     ## ITranscoding Event Listers ##
 
@@ -193,6 +309,8 @@ class Scheduler(log.Loggable, events.EventSourceMixin):
         #       Canceling a task already acknowledged should be prevented.
         #       See #2921
         profCtx = task.getProfileContext()
+        self._running.pop(profCtx.uid, None)
+        self._preemptions.pop(profCtx.uid, None)
         self._transcoding.removeTask(profCtx.uid)
 
     def __ebReportRetrievalFailed(self, failure, transcod_successful):
@@ -217,14 +335,20 @@ class Scheduler(log.Loggable, events.EventSourceMixin):
     ## Private Methods ##
 
     def __transcodingDone(self, report, task, transPxy):
+        self.__checkDeadline(task)
         self.emit("transcoding-done", task, report)
+        self._deadlines.pop(task.getProfileContext().uid, None)
         docs = transPxy and transPxy.getDocuments()
         trigger = NotificationTriggerEnum.done
         profCtx = task.getProfileContext()
+        if report:
+            costmodel.recordReport(self._costModel, profCtx.identifier, report)
         self.__notify(task.label, trigger, profCtx, report, docs)
 
     def __transcodingFailed(self, report, task, transPxy):
+        self.__checkDeadline(task)
         self.emit("transcoding-failed", task, report)
+        self._deadlines.pop(task.getProfileContext().uid, None)
         d = self._diagnostician.diagnoseTranscodingFailure(task, transPxy)
         args = (report, task, transPxy)
         d.addCallbacks(self.__notifyTranscodingfailure,
@@ -291,6 +415,18 @@ class Scheduler(log.Loggable, events.EventSourceMixin):
                 # Ignore Failures to prevent defer to notify them
                 d.addErrback(defer.resolveFailure)
 
+    def __checkDeadline(self, task):
+        deadline = self._deadlines.get(task.getProfileContext().uid, None)
+        if deadline is None:
+            return
+        late = self._reactor.seconds() - deadline
+        if late > 0:
+            self._deadlineStats["missed"] += 1
+            self.info("Transcoding task '%s' missed its deadline "
+                      "by %d second(s)", task.label, late)
+        else:
+            self._deadlineStats["met"] += 1
+
     def __cbRestoreTasks(self, activCtxs):
         self.debug("Restoring transcoding tasks")
         for activCtx in activCtxs:
@@ -314,7 +450,8 @@ class Scheduler(log.Loggable, events.EventSourceMixin):
 
     def __startupTasks(self):
         if self.isStarted() and not self._startDelay:
-            self._startDelay = utils.callNext(self.__asyncStartTask)
+            self._startDelay = self._reactor.callLater(0,
+                                                       self.__asyncStartTask)
 
     def __cancelTasksStartup(self):
         if self._startDelay:
@@ -325,16 +462,18 @@ class Scheduler(log.Loggable, events.EventSourceMixin):
         available = self._transcoding.getAvailableSlots()
         if available <= 0:
             self._startDelay = None
+            if self._preemptionGap > 0:
+                self.__preemptTask()
             return
         profCtx, params = self.__popNextProfile()
         if not profCtx:
             self._startDelay = None
             return
         self.__startTranscodingTask(profCtx, params=params)
-        self._startDelay = utils.callNext(self.__asyncStartTask)
+        self._startDelay = self._reactor.callLater(0, self.__asyncStartTask)
 
     def __startTranscodingTask(self, profCtx, activCtx=None, params=None):
-        task = transtask.TranscodingTask(self._transcoding, profCtx, params)
+        task = self._taskFactory(self._transcoding, profCtx, params)
         self.info("Starting transcoding task '%s'",  task.label)
         self._transcoding.addTask(profCtx.uid, task)
         self.emit("transcoding-started", task)
@@ -346,35 +485,211 @@ class Scheduler(log.Loggable, events.EventSourceMixin):
             activCtx.store.store()
         self._activities[task] = activCtx
 
+    def __getConfig(self, name, default):
+        if self._schedulerCtx is None:
+            return default
+        value = getattr(self._schedulerCtx.config, name, None)
+        if value is None:
+            return default
+        return value
+
+    def __getPolicy(self):
+        policy = self.__getConfig("policy",
+                                  adminconsts.DEFAULT_SCHEDULER_POLICY)
+        if policy not in adminconsts.SCHEDULER_POLICIES:
+            self.warning("Unknown scheduler policy '%s', using '%s'",
+                         policy, adminconsts.DEFAULT_SCHEDULER_POLICY)
+            policy = adminconsts.DEFAULT_SCHEDULER_POLICY
+        return policy
+
+    def __getPreemptionGap(self):
+        gap = self.__getConfig("preemptionGap",
+                               adminconsts.SCHEDULER_PREEMPTION_GAP)
+        policy = adminconsts.SCHEDULER_POLICY_PRIORITY
+        if (gap > 0) and (self._policy != policy):
+            self.warning("Preemption only supported with the '%s' policy",
+                         policy)
+            return 0
+        return gap
+
+    def __createCostModel(self):
+        name = self.__getConfig("costModel", adminconsts.DEFAULT_COST_MODEL)
+        model = costmodel.createCostModel(name)
+        if model is None:
+            self.warning("Unknown cost model '%s', using '%s'",
+                         name, adminconsts.DEFAULT_COST_MODEL)
+            model = costmodel.createCostModel(adminconsts.DEFAULT_COST_MODEL)
+        return model
+
+    def __createQueue(self):
+        if self._policy == adminconsts.SCHEDULER_POLICY_FAIR:
+            return schedqueue.FairQueue()
+        if self._policy == adminconsts.SCHEDULER_POLICY_SHORTEST:
+            maxWait = self.__getConfig("maxWait",
+                                       adminconsts.SCHEDULER_MAX_WAIT)
+            return schedqueue.ShortestQueue(maxWait, self._reactor.seconds)
+        if self._policy == adminconsts.SCHEDULER_POLICY_DEADLINE:
+            margin = self.__getConfig("riskMargin",
+                                      adminconsts.SCHEDULER_RISK_MARGIN)
+            return schedqueue.DeadlineQueue(margin, self._reactor.seconds)
+        rate = self.__getConfig("agingRate", adminconsts.SCHEDULER_AGING_RATE)
+        cap = self.__getConfig("agingCap", adminconsts.SCHEDULER_AGING_CAP)
+        if (rate > 0) and (cap > 0):
+            # The rate is configured by minute
+            return schedqueue.AgingQueue(rate / 60.0, cap,
+                                         self._reactor.seconds)
+        return schedqueue.PriorityQueue()
+
     def __getProfilePriority(self, profCtx):
+        profPri = profCtx.transcodingPriority
+        if self._policy == adminconsts.SCHEDULER_POLICY_FAIR:
+            # The customers share the slots by weight
+            return profPri
         custCtx = profCtx.getCustomerContext()
         custPri = custCtx.customerPriority
-        profPri = profCtx.transcodingPriority
         return custPri * 1000 + profPri
 
-    def __getKeyPriority(self, key):
-        return self.__getProfilePriority(self._queue[key][0])
+    def __estimateCost(self, profCtx, params, fileSize):
+        return self._costModel.estimate(profCtx.identifier, fileSize)
+
+    def __getTurnaroundTime(self, profCtx):
+        turnaround = profCtx.turnaroundTime
+        if turnaround is not None:
+            return turnaround
+        if self._policy == adminconsts.SCHEDULER_POLICY_DEADLINE:
+            return self.__getConfig("turnaroundTime",
+                                    adminconsts.SCHEDULER_TURNAROUND_TIME)
+        return None
 
-    def __queueProfile(self, profCtx, params=None):
+    def __getQueueItem(self, now, profCtx, params=None, fileSize=None):
+        turnaround = self.__getTurnaroundTime(profCtx)
+        if turnaround is not None:
+            self._deadlines[profCtx.uid] = now + turnaround
+        if self._policy == adminconsts.SCHEDULER_POLICY_SHORTEST:
+            cost = self.__estimateCost(profCtx, params, fileSize)
+            return (profCtx.uid, (profCtx, params), cost)
+        if self._policy == adminconsts.SCHEDULER_POLICY_DEADLINE:
+            cost = self.__estimateCost(profCtx, params, fileSize)
+            return (profCtx.uid, (profCtx, params), now + turnaround, cost)
+        item = (profCtx.uid, (profCtx, params),
+                self.__getProfilePriority(profCtx))
+        if self._policy == adminconsts.SCHEDULER_POLICY_FAIR:
+            custCtx = profCtx.getCustomerContext()
+            cost = self.__estimateCost(profCtx, params, fileSize)
+            item += (custCtx.identifier, custCtx.customerWeight, cost)
+        return item
+
+    def __queueProfile(self, profCtx, params=None, fileSize=None):
         puid = profCtx.uid
         assert not (puid in self._queue)
-        self._queue[puid] =  (profCtx, params)
-        self._order.append(puid)
-        self._order.sort(key=self.__getKeyPriority)
+        now = self._reactor.seconds()
+        item = self.__getQueueItem(now, profCtx, params, fileSize)
+        self._queue.push(*item)
+
+    def __requeueProfile(self, profCtx):
+        if self._policy in (adminconsts.SCHEDULER_POLICY_SHORTEST,
+                            adminconsts.SCHEDULER_POLICY_DEADLINE):
+            # Keep the estimated cost and the deadline
+            return
+        # The customer or profile priority may have changed
+        self._queue.update(profCtx.uid, self.__getProfilePriority(profCtx))
 
     def __unqueuProfile(self, profCtx):
         puid = profCtx.uid
         assert puid in self._queue
-        del self._queue[puid]
-        self._order.remove(puid)
+        self._queue.remove(puid)
+
+    def __getEffectivePriority(self, puid):
+        getEffectivePriority = getattr(self._queue, "getEffectivePriority",
+                                       self._queue.getPriority)
+        return getEffectivePriority(puid)
 
     def __popNextProfile(self):
-        if not self._order:
+        if not self._queue:
             return (None, None)
-        puid = self._order.pop()
-        profCtx, params = self._queue.pop(puid)
+        if self._preemptionGap > 0:
+            puid, (profCtx, params) = self._queue.peek()
+            priority = self._queue.getPriority(puid)
+            credit = self.__getEffectivePriority(puid) - priority
+            queuingTime = None
+            if isinstance(self._queue, schedqueue.AgingQueue):
+                queuingTime = self._queue.getQueuingTime(puid)
+            now = self._reactor.seconds()
+            self._running[puid] = (priority, credit, now, params,
+                                   queuingTime)
+        puid, (profCtx, params) = self._queue.pop()
         return (profCtx, params)
 
+    def __estimateRemainingCost(self, task, elapsed):
+        progress = task.getProgress()
+        if progress:
+            return elapsed * (100.0 - progress) / progress
+        cost = self.__estimateCost(task.getProfileContext(), None, None)
+        return max(cost - elapsed, 0)
+
+    def __getPreemptionVictim(self, urgency):
+        """
+        Returns the running task with the lowest priority, then the most
+        remaining work, that can be preempted for a queued transcoding
+        of the specified effective priority, or None.
+        """
+        now = self._reactor.seconds()
+        minRunTime = self.__getConfig("preemptionMinRunTime",
+                                      adminconsts.SCHEDULER_PREEMPTION_MIN_RUN_TIME)
+        maxCount = self.__getConfig("preemptionMaxCount",
+                                    adminconsts.SCHEDULER_PREEMPTION_MAX_COUNT)
+        victim = None
+        victimKey = None
+        for task in self._transcoding.iterTasks():
+            puid = task.getProfileContext().uid
+            running = self._running.get(puid, None)
+            if (running is None) or task.isAcknowledging():
+                continue
+            priority, credit, startTime, params, queuingTime = running
+            if urgency - (priority + credit) < self._preemptionGap:
+                continue
+            elapsed = now - startTime
+            if elapsed < minRunTime:
+                continue
+            if self._preemptions.get(puid, 0) >= maxCount:
+                continue
+            remaining = self.__estimateRemainingCost(task, elapsed)
+            key = (priority + credit, -remaining)
+            if (victimKey is None) or (key < victimKey):
+                victim = task
+                victimKey = key
+        return victim
+
+    def __preemptTask(self):
+        if not self._queue:
+            return
+        puid, (urgentCtx, urgentParams) = self._queue.peek()
+        task = self.__getPreemptionVictim(self.__getEffectivePriority(puid))
+        if task is None:
+            return
+        profCtx = task.getProfileContext()
+        running = self._running.pop(profCtx.uid)
+        priority, credit, startTime, params, queuingTime = running
+        count = self._preemptions.get(profCtx.uid, 0) + 1
+        self._preemptions[profCtx.uid] = count
+        self.info("Preempting transcoding task '%s' for '%s' (%d time(s))",
+                  task.label, urgentCtx.inputPath, count)
+        activCtx = self._activities.pop(task, None)
+        # Stops the task cleanly, the freed slot will be
+        # used by the urgent transcoding, first in the queue
+        self._transcoding.removeTask(profCtx.uid)
+        if activCtx is not None:
+            activCtx.store.delete()
+        # Keep the original priority, and the original queuing time
+        # so the aging credit is not counted again from zero
+        if queuingTime is None:
+            self._queue.push(profCtx.uid, (profCtx, params), priority)
+        else:
+            self._queue.push(profCtx.uid, (profCtx, params), priority,
+                             queuingTime)
+        self.emit("profile-queued", profCtx)
+
     def __clearQueue(self):
+        for puid in self._queue:
+            self._deadlines.pop(puid, None)
         self._queue.clear()
-        del self._order[:]
@@ -0,0 +1,691 @@
+# vi:si:et:sw=4:sts=4:ts=4
+
+# Flumotion - a streaming media server
+# Copyright (C) 2004,2005,2006,2007,2008,2009 Fluendo, S.L.
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+#
+# This file may be distributed and/or modified under the terms of
+# the GNU Lesser General Public License version 2.1 as published by
+# the Free Software Foundation.
+# This file is distributed without any warranty; without even the implied
+# warranty of merchantability or fitness for a particular purpose.
+# See "LICENSE.LGPL" in the source distribution for more information.
+#
+# Headers in this file shall remain intact.
+
+"""
+Offline simulation of the transcoding scheduling.
+
+Replays recorded job arrivals against the real scheduler and
+transcoder balancer on a virtual clock, so the scheduling policies
+can be compared without touching the live cluster.
+
+The workers, the transcoding tasks and the transcoder proxies are
+simulated: a task transcodes for the recorded time of the job, divided
+by the speed of its worker, as soon as the balancer gives it a worker.
+The transcoding manager is replaced by SimulatedTranscoding, which feeds
+the real balancer like the Transcoding manager does, without the
+component proxies. The customers and profiles only exist in memory,
+with the priorities, weights and turnaround times given to the
+simulation. The simulated transcodings never fail, but a task preempted
+by the scheduler transcodes again from the beginning when restarted.
+"""
+
+from zope.interface import implements
+from twisted.internet import task as itask
+
+from flumotion.inhouse import log, defer, events
+
+from flumotion.transcoder.admin import adminconsts, admintask, costmodel
+from flumotion.transcoder.admin import scheduler, transbalancer
+from flumotion.transcoder.admin.context import store
+from flumotion.transcoder.admin.datastore import base as storebase
+
+
+class TraceJob(object):
+    """
+    A recorded job, arrived arrival seconds after the start of the trace
+    and transcoded in cost seconds by a worker of speed 1.
+    """
+
+    def __init__(self, arrival, customer, profile, cost, fileSize=None):
+        self.arrival = arrival
+        self.customer = customer
+        self.profile = profile
+        self.cost = cost
+        self.fileSize = fileSize
+
+
+def _getSeconds(delta):
+    return delta.days * 86400 + delta.seconds + delta.microseconds / 1e6
+
+
+def _makeTrace(records):
+    """
+    Returns the TraceJob of a list of (arrival datetime, customer,
+    profile, cost, fileSize), by arrival, relative to the first one.
+    """
+    records.sort(key=lambda r: r[0])
+    if not records:
+        return []
+    first = records[0][0]
+    return [TraceJob(_getSeconds(a - first), c, p, t, s)
+            for a, c, p, t, s in records]
+
+
+def loadReportTrace(reports):
+    """
+    Returns the trace of the transcodings recorded in transcode
+    reports (datastore.reportsstore.TranscodeReportStore or
+    datasource.sqlsource.TranscodeReport). The jobs arrive when
+    they were queued and cost the real time they took.
+    The reports without these informations are skipped.
+    """
+    records = []
+    for report in reports:
+        arrival = (report.queueingTime or report.detectionTime
+                   or report.transcodingStartTime)
+        cost = report.totalRealTime
+        if (not cost) and report.transcodingStartTime \
+                and report.transcodingFinishTime:
+            cost = _getSeconds(report.transcodingFinishTime
+                               - report.transcodingStartTime)
+        if (arrival is None) or (not cost):
+            continue
+        records.append((arrival, report.customerId, report.profileId,
+                        cost, report.fileSize))
+    return _makeTrace(records)
+
+
+def loadActivityTrace(activStores, model=None):
+    """
+    Returns the trace of the transcoding activities
+    (datastore.activity.TranscodingActivityStore). The activities
+    only tell when the transcodings started, so the jobs arrive
+    at that time and their cost is estimated by the specified cost
+    model (costmodel.ICostModel), by default from a fixed throughput.
+    The activities of removed customers or profiles are skipped.
+    """
+    if model is None:
+        model = costmodel.SizeCostModel()
+    records = []
+    for activStore in activStores:
+        profStore = activStore.getProfileStore()
+        if (profStore is None) or (activStore.startTime is None):
+            continue
+        custStore = profStore.getCustomerStore()
+        cost = model.estimate(profStore.identifier)
+        records.append((activStore.startTime, custStore.identifier,
+                        profStore.identifier, cost, None))
+    return _makeTrace(records)
+
+
+def getPercentile(values, fraction):
+    """
+    Returns the nearest-rank percentile of a sorted list,
+    None if the list is empty.
+    """
+    if not values:
+        return None
+    index = int(round(fraction * (len(values) - 1)))
+    return values[index]
+
+
+def getFairness(values):
+    """
+    Returns the Jain's fairness index of a list of values,
+    from 1/len(values) when only one has everything to 1
+    when all are equal.
+    """
+    values = [v for v in values if v is not None]
+    if not values:
+        return None
+    square = sum([v * v for v in values])
+    if not square:
+        return 1.0
+    total = sum(values)
+    return float(total * total) / (len(values) * square)
+
+
+class SimulatedWorker(object):
+    """
+    Stands for a worker proxy and its worker context.
+    """
+
+    def __init__(self, name, maxTask, speed=1.0):
+        self.label = name
+        self._name = name
+        self._maxTask = maxTask
+        self.speed = speed
+
+    def getName(self):
+        return self._name
+
+    def getWorkerContext(self):
+        return self
+
+    def getMaxTask(self):
+        return self._maxTask
+
+
+class SimulatedStore(object):
+    """
+    An in-memory store of the admin, a customer or a profile,
+    without targets nor notifications. The values not specified
+    are None so the contexts use the defaults.
+    """
+
+    implements(storebase.INotificationProvider)
+
+    def __init__(self, parent, identifier, values=None):
+        self.parent = parent
+        self.identifier = identifier
+        self.label = identifier
+        self.name = identifier
+        self._values = dict(values or {})
+        self._children = {} # {identifier: SimulatedStore}
+
+    def __getattr__(self, attr):
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return self._values.get(attr, None)
+
+    def getChild(self, identifier, values=None):
+        child = self._children.get(identifier, None)
+        if child is None:
+            child = SimulatedStore(self, identifier, values)
+            self._children[identifier] = child
+        return child
+
+    def getCustomerStore(self, identifier, default=None):
+        return self._children.get(identifier, default)
+
+    def getProfileStore(self, identifier, default=None):
+        return self._children.get(identifier, default)
+
+    def getTargetStores(self):
+        return []
+
+    def iterTargetStores(self):
+        return iter([])
+
+    def getNotificationStores(self, trigger):
+        return []
+
+    def iterNotificationStores(self, trigger):
+        return iter([])
+
+
+class SimulatedAdminContext(object):
+
+    def __init__(self):
+        self.config = self
+        self.activityLabelTemplate = adminconsts.ACTIVITY_LABEL_TEMPLATE
+        self.transcoderLabelTemplate = adminconsts.TRANSCODER_LABEL_TEMPLATE
+
+
+class SimulatedActivityStore(object):
+
+    def __init__(self, label, state):
+        self.label = label
+        self.state = state
+
+    def store(self):
+        pass
+
+    def delete(self):
+        pass
+
+
+class SimulatedActivity(object):
+
+    def __init__(self, label, state, profCtx):
+        self.label = label
+        self.store = SimulatedActivityStore(label, state)
+        self._profCtx = profCtx
+
+    def getProfileContext(self):
+        return self._profCtx
+
+
+class SimulatedStateContext(object):
+    """
+    Stands for the store context given to the scheduler,
+    keeping the transcoding activities in memory.
+    """
+
+    def getStateContext(self):
+        return self
+
+    def retrieveTranscodingContexts(self, states):
+        return defer.succeed([])
+
+    def newTranscodingContext(self, label, state, profCtx):
+        return SimulatedActivity(label, state, profCtx)
+
+
+class SimulatedNotifier(object):
+
+    def notify(self, label, trigger, notifCtx, variables, docs):
+        return defer.succeed(None)
+
+
+class SimulatedUsage(object):
+    """
+    The source and usage parts of a transcoding report
+    the scheduler and its cost model look at.
+    """
+
+    def __init__(self, fileSize):
+        self.fileSize = fileSize
+        self.analysis = None
+
+
+class SimulatedReport(object):
+
+    def __init__(self, realTime, fileSize):
+        self.source = SimulatedUsage(fileSize)
+        self.targets = {}
+        self.fatalError = None
+        self.cpuUsageTotal = (realTime, realTime, 100.0)
+        self.cpuUsageTranscoding = (realTime, realTime, 100.0)
+
+
+class SimulatedTranscoder(object):
+    """
+    Stands for the transcoder proxy of a done transcoding.
+    """
+
+    def __init__(self, report):
+        self._report = report
+
+    def retrieveReport(self):
+        return defer.succeed(self._report)
+
+    def getDocuments(self):
+        return None
+
+
+class SimulatedTask(log.LoggerProxy, events.EventSourceMixin):
+    """
+    A transcoding task running for the cost of its job
+    divided by the speed of the worker suggested by the balancer.
+    Loosing its worker restarts the transcoding from the beginning,
+    like the component of a real task would be restarted.
+    """
+
+    implements(admintask.IAdminTask)
+
+    def __init__(self, logger, reactor, profCtx, job):
+        log.LoggerProxy.__init__(self, logger)
+        self.label = profCtx.inputRelPath
+        self._reactor = reactor
+        self._profCtx = profCtx
+        self._job = job
+        self._workerPxy = None
+        self._running = None # IDelayedCall
+        self._since = None
+        self._terminated = False
+        self.firstStart = None
+        self.lastStart = None
+        self.busyTime = 0.0
+        self.restarts = 0
+        self.preemptions = 0
+        # Registering Events
+        self._register("failed")
+        self._register("done")
+        self._register("terminated")
+
+    def getProfileContext(self):
+        return self._profCtx
+
+    def getJob(self):
+        return self._job
+
+    def getWorkerProxy(self):
+        return self._workerPxy
+
+    def isStarted(self):
+        return self._running is not None
+
+    def hasTerminated(self):
+        return self._terminated
+
+    def isAcknowledging(self):
+        return False
+
+    def getProcessInterruptionCount(self):
+        return 0
+
+    def setAdmissionController(self, admission):
+        pass
+
+    def start(self, paused=False, timeout=None):
+        return defer.succeed(self)
+
+    def suggestWorker(self, workerPxy):
+        if workerPxy == self._workerPxy:
+            return self._workerPxy
+        if self._running is not None:
+            self.__interrupt()
+            self.restarts += 1
+        self._workerPxy = workerPxy
+        if (workerPxy is not None) and not self._terminated:
+            now = self._reactor.seconds()
+            if self.firstStart is None:
+                self.firstStart = now
+            self.lastStart = now
+            self._since = now
+            duration = self._job.cost / float(workerPxy.speed)
+            self._running = self._reactor.callLater(duration, self.__done)
+        return self._workerPxy
+
+    def getProgress(self):
+        if self._running is None:
+            return None
+        start = self._since
+        end = self._running.getTime()
+        return 100.0 * (self._reactor.seconds() - start) / (end - start)
+
+    def resume(self, preempted):
+        """
+        Continues the statistics of a preempted task
+        of the same job started again.
+        """
+        self.firstStart = preempted.firstStart
+        self.busyTime = preempted.busyTime
+        self.restarts = preempted.restarts
+        self.preemptions = preempted.preemptions + 1
+
+    def stop(self, timeout=None):
+        if self._running is not None:
+            self.__interrupt()
+        self._terminated = True
+        return defer.succeed(self)
+
+    def abort(self):
+        self.stop()
+
+
+    ## Private Methods ##
+
+    def __interrupt(self):
+        if self._running.active():
+            self._running.cancel()
+        self._running = None
+        self.busyTime += self._reactor.seconds() - self._since
+
+    def __done(self):
+        self._running = None
+        self.busyTime += self._reactor.seconds() - self._since
+        self._terminated = True
+        report = SimulatedReport(self._job.cost, self._job.fileSize)
+        self.emit("done", SimulatedTranscoder(report))
+        self.emit("terminated", True)
+
+
+class SimulatedTranscoding(log.LoggerProxy, events.EventSourceMixin):
+    """
+    Manages the simulated tasks like the Transcoding manager,
+    distributing them to the workers with the real balancer.
+    """
+
+    def __init__(self, logger, workers):
+        log.LoggerProxy.__init__(self, logger)
+        self._tasks = {} # {identifier: SimulatedTask}
+        self._balancer = transbalancer.TranscoderBalancer(self)
+        for workerPxy in workers:
+            self._balancer.addWorker(workerPxy)
+        # Registering Events
+        self._register("task-added")
+        self._register("task-removed")
+        self._register("slot-available")
+
+    def getAvailableSlots(self):
+        return self._balancer.getAvailableSlots()
+
+    def addTask(self, identifier, task):
+        assert not (identifier in self._tasks)
+        self._tasks[identifier] = task
+        self._balancer.addTask(task)
+        self._balancer.balance()
+        self.emit("task-added", task)
+
+    def removeTask(self, identifier):
+        task = self._tasks.pop(identifier, None)
+        if task is None:
+            return
+        self._balancer.removeTask(task)
+        self._balancer.balance()
+        self.emit("task-removed", task)
+        task.stop()
+
+    def getTask(self, identifier, default=None):
+        return self._tasks.get(identifier, default)
+
+    def getTasks(self):
+        return self._tasks.values()
+
+    def iterTasks(self):
+        return self._tasks.itervalues()
+
+
+    ## TranscodingBalancer Callback ##
+
+    def onSlotsAvailable(self, balancer, count):
+        self.emit("slot-available", count)
+
+
+    ## Overriden Methods ##
+
+    def refreshListener(self, listener):
+        for t in self.iterTasks():
+            self.emitTo("task-added", listener, t)
+        available = self._balancer.getAvailableSlots()
+        if available > 0:
+            self.emitTo("slot-available", listener, available)
+
+
+class SimulatedSchedulerConfig(object):
+    """
+    Stands for the scheduler context and its configuration
+    (adminconfig.SchedulerConfig), the values not specified
+    are None so the scheduler uses the defaults.
+    """
+
+    def __init__(self, values=None):
+        self.config = self
+        self._values = dict(values or {})
+
+    def __getattr__(self, attr):
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return self._values.get(attr, None)
+
+
+class Simulation(log.Loggable):
+    """
+    Replays a trace (a list of TraceJob) on a set of SimulatedWorker
+    with a scheduler configured with the specified values, named like
+    the attributes of adminconfig.SchedulerConfig (policy, agingRate...).
+    The customers are configured with a dict {customerId: values} and
+    the profiles with a dict {(customerId, profileId): values}, named
+    like the context attributes (customerPriority, customerWeight,
+    transcodingPriority, turnaroundTime...). The cost model can be
+    initialized with the (profileId, realTime, fileSize) of previous
+    transcodings like Scheduler.recordHistory().
+    """
+
+    logCategory = adminconsts.SIMULATOR_LOG_CATEGORY
+
+    def __init__(self, jobs, workers, config=None,
+                 customers=None, profiles=None, history=None):
+        self._jobs = list(jobs)
+        self._workers = list(workers)
+        self._config = config
+        self._customers = customers or {}
+        self._profiles = profiles or {}
+        self._history = history
+        self._clock = None
+        self._pending = {} # {puid: TraceJob}
+        self._arrivals = {} # {puid: arrival time}
+        self._tasks = {} # {puid: last SimulatedTask}
+        self._done = [] # [(SimulatedTask, arrival, finish)]
+
+    def run(self):
+        """
+        Runs the simulation to the end and returns its results,
+        see getResults().
+        """
+        self._clock = itask.Clock()
+        self._pending.clear()
+        self._arrivals.clear()
+        self._tasks.clear()
+        del self._done[:]
+        adminStore = SimulatedStore(None, "simulation")
+        storeCtx = store.StoreContext(SimulatedAdminContext(), adminStore)
+        transcoding = SimulatedTranscoding(self, self._workers)
+        sched = scheduler.Scheduler(SimulatedSchedulerConfig(self._config),
+                                    SimulatedStateContext(),
+                                    SimulatedNotifier(), transcoding, None,
+                                    reactor=self._clock,
+                                    taskFactory=self.__createTask)
+        if self._history:
+            sched.recordHistory(self._history)
+        sched.connectListener("transcoding-done", self,
+                              self.__onTranscodingDone)
+        sched.initialize()
+        sched.start()
+        for index, job in enumerate(self._jobs):
+            profCtx = self.__getProfileContext(storeCtx, adminStore,
+                                               index, job)
+            self._clock.callLater(job.arrival, self.__arrive,
+                                  sched, profCtx, job)
+        self.__runClock()
+        if self._pending:
+            self.warning("%d job(s) never done", len(self._pending))
+        results = self.getResults()
+        results["policy"] = sched.getPolicy()
+        results["deadlines"] = sched.getDeadlineStatistics()
+        return results
+
+    def getResults(self):
+        """
+        Returns a dict with the number of done jobs, the time span from
+        the first arrival to the last transcoding done, the throughput
+        in jobs by hour, the slot utilization, the queue waits (from the
+        arrival to the first start) mean, max and 50th, 90th and 99th
+        percentiles, the Jain's fairness index of the customers mean
+        slowdown (the time from the arrival to the end divided by the
+        cost), the number of preempted transcodings and by customer
+        the number of jobs, the waits mean and 90th percentile,
+        the mean slowdown and the slot time used.
+        """
+        done = self._done
+        slots = sum([w.getMaxTask() for w in self._workers])
+        waits = []
+        customers = {} # {customerId: [(wait, slowdown, busyTime)]}
+        start = None
+        end = None
+        busy = 0.0
+        preemptions = 0
+        for task, arrival, finish in done:
+            job = task.getJob()
+            wait = task.firstStart - arrival
+            slowdown = (finish - arrival) / max(job.cost, 1e-6)
+            waits.append(wait)
+            customers.setdefault(job.customer, []).append(
+                (wait, slowdown, task.busyTime))
+            busy += task.busyTime
+            preemptions += task.preemptions
+            if (start is None) or (arrival < start):
+                start = arrival
+            if (end is None) or (finish > end):
+                end = finish
+        span = (end or 0) - (start or 0)
+        waits.sort()
+        result = {"done": len(done), "span": span,
+                  "throughput": None, "utilization": None,
+                  "waitMean": None, "waitMax": None,
+                  "wait50": getPercentile(waits, 0.50),
+                  "wait90": getPercentile(waits, 0.90),
+                  "wait99": getPercentile(waits, 0.99),
+                  "fairness": None, "preemptions": preemptions,
+                  "customers": {}}
+        if waits:
+            result["waitMean"] = sum(waits) / len(waits)
+            result["waitMax"] = waits[-1]
+        if span > 0:
+            result["throughput"] = len(done) * 3600.0 / span
+            if slots:
+                result["utilization"] = busy / (slots * span)
+        slowdowns = []
+        for custId, samples in customers.iteritems():
+            custWaits = [w for w, s, b in samples]
+            custWaits.sort()
+            slowdown = sum([s for w, s, b in samples]) / len(samples)
+            slowdowns.append(slowdown)
+            result["customers"][custId] = {
+                "count": len(samples),
+                "waitMean": sum(custWaits) / len(custWaits),
+                "wait90": getPercentile(custWaits, 0.90),
+                "slowdown": slowdown,
+                "busyTime": sum([b for w, s, b in samples])}
+        result["fairness"] = getFairness(slowdowns)
+        return result
+
+
+    ## Scheduler Event Listeners ##
+
+    def __onTranscodingDone(self, sched, task, report):
+        puid = task.getProfileContext().uid
+        self._pending.pop(puid, None)
+        arrival = self._arrivals.pop(puid)
+        self._tasks.pop(puid, None)
+        self._done.append((task, arrival, self._clock.seconds()))
+
+
+    ## Private Methods ##
+
+    def __getProfileContext(self, storeCtx, adminStore, index, job):
+        custValues = self._customers.get(job.customer, None)
+        custStore = adminStore.getChild(job.customer, custValues)
+        profValues = self._profiles.get((job.customer, job.profile), None)
+        profStore = custStore.getChild(job.profile, profValues)
+        custCtx = storeCtx.getCustomerContextFor(custStore)
+        # Every job gets its own input file
+        return custCtx.getProfileContextFor(profStore, "/job%d" % index)
+
+    def __createTask(self, transcoding, profCtx, params):
+        job = self._pending[profCtx.uid]
+        task = SimulatedTask(self, self._clock, profCtx, job)
+        preempted = self._tasks.get(profCtx.uid, None)
+        if preempted is not None:
+            task.resume(preempted)
+        self._tasks[profCtx.uid] = task
+        return task
+
+    def __arrive(self, sched, profCtx, job):
+        self._pending[profCtx.uid] = job
+        self._arrivals[profCtx.uid] = self._clock.seconds()
+        sched.addProfile(profCtx, None, job.fileSize)
+
+    def __runClock(self):
+        while True:
+            calls = self._clock.getDelayedCalls()
+            if not calls:
+                break
+            next = min([c.getTime() for c in calls])
+            self._clock.advance(max(next - self._clock.seconds(), 0))
+
+
+def compare(jobs, workers, configs, customers=None,
+            profiles=None, history=None):
+    """
+    Replays the same trace with each scheduler configuration
+    of a list, and returns the list of their results.
+    """
+    return [Simulation(jobs, workers, c, customers, profiles,
+                       history).run()
+            for c in configs]
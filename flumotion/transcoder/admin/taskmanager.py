@@ -32,8 +32,9 @@ class TaskManager(log.Loggable, events.EventSourceMixin):
 
     logCategory = "" # Should be set by child classes
 
-    def __init__(self):
+    def __init__(self, admission=None):
         self.label = self.__class__.__name__
+        self._admission = admission # admission.AdmissionController
         self._identifiers = {} # {identifiers: ComponentProperties}
         self._tasks = {} # {ComponentProperties: admintask.IAdminTask}
         self._taskless = {} # {component.ComponentProxy: None}
@@ -59,6 +60,7 @@ class TaskManager(log.Loggable, events.EventSourceMixin):
         assert not (identifier in self._identifiers)
         self._identifiers[identifier] = props
         self._tasks[props] = task
+        task.setAdmissionController(self._admission)
         for compPxy in self.__getTasklessComponents():
             if compPxy.getProperties() == props:
                 # Not my responsability anymore
@@ -84,6 +86,9 @@ class TaskManager(log.Loggable, events.EventSourceMixin):
                        self.__ebTaskStopFailed,
                        errbackArgs=(task,))
 
+    def getAdmissionController(self):
+        return self._admission
+
     def getTasks(self):
         return self._tasks.values()
 
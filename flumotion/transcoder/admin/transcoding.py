@@ -29,8 +29,8 @@ class Transcoding(taskmanager.TaskManager):
 
     logCategory = adminconsts.TRANSCODING_LOG_CATEGORY
 
-    def __init__(self, workerPxySet, transPxySet):
-        taskmanager.TaskManager.__init__(self)
+    def __init__(self, workerPxySet, transPxySet, admission=None):
+        taskmanager.TaskManager.__init__(self, admission)
         self._workerPxySet = workerPxySet
         self._transPxySet = transPxySet
         self._balancer = transbalancer.TranscoderBalancer(self)
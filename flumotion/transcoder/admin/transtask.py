@@ -28,10 +28,6 @@ from flumotion.transcoder.admin import adminconsts, admintask
 from flumotion.transcoder.admin.property import filetrans
 from flumotion.transcoder.admin.proxy import transcoder
 
-#TODO: Schedule the component startup to prevent starting
-#      lots of component at the same time.
-#      Because when starting lots of components, the transcoders
-#      happy timeout may be triggered. For now, just using a large timeout.
 #TODO: Cancel operations when going sad or lost, do not wait
 #      for the timeout to be triggered
 
@@ -71,6 +67,16 @@ class TranscodingTask(admintask.AdminTask):
     def getAttemptCount(self):
         return self._attempts
 
+    def getProgress(self):
+        """
+        Returns the progress in percent reported by the transcoder,
+        None if not known.
+        """
+        transPxy = self.getActiveComponent()
+        if transPxy is None:
+            return None
+        return transPxy.getTranscoderProgress()
+
     ## Component Event Listeners ##
 
     def __onComponentOrphaned(self, transPxy, workerPxy):
@@ -0,0 +1,239 @@
+# vi:si:et:sw=4:sts=4:ts=4
+
+# Flumotion - a streaming media server
+# Copyright (C) 2004,2005,2006,2007,2008,2009 Fluendo, S.L.
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+#
+# This file may be distributed and/or modified under the terms of
+# the GNU Lesser General Public License version 2.1 as published by
+# the Free Software Foundation.
+# This file is distributed without any warranty; without even the implied
+# warranty of merchantability or fitness for a particular purpose.
+# See "LICENSE.LGPL" in the source distribution for more information.
+#
+# Headers in this file shall remain intact.
+
+"""
+Pending files state shared between the monitors and their clients.
+
+Each pending file is described by a compact record:
+
+    (version, state, size, mtime, ctime, detection_time,
+     mime_type, checksum, params)
+
+The monitor keeps the records of its pending files in a PendingFilesJournal
+and publishes the changes in numbered batches. The clients apply the
+batches to a PendingFilesMirror; when a batch is missing, they ask the
+monitor for the changes since the last batch they applied, or for all
+the records if the monitor doesn't remember that far.
+
+The records are keyed by (profile key, relative file path). A monitor
+watching the profiles of many customers qualifies the profile names
+with the customer name, see makeProfileKey.
+"""
+
+import stat
+
+from flumotion.transcoder import errors
+
+
+RECORD_VERSION = 1
+
+# Customer and profile names are used as directory names,
+# so they cannot contain the separator
+PROFILE_KEY_SEPARATOR = "/"
+
+_STAT_SIZE = max(stat.ST_SIZE, stat.ST_MTIME, stat.ST_CTIME) + 1
+
+
+def makeRecord(state, fileinfo, detection_time=None, mime_type=None,
+               checksum=None, params=None):
+    """
+    Creates a pending file record; fileinfo is an os.stat result or None.
+    """
+    size = mtime = ctime = None
+    if fileinfo:
+        size = fileinfo[stat.ST_SIZE]
+        mtime = fileinfo[stat.ST_MTIME]
+        ctime = fileinfo[stat.ST_CTIME]
+    return (RECORD_VERSION, state, size, mtime, ctime, detection_time,
+            mime_type, checksum, params or None)
+
+def setRecordState(record, state):
+    return record[:1] + (state,) + record[2:]
+
+def parseRecord(record):
+    """
+    Returns (state, fileinfo, detection_time, mime_type, checksum, params)
+    from a record. The fileinfo is a tuple where only the size,
+    the modification and the creation time can be accessed
+    using the stat module indexes, or None if they are not known.
+    """
+    if record[0] != RECORD_VERSION:
+        raise errors.TranscoderError("Unsupported pending file record "
+                                     "version %r" % (record[0],))
+    _, state, size, mtime, ctime, detection_time, mime, checksum, params \
+        = record
+    fileinfo = None
+    if size is not None:
+        fileinfo = [0] * _STAT_SIZE
+        fileinfo[stat.ST_SIZE] = size
+        fileinfo[stat.ST_MTIME] = mtime
+        fileinfo[stat.ST_CTIME] = ctime
+        fileinfo = tuple(fileinfo)
+    return state, fileinfo, detection_time, mime, checksum, params
+
+
+def makeProfileKey(profile_name, customer_name=None):
+    """
+    Returns the key identifying a profile in a monitor; the profile name
+    is qualified with the customer name if the monitor is shared.
+    """
+    if customer_name is None:
+        return profile_name
+    return customer_name + PROFILE_KEY_SEPARATOR + profile_name
+
+def splitProfileKey(profile_key):
+    """
+    Returns (customer name or None, profile name) from a profile key.
+    """
+    if PROFILE_KEY_SEPARATOR not in profile_key:
+        return None, profile_key
+    customer_name, profile_name \
+        = profile_key.split(PROFILE_KEY_SEPARATOR, 1)
+    return customer_name, profile_name
+
+
+class PendingFilesJournal(object):
+    """
+    The pending files records of a monitor, keyed by (profile, file).
+    The changes are coalesced until flush() is called; each flush creates
+    a batch with the next sequence number. The last history batches
+    are kept to answer the clients that missed some of them.
+    """
+
+    def __init__(self, history):
+        self.history = history
+        self._records = {} # {key: record}
+        self._changes = {} # {key: record or None}
+        self._batches = [] # [(sequence, {key: record or None})]
+        self._sequence = 0
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, key):
+        return key in self._records
+
+    def get(self, key, default=None):
+        return self._records.get(key, default)
+
+    def iterRecords(self):
+        return self._records.iteritems()
+
+    def getSequence(self):
+        return self._sequence
+
+    def set(self, key, record):
+        if self._records.get(key) == record:
+            return
+        self._records[key] = record
+        self._changes[key] = record
+
+    def remove(self, key):
+        if self._records.pop(key, None) is None:
+            return
+        self._changes[key] = None
+
+    def flush(self):
+        """
+        Returns the (sequence, changes) batch of the changes since
+        the last flush, or None if nothing changed.
+        The changes are a list of (key, record or None if removed).
+        """
+        if not self._changes:
+            return None
+        changes, self._changes = self._changes, {}
+        self._sequence += 1
+        self._batches.append((self._sequence, changes))
+        del self._batches[:-self.history]
+        return self._sequence, changes.items()
+
+    def getChanges(self, since=None):
+        """
+        Returns (sequence, full, changes) with the flushed changes
+        since the given sequence. If the sequence is not known anymore,
+        full is True and the changes contain all the records.
+        The changes not flushed yet are included in the full records,
+        so the caller should flush and publish them before.
+        """
+        first = self._batches and self._batches[0][0] or self._sequence + 1
+        if (since is None) or (since < first - 1) or (since > self._sequence):
+            return self._sequence, True, self._records.items()
+        merged = {}
+        for sequence, changes in self._batches:
+            if sequence > since:
+                merged.update(changes)
+        return self._sequence, False, merged.items()
+
+
+class PendingFilesMirror(object):
+    """
+    The client side copy of the pending files records of a monitor.
+    apply() and reset() return the list of (key, old record, new record)
+    that really changed; a None old record means the file was added,
+    a None new record means it was removed.
+    """
+
+    def __init__(self):
+        self._records = {}
+        self._sequence = None
+
+    def getSequence(self):
+        return self._sequence
+
+    def iterRecords(self):
+        return self._records.iteritems()
+
+    def clear(self):
+        self._records.clear()
+        self._sequence = None
+
+    def accept(self, sequence):
+        """
+        Returns True if the batch with the given sequence can be applied,
+        False if a batch is missing and the mirror should be resynchronized.
+        """
+        return (self._sequence is not None) and (sequence == self._sequence + 1)
+
+    def apply(self, sequence, changes):
+        self._sequence = sequence
+        return self._update(changes)
+
+    def reset(self, sequence, full, changes):
+        if not full:
+            return self.apply(sequence, changes)
+        self._sequence = sequence
+        removed = self._records.keys()
+        news = dict(changes)
+        for key in removed:
+            if key not in news:
+                news[key] = None
+        return self._update(news.items())
+
+
+    ## Private Methods ##
+
+    def _update(self, changes):
+        updated = []
+        for key, record in changes:
+            old = self._records.get(key)
+            if old == record:
+                continue
+            if record is None:
+                del self._records[key]
+            else:
+                self._records[key] = record
+            updated.append((key, old, record))
+        return updated
@@ -0,0 +1,50 @@
+# vi:si:et:sw=4:sts=4:ts=4
+
+# Flumotion - a streaming media server
+# Copyright (C) 2004,2005,2006,2007,2008,2009 Fluendo, S.L.
+# Copyright (C) 2010,2011 Flumotion Services, S.A.
+# All rights reserved.
+#
+# This file may be distributed and/or modified under the terms of
+# the GNU Lesser General Public License version 2.1 as published by
+# the Free Software Foundation.
+# This file is distributed without any warranty; without even the implied
+# warranty of merchantability or fitness for a particular purpose.
+# See "LICENSE.LGPL" in the source distribution for more information.
+#
+# Headers in this file shall remain intact.
+
+"""
+Ownership of the incoming files of a customer monitored by many shards.
+
+The files are owned by subtree: the entries of a profile's incoming
+directory, with everything below them, are distributed to the shards
+by a stable hash of the profile name and the entry name. So each shard
+only walks and watches the subtrees it owns, and the admin can tell
+which shard monitors a file without asking.
+"""
+
+import zlib
+
+
+def getShardEntry(relpath):
+    """
+    Returns the name of the incoming directory entry a file belongs to.
+    """
+    return relpath.lstrip('/').split('/', 1)[0]
+
+def getEntryShard(profile_name, entry, count):
+    """
+    Returns the index of the shard owning an incoming directory entry.
+    """
+    if count <= 1:
+        return 0
+    key = "%s/%s" % (profile_name, entry)
+    return (zlib.crc32(key) & 0xffffffff) % count
+
+def getFileShard(profile_name, relpath, count):
+    """
+    Returns the index of the shard owning a file,
+    given by its path relative to the profile's incoming directory.
+    """
+    return getEntryShard(profile_name, getShardEntry(relpath), count)
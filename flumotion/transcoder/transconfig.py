@@ -54,6 +54,9 @@ class SourceConfig(properties.PropertyBag):
     reportTemplate = properties.String('report-template', None, True)
     preProcess = properties.String('pre-process', None)
     cuePoints = properties.String('cue-points', None)
+    # Completion method of a source file still being written,
+    # see flumotion.component.transcoder.growingfile
+    growingCompletion = properties.String('growing-completion', None)
 
 
 class AudioConfig(properties.PropertyBag):